@@ -0,0 +1,169 @@
+"""
+Admission control and load shedding.
+
+Work is admitted per class with a concurrency limit and a bounded FIFO wait
+queue. A request that finds the queue full, or that waits longer than the
+class's maximum queue age, is shed with 503 and `Retry-After` instead of
+queueing until the client has given up anyway.
+
+Classes:
+- requests: every HTTP request except EXEMPT_PATHS (AdmissionMiddleware), so a
+  login flood is shed before it reaches the pool and the bcrypt threads.
+- password_hashing: bcrypt hashes/verifies, run in the threadpool.
+- admin_queries: listing/search/delta-sync scans, capped below the DB pool
+  size so they cannot take every connection.
+- smtp: outgoing email.
+
+EXEMPT_PATHS (/auth/me, /auth/logout, /health, /ready, /metrics) are never queued or
+shed, so they stay responsive during a flood; the long-lived SSE streams are
+exempt too, as they would otherwise hold a request slot for hours.
+"""
+import asyncio
+import math
+from collections import deque
+from contextlib import asynccontextmanager
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+import metrics
+from config import (
+    ADMISSION_MAX_REQUESTS, ADMISSION_QUEUE_SIZE, ADMISSION_MAX_QUEUE_MS,
+    HASHING_CONCURRENCY, HASHING_QUEUE_SIZE, HASHING_MAX_QUEUE_MS,
+    ADMIN_QUERY_CONCURRENCY, ADMIN_QUERY_QUEUE_SIZE, ADMIN_QUERY_MAX_QUEUE_MS,
+    SMTP_CONCURRENCY, SMTP_QUEUE_SIZE, SMTP_MAX_QUEUE_MS
+)
+
+EXEMPT_PATHS = {
+    "/auth/me", "/auth/logout", "/health", "/ready", "/metrics",
+    "/auth/admin/events", "/auth/registration-status/events",
+    # Cheap, and most needed while overloaded
+    "/auth/admin/diagnostics/loop",
+}
+
+class Overloaded(HTTPException):
+    """Work shed by admission control (503 with Retry-After)"""
+
+    def __init__(self, work_class: str, retry_after: int):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={"status": "error", "message": "Hệ thống đang quá tải, vui lòng thử lại sau"},
+            headers={"Retry-After": str(retry_after)}
+        )
+        self.work_class = work_class
+
+class WorkClass:
+    """Concurrency limit with a bounded, age-limited FIFO wait queue"""
+
+    def __init__(self, name: str, limit: int, queue_size: int, max_queue_ms: int):
+        self.name = name
+        self.limit = max(limit, 1)
+        self.queue_size = queue_size
+        self.max_queue_seconds = max_queue_ms / 1000
+        self.retry_after = max(math.ceil(self.max_queue_seconds), 1)
+        self.in_flight = 0
+        self.waiters = deque()
+        self.admitted = 0
+        self.shed_queue_full = 0
+        self.shed_queue_age = 0
+
+    async def acquire(self):
+        if self.in_flight < self.limit and not self.waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+        if len(self.waiters) >= self.queue_size:
+            self.shed_queue_full += 1
+            raise Overloaded(self.name, self.retry_after)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            # release() hands its slot directly to the oldest waiter
+            await asyncio.wait_for(waiter, timeout=self.max_queue_seconds)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot arrived just as we gave up: pass it on
+                self.release()
+            else:
+                try:
+                    self.waiters.remove(waiter)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.TimeoutError):
+                self.shed_queue_age += 1
+                raise Overloaded(self.name, self.retry_after)
+            raise
+        self.admitted += 1
+
+    def release(self):
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queued": len(self.waiters),
+            "admitted": self.admitted,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_queue_age": self.shed_queue_age,
+        }
+
+http_requests = WorkClass("requests", ADMISSION_MAX_REQUESTS, ADMISSION_QUEUE_SIZE, ADMISSION_MAX_QUEUE_MS)
+password_hashing = WorkClass("password_hashing", HASHING_CONCURRENCY, HASHING_QUEUE_SIZE, HASHING_MAX_QUEUE_MS)
+admin_queries = WorkClass("admin_queries", ADMIN_QUERY_CONCURRENCY, ADMIN_QUERY_QUEUE_SIZE, ADMIN_QUERY_MAX_QUEUE_MS)
+smtp = WorkClass("smtp", SMTP_CONCURRENCY, SMTP_QUEUE_SIZE, SMTP_MAX_QUEUE_MS)
+
+WORK_CLASSES = (http_requests, password_hashing, admin_queries, smtp)
+
+async def run_hashing(func, *args):
+    """Run a bcrypt call in the threadpool under the password_hashing limit"""
+    async with password_hashing.slot():
+        return await run_in_threadpool(func, *args)
+
+def stats() -> dict:
+    return {work_class.name: work_class.stats() for work_class in WORK_CLASSES}
+
+def _per_class(attribute):
+    return lambda: {(("class", work.name),): work.stats()[attribute] for work in WORK_CLASSES}
+
+metrics.gauge("admission_in_flight", "Admitted work in progress per class", _per_class("in_flight"))
+metrics.gauge("admission_queued", "Work waiting for admission per class", _per_class("queued"))
+metrics.gauge("admission_shed_queue_full", "Work shed because the wait queue was full", _per_class("shed_queue_full"))
+metrics.gauge("admission_shed_queue_age", "Work shed after waiting too long", _per_class("shed_queue_age"))
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware admitting HTTP requests through a WorkClass"""
+
+    def __init__(self, app, work_class: WorkClass = http_requests, exempt_paths=EXEMPT_PATHS):
+        self.app = app
+        self.work_class = work_class
+        self.exempt_paths = exempt_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.work_class.acquire()
+        except Overloaded as e:
+            response = JSONResponse({"detail": e.detail}, status_code=e.status_code, headers=e.headers)
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.work_class.release()
@@ -0,0 +1,127 @@
+"""
+API keys for machine clients.
+
+A key looks like `ak_<prefix>_<secret>` and is shown once, when an admin
+issues it. Only the prefix (public, unique, indexed) and a keyed hash,
+HMAC-SHA256(API_KEY_PEPPER, key), are stored: the secret is 256 random bits,
+so a fast keyed hash is as safe as bcrypt here and costs about a microsecond.
+
+Callers send the key as `Authorization: Bearer <key>` or `X-API-Key: <key>`.
+Verification looks the key row up by prefix, caches it (positive entries
+only, API_KEY_CACHE_TTL_SECONDS at most) and compares hashes in constant
+time, so a warm key authenticates without touching the database. Revoking
+a key drops it from this worker's cache at once and, through the
+`api_key.revoked` event (events.py), from every other worker's.
+
+Keys are meant for service-to-service calls. Admin keys are only issued, and
+only accepted, while API_KEY_ADMIN_ENABLED is set; admin actions made with
+one are audited with the key's prefix, never as a user id.
+"""
+import hashlib
+import hmac
+import secrets
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+from typing import Optional
+import events
+import metrics
+from config import API_KEY_PEPPER, API_KEY_ADMIN_ENABLED, API_KEY_CACHE_SIZE, API_KEY_CACHE_TTL_SECONDS
+from storage import get_storage
+
+KEY_PREFIX = "ak"
+PREFIX_BYTES = 6
+SECRET_BYTES = 32
+
+SERVICE_ROLE = "service"
+ADMIN_ROLE = "admin"
+ROLES = (SERVICE_ROLE, ADMIN_ROLE)
+
+API_KEY_REVOKED = events.API_KEY_REVOKED
+
+def generate_api_key():
+    """Return (key, prefix) for a new key"""
+    prefix = secrets.token_hex(PREFIX_BYTES)
+    return f"{KEY_PREFIX}_{prefix}_{secrets.token_urlsafe(SECRET_BYTES)}", prefix
+
+def hash_api_key(key: str) -> str:
+    return hmac.new(API_KEY_PEPPER.encode(), key.encode(), hashlib.sha256).hexdigest()
+
+def parse_prefix(key: str) -> Optional[str]:
+    parts = key.split("_", 2)
+    if len(parts) != 3 or parts[0] != KEY_PREFIX or len(parts[1]) != PREFIX_BYTES * 2:
+        return None
+    return parts[1]
+
+def role_allowed(role: str) -> bool:
+    return role == SERVICE_ROLE or (role == ADMIN_ROLE and API_KEY_ADMIN_ENABLED)
+
+def principal_for(row) -> SimpleNamespace:
+    """What require_admin and friends see for a request made with this key"""
+    return SimpleNamespace(id=row.id, role=row.role, is_approved=True, is_active=True, api_key_prefix=row.prefix)
+
+class ApiKeyCache:
+    """Bounded LRU of active key rows by prefix"""
+
+    def __init__(self, max_entries: int = API_KEY_CACHE_SIZE, ttl_seconds: float = API_KEY_CACHE_TTL_SECONDS,
+                 clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Bumped by every invalidation: a lookup that overlapped one must not be cached
+        self.epoch = 0
+
+    def get(self, prefix: str):
+        entry = self.entries.get(prefix)
+        if entry is None or self.clock() >= entry[2]:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(prefix)
+        self.hits += 1
+        return entry[0], entry[1]
+
+    def put(self, prefix: str, key_hash: str, principal, epoch: Optional[int] = None):
+        """Cache a row read at `epoch` (skipped if a key was revoked since)"""
+        if epoch is not None and epoch != self.epoch:
+            return key_hash, principal
+        self.entries[prefix] = (key_hash, principal, self.clock() + self.ttl_seconds)
+        self.entries.move_to_end(prefix)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return key_hash, principal
+
+    def invalidate(self, prefix: str):
+        self.epoch += 1
+        self.entries.pop(prefix, None)
+
+    def observe(self, event: dict):
+        """Drop keys revoked by any worker (events.py observer)"""
+        if event.get("type") == API_KEY_REVOKED and event.get("prefix"):
+            self.invalidate(event["prefix"])
+
+api_key_cache = ApiKeyCache()
+
+async def authenticate(key: str, store=None):
+    """Principal for a valid, unrevoked key, or None"""
+    prefix = parse_prefix(key)
+    if prefix is None:
+        return None
+    cached = api_key_cache.get(prefix)
+    if cached is None:
+        epoch = api_key_cache.epoch
+        row = await (store or get_storage()).get_api_key_by_prefix(prefix)
+        if row is None or row.revoked_at is not None or not role_allowed(row.role):
+            return None
+        # A revocation processed during the read may predate it: use the row once, don't cache it
+        cached = api_key_cache.put(prefix, row.key_hash, principal_for(row), epoch)
+    key_hash, principal = cached
+    if not hmac.compare_digest(key_hash, hash_api_key(key)):
+        return None
+    return principal
+
+metrics.gauge("api_key_cache_hits", "API key lookups served from this worker's cache", lambda: api_key_cache.hits)
+metrics.gauge("api_key_cache_misses", "API key lookups that went to storage", lambda: api_key_cache.misses)
+metrics.gauge("api_key_cache_entries", "API keys cached in this worker", lambda: len(api_key_cache.entries))
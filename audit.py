@@ -0,0 +1,176 @@
+"""
+Append-only authentication audit log.
+
+Handlers call `audit_log.record(...)`, which only appends a tuple to an
+in-memory bounded buffer. A background task flushes the buffer through the
+storage backend every AUDIT_FLUSH_MS, or as soon as AUDIT_BATCH_SIZE events
+are waiting. On Postgres a flush is a single COPY into the daily-partitioned
+`audit_log` table.
+
+When the buffer is full, AUDIT_OVERFLOW decides what is lost:
+- "drop_newest": the incoming event is discarded;
+- "drop_oldest": the oldest buffered event is discarded.
+Either way the loss is counted (audit_dropped in /metrics). A failed flush is
+put back in front of the buffer (as far as capacity allows) and retried,
+unless the database rejected the data itself (asyncpg DataError): retrying
+that batch could never succeed and would hold up every later event, so it is
+counted as dropped instead. Text fields are clipped to their column widths
+when recorded, so client input (e.g. a long login identifier) cannot cause
+such a rejection.
+
+A maintenance task creates partitions AUDIT_PARTITIONS_AHEAD days ahead and
+drops whole partitions older than AUDIT_RETENTION_DAYS; rows are never
+deleted one by one.
+"""
+import asyncio
+from collections import deque
+from datetime import datetime
+from typing import Optional
+from asyncpg.exceptions import DataError
+from config import (
+    AUDIT_ENABLED, AUDIT_BUFFER_SIZE, AUDIT_BATCH_SIZE, AUDIT_FLUSH_MS, AUDIT_OVERFLOW,
+    AUDIT_MAINTENANCE_SECONDS
+)
+from logging_service import get_logger, request_id_var
+from storage import get_storage
+import metrics
+
+logger = get_logger(__name__)
+
+DROP_NEWEST = "drop_newest"
+DROP_OLDEST = "drop_oldest"
+
+# Column widths of audit_log (database.py)
+EVENT_WIDTH = 50
+OUTCOME_WIDTH = 20
+IDENTIFIER_WIDTH = 255
+IP_WIDTH = 45
+REQUEST_ID_WIDTH = 64
+
+def client_ip(request) -> Optional[str]:
+    return request.client.host if request is not None and request.client else None
+
+def clip(value: Optional[str], width: int) -> Optional[str]:
+    return value[:width] if value is not None else None
+
+class AuditLog:
+    """Bounded buffer of audit records plus the task that flushes it"""
+
+    def __init__(self, capacity: int = AUDIT_BUFFER_SIZE, batch_size: int = AUDIT_BATCH_SIZE,
+                 flush_ms: int = AUDIT_FLUSH_MS, overflow: str = AUDIT_OVERFLOW, enabled: bool = AUDIT_ENABLED,
+                 store=None):
+        if overflow not in (DROP_NEWEST, DROP_OLDEST):
+            raise ValueError(f"Unknown AUDIT_OVERFLOW: {overflow}")
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_seconds = flush_ms / 1000
+        self.overflow = overflow
+        self.enabled = enabled
+        self.store = store
+        self.buffer = deque()
+        self.wakeup: Optional[asyncio.Event] = None
+        self.flush_task: Optional[asyncio.Task] = None
+        self.maintenance_task: Optional[asyncio.Task] = None
+        self.dropped = 0
+        self.written = 0
+        self.flush_failures = 0
+
+    def record(self, event: str, request=None, outcome: str = "success", user_id=None,
+               actor_id=None, identifier: Optional[str] = None):
+        """Buffer one audit event (never blocks, never raises)"""
+        if not self.enabled:
+            return
+        if len(self.buffer) >= self.capacity:
+            self.dropped += 1
+            if self.overflow == DROP_NEWEST:
+                return
+            self.buffer.popleft()
+        # AUDIT_COLUMNS order
+        self.buffer.append((
+            datetime.utcnow(),
+            clip(event, EVENT_WIDTH),
+            clip(outcome, OUTCOME_WIDTH),
+            str(user_id) if user_id is not None else None,
+            str(actor_id) if actor_id is not None else None,
+            clip(identifier, IDENTIFIER_WIDTH),
+            clip(client_ip(request), IP_WIDTH),
+            clip(request_id_var.get(), REQUEST_ID_WIDTH),
+        ))
+        if len(self.buffer) >= self.batch_size and self.wakeup is not None:
+            self.wakeup.set()
+
+    def _take_batch(self) -> list:
+        count = min(len(self.buffer), self.batch_size)
+        return [self.buffer.popleft() for _ in range(count)]
+
+    async def flush(self) -> int:
+        """Write everything buffered so far; returns the number of events written"""
+        store = self.store or get_storage()
+        total = 0
+        while self.buffer:
+            batch = self._take_batch()
+            try:
+                await store.write_audit_events(batch)
+            except DataError as e:
+                # Rejected for its content: retrying cannot succeed
+                self.flush_failures += 1
+                self.dropped += len(batch)
+                logger.error("Audit batch rejected, dropped", extra={"fields": {"events": len(batch), "error": str(e)}})
+                continue
+            except Exception as e:
+                self.flush_failures += 1
+                # Retry later, oldest first, keeping within capacity
+                room = max(self.capacity - len(self.buffer), 0)
+                self.dropped += len(batch) - min(room, len(batch))
+                self.buffer.extendleft(reversed(batch[:room]))
+                logger.error("Audit flush failed", extra={"fields": {"events": len(batch), "error": str(e)}})
+                break
+            self.written += len(batch)
+            total += len(batch)
+        return total
+
+    async def _flush_forever(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            await self.flush()
+
+    async def _maintain_forever(self):
+        store = self.store or get_storage()
+        while True:
+            try:
+                await store.maintain_audit_partitions()
+            except Exception as e:
+                logger.error("Audit partition maintenance failed", extra={"fields": {"error": str(e)}})
+            await asyncio.sleep(AUDIT_MAINTENANCE_SECONDS)
+
+    def start(self):
+        if not self.enabled or self.flush_task is not None:
+            return
+        self.wakeup = asyncio.Event()
+        self.maintenance_task = asyncio.create_task(self._maintain_forever())
+        self.flush_task = asyncio.create_task(self._flush_forever())
+
+    async def stop(self):
+        """Stop the tasks and write out what is still buffered"""
+        for task in (self.flush_task, self.maintenance_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self.flush_task = self.maintenance_task = None
+        if self.enabled and self.buffer:
+            await self.flush()
+
+audit_log = AuditLog()
+
+metrics.gauge("audit_buffered", "Audit events waiting to be flushed", lambda: len(audit_log.buffer))
+metrics.gauge("audit_written", "Audit events written since start", lambda: audit_log.written)
+metrics.gauge("audit_dropped", "Audit events lost to buffer overflow or rejected batches since start",
+              lambda: audit_log.dropped)
+metrics.gauge("audit_flush_failures", "Failed audit flushes since start", lambda: audit_log.flush_failures)
@@ -0,0 +1,29 @@
+"""
+Python client for the authentication API.
+
+    from auth_client import AsyncAuthClient
+
+    async with AsyncAuthClient("http://localhost:8000") as client:
+        await client.login("user@example.com", "mypassword123")
+        await client.verify_otp(input("OTP: "))
+        print(await client.me())
+
+AuthClient is the blocking twin with the same methods. Both keep pooled
+keep-alive connections and the session cookies for you, retry requests the
+server shed (503/429, honouring Retry-After) and connection failures with
+exponential backoff (see RetryPolicy), and raise AuthAPIError on errors.
+"""
+from .async_client import AsyncAuthClient
+from .sync_client import AuthClient
+from .core import RetryPolicy, NO_RETRY
+from .errors import AuthAPIError
+from .models import (
+    Result, AuthResult, AdminResult, User, UserListItem, UserChange, UserChanges, UserSearchPage,
+    AdminStats, ApiKey, CreatedApiKey, TokenClaims, Principal, Event
+)
+
+__all__ = [
+    "AsyncAuthClient", "AuthClient", "RetryPolicy", "NO_RETRY", "AuthAPIError",
+    "Result", "AuthResult", "AdminResult", "User", "UserListItem", "UserChange", "UserChanges",
+    "UserSearchPage", "AdminStats", "ApiKey", "CreatedApiKey", "TokenClaims", "Principal", "Event",
+]
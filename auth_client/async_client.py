@@ -0,0 +1,112 @@
+"""asyncio client: one pooled httpx.AsyncClient per instance"""
+import asyncio
+from typing import AsyncIterator, Optional
+import httpx
+from .core import (
+    Endpoints, Call, RetryPolicy, SSEParser, AUTH_SESSION_COOKIE, API_KEY_HEADER, INTERNAL_TOKEN_HEADER
+)
+from .errors import AuthAPIError
+from .models import Event, UserChanges, UserListItem
+
+class AsyncAuthClient(Endpoints):
+    """
+    Async client for the auth API.
+
+    Keep one instance per process and share it: connections stay open
+    (keep-alive, up to max_keepalive_connections) and the auth cookies are
+    kept in the instance's jar, so call login/verify_otp once and every
+    later call is authenticated.
+    """
+
+    def __init__(self, base_url: str = "http://localhost:8000", *, api_key: Optional[str] = None,
+                 internal_token: Optional[str] = None, session_token: Optional[str] = None,
+                 retry: RetryPolicy = RetryPolicy(), timeout: float = 10.0, max_connections: int = 100,
+                 max_keepalive_connections: int = 20, transport: Optional[httpx.AsyncBaseTransport] = None):
+        super().__init__(retry)
+        headers = {}
+        if api_key:
+            headers[API_KEY_HEADER] = api_key
+        if internal_token:
+            headers[INTERNAL_TOKEN_HEADER] = internal_token
+        self.timeout = timeout
+        self._http = httpx.AsyncClient(
+            base_url=base_url, headers=headers, timeout=timeout, transport=transport,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections)
+        )
+        if session_token:
+            self._http.cookies.set(AUTH_SESSION_COOKIE, session_token)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._http.aclose()
+
+    @property
+    def cookies(self) -> httpx.Cookies:
+        return self._http.cookies
+
+    async def _send(self, call: Call) -> httpx.Response:
+        attempt = 0
+        while True:
+            try:
+                response = await self._http.request(
+                    call.method, call.path, json=call.json, params=call.params, headers=self._request_headers(call)
+                )
+            except httpx.TransportError as error:
+                if attempt + 1 >= self.retry.attempts or not self.retry.retry_error(call.method, error):
+                    raise
+                await asyncio.sleep(self.retry.delay(attempt))
+            else:
+                if attempt + 1 >= self.retry.attempts or not self.retry.retry_status(call.method, response.status_code):
+                    return response
+                await asyncio.sleep(self.retry.delay(attempt, response.headers.get("Retry-After")))
+            attempt += 1
+
+    async def _call(self, call: Call):
+        return self._finish(call, await self._send(call))
+
+    # Paginated listings
+    async def iter_search_users(self, q: str, field: str = "all", page_size: int = 100) -> AsyncIterator[UserListItem]:
+        """Every match, page by page (bounded by the server's SEARCH_MAX_WINDOW)"""
+        page = 1
+        while True:
+            result = await self.search_users(q, field, page, page_size)
+            for item in result.items:
+                yield item
+            if not result.has_more:
+                return
+            page += 1
+
+    async def iter_user_changes(self, since: int = 0, limit: int = 500) -> AsyncIterator[UserChanges]:
+        """Pages of changes after `since` until caught up; keep the last page's version"""
+        while True:
+            changes = await self.user_changes(since, limit)
+            yield changes
+            if not changes.has_more:
+                return
+            since = changes.version
+
+    # Server-sent event streams
+    def admin_events(self) -> AsyncIterator[Event]:
+        """Registrations and approvals as they happen (admin)"""
+        return self._events("/auth/admin/events")
+
+    def registration_status_events(self) -> AsyncIterator[Event]:
+        """This registration's status; ends once approved"""
+        return self._events("/auth/registration-status/events")
+
+    async def _events(self, path: str) -> AsyncIterator[Event]:
+        timeout = httpx.Timeout(self.timeout, read=None)
+        async with self._http.stream("GET", path, timeout=timeout) as response:
+            if response.is_error:
+                await response.aread()
+                raise AuthAPIError.from_response(response)
+            parser = SSEParser()
+            async for line in response.aiter_lines():
+                event = parser.feed(line)
+                if event is not None:
+                    yield event
@@ -0,0 +1,238 @@
+"""
+Transport-independent half of the clients.
+
+Endpoints describes every auth_routes endpoint as a Call; AsyncAuthClient
+and AuthClient only differ in how they send it (and in how they page and
+stream). Retries, ETag revalidation, cookie bookkeeping and SSE parsing live
+here so both behave the same.
+"""
+import json
+import random
+from dataclasses import dataclass
+from typing import Callable, Optional, List
+import httpx
+from .errors import AuthAPIError
+from .models import (
+    Result, AuthResult, AdminResult, User, UserListItem, UserChanges, UserSearchPage, AdminStats,
+    ApiKey, CreatedApiKey, TokenClaims, Principal, Event
+)
+
+AUTH_SESSION_COOKIE = "auth_session_id"
+TEMP_SESSION_COOKIE = "temp_session_id"
+TEMP_REGISTRATION_COOKIE = "temp_registration_id"
+
+API_KEY_HEADER = "X-API-Key"
+INTERNAL_TOKEN_HEADER = "X-Internal-Token"
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """When and how long to wait before sending a request again"""
+    attempts: int = 3  # including the first one
+    backoff: float = 0.1  # first delay in seconds, doubled on every retry
+    max_backoff: float = 2.0
+    jitter: float = 0.2  # +/- fraction of the delay
+    max_retry_after: float = 10.0  # longest Retry-After honoured
+    # Rejected before any handler ran (admission control, rate limits): safe for every method
+    statuses: frozenset = frozenset({429, 503})
+    # Maybe processed: only retried for idempotent methods
+    idempotent_statuses: frozenset = frozenset({502, 504})
+
+    def retry_status(self, method: str, status_code: int) -> bool:
+        return status_code in self.statuses or (
+            method in IDEMPOTENT_METHODS and status_code in self.idempotent_statuses
+        )
+
+    def retry_error(self, method: str, error: httpx.TransportError) -> bool:
+        # The request never left: safe for every method
+        if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+            return True
+        return method in IDEMPOTENT_METHODS
+
+    def delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_retry_after)
+            except ValueError:
+                pass  # HTTP-date form: fall back to backoff
+        delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+NO_RETRY = RetryPolicy(attempts=1)
+
+@dataclass
+class Call:
+    """One API request and how to read its answer"""
+    method: str
+    path: str
+    parse: Callable[[httpx.Response], object]
+    json: Optional[dict] = None
+    params: Optional[dict] = None
+    headers: Optional[dict] = None
+    revalidate: bool = False  # keep the last body and send If-None-Match
+    forget: tuple = ()  # cookies the server clears on success
+    accept: tuple = ()  # non-2xx statuses parse() handles itself
+
+def _json(parse):
+    return lambda response: parse(response.json())
+
+def _list_of(parse):
+    return lambda response: [parse(item) for item in response.json()]
+
+def _principal(response: httpx.Response) -> Optional[Principal]:
+    if response.status_code == 401:
+        return None
+    return Principal(user_id=response.headers["X-Auth-User-Id"], role=response.headers["X-Auth-Role"])
+
+def _introspection(response: httpx.Response) -> List[TokenClaims]:
+    return [TokenClaims.from_json(result) for result in response.json()["results"]]
+
+class SSEParser:
+    """Incremental text/event-stream parser, fed one line at a time"""
+
+    def __init__(self):
+        self.event_type = "message"
+        self.event_id = None
+        self.data = []
+
+    def feed(self, line: str) -> Optional[Event]:
+        if not line:
+            if not self.data:
+                return None
+            event = Event(type=self.event_type, data=json.loads("\n".join(self.data)), id=self.event_id)
+            self.event_type, self.event_id, self.data = "message", None, []
+            return event
+        if line.startswith(":"):
+            return None  # keep-alive comment
+        name, _, value = line.partition(":")
+        value = value[1:] if value.startswith(" ") else value
+        if name == "event":
+            self.event_type = value
+        elif name == "data":
+            self.data.append(value)
+        elif name == "id":
+            self.event_id = value
+        return None
+
+class Endpoints:
+    """Typed methods for every auth_routes endpoint; subclasses send the calls"""
+
+    def __init__(self, retry: RetryPolicy):
+        self.retry = retry
+        self._cached = {}  # path -> (etag, result) for revalidated listings
+
+    # Helpers for subclasses
+    def _call(self, call: Call):
+        raise NotImplementedError
+
+    @property
+    def cookies(self) -> httpx.Cookies:
+        raise NotImplementedError
+
+    @property
+    def session_token(self) -> Optional[str]:
+        return self.cookies.get(AUTH_SESSION_COOKIE)
+
+    def _request_headers(self, call: Call) -> Optional[dict]:
+        if not call.revalidate or call.path not in self._cached:
+            return call.headers
+        return {**(call.headers or {}), "If-None-Match": self._cached[call.path][0]}
+
+    def _finish(self, call: Call, response: httpx.Response):
+        if call.revalidate and response.status_code == 304:
+            return self._cached[call.path][1]
+        if response.is_error and response.status_code not in call.accept:
+            raise AuthAPIError.from_response(response)
+        for name in call.forget:
+            self._forget_cookie(name)
+        result = call.parse(response)
+        if call.revalidate and "ETag" in response.headers:
+            self._cached[call.path] = (response.headers["ETag"], result)
+        return result
+
+    def _forget_cookie(self, name: str):
+        # The jar keeps cookies the server expired with a bare Set-Cookie
+        for cookie in list(self.cookies.jar):
+            if cookie.name == name:
+                self.cookies.jar.clear(cookie.domain, cookie.path, cookie.name)
+
+    # Service
+    def health(self):
+        return self._call(Call("GET", "/health", lambda response: response.json()))
+
+    # Registration (temp_registration_id cookie kept by the client)
+    def register(self, name: str, email: str, phone: str, password: str) -> Result:
+        return self._call(Call("POST", "/auth/register", _json(Result.from_json), json={
+            "name": name, "email": email, "phone": phone, "password": password, "confirm_password": password
+        }))
+
+    def verify_registration(self, otp: str) -> AuthResult:
+        return self._call(Call("POST", "/auth/verify-registration", _json(AuthResult.from_json),
+                               json={"otp": otp}, forget=(TEMP_REGISTRATION_COOKIE,)))
+
+    def resend_registration_otp(self) -> Result:
+        return self._call(Call("POST", "/auth/resend-registration-otp", _json(Result.from_json)))
+
+    # Login (temp_session_id, then auth_session_id)
+    def login(self, identifier: str, password: str) -> Result:
+        return self._call(Call("POST", "/auth/login", _json(Result.from_json),
+                               json={"identifier": identifier, "password": password}))
+
+    def verify_otp(self, otp: str) -> AuthResult:
+        return self._call(Call("POST", "/auth/verify-otp", _json(AuthResult.from_json),
+                               json={"otp": otp}, forget=(TEMP_SESSION_COOKIE,)))
+
+    def resend_otp(self) -> Result:
+        return self._call(Call("POST", "/auth/resend-otp", _json(Result.from_json)))
+
+    def logout(self) -> Result:
+        return self._call(Call("POST", "/auth/logout", _json(Result.from_json), forget=(AUTH_SESSION_COOKIE,)))
+
+    def me(self) -> User:
+        return self._call(Call("GET", "/auth/me", _json(User.from_json)))
+
+    # Admin
+    def pending_users(self) -> List[UserListItem]:
+        return self._call(Call("GET", "/auth/admin/pending-users", _list_of(UserListItem.from_json),
+                               revalidate=True))
+
+    def all_users(self) -> List[UserListItem]:
+        return self._call(Call("GET", "/auth/admin/all-users", _list_of(UserListItem.from_json), revalidate=True))
+
+    def user_changes(self, since: int = 0, limit: int = 500) -> UserChanges:
+        return self._call(Call("GET", "/auth/admin/users/changes", _json(UserChanges.from_json),
+                               params={"since": since, "limit": limit}))
+
+    def search_users(self, q: str, field: str = "all", page: int = 1, page_size: int = 20) -> UserSearchPage:
+        return self._call(Call("GET", "/auth/admin/search-users", _json(UserSearchPage.from_json),
+                               params={"q": q, "field": field, "page": page, "page_size": page_size}))
+
+    def approve_user(self, user_id: str) -> AdminResult:
+        return self._call(Call("POST", "/auth/admin/approve-user", _json(AdminResult.from_json),
+                               json={"user_id": user_id}))
+
+    def delete_user(self, user_id: str) -> AdminResult:
+        return self._call(Call("DELETE", f"/auth/admin/delete-user/{user_id}", _json(AdminResult.from_json)))
+
+    def admin_stats(self) -> AdminStats:
+        return self._call(Call("GET", "/auth/admin/stats", _json(AdminStats.from_json)))
+
+    def create_api_key(self, name: str, role: str = "service") -> CreatedApiKey:
+        return self._call(Call("POST", "/auth/admin/api-keys", _json(CreatedApiKey.from_json),
+                               json={"name": name, "role": role}))
+
+    def list_api_keys(self) -> List[ApiKey]:
+        return self._call(Call("GET", "/auth/admin/api-keys", _list_of(ApiKey.from_json)))
+
+    def revoke_api_key(self, key_id: str) -> AdminResult:
+        return self._call(Call("DELETE", f"/auth/admin/api-keys/{key_id}", _json(AdminResult.from_json)))
+
+    # Internal (needs internal_token)
+    def introspect(self, tokens: List[str]) -> List[TokenClaims]:
+        return self._call(Call("POST", "/auth/internal/introspect", _introspection, json={"tokens": tokens}))
+
+    def forward_auth(self, session_token: str) -> Optional[Principal]:
+        """The session's principal, or None (an explicit Cookie header beats the client's own jar)"""
+        return self._call(Call("GET", "/auth/internal/forward-auth", _principal, accept=(401,),
+                               headers={"Cookie": f"{AUTH_SESSION_COOKIE}={session_token}"}))
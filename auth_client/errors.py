@@ -0,0 +1,22 @@
+"""Errors raised by the auth API clients"""
+import httpx
+
+class AuthAPIError(Exception):
+    """The API answered with an error status"""
+
+    def __init__(self, status_code: int, message: str, body=None):
+        super().__init__(f"{status_code}: {message}")
+        self.status_code = status_code
+        self.message = message
+        self.body = body
+
+    @classmethod
+    def from_response(cls, response: httpx.Response) -> "AuthAPIError":
+        try:
+            body = response.json()
+        except ValueError:
+            return cls(response.status_code, response.text or response.reason_phrase)
+        # Route errors carry {"detail": {"status": "error", "message": ...}}, validation errors a list
+        detail = body.get("detail", body) if isinstance(body, dict) else body
+        message = detail.get("message", str(detail)) if isinstance(detail, dict) else str(detail)
+        return cls(response.status_code, message, body)
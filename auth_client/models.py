@@ -0,0 +1,142 @@
+"""Typed results of the auth API (mirrors the response models in models.py)"""
+from dataclasses import dataclass, fields
+from datetime import datetime
+from typing import Optional, List
+
+def _datetime(value) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+def _build(cls, data: dict, **overrides):
+    """Instantiate a dataclass from JSON, ignoring fields the server added later"""
+    values = {field.name: data.get(field.name) for field in fields(cls)}
+    values.update(overrides)
+    return cls(**values)
+
+@dataclass
+class Result:
+    status: str
+    message: str
+
+    @classmethod
+    def from_json(cls, data: dict):
+        return _build(cls, data)
+
+@dataclass
+class User:
+    id: str
+    name: str
+    email: str
+    phone: str
+    role: str
+    is_approved: bool
+
+    @classmethod
+    def from_json(cls, data: dict):
+        return _build(cls, data)
+
+@dataclass
+class AuthResult(Result):
+    """verify-registration and verify-otp"""
+    user: Optional[User] = None
+
+    @classmethod
+    def from_json(cls, data: dict):
+        return _build(cls, data, user=User.from_json(data["user"]) if data.get("user") else None)
+
+@dataclass
+class AdminResult(Result):
+    data: Optional[dict] = None
+
+@dataclass
+class UserListItem(User):
+    is_active: bool
+    created_at: datetime
+
+    @classmethod
+    def from_json(cls, data: dict):
+        return _build(cls, data, created_at=_datetime(data.get("created_at")))
+
+@dataclass
+class UserChange(UserListItem):
+    version: int
+
+@dataclass
+class UserChanges:
+    version: int  # pass as `since` on the next call
+    users: List[UserChange]
+    deleted: List[str]
+    has_more: bool
+
+    @classmethod
+    def from_json(cls, data: dict):
+        return _build(cls, data, users=[UserChange.from_json(user) for user in data["users"]])
+
+@dataclass
+class UserSearchPage:
+    items: List[UserListItem]
+    page: int
+    page_size: int
+    has_more: bool
+
+    @classmethod
+    def from_json(cls, data: dict):
+        return _build(cls, data, items=[UserListItem.from_json(item) for item in data["items"]])
+
+@dataclass
+class AdminStats:
+    pending_users: int
+    active_users: int
+    live_sessions: int
+    identifier_filter: Optional[dict] = None
+    admission: Optional[dict] = None
+
+    @classmethod
+    def from_json(cls, data: dict):
+        return _build(cls, data)
+
+@dataclass
+class ApiKey:
+    id: str
+    name: str
+    prefix: str
+    role: str
+    created_at: Optional[datetime] = None
+    revoked_at: Optional[datetime] = None
+
+    @classmethod
+    def from_json(cls, data: dict):
+        return _build(cls, data, created_at=_datetime(data.get("created_at")),
+                      revoked_at=_datetime(data.get("revoked_at")))
+
+@dataclass
+class CreatedApiKey(Result):
+    key: str = ""  # shown once, never retrievable again
+    api_key: Optional[ApiKey] = None
+
+    @classmethod
+    def from_json(cls, data: dict):
+        return _build(cls, data, api_key=ApiKey.from_json(data["api_key"]))
+
+@dataclass
+class TokenClaims:
+    active: bool
+    user_id: Optional[str] = None
+    role: Optional[str] = None
+    expires_at: Optional[datetime] = None
+
+    @classmethod
+    def from_json(cls, data: dict):
+        return _build(cls, data, expires_at=_datetime(data.get("expires_at")))
+
+@dataclass
+class Principal:
+    """forward-auth answer for a valid session"""
+    user_id: str
+    role: str
+
+@dataclass
+class Event:
+    """One server-sent event"""
+    type: str
+    data: dict
+    id: Optional[str] = None
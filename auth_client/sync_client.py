@@ -0,0 +1,109 @@
+"""Blocking client: one pooled httpx.Client per instance"""
+import time
+from typing import Iterator, Optional
+import httpx
+from .core import (
+    Endpoints, Call, RetryPolicy, SSEParser, AUTH_SESSION_COOKIE, API_KEY_HEADER, INTERNAL_TOKEN_HEADER
+)
+from .errors import AuthAPIError
+from .models import Event, UserChanges, UserListItem
+
+class AuthClient(Endpoints):
+    """
+    Blocking client for the auth API (same methods as AsyncAuthClient).
+
+    Keep one instance and reuse it: connections stay open and the auth
+    cookies are kept in the instance's jar.
+    """
+
+    def __init__(self, base_url: str = "http://localhost:8000", *, api_key: Optional[str] = None,
+                 internal_token: Optional[str] = None, session_token: Optional[str] = None,
+                 retry: RetryPolicy = RetryPolicy(), timeout: float = 10.0, max_connections: int = 100,
+                 max_keepalive_connections: int = 20, transport: Optional[httpx.BaseTransport] = None):
+        super().__init__(retry)
+        headers = {}
+        if api_key:
+            headers[API_KEY_HEADER] = api_key
+        if internal_token:
+            headers[INTERNAL_TOKEN_HEADER] = internal_token
+        self.timeout = timeout
+        self._http = httpx.Client(
+            base_url=base_url, headers=headers, timeout=timeout, transport=transport,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections)
+        )
+        if session_token:
+            self._http.cookies.set(AUTH_SESSION_COOKIE, session_token)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._http.close()
+
+    @property
+    def cookies(self) -> httpx.Cookies:
+        return self._http.cookies
+
+    def _send(self, call: Call) -> httpx.Response:
+        attempt = 0
+        while True:
+            try:
+                response = self._http.request(
+                    call.method, call.path, json=call.json, params=call.params, headers=self._request_headers(call)
+                )
+            except httpx.TransportError as error:
+                if attempt + 1 >= self.retry.attempts or not self.retry.retry_error(call.method, error):
+                    raise
+                time.sleep(self.retry.delay(attempt))
+            else:
+                if attempt + 1 >= self.retry.attempts or not self.retry.retry_status(call.method, response.status_code):
+                    return response
+                time.sleep(self.retry.delay(attempt, response.headers.get("Retry-After")))
+            attempt += 1
+
+    def _call(self, call: Call):
+        return self._finish(call, self._send(call))
+
+    # Paginated listings
+    def iter_search_users(self, q: str, field: str = "all", page_size: int = 100) -> Iterator[UserListItem]:
+        """Every match, page by page (bounded by the server's SEARCH_MAX_WINDOW)"""
+        page = 1
+        while True:
+            result = self.search_users(q, field, page, page_size)
+            yield from result.items
+            if not result.has_more:
+                return
+            page += 1
+
+    def iter_user_changes(self, since: int = 0, limit: int = 500) -> Iterator[UserChanges]:
+        """Pages of changes after `since` until caught up; keep the last page's version"""
+        while True:
+            changes = self.user_changes(since, limit)
+            yield changes
+            if not changes.has_more:
+                return
+            since = changes.version
+
+    # Server-sent event streams
+    def admin_events(self) -> Iterator[Event]:
+        """Registrations and approvals as they happen (admin)"""
+        return self._events("/auth/admin/events")
+
+    def registration_status_events(self) -> Iterator[Event]:
+        """This registration's status; ends once approved"""
+        return self._events("/auth/registration-status/events")
+
+    def _events(self, path: str) -> Iterator[Event]:
+        timeout = httpx.Timeout(self.timeout, read=None)
+        with self._http.stream("GET", path, timeout=timeout) as response:
+            if response.is_error:
+                response.read()
+                raise AuthAPIError.from_response(response)
+            parser = SSEParser()
+            for line in response.iter_lines():
+                event = parser.feed(line)
+                if event is not None:
+                    yield event
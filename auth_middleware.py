@@ -0,0 +1,148 @@
+"""
+Per-request authentication context.
+
+AuthMiddleware (pure ASGI) attaches an AuthContext to the request scope. The
+Cookie header is parsed on first access and the principal is resolved on
+first access, once per request however many dependencies ask for it: `me`
+and `Depends(require_admin)` share one session lookup and one user lookup.
+
+With the shared session cache enabled (session_cache.py), the principal
+(id, role, approval and active flags) usually comes from the cache without
+any query; only routes that need the full user row (`me`) then load it.
+
+Without a session cookie, an API key (`Authorization: Bearer ak_...` or
+`X-API-Key`) is tried instead; see api_keys.py.
+
+PUBLIC_PATHS get no context at all; if a handler there reads a cookie, the
+context is created on demand instead (see auth_context).
+"""
+from typing import Optional
+from starlette.requests import cookie_parser
+from storage import get_storage
+import api_keys
+import session_cache
+from utils import is_expired
+
+SCOPE_KEY = "auth_context"
+
+API_KEY_HEADER = b"x-api-key"
+
+AUTH_SESSION_COOKIE = "auth_session_id"
+TEMP_SESSION_COOKIE = "temp_session_id"
+TEMP_REGISTRATION_COOKIE = "temp_registration_id"
+
+# Routes that never need the principal
+PUBLIC_PATHS = {
+    "/", "/health", "/ready", "/metrics", "/docs", "/redoc", "/openapi.json",
+    "/auth/register", "/auth/verify-registration", "/auth/resend-registration-otp",
+    "/auth/login", "/auth/verify-otp", "/auth/resend-otp",
+    "/auth/registration-status/events",
+}
+
+_UNRESOLVED = object()
+
+class AuthContext:
+    """Lazily parsed cookies and lazily resolved principal of one request"""
+
+    __slots__ = ("scope", "_cookies", "_principal", "_user", "session_expires_at")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self._cookies = None
+        self._principal = _UNRESOLVED
+        self._user = _UNRESOLVED
+        # Expiry of the session behind the principal (None for API keys)
+        self.session_expires_at = None
+
+    @property
+    def cookies(self) -> dict:
+        if self._cookies is None:
+            header = b""
+            for name, value in self.scope["headers"]:
+                if name == b"cookie":
+                    header = value
+                    break
+            self._cookies = cookie_parser(header.decode("latin-1"))
+        return self._cookies
+
+    def cookie(self, name: str) -> Optional[str]:
+        return self.cookies.get(name)
+
+    def api_key(self) -> Optional[str]:
+        for name, value in self.scope["headers"]:
+            if name == API_KEY_HEADER:
+                return value.decode("latin-1")
+            if name == b"authorization":
+                scheme, _, credentials = value.decode("latin-1").partition(" ")
+                if scheme.lower() == "bearer" and credentials:
+                    return credentials
+        return None
+
+    async def principal(self, request=None):
+        """The logged-in user's id, role and flags, or None (resolved at most once)"""
+        if self._principal is _UNRESOLVED:
+            self._principal = await self._resolve(request)
+        return self._principal
+
+    def resolved_principal(self):
+        """The principal if a handler already resolved it (never looks anything up)"""
+        return None if self._principal is _UNRESOLVED else self._principal
+
+    async def user(self, request=None):
+        """The logged-in user's full row, or None"""
+        principal = await self.principal(request)
+        if principal is None:
+            return None
+        if self._user is _UNRESOLVED:
+            # The principal came from the shared cache
+            self._user = await get_storage().get_user(principal.id, request)
+        return self._user
+
+    async def _resolve(self, request):
+        token = self.cookie(AUTH_SESSION_COOKIE)
+        if not token:
+            key = self.api_key()
+            if not key:
+                return None
+            # Machine clients have no user row
+            self._user = None
+            return await api_keys.authenticate(key)
+        cache = session_cache.get_session_cache()
+        since = None
+        if cache is not None:
+            cached = cache.get(token)
+            if cached is not None:
+                self.session_expires_at = cached.session_expires_at
+                return cached
+            since = cache.generations()
+            # Every worker trusts a fill: read it from the primary, since a
+            # lagging replica may still return a session just logged out
+            request = None
+        store = get_storage()
+        session = await store.get_auth_session(token, request)
+        if not session or is_expired(session.expires_at):
+            return None
+        self.session_expires_at = session.expires_at
+        self._user = await store.get_user(session.user_id, request)
+        if self._user is not None and cache is not None:
+            cache.put(token, self._user, session.expires_at, since)
+        return self._user
+
+def auth_context(request) -> AuthContext:
+    """The request's AuthContext, created on demand where the middleware skipped it"""
+    context = request.scope.get(SCOPE_KEY)
+    if context is None:
+        context = request.scope[SCOPE_KEY] = AuthContext(request.scope)
+    return context
+
+class AuthMiddleware:
+    """Pure ASGI middleware attaching an AuthContext to non-public requests"""
+
+    def __init__(self, app, public_paths=PUBLIC_PATHS):
+        self.app = app
+        self.public_paths = public_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] not in self.public_paths:
+            scope[SCOPE_KEY] = AuthContext(scope)
+        await self.app(scope, receive, send)
@@ -1,55 +1,71 @@
-from fastapi import APIRouter, HTTPException, Response, Request, Depends, status
-from fastapi.responses import JSONResponse
-from models import *
-from database import database, users_table, temp_registrations_table, temp_sessions_table, auth_sessions_table
-from utils import *
+from fastapi import APIRouter, HTTPException, Response, Request, Depends, BackgroundTasks, Query, status
+from fastapi.responses import StreamingResponse
+from models import (
+    RegisterRequest, VerifyRegistrationRequest, LoginRequest, VerifyOTPRequest,
+    UserResponse, RegisterSuccessResponse, RegisterResponse, LoginPendingResponse,
+    LoginSuccessResponse, SuccessResponse, UserListResponse, UserSearchResponse, ApproveUserRequest,
+    AdminResponse, AdminStatsResponse, UserChangeResponse, UserChangesResponse,
+    IntrospectRequest, IntrospectResponse, TokenClaims,
+    CreateApiKeyRequest, ApiKeyResponse, ApiKeyCreatedResponse
+)
+from database import pin_primary
+from storage import get_storage, DuplicateUserError
+from auth_middleware import (
+    auth_context, AUTH_SESSION_COOKIE, TEMP_SESSION_COOKIE, TEMP_REGISTRATION_COOKIE
+)
+from utils import (
+    hash_password, verify_password, password_needs_rehash, generate_otp, is_email, is_phone,
+    get_otp_expiry, get_auth_session_expiry, is_expired, generate_session_token,
+    create_access_token, verify_token
+)
 from email_service import send_otp_email, send_otp_sms, send_admin_notification
+from logging_service import get_logger
+from config import SEARCH_MAX_WINDOW, INTERNAL_API_TOKEN, INTROSPECT_MAX_AGE_SECONDS
+import events
+import session_cache
+import api_keys
+from audit import audit_log
+import admission
+from bloom import identifier_filter
 from datetime import datetime
 from typing import Optional, List
 import uuid
-import sqlalchemy
+import hmac
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
+logger = get_logger(__name__)
 
-# Helper function to get temp_registration_id from cookie
+# Helper functions to read our cookies (parsed once per request, see auth_middleware.py)
 def get_temp_registration_id(request: Request) -> Optional[str]:
-    return request.cookies.get("temp_registration_id")
+    return auth_context(request).cookie(TEMP_REGISTRATION_COOKIE)
 
-# Helper function to get temp_session_id from cookie
 def get_temp_session_id(request: Request) -> Optional[str]:
-    return request.cookies.get("temp_session_id")
+    return auth_context(request).cookie(TEMP_SESSION_COOKIE)
 
-# Helper function to get auth_session_id from cookie
 def get_auth_session_id(request: Request) -> Optional[str]:
-    return request.cookies.get("auth_session_id")
+    return auth_context(request).cookie(AUTH_SESSION_COOKIE)
+
+# Helper function to get the registration status token from cookie
+REGISTRATION_STATUS_COOKIE = "registration_status_token"
+REGISTRATION_STATUS_SCOPE = "registration_status"
+
+def get_registration_status_user_id(request: Request) -> Optional[str]:
+    token = auth_context(request).cookie(REGISTRATION_STATUS_COOKIE)
+    payload = verify_token(token) if token else None
+    if not payload or payload.get("scope") != REGISTRATION_STATUS_SCOPE:
+        return None
+    return payload.get("sub")
 
 # Helper function to get current user from session
 async def get_current_user(request: Request) -> Optional[dict]:
-    """Get current user from auth session"""
-    auth_session_id = get_auth_session_id(request)
-    if not auth_session_id:
-        return None
-    
-    # Check auth session
-    query = sqlalchemy.select(auth_sessions_table).where(
-        auth_sessions_table.c.session_token == auth_session_id
-    )
-    session = await database.fetch_one(query)
-    
-    if not session or is_expired(session.expires_at):
-        return None
-    
-    # Get user
-    user_query = sqlalchemy.select(users_table).where(
-        users_table.c.id == session.user_id
-    )
-    user = await database.fetch_one(user_query)
-    return user
+    """Get current user from auth session (resolved once per request)"""
+    return await auth_context(request).user(request)
 
 # Helper function to check if user is admin
 async def require_admin(request: Request):
     """Require admin role"""
-    user = await get_current_user(request)
+    # Role check only: no full user row needed (often served by the session cache)
+    user = await auth_context(request).principal(request)
     if not user or user.role != 'admin':
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -57,6 +73,99 @@ async def require_admin(request: Request):
         )
     return user
 
+# Helper function to keep API-key principals (api_keys.py) out of user-id columns
+def admin_actor(admin_user) -> tuple:
+    """(actor user id, audit identifier): admin API keys are recorded by prefix"""
+    prefix = getattr(admin_user, "api_key_prefix", None)
+    if prefix is not None:
+        return None, f"api_key:{prefix}"
+    return admin_user.id, None
+
+# Helper function to require a signed-in admin (no API key)
+async def require_admin_user(request: Request):
+    """Require an admin session; used where an API key must not act (managing keys)"""
+    user = await require_admin(request)
+    if getattr(user, "api_key_prefix", None) is not None:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail={"status": "error", "message": "API key không được quản lý API key"}
+        )
+    return user
+
+# Helper function to check internal callers (other services, reverse proxies)
+INTERNAL_TOKEN_HEADER = "X-Internal-Token"
+
+def require_internal_caller(request: Request):
+    """Require the shared internal API token"""
+    supplied = request.headers.get(INTERNAL_TOKEN_HEADER, "")
+    if not INTERNAL_API_TOKEN or not hmac.compare_digest(supplied.encode(), INTERNAL_API_TOKEN.encode()):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail={"status": "error", "message": "Không có quyền truy cập"}
+        )
+
+# Helpers shared by introspection and forward auth
+def session_usable(principal) -> bool:
+    """Sessions of deactivated or unapproved users grant nothing to other services"""
+    return bool(principal.is_active and principal.is_approved)
+
+def answer_max_age(expires_at: Optional[datetime], now: datetime) -> int:
+    """How long a caller may cache an answer: never past the session's expiry"""
+    if expires_at is None:
+        return INTROSPECT_MAX_AGE_SECONDS
+    return max(min(INTROSPECT_MAX_AGE_SECONDS, int((expires_at - now).total_seconds())), 0)
+
+# Largest page the delta-sync endpoint returns
+MAX_CHANGES_LIMIT = 1000
+
+def users_etag(version: int) -> str:
+    return f'W/"users-{version}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check If-None-Match against our (weak) ETag"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [tag.strip() for tag in header.split(",")]
+    return "*" in candidates or etag in candidates or etag[2:] in candidates
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+def api_key_item(row) -> ApiKeyResponse:
+    return ApiKeyResponse(
+        id=str(row.id),
+        name=row.name,
+        prefix=row.prefix,
+        role=row.role,
+        created_at=row.created_at,
+        revoked_at=row.revoked_at
+    )
+
+def user_list_item(user) -> UserListResponse:
+    return UserListResponse(
+        id=str(user.id),
+        name=user.name,
+        email=user.email,
+        phone=user.phone,
+        role=user.role,
+        is_approved=user.is_approved,
+        is_active=user.is_active,
+        created_at=user.created_at
+    )
+
+SEARCH_FIELDS = ("name", "email", "phone")
+
+async def rehash_password(user_id, password: str, old_hash: str):
+    """Upgrade a stored hash to the current bcrypt cost (runs after the response)"""
+    try:
+        new_hash = await admission.run_hashing(hash_password, password)
+    except admission.Overloaded:
+        # Best effort: the next login tries again
+        return
+    # Only replace the hash we verified, never a password changed in the meantime
+    await get_storage().replace_password_hash(user_id, old_hash, new_hash)
+
 @router.post("/register", response_model=RegisterResponse, status_code=status.HTTP_201_CREATED)
 async def register(request: RegisterRequest, response: Response):
     """Register a new user"""
@@ -68,24 +177,22 @@ async def register(request: RegisterRequest, response: Response):
             detail={"status": "error", "message": "Mật khẩu không trùng khớp"}
         )
     
-    # Check if email or phone already exists
-    query = sqlalchemy.select(users_table).where(
-        sqlalchemy.or_(
-            users_table.c.email == request.email,
-            users_table.c.phone == request.phone
-        )
-    )
-    existing_user = await database.fetch_one(query)
+    store = get_storage()
     
-    if existing_user:
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail={"status": "error", "message": "Email hoặc số điện thoại đã được đăng kí"}
-        )
+    # Check if email or phone already exists.
+    # A definite miss in the in-memory filter skips the lookup; the unique
+    # constraints still reject a duplicate when the user row is inserted
+    if identifier_filter.might_contain(request.email, request.phone):
+        if await store.identifier_taken(request.email, request.phone):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail={"status": "error", "message": "Email hoặc số điện thoại đã được đăng kí"}
+            )
+        identifier_filter.record_false_positive()
     
     # Generate OTP and hash password
     otp = generate_otp()
-    password_hash = hash_password(request.password)
+    password_hash = await admission.run_hashing(hash_password, request.password)
     
     # Save temporary registration
     temp_reg_id = str(uuid.uuid4())
@@ -99,18 +206,8 @@ async def register(request: RegisterRequest, response: Response):
         "otp_expires_at": get_otp_expiry()
     }
     
-    # Delete any existing temp registration for this email/phone
-    delete_query = sqlalchemy.delete(temp_registrations_table).where(
-        sqlalchemy.or_(
-            temp_registrations_table.c.email == request.email,
-            temp_registrations_table.c.phone == request.phone
-        )
-    )
-    await database.execute(delete_query)
-    
-    # Insert new temp registration
-    insert_query = temp_registrations_table.insert().values(temp_reg_data)
-    await database.execute(insert_query)
+    # Replace any existing temp registration for this email/phone
+    await store.replace_temp_registration(temp_reg_data)
     
     # Set cookie
     response.set_cookie(
@@ -139,11 +236,10 @@ async def verify_registration(request: VerifyRegistrationRequest, http_request:
             detail={"status": "error", "message": "Chưa thấy đăng kí"}
         )
     
+    store = get_storage()
+    
     # Get temp registration
-    query = sqlalchemy.select(temp_registrations_table).where(
-        temp_registrations_table.c.id == temp_reg_id
-    )
-    temp_reg = await database.fetch_one(query)
+    temp_reg = await store.get_temp_registration(temp_reg_id)
     
     if not temp_reg:
         raise HTTPException(
@@ -153,6 +249,7 @@ async def verify_registration(request: VerifyRegistrationRequest, http_request:
     
     # Check OTP and expiry
     if temp_reg.otp_code != request.otp or is_expired(temp_reg.otp_expires_at):
+        audit_log.record("registration.verify", http_request, "failure", identifier=temp_reg.email)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail={"status": "error", "message": "Mã OTP đã hết hạn hoặc không tồn tại"}
@@ -171,8 +268,16 @@ async def verify_registration(request: VerifyRegistrationRequest, http_request:
         "is_approved": False  # Need admin approval
     }
     
-    insert_user_query = users_table.insert().values(user_data)
-    await database.execute(insert_user_query)
+    try:
+        await store.create_user(user_data)
+    except DuplicateUserError:
+        # Taken since /register ran (or missed by the pre-check)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"status": "error", "message": "Email hoặc số điện thoại đã được đăng kí"}
+        )
+    identifier_filter.add(temp_reg.email, temp_reg.phone)
+    audit_log.record("registration.verify", http_request, user_id=user_id, identifier=temp_reg.email)
     
     # Send notification to admin about new registration
     admin_notification_data = {
@@ -186,17 +291,25 @@ async def verify_registration(request: VerifyRegistrationRequest, http_request:
     try:
         await send_admin_notification(admin_notification_data)
     except Exception as e:
-        print(f"Warning: Failed to send admin notification: {e}")
+        logger.warning("Failed to send admin notification", extra={"fields": {"error": str(e)}})
     
     # Delete temp registration
-    delete_temp_query = sqlalchemy.delete(temp_registrations_table).where(
-        temp_registrations_table.c.id == temp_reg_id
-    )
-    await database.execute(delete_temp_query)
+    await store.delete_temp_registration(temp_reg_id)
     
     # Clear temp registration cookie
     response.delete_cookie(key="temp_registration_id", path="/")
     
+    # Lets the user follow their approval status without logging in
+    response.set_cookie(
+        key=REGISTRATION_STATUS_COOKIE,
+        value=create_access_token({"sub": user_id, "scope": REGISTRATION_STATUS_SCOPE}),
+        httponly=True,
+        secure=False,
+        samesite="lax",
+        path="/auth/registration-status",
+        max_age=86400  # 24 hours
+    )
+    
     return RegisterSuccessResponse(
         status="success",
         message="Chúc mừng bạn đã đăng kí thành công! Vui lòng chờ admin phê duyệt.",
@@ -221,11 +334,10 @@ async def resend_registration_otp(request: Request):
             detail={"status": "error", "message": "Không thấy đăng kí"}
         )
     
+    store = get_storage()
+    
     # Get temp registration
-    query = sqlalchemy.select(temp_registrations_table).where(
-        temp_registrations_table.c.id == temp_reg_id
-    )
-    temp_reg = await database.fetch_one(query)
+    temp_reg = await store.get_temp_registration(temp_reg_id)
     
     if not temp_reg:
         raise HTTPException(
@@ -237,13 +349,7 @@ async def resend_registration_otp(request: Request):
     new_otp = generate_otp()
     
     # Update temp registration with new OTP
-    update_query = sqlalchemy.update(temp_registrations_table).where(
-        temp_registrations_table.c.id == temp_reg_id
-    ).values(
-        otp_code=new_otp,
-        otp_expires_at=get_otp_expiry()
-    )
-    await database.execute(update_query)
+    await store.update_temp_registration_otp(temp_reg_id, new_otp, get_otp_expiry())
     
     # Send new OTP
     email_sent = await send_otp_email(temp_reg.email, new_otp, "registration")
@@ -259,35 +365,52 @@ async def resend_registration_otp(request: Request):
     )
 
 @router.post("/login", response_model=LoginPendingResponse)
-async def login(request: LoginRequest, response: Response):
+async def login(request: LoginRequest, http_request: Request, response: Response, background_tasks: BackgroundTasks):
     """Login user - step 1"""
     
+    store = get_storage()
+    
     # Determine if identifier is email or phone
     if is_email(request.identifier):
-        query = sqlalchemy.select(users_table).where(users_table.c.email == request.identifier)
+        lookup = store.get_user_by_email
     elif is_phone(request.identifier):
-        query = sqlalchemy.select(users_table).where(users_table.c.phone == request.identifier)
+        lookup = store.get_user_by_phone
     else:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail={"status": "error", "message": "Định dạng email hoặc số điện thoại không hợp lệ"}
         )
+    user = await lookup(request.identifier, http_request)
     
-    user = await database.fetch_one(query)
-    if not user or not verify_password(request.password, user.password_hash):
+    if not user or not await admission.run_hashing(verify_password, request.password, user.password_hash):
+        audit_log.record(
+            "login.password", http_request, "failure",
+            user_id=user.id if user else None, identifier=request.identifier
+        )
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail={"status": "error", "message": "Thông tin đăng nhập không chính xác"}
         )
     
+    # Transparently upgrade hashes made with outdated bcrypt parameters
+    if password_needs_rehash(user.password_hash):
+        background_tasks.add_task(rehash_password, user.id, request.password, user.password_hash)
+    
+    # A just-approved (or reactivated) user may still look refused on a
+    # lagging replica: confirm on the primary before turning them away
+    if not user.is_approved or not user.is_active:
+        user = await lookup(request.identifier) or user
+    
     # Check if user is approved
     if not user.is_approved:
+        audit_log.record("login.password", http_request, "not_approved", user_id=user.id, identifier=request.identifier)
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail={"status": "error", "message": "Tài khoản của bạn chưa được admin phê duyệt"}
         )
     
     if not user.is_active:
+        audit_log.record("login.password", http_request, "inactive", user_id=user.id, identifier=request.identifier)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail={"status": "error", "message": "Tài khoản đã bị vô hiệu hóa"}
@@ -297,13 +420,7 @@ async def login(request: LoginRequest, response: Response):
     otp = generate_otp()
     temp_session_id = str(uuid.uuid4())
     
-    # Delete any existing temp sessions for this user
-    delete_query = sqlalchemy.delete(temp_sessions_table).where(
-        temp_sessions_table.c.user_id == user.id
-    )
-    await database.execute(delete_query)
-    
-    # Create new temp session
+    # Create new temp session, replacing any existing ones for this user
     temp_session_data = {
         "id": temp_session_id,
         "user_id": user.id,
@@ -311,8 +428,8 @@ async def login(request: LoginRequest, response: Response):
         "otp_expires_at": get_otp_expiry()
     }
     
-    insert_query = temp_sessions_table.insert().values(temp_session_data)
-    await database.execute(insert_query)
+    await store.replace_temp_session(temp_session_data)
+    audit_log.record("login.password", http_request, user_id=user.id, identifier=request.identifier)
     # Set cookie
     response.set_cookie(
         key="temp_session_id",
@@ -340,11 +457,10 @@ async def verify_otp(request: VerifyOTPRequest, http_request: Request, response:
             detail={"status": "error", "message": "Phiên đăng nhập không hợp lệ"}
         )
     
+    store = get_storage()
+    
     # Get temp session
-    query = sqlalchemy.select(temp_sessions_table).where(
-        temp_sessions_table.c.id == temp_session_id
-    )
-    temp_session = await database.fetch_one(query)
+    temp_session = await store.get_temp_session(temp_session_id)
     
     if not temp_session:
         raise HTTPException(
@@ -354,16 +470,14 @@ async def verify_otp(request: VerifyOTPRequest, http_request: Request, response:
     
     # Check OTP and expiry
     if temp_session.otp_code != request.otp or is_expired(temp_session.otp_expires_at):
+        audit_log.record("login.otp", http_request, "failure", user_id=temp_session.user_id)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail={"status": "error", "message": "Mã OTP không hợp lệ hoặc đã hết hạn"}
         )
     
     # Get user info
-    user_query = sqlalchemy.select(users_table).where(
-        users_table.c.id == temp_session.user_id
-    )
-    user = await database.fetch_one(user_query)
+    user = await store.get_user(temp_session.user_id)
     
     if not user:
         raise HTTPException(
@@ -380,21 +494,14 @@ async def verify_otp(request: VerifyOTPRequest, http_request: Request, response:
         "expires_at": get_auth_session_expiry()
     }
     
-    # Delete any existing auth sessions for this user
-    delete_auth_query = sqlalchemy.delete(auth_sessions_table).where(
-        auth_sessions_table.c.user_id == user.id
-    )
-    await database.execute(delete_auth_query)
-    
-    # Insert new auth session
-    insert_auth_query = auth_sessions_table.insert().values(auth_session_data)
-    await database.execute(insert_auth_query)
+    # Replace any existing auth sessions for this user
+    await store.replace_auth_session(auth_session_data)
+    # The user's previous sessions are gone
+    session_cache.invalidate_user(user.id)
+    audit_log.record("login.otp", http_request, user_id=user.id)
     
     # Delete temp session
-    delete_temp_query = sqlalchemy.delete(temp_sessions_table).where(
-        temp_sessions_table.c.id == temp_session_id
-    )
-    await database.execute(delete_temp_query)
+    await store.delete_temp_session(temp_session_id)
     
     # Set auth cookie and clear temp cookie
     response.set_cookie(
@@ -407,6 +514,8 @@ async def verify_otp(request: VerifyOTPRequest, http_request: Request, response:
         max_age=86400  # 24 hours
     )
     response.delete_cookie(key="temp_session_id", path="/")
+    # The new session must be visible to the client's next request
+    pin_primary(response)
     
     return LoginSuccessResponse(
         status="success",
@@ -432,11 +541,10 @@ async def resend_otp(request: Request):
             detail={"status": "error", "message": "Phiên đăng nhập không hợp lệ"}
         )
     
+    store = get_storage()
+    
     # Get temp session with user info
-    query = sqlalchemy.select(temp_sessions_table).where(
-        temp_sessions_table.c.id == temp_session_id
-    )
-    temp_session = await database.fetch_one(query)
+    temp_session = await store.get_temp_session(temp_session_id)
     
     if not temp_session:
         raise HTTPException(
@@ -445,10 +553,7 @@ async def resend_otp(request: Request):
         )
     
     # Get user info
-    user_query = sqlalchemy.select(users_table).where(
-        users_table.c.id == temp_session.user_id
-    )
-    user = await database.fetch_one(user_query)
+    user = await store.get_user(temp_session.user_id)
     
     if not user:
         raise HTTPException(
@@ -461,13 +566,7 @@ async def resend_otp(request: Request):
     new_otp = generate_otp()
     
     # Update temp session with new OTP
-    update_query = sqlalchemy.update(temp_sessions_table).where(
-        temp_sessions_table.c.id == temp_session_id
-    ).values(
-        otp_code=new_otp,
-        otp_expires_at=get_otp_expiry()
-    )
-    await database.execute(update_query)
+    await store.update_temp_session_otp(temp_session_id, new_otp, get_otp_expiry())
     
     # Send new OTP to email (you can modify logic to determine email vs SMS)
     otp_sent = await send_otp_email(user.email, new_otp, "login")
@@ -489,11 +588,10 @@ async def logout(request: Request, response: Response):
     
     auth_session_id = get_auth_session_id(request)
     if auth_session_id:
-        # Delete auth session from database
-        delete_query = sqlalchemy.delete(auth_sessions_table).where(
-            auth_sessions_table.c.session_token == auth_session_id
-        )
-        await database.execute(delete_query)
+        # Delete auth session from storage
+        await get_storage().delete_auth_session(auth_session_id)
+        session_cache.invalidate(auth_session_id)
+        audit_log.record("logout", request)
     
     # Clear cookie
     response.delete_cookie(key="auth_session_id", path="/")
@@ -504,14 +602,13 @@ async def logout(request: Request, response: Response):
     )
 
 @router.delete("/admin/delete-user/{user_id}", response_model=AdminResponse)
-async def delete_user(user_id: str, http_request: Request, admin_user = Depends(require_admin)):
+async def delete_user(user_id: str, http_request: Request, response: Response, admin_user = Depends(require_admin)):
     """Delete a user (Admin only)"""
     
+    store = get_storage()
+    
     # Check if user exists
-    user_query = sqlalchemy.select(users_table).where(
-        users_table.c.id == user_id
-    )
-    user = await database.fetch_one(user_query)
+    user = await store.get_user(user_id)
     
     if not user:
         raise HTTPException(
@@ -519,11 +616,14 @@ async def delete_user(user_id: str, http_request: Request, admin_user = Depends(
             detail={"status": "error", "message": "Người dùng không tồn tại"}
         )
     
-    # Delete user
-    delete_query = sqlalchemy.delete(users_table).where(
-        users_table.c.id == user_id
-    )
-    await database.execute(delete_query)
+    # Delete user with their sessions
+    deleted = await store.delete_user(user_id)
+    session_cache.invalidate_user(user_id)
+    if deleted:
+        identifier_filter.remove(user.email, user.phone)
+        actor_id, actor_key = admin_actor(admin_user)
+        audit_log.record("admin.delete_user", http_request, user_id=user_id, actor_id=actor_id, identifier=actor_key)
+    pin_primary(response)
     
     return AdminResponse(
         status="success",
@@ -552,38 +652,154 @@ async def me(request: Request):
 
 # Admin endpoints
 @router.get("/admin/pending-users", response_model=List[UserListResponse])
-async def get_pending_users(request: Request, admin_user = Depends(require_admin)):
+async def get_pending_users(request: Request, response: Response, admin_user = Depends(require_admin)):
     """Get list of users pending approval (Admin only)"""
     
-    query = sqlalchemy.select(users_table).where(
-        users_table.c.is_approved == False
-    ).order_by(users_table.c.created_at.desc())
+    # Unchanged since the client's copy: one index probe and a 304
+    store = get_storage()
+    etag = users_etag(await store.users_version(request))
+    if etag_matches(request, etag):
+        return not_modified(etag)
     
-    users = await database.fetch_all(query)
+    async with admission.admin_queries.slot():
+        users = await store.list_users(pending_only=True, request=request)
+    response.headers["ETag"] = etag
     
-    return [
-        UserListResponse(
-            id=str(user.id),
-            name=user.name,
-            email=user.email,
-            phone=user.phone,
-            role=user.role,
-            is_approved=user.is_approved,
-            is_active=user.is_active,
-            created_at=user.created_at
+    return [user_list_item(user) for user in users]
+
+@router.get("/admin/users/changes", response_model=UserChangesResponse)
+async def get_user_changes(
+    request: Request,
+    since: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=MAX_CHANGES_LIMIT),
+    admin_user = Depends(require_admin)
+):
+    """Get users created/approved and deleted after version `since` (Admin only)"""
+    
+    async with admission.admin_queries.slot():
+        users, tombstones = await get_storage().user_changes(since, limit, request)
+    
+    # Merge both streams by version; each holds limit + 1 rows, so the first
+    # `limit` merged changes are complete
+    changes = sorted(
+        [(user.version, user, None) for user in users] +
+        [(tombstone.version, None, tombstone) for tombstone in tombstones],
+        key=lambda change: change[0]
+    )
+    page = changes[:limit]
+    
+    return UserChangesResponse(
+        version=page[-1][0] if page else since,
+        users=[
+            UserChangeResponse(**user_list_item(user).model_dump(), version=user.version)
+            for _, user, _ in page if user is not None
+        ],
+        deleted=[str(tombstone.user_id) for _, _, tombstone in page if tombstone is not None],
+        has_more=len(changes) > limit
+    )
+
+def event_stream_response(subscription, **kwargs) -> StreamingResponse:
+    if subscription is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={"status": "error", "message": "Quá nhiều kết nối, vui lòng thử lại sau"},
+            headers={"Retry-After": "5"}
         )
-        for user in users
-    ]
+    return StreamingResponse(
+        events.stream(subscription, **kwargs),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/admin/events")
+async def admin_events(admin_user = Depends(require_admin)):
+    """Stream registration and approval events (Admin only, server-sent events)"""
+    return event_stream_response(
+        events.broadcaster.subscribe(lambda event: event["type"] in events.USER_EVENT_TYPES)
+    )
+
+@router.get("/registration-status/events")
+async def registration_status_events(request: Request):
+    """Stream the caller's own approval status (server-sent events)"""
+    
+    user_id = get_registration_status_user_id(request)
+    if not user_id:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail={"status": "error", "message": "Chưa thấy đăng kí"}
+        )
+    
+    # Subscribe before reading the current status so no approval is missed
+    subscription = events.broadcaster.subscribe(
+        lambda event: event.get("user_id") == user_id and event["type"] == events.USER_APPROVED
+    )
+    if subscription is None:
+        return event_stream_response(None)
+    try:
+        user = await get_storage().get_user(user_id)
+    except Exception:
+        events.broadcaster.unsubscribe(subscription)
+        raise
+    if not user:
+        events.broadcaster.unsubscribe(subscription)
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail={"status": "error", "message": "Người dùng không tồn tại"}
+        )
+    
+    # Only the status is sent to the user, never other users' data
+    initial = [{
+        "type": events.USER_APPROVED if user.is_approved else "user.pending",
+        "user_id": user_id,
+        "version": user.version
+    }]
+    return event_stream_response(
+        subscription,
+        initial=initial,
+        close_after=lambda event: event["type"] == events.USER_APPROVED,
+        transform=lambda event: {key: event[key] for key in ("type", "user_id", "version") if key in event}
+    )
+
+@router.get("/admin/search-users", response_model=UserSearchResponse)
+async def search_users(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=100),
+    field: str = Query("all", pattern="^(all|name|email|phone)$"),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100),
+    admin_user = Depends(require_admin)
+):
+    """Search users by name, email or phone prefix/substring (Admin only)"""
+    
+    offset = (page - 1) * page_size
+    if offset + page_size > SEARCH_MAX_WINDOW:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"status": "error", "message": "Vui lòng thu hẹp từ khóa tìm kiếm"}
+        )
+    
+    fields = SEARCH_FIELDS if field == "all" else (field,)
+    async with admission.admin_queries.slot():
+        users = await get_storage().search_users(q, fields, page_size, offset, request)
+    
+    return UserSearchResponse(
+        items=[
+            user_list_item(user)
+            for user in users[:page_size]
+        ],
+        page=page,
+        page_size=page_size,
+        has_more=len(users) > page_size
+    )
 
 @router.post("/admin/approve-user", response_model=AdminResponse)
-async def approve_user(request: ApproveUserRequest, http_request: Request, admin_user = Depends(require_admin)):
+async def approve_user(request: ApproveUserRequest, http_request: Request, response: Response, admin_user = Depends(require_admin)):
     """Approve a user (Admin only)"""
     
+    store = get_storage()
+    
     # Check if user exists
-    user_query = sqlalchemy.select(users_table).where(
-        users_table.c.id == request.user_id
-    )
-    user = await database.fetch_one(user_query)
+    user = await store.get_user(request.user_id)
     
     if not user:
         raise HTTPException(
@@ -597,22 +813,26 @@ async def approve_user(request: ApproveUserRequest, http_request: Request, admin
             detail={"status": "error", "message": "Người dùng đã được phê duyệt"}
         )
     
-    # Approve user
-    update_query = users_table.update().where(
-        users_table.c.id == request.user_id
-    ).values(
-        is_approved=True,
-        approved_at=datetime.utcnow(),
-        approved_by=admin_user.id
-    )
-    await database.execute(update_query)
+    # Approve user (counted and announced only once under concurrent approvals)
+    actor_id, actor_key = admin_actor(admin_user)
+    approved = await store.approve_user(request.user_id, actor_id)
+    session_cache.invalidate_user(request.user_id)
+    pin_primary(response)
+    if not approved:
+        # A concurrent approval won; it sends the email
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"status": "error", "message": "Người dùng đã được phê duyệt"}
+        )
+    audit_log.record("admin.approve_user", http_request, user_id=request.user_id, actor_id=actor_id,
+                     identifier=actor_key)
     
-    # Send approval email
-    approval_sent = await send_otp_email(
-        user.email, 
-        "", 
-        "approval"
-    )
+    # Send approval email (best effort: the approval is already committed,
+    # so a shed SMTP slot must not turn it into a 503 the client retries)
+    try:
+        await send_otp_email(user.email, "", "approval")
+    except admission.Overloaded:
+        logger.warning("Approval email not sent: SMTP overloaded", extra={"fields": {"user_id": request.user_id}})
     
     return AdminResponse(
         status="success",
@@ -620,23 +840,125 @@ async def approve_user(request: ApproveUserRequest, http_request: Request, admin
         data={"user_id": request.user_id, "user_name": user.name}
     )
 
+@router.get("/admin/stats", response_model=AdminStatsResponse)
+async def get_admin_stats(request: Request, admin_user = Depends(require_admin)):
+    """Get pending/active user and live session counts (Admin only)"""
+    
+    values = await get_storage().admin_counts(request)
+    return AdminStatsResponse(**values, identifier_filter=identifier_filter.stats(), admission=admission.stats())
+
 @router.get("/admin/all-users", response_model=List[UserListResponse])
-async def get_all_users(request: Request, admin_user = Depends(require_admin)):
+async def get_all_users(request: Request, response: Response, admin_user = Depends(require_admin)):
     """Get list of all users (Admin only)"""
     
-    query = sqlalchemy.select(users_table).order_by(users_table.c.created_at.desc())
-    users = await database.fetch_all(query)
+    store = get_storage()
+    etag = users_etag(await store.users_version(request))
+    if etag_matches(request, etag):
+        return not_modified(etag)
     
-    return [
-        UserListResponse(
-            id=str(user.id),
-            name=user.name,
-            email=user.email,
-            phone=user.phone,
-            role=user.role,
-            is_approved=user.is_approved,
-            is_active=user.is_active,
-            created_at=user.created_at
+    async with admission.admin_queries.slot():
+        users = await store.list_users(request=request)
+    response.headers["ETag"] = etag
+    
+    return [user_list_item(user) for user in users]
+
+@router.post("/admin/api-keys", response_model=ApiKeyCreatedResponse, status_code=status.HTTP_201_CREATED)
+async def create_api_key(request: CreateApiKeyRequest, http_request: Request, admin_user = Depends(require_admin_user)):
+    """Issue an API key for a machine client (Admin only, the key is shown once)"""
+    
+    if not api_keys.role_allowed(request.role):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"status": "error", "message": "Không được tạo API key quyền admin (API_KEY_ADMIN_ENABLED)"}
+        )
+    store = get_storage()
+    key, prefix = api_keys.generate_api_key()
+    key_id = uuid.uuid4()
+    await store.create_api_key({
+        "id": key_id,
+        "name": request.name,
+        "prefix": prefix,
+        "key_hash": api_keys.hash_api_key(key),
+        "role": request.role,
+        "created_by": admin_user.id
+    })
+    audit_log.record("admin.create_api_key", http_request, actor_id=admin_user.id, identifier=prefix)
+    
+    return ApiKeyCreatedResponse(
+        status="success",
+        message="Đã tạo API key, hãy lưu lại vì key chỉ hiển thị một lần",
+        key=key,
+        api_key=api_key_item(await store.get_api_key_by_prefix(prefix))
+    )
+
+@router.get("/admin/api-keys", response_model=List[ApiKeyResponse])
+async def list_api_keys(admin_user = Depends(require_admin_user)):
+    """List API keys without their secrets (Admin only)"""
+    
+    return [api_key_item(row) for row in await get_storage().list_api_keys()]
+
+@router.delete("/admin/api-keys/{key_id}", response_model=AdminResponse)
+async def revoke_api_key(key_id: str, http_request: Request, response: Response, admin_user = Depends(require_admin_user)):
+    """Revoke an API key (Admin only, effective on every worker at once)"""
+    
+    revoked = await get_storage().revoke_api_key(key_id)
+    if not revoked:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail={"status": "error", "message": "API key không tồn tại hoặc đã bị thu hồi"}
         )
-        for user in users
-    ]
+    api_keys.api_key_cache.invalidate(revoked.prefix)
+    audit_log.record("admin.revoke_api_key", http_request, actor_id=admin_user.id, identifier=revoked.prefix)
+    pin_primary(response)
+    
+    return AdminResponse(
+        status="success",
+        message=f"Đã thu hồi API key {revoked.name}",
+        data={"key_id": key_id, "prefix": revoked.prefix}
+    )
+
+@router.post("/internal/introspect", response_model=IntrospectResponse)
+async def introspect_tokens(request: IntrospectRequest, http_request: Request, response: Response,
+                            _ = Depends(require_internal_caller)):
+    """Validate a batch of session tokens in one query (internal services)"""
+    
+    rows = await get_storage().introspect_sessions(list(set(request.tokens)), http_request)
+    sessions = {row.session_token: row for row in rows}
+    
+    results = []
+    max_age = INTROSPECT_MAX_AGE_SECONDS
+    now = datetime.utcnow()
+    for token in request.tokens:
+        session = sessions.get(token)
+        if session is None or is_expired(session.expires_at) or not session_usable(session):
+            results.append(TokenClaims(active=False))
+            continue
+        results.append(TokenClaims(
+            active=True,
+            user_id=str(session.user_id),
+            role=session.role,
+            expires_at=session.expires_at
+        ))
+        max_age = min(max_age, answer_max_age(session.expires_at, now))
+    
+    response.headers["Cache-Control"] = f"private, max-age={max_age}"
+    return IntrospectResponse(results=results)
+
+@router.get("/internal/forward-auth", status_code=status.HTTP_204_NO_CONTENT)
+async def forward_auth(request: Request, _ = Depends(require_internal_caller)):
+    """Check the auth_session_id cookie for nginx/Envoy auth_request (headers only)"""
+    
+    context = auth_context(request)
+    principal = await context.principal(request)
+    if principal is None or not session_usable(principal):
+        return Response(status_code=status.HTTP_401_UNAUTHORIZED, headers={"Cache-Control": "no-store"})
+    
+    max_age = answer_max_age(context.session_expires_at, datetime.utcnow())
+    return Response(
+        status_code=status.HTTP_204_NO_CONTENT,
+        headers={
+            "X-Auth-User-Id": str(principal.id),
+            "X-Auth-Role": principal.role,
+            "Cache-Control": f"private, max-age={max_age}"
+        }
+    )
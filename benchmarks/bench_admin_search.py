@@ -0,0 +1,88 @@
+"""
+Admin search latency benchmark on a seeded users table.
+
+Seeds --users synthetic users into a scratch database with seed_dataset.py
+(which applies the migrations, so the search indexes exist), then times the
+exact query that /auth/admin/search-users runs against a p95 budget.
+
+Usage (from the repository root):
+    BENCH_DATABASE_URL=postgresql://... python -m benchmarks.bench_admin_search [--users 1000000]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import asyncpg
+import databases
+import seed_dataset
+from auth_routes import SEARCH_FIELDS
+from storage_postgres import build_user_search_query
+
+BUDGET_MS = 10.0
+
+CASES = [
+    ("name prefix", "nguyen van", SEARCH_FIELDS),
+    ("name substring", "linh 12", SEARCH_FIELDS),
+    # Matches about 1 user in 8: every match is scored before the best are kept
+    ("common substring", "guyen", SEARCH_FIELDS),
+    ("email prefix", "user12345", ("email",)),
+    ("email substring", "345@yahoo", SEARCH_FIELDS),
+    ("phone prefix", "0900012", ("phone",)),
+    ("phone substring", "123456", SEARCH_FIELDS),
+    ("short term", "ng", SEARCH_FIELDS),
+    ("no match", "zzzqqq", SEARCH_FIELDS),
+]
+
+async def seed(url: str, target: int):
+    """(Re)seed the users table unless it already holds exactly `target` rows"""
+    conn = await asyncpg.connect(url)
+    try:
+        existing = await conn.fetchval("SELECT count(*) FROM users") if await conn.fetchval(
+            "SELECT to_regclass('users') IS NOT NULL"
+        ) else None
+    finally:
+        await conn.close()
+    if existing != target:
+        await seed_dataset.seed(url, target, 0, 0, 0, "bench", truncate=True)
+
+async def bench(url: str, iterations: int):
+    db = databases.Database(url)
+    await db.connect()
+    failed = False
+    try:
+        print(f"\n{'case':<16} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}  rows")
+        for label, term, fields in CASES:
+            query = build_user_search_query(term, fields, 20, 0)
+            rows = await db.fetch_all(query)  # first run prepares the statement
+            timings = []
+            for _ in range(iterations):
+                started = time.perf_counter()
+                await db.fetch_all(query)
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            p95 = timings[int(len(timings) * 0.95) - 1]
+            ok = p95 <= BUDGET_MS
+            failed |= not ok
+            print(f"{label:<16} {statistics.median(timings):8.2f} {p95:8.2f} {timings[-1]:8.2f}  "
+                  f"{len(rows):4d} {'✅' if ok else '❌'}")
+    finally:
+        await db.disconnect()
+    return not failed
+
+async def main():
+    parser = argparse.ArgumentParser(description="Admin search latency benchmark")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    url = os.environ.get("BENCH_DATABASE_URL")
+    if not url:
+        raise SystemExit("Set BENCH_DATABASE_URL to a scratch database (it will be seeded)")
+
+    await seed(url, args.users)
+    ok = await bench(url, args.iterations)
+    print(f"\nBudget p95 <= {BUDGET_MS} ms: {'met' if ok else 'NOT met'}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+"""
+API key verification vs bcrypt.
+
+Times api_keys.authenticate() on a warm cache (one HMAC-SHA256 and a
+constant-time compare) and on a cold one (plus an in-memory lookup by
+prefix), against verifying the same key as a bcrypt hash at BCRYPT_ROUNDS.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_api_keys [--keys 1000] [--lookups 100000]
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+import uuid
+from api_keys import ApiKeyCache, generate_api_key, hash_api_key
+import api_keys
+from storage_memory import MemoryStorage
+from utils import hash_password, verify_password
+
+async def time_authenticate(keys, lookups: int, cold: bool) -> list:
+    samples = []
+    for key in random.choices(keys, k=lookups):
+        if cold:
+            api_keys.api_key_cache.entries.clear()
+        started = time.perf_counter()
+        assert await api_keys.authenticate(key) is not None
+        samples.append((time.perf_counter() - started) * 1e6)
+    return samples
+
+async def run(args):
+    store = MemoryStorage()
+    api_keys.api_key_cache = ApiKeyCache(max_entries=args.keys)
+    keys = []
+    for _ in range(args.keys):
+        key, prefix = generate_api_key()
+        await store.create_api_key({
+            "id": uuid.uuid4(), "name": "bench", "prefix": prefix, "key_hash": hash_api_key(key), "role": "service"
+        })
+        keys.append(key)
+    api_keys.get_storage = lambda: store
+
+    results = [
+        ("hmac, cold cache", await time_authenticate(keys, args.lookups, cold=True)),
+        ("hmac, warm cache", await time_authenticate(keys, args.lookups, cold=False)),
+    ]
+    bcrypt_hash = hash_password(keys[0])
+    bcrypt_samples = []
+    for _ in range(5):
+        started = time.perf_counter()
+        verify_password(keys[0], bcrypt_hash)
+        bcrypt_samples.append((time.perf_counter() - started) * 1e6)
+    results.append(("bcrypt", bcrypt_samples))
+
+    print(f"{args.keys} keys, {args.lookups} lookups\n")
+    print(f"{'verification':<18} {'p50 µs':>10} {'p99 µs':>10}")
+    for label, samples in results:
+        samples.sort()
+        print(f"{label:<18} {statistics.median(samples):10.1f} {samples[int(len(samples) * 0.99) - 1]:10.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="API key verification cost")
+    parser.add_argument("--keys", type=int, default=1000)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Audit log throughput benchmark.
+
+Times the two halves of the pipeline separately:
+- record(): what a request handler pays per event (in-process, no I/O);
+- flush: batches written with one COPY each into the partitioned audit_log
+  table (only with BENCH_DATABASE_URL; the table is created by the migrations).
+
+Usage (from the repository root):
+    [BENCH_DATABASE_URL=postgresql://...] python -m benchmarks.bench_audit [--events 200000] [--batch 5000]
+"""
+import argparse
+import asyncio
+import os
+import time
+import uuid
+from datetime import datetime
+import asyncpg
+from audit import AuditLog
+from storage import AUDIT_COLUMNS
+from storage_postgres import maintain_audit_partitions
+from migrations import migrate
+
+class CopyStorage:
+    """Audit sink writing straight to a scratch database"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def write_audit_events(self, records: list):
+        await self.conn.copy_records_to_table("audit_log", records=records, columns=AUDIT_COLUMNS)
+
+class NullStorage:
+    async def write_audit_events(self, records: list):
+        pass
+
+def fill(log: AuditLog, events: int) -> float:
+    user_ids = [uuid.uuid4() for _ in range(1000)]
+    started = time.perf_counter()
+    for i in range(events):
+        log.record("login.password", None, "failure", user_id=user_ids[i % 1000],
+                   identifier=f"user{i % 1000}@example.com")
+    return time.perf_counter() - started
+
+async def main():
+    parser = argparse.ArgumentParser(description="Audit log throughput benchmark")
+    parser.add_argument("--events", type=int, default=200_000)
+    parser.add_argument("--batch", type=int, default=5000)
+    args = parser.parse_args()
+
+    log = AuditLog(capacity=args.events, batch_size=args.batch, enabled=True, store=NullStorage())
+    elapsed = fill(log, args.events)
+    print(f"record():  {elapsed / args.events * 1e6:8.2f} µs/event  {args.events / elapsed:12,.0f} events/s")
+
+    url = os.environ.get("BENCH_DATABASE_URL")
+    if not url:
+        print("Set BENCH_DATABASE_URL to a scratch database to time COPY flushes")
+        return
+
+    await migrate(database_url=url)
+    conn = await asyncpg.connect(url)
+    try:
+        await maintain_audit_partitions(conn, datetime.utcnow().date())
+        log.store = CopyStorage(conn)
+        started = time.perf_counter()
+        written = await log.flush()
+        elapsed = time.perf_counter() - started
+        print(f"COPY flush: {elapsed / (written / args.batch) * 1000:7.2f} ms/batch  "
+              f"{written / elapsed:12,.0f} events/s  (batch {args.batch})")
+    finally:
+        await conn.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
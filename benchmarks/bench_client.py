@@ -0,0 +1,77 @@
+"""
+Client SDK benchmark against a running server.
+
+Compares the old examples.py pattern (a new `requests` connection per call)
+with the pooled AuthClient (keep-alive, sequential) and AsyncAuthClient
+(keep-alive, --concurrency calls in flight). Hits /health by default, or
+/auth/me with --session-token (e.g. one printed by seed_dataset.py).
+
+Usage (from the repository root, with the API running):
+    STORAGE_BACKEND=memory uvicorn main:app --port 8000 &
+    python -m benchmarks.bench_client [--base-url http://localhost:8000] [--requests 2000] \
+        [--concurrency 20] [--session-token TOKEN]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import requests
+from auth_client import AsyncAuthClient, AuthClient
+
+def report(label: str, samples: list, elapsed: float):
+    samples.sort()
+    print(f"{label:<32} {len(samples) / elapsed:10.0f} {statistics.median(samples):9.2f} "
+          f"{samples[int(len(samples) * 0.99) - 1]:9.2f}")
+
+def timed(call) -> float:
+    started = time.perf_counter()
+    call()
+    return (time.perf_counter() - started) * 1000
+
+def per_call_connections(args) -> tuple:
+    url = args.base_url + ("/auth/me" if args.session_token else "/health")
+    cookies = {"auth_session_id": args.session_token} if args.session_token else None
+    started = time.perf_counter()
+    samples = [timed(lambda: requests.get(url, cookies=cookies).raise_for_status()) for _ in range(args.requests)]
+    return samples, time.perf_counter() - started
+
+def pooled_sync(args) -> tuple:
+    with AuthClient(args.base_url, session_token=args.session_token) as client:
+        call = client.me if args.session_token else client.health
+        started = time.perf_counter()
+        samples = [timed(call) for _ in range(args.requests)]
+        return samples, time.perf_counter() - started
+
+async def pooled_async(args) -> tuple:
+    async with AsyncAuthClient(args.base_url, session_token=args.session_token,
+                               max_keepalive_connections=args.concurrency) as client:
+        call = client.me if args.session_token else client.health
+        samples = []
+
+        async def worker(count: int):
+            for _ in range(count):
+                started = time.perf_counter()
+                await call()
+                samples.append((time.perf_counter() - started) * 1000)
+
+        per_worker = args.requests // args.concurrency
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(per_worker) for _ in range(args.concurrency)))
+        return samples, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description="Client SDK vs per-call connections")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--session-token", default=None)
+    args = parser.parse_args()
+
+    print(f"{args.requests} x GET {'/auth/me' if args.session_token else '/health'} on {args.base_url}\n")
+    print(f"{'client':<32} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9}")
+    report("requests, new connection/call", *per_call_connections(args))
+    report("AuthClient, pooled", *pooled_sync(args))
+    report(f"AsyncAuthClient, pooled x{args.concurrency}", *asyncio.run(pooled_async(args)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Log throughput benchmark: queued logging vs print() against a slow sink.
+
+Emits records from inside the event loop while a heartbeat task measures loop
+lag, and writes to a sink that sleeps on every write (a slow log pipe).
+
+Usage (from the repository root):
+    python -m benchmarks.bench_logging [--records 20000] [--sink-delay-ms 0.2]
+"""
+import argparse
+import asyncio
+import contextlib
+import statistics
+import time
+import logging_service
+
+class SlowSink:
+    """File-like object that blocks on every write, like a congested pipe"""
+
+    def __init__(self, delay_s: float):
+        self.delay_s = delay_s
+        self.lines = 0
+
+    def write(self, data):
+        time.sleep(self.delay_s)
+        self.lines += data.count("\n")
+
+    def flush(self):
+        pass
+
+async def measure(emit, records: int):
+    """Run `emit(i)` records times; return (elapsed_s, emit_latencies_us, max_lag_ms)"""
+    lags = []
+    running = True
+
+    async def heartbeat():
+        interval = 0.005
+        while running:
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            lags.append((time.perf_counter() - started - interval) * 1000)
+
+    monitor = asyncio.create_task(heartbeat())
+    latencies = []
+    started = time.perf_counter()
+    for i in range(records):
+        t0 = time.perf_counter()
+        emit(i)
+        latencies.append((time.perf_counter() - t0) * 1e6)
+        if i % 100 == 0:
+            await asyncio.sleep(0)  # let the heartbeat run, as request handlers would
+    elapsed = time.perf_counter() - started
+    running = False
+    await monitor
+    return elapsed, latencies, max(lags, default=0.0)
+
+def report(name, records, elapsed, latencies, max_lag_ms, extra=""):
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{name:>8}: {records / elapsed:10.0f} records/s  "
+          f"emit p50={statistics.median(latencies):7.1f} us  p99={p99:8.1f} us  "
+          f"max loop lag={max_lag_ms:7.1f} ms {extra}")
+
+async def main():
+    parser = argparse.ArgumentParser(description="Log throughput benchmark")
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--sink-delay-ms", type=float, default=0.2)
+    args = parser.parse_args()
+    delay = args.sink_delay_ms / 1000
+
+    sink = SlowSink(delay)
+    elapsed, latencies, lag = await measure(
+        lambda i: print(f"SMS to 0987654321: Mã OTP của bạn là: {i:06d}", file=sink), args.records
+    )
+    report("print", args.records, elapsed, latencies, lag)
+
+    sink = SlowSink(delay)
+    logging_service.setup_logging(stream=sink, queue_size=args.records)
+    logger = logging_service.get_logger("bench")
+    elapsed, latencies, lag = await measure(
+        lambda i: logger.info("SMS sent", extra={"fields": {"phone": "0987654321", "sms_text": f"{i:06d}"}}),
+        args.records,
+    )
+    drained_started = time.perf_counter()
+    with contextlib.suppress(Exception):
+        logging_service.shutdown_logging()
+    drain_s = time.perf_counter() - drained_started
+    report("queued", args.records, elapsed, latencies, lag,
+           f"(writer drained {sink.lines} lines in a further {drain_s:.2f} s, "
+           f"dropped={args.records - sink.lines})")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+"""
+CPU-only login benchmark on the in-memory storage backend.
+
+Drives /auth/login and /auth/verify-otp in-process (httpx ASGI transport, no
+sockets, no database), so the numbers are the cost of the HTTP stack plus
+bcrypt. Also times bcrypt alone, to show how much of a login it accounts for.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_login [--logins 200] [--concurrency 10]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+import httpx
+from main import app
+from storage import create_storage, set_storage
+from utils import hash_password, verify_password
+
+PASSWORD = "password123"
+
+async def seed(store, users: int):
+    password_hash = hash_password(PASSWORD)
+    for i in range(users):
+        user_id = str(uuid.uuid4())
+        await store.create_user({
+            "id": user_id,
+            "name": f"Bench User {i}",
+            "email": f"bench{i}@example.com",
+            "phone": f"09{i:08d}",
+            "password_hash": password_hash,
+            "role": "user",
+            "is_active": True,
+            "is_approved": False
+        })
+        await store.approve_user(user_id, None)
+    return password_hash
+
+async def login_once(store, i: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.perf_counter()
+        response = await client.post("/auth/login", json={
+            "identifier": f"bench{i}@example.com", "password": PASSWORD
+        })
+        response.raise_for_status()
+        temp_session = await store.get_temp_session(response.cookies["temp_session_id"])
+        response = await client.post("/auth/verify-otp", json={"otp": temp_session.otp_code})
+        response.raise_for_status()
+        return (time.perf_counter() - started) * 1000
+
+async def main(logins: int, concurrency: int):
+    store = create_storage("memory")
+    set_storage(store)
+    await store.connect()
+    password_hash = await seed(store, concurrency)
+
+    started = time.perf_counter()
+    for _ in range(10):
+        verify_password(PASSWORD, password_hash)
+    bcrypt_ms = (time.perf_counter() - started) * 100
+
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def worker(i):
+        async with semaphore:
+            latencies.append(await login_once(store, i % concurrency))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(logins)))
+    elapsed = time.perf_counter() - started
+    await store.disconnect()
+
+    latencies.sort()
+    print(f"bcrypt verify: {bcrypt_ms:8.1f} ms")
+    print(f"login + OTP:   {statistics.median(latencies):8.1f} ms p50  "
+          f"{latencies[int(len(latencies) * 0.99) - 1]:8.1f} ms p99  "
+          f"{logins / elapsed:8.1f} logins/s  (concurrency {concurrency})")
+    print(f"non-bcrypt share of a login: {max(statistics.median(latencies) - bcrypt_ms, 0):.1f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.concurrency))
@@ -0,0 +1,101 @@
+"""
+Shared session cache vs a per-process dict cache.
+
+Times hits of both on --sessions live sessions and compares memory: the
+shared table is paid once per host, a per-process cache once per worker
+(measured with tracemalloc for one worker, multiplied by --workers).
+
+Usage (from the repository root):
+    python -m benchmarks.bench_session_cache [--sessions 50000] [--workers 16] [--lookups 200000]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from session_cache import SharedSessionCache, RECORD_SIZE
+
+def make_sessions(count: int):
+    return [
+        (uuid.uuid4().hex + uuid.uuid4().hex, SimpleNamespace(
+            id=uuid.uuid4(), role="user", is_approved=True, is_active=True
+        ))
+        for _ in range(count)
+    ]
+
+class DictCache:
+    """What each worker would keep on its own"""
+
+    def __init__(self, ttl_seconds: float = 30):
+        self.entries = {}
+        self.ttl_seconds = ttl_seconds
+
+    def put(self, token, user, session_expires_at: datetime):
+        expires = min(session_expires_at.timestamp(), time.time() + self.ttl_seconds)
+        self.entries[token] = (expires, SimpleNamespace(
+            id=user.id, role=user.role, is_approved=user.is_approved, is_active=user.is_active
+        ))
+
+    def get(self, token):
+        entry = self.entries.get(token)
+        if entry is None or time.time() >= entry[0]:
+            return None
+        return entry[1]
+
+def time_lookups(cache, tokens, lookups: int) -> list:
+    samples = []
+    batch = 1000
+    for _ in range(lookups // batch):
+        chosen = random.choices(tokens, k=batch)
+        started = time.perf_counter()
+        for token in chosen:
+            cache.get(token)
+        samples.append((time.perf_counter() - started) / batch * 1e6)
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared vs per-process session cache")
+    parser.add_argument("--sessions", type=int, default=50_000)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--lookups", type=int, default=200_000)
+    args = parser.parse_args()
+
+    slots = 1 << max(args.sessions * 2 - 1, 1).bit_length()
+    sessions = make_sessions(args.sessions)
+    tokens = [token for token, _ in sessions]
+    expires = datetime.utcnow() + timedelta(hours=1)
+
+    with tempfile.TemporaryDirectory() as directory:
+        shared = SharedSessionCache(os.path.join(directory, "sessions"), slots=slots, ttl_seconds=3600)
+        for token, user in sessions:
+            shared.put(token, user, expires)
+        shared_us = time_lookups(shared, tokens, args.lookups)
+        shared_bytes = shared.size
+        shared.close()
+
+    tracemalloc.start()
+    local = DictCache(ttl_seconds=3600)
+    for token, user in sessions:
+        local.put(token, user, expires)
+    local_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    local_us = time_lookups(local, tokens, args.lookups)
+
+    print(f"{args.sessions} sessions, {args.workers} workers ({slots} slots x {RECORD_SIZE} B)\n")
+    print(f"{'cache':<14} {'p50 µs':>8} {'p99 µs':>8} {'memory/host':>14}")
+    for label, samples, memory in (
+        ("shared mmap", shared_us, shared_bytes),
+        ("per-process", local_us, local_bytes * args.workers),
+    ):
+        samples.sort()
+        print(f"{label:<14} {statistics.median(samples):8.2f} {samples[int(len(samples) * 0.99) - 1]:8.2f} "
+              f"{memory / 2**20:11.1f} MiB")
+    print(f"\nper-process: each session is also a cold miss in up to {args.workers} workers")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+In-memory pre-check for taken emails and phone numbers.
+
+A counting Bloom filter over every `users.email` and `users.phone`, built by a
+streaming scan at startup and kept current as users are created.
+`/auth/register` consults it first: a definite miss skips the duplicate
+lookup entirely (the unique constraints still confirm it when the user row is
+inserted), and only a possible hit goes to Postgres.
+
+The filter can only err towards "maybe present":
+- until the startup scan completes every lookup is a possible hit;
+- deleting a user never decrements counters. Another worker's registration
+  reaches this one through the events listener (events.py) and can be missed
+  (e.g. while the listener reconnects), so a worker cannot know whether it
+  counted the key; decrementing one it never added would zero counters that
+  other keys share and turn them into false negatives. Deleted identifiers
+  instead stay possible hits (costing a lookup) until the filter is rebuilt
+  from a fresh scan, every BLOOM_REBUILD_SECONDS when something was deleted;
+- counters saturate instead of wrapping, and saturated counters stay put.
+
+A missed registration only means the unique constraint rejects the duplicate
+when the user row is inserted (after the OTP round-trip), until the next
+rebuild. A worker also hears its own notifications, so a key may be counted
+twice, which is harmless.
+"""
+import asyncio
+import hashlib
+import math
+import time
+from config import BLOOM_EXPECTED_ITEMS, BLOOM_FALSE_POSITIVE_RATE, BLOOM_REBUILD_SECONDS
+from storage import get_storage
+from logging_service import get_logger
+
+logger = get_logger(__name__)
+
+MAX_COUNT = 255
+
+class CountingBloomFilter:
+    """Bloom filter with one-byte counters, so keys can also be removed"""
+
+    def __init__(self, expected_items: int = BLOOM_EXPECTED_ITEMS,
+                 false_positive_rate: float = BLOOM_FALSE_POSITIVE_RATE):
+        expected_items = max(expected_items, 1)
+        # Standard sizing: m = -n ln p / (ln 2)^2, k = m/n ln 2
+        self.size = max(int(-expected_items * math.log(false_positive_rate) / math.log(2) ** 2), 8)
+        self.hash_count = max(round(self.size / expected_items * math.log(2)), 1)
+        self.counters = bytearray(self.size)
+        self.items = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            if self.counters[position] < MAX_COUNT:
+                self.counters[position] += 1
+        self.items += 1
+
+    def remove(self, key: str):
+        for position in self._positions(key):
+            if 0 < self.counters[position] < MAX_COUNT:
+                self.counters[position] -= 1
+        self.items = max(self.items - 1, 0)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.counters[position] for position in self._positions(key))
+
+    def estimated_false_positive_rate(self) -> float:
+        return (1 - math.exp(-self.hash_count * self.items / self.size)) ** self.hash_count
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self.counters)
+
+def email_key(email: str) -> str:
+    return f"email:{email}"
+
+def phone_key(phone: str) -> str:
+    return f"phone:{phone}"
+
+class IdentifierFilter:
+    """Which emails/phones may already belong to a user"""
+
+    def __init__(self, expected_items: int = BLOOM_EXPECTED_ITEMS,
+                 false_positive_rate: float = BLOOM_FALSE_POSITIVE_RATE):
+        # Each user contributes two keys
+        self.expected_keys = expected_items * 2
+        self.false_positive_rate = false_positive_rate
+        self.filter = CountingBloomFilter(self.expected_keys, false_positive_rate)
+        # Filled by a build in progress, then swapped in
+        self.building = None
+        self.ready = False
+        self.build_seconds = None
+        # Deleted users still counted (see the module docstring)
+        self.stale = 0
+        self.checks = 0
+        self.skipped = 0
+        self.false_positives = 0
+
+    def add(self, email: str, phone: str):
+        for bloom in (self.filter, self.building):
+            if bloom is not None:
+                bloom.add(email_key(email))
+                bloom.add(phone_key(phone))
+
+    def remove(self, email: str, phone: str):
+        """A user was deleted: forgotten at the next rebuild, never decremented"""
+        self.stale += 1
+
+    def might_contain(self, email: str, phone: str) -> bool:
+        """False only if neither identifier can belong to an existing user"""
+        self.checks += 1
+        if self.ready and email_key(email) not in self.filter and phone_key(phone) not in self.filter:
+            self.skipped += 1
+            return False
+        return True
+
+    def record_false_positive(self):
+        """The database found no user for a possible hit"""
+        if self.ready:
+            self.false_positives += 1
+
+    def observe(self, event: dict):
+        """Track registrations committed by other workers (events.py observer)"""
+        if event.get("type") == "user.registered" and event.get("email") and event.get("phone"):
+            self.add(event["email"], event["phone"])
+
+    async def build(self, store=None, yield_every: int = 1000):
+        """Load every existing email/phone with a streaming scan of the storage backend
+
+        The scan fills a new filter (registrations during it are added to both)
+        that then replaces the current one, dropping deleted users' keys.
+        """
+        started = time.perf_counter()
+        store = store or get_storage()
+        stale = self.stale
+        self.building = fresh = CountingBloomFilter(self.expected_keys, self.false_positive_rate)
+        rows = 0
+        try:
+            async for email, phone in store.iter_identifiers():
+                fresh.add(email_key(email))
+                fresh.add(phone_key(phone))
+                rows += 1
+                if rows % yield_every == 0:
+                    # Hashing is CPU work; let requests run between batches
+                    await asyncio.sleep(0)
+        finally:
+            self.building = None
+        self.filter = fresh
+        # Deletions during the scan may not be reflected in it
+        self.stale -= stale
+        self.build_seconds = round(time.perf_counter() - started, 3)
+        self.ready = True
+        logger.info("Identifier filter built", extra={"fields": {"users": rows, **self.stats()}})
+
+    def stats(self) -> dict:
+        # Negatives are the skipped checks plus the hits the database refuted
+        negatives = self.skipped + self.false_positives
+        return {
+            "ready": self.ready,
+            "keys": self.filter.items,
+            "stale_users": self.stale,
+            "memory_bytes": self.filter.memory_bytes,
+            "hash_count": self.filter.hash_count,
+            "estimated_false_positive_rate": round(self.filter.estimated_false_positive_rate(), 6),
+            "observed_false_positive_rate": round(self.false_positives / negatives, 6) if negatives else 0.0,
+            "checks": self.checks,
+            "queries_skipped": self.skipped,
+            "build_seconds": self.build_seconds,
+        }
+
+identifier_filter = IdentifierFilter()
+
+async def build_identifier_filter(rebuild_seconds: float = BLOOM_REBUILD_SECONDS):
+    """Background task: build at startup (registration falls back to the
+    database until done), then rebuild every interval if users were deleted"""
+    while True:
+        if not identifier_filter.ready or identifier_filter.stale:
+            try:
+                await identifier_filter.build()
+            except Exception as e:
+                logger.error("Identifier filter build failed", extra={"fields": {"error": str(e)}})
+        await asyncio.sleep(rebuild_seconds)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Measure bcrypt hash time on this machine and suggest BCRYPT_ROUNDS.
+
+Picks the highest cost whose median hash time stays within the latency
+budget (PASSWORD_HASH_TARGET_MS, or --target-ms). If even MIN_ROUNDS is over
+budget it says so and exits non-zero instead of suggesting a cost.
+
+Usage:
+    python calibrate_bcrypt.py [--target-ms 250] [--samples 5]
+"""
+import argparse
+import statistics
+import time
+from typing import Optional
+from config import PASSWORD_HASH_TARGET_MS, BCRYPT_ROUNDS
+from utils import build_pwd_context
+
+MIN_ROUNDS = 10
+MAX_ROUNDS = 16
+
+def measure(rounds: int, samples: int) -> float:
+    """Median hash time in milliseconds for the given cost"""
+    context = build_pwd_context(rounds)
+    context.hash("warm-up")  # load the backend outside the measurement
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        context.hash("calibration-password")
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+def calibrate(target_ms: float, samples: int) -> Optional[int]:
+    """Return the highest cost whose median hash time fits the target (None if none does)"""
+    chosen = None
+    for rounds in range(MIN_ROUNDS, MAX_ROUNDS + 1):
+        elapsed = measure(rounds, samples)
+        fits = elapsed <= target_ms
+        print(f"  rounds={rounds:2d}  median={elapsed:8.1f} ms  {'✅' if fits else '❌'}")
+        if not fits:
+            break
+        chosen = rounds
+    return chosen
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate bcrypt cost for this machine")
+    parser.add_argument("--target-ms", type=float, default=PASSWORD_HASH_TARGET_MS,
+                        help="Latency budget for one hash (default: PASSWORD_HASH_TARGET_MS)")
+    parser.add_argument("--samples", type=int, default=5, help="Hashes measured per cost")
+    args = parser.parse_args()
+
+    print(f"🔧 Calibrating bcrypt for a {args.target_ms:.0f} ms budget...")
+    rounds = calibrate(args.target_ms, args.samples)
+    print(f"\nCurrent BCRYPT_ROUNDS={BCRYPT_ROUNDS}")
+    if rounds is None:
+        raise SystemExit(
+            f"❌ Even BCRYPT_ROUNDS={MIN_ROUNDS} exceeds the {args.target_ms:.0f} ms budget on this machine. "
+            f"Lower costs are not offered; raise the budget or give hashing more CPU."
+        )
+    print(f"Suggested setting for .env:\nBCRYPT_ROUNDS={rounds}")
+    if rounds != BCRYPT_ROUNDS:
+        print("Existing hashes are upgraded transparently on the next successful login.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Circuit breaker for calls to an unreliable dependency (used for SMTP).
+
+- closed: calls go through; `failure_threshold` consecutive failures open it.
+- open: calls fail fast with CircuitOpen for `cooldown_seconds`.
+- half-open: up to `half_open_max_calls` probe calls go through; a success
+  closes the circuit, a failure opens it for another cooldown.
+"""
+import time
+from contextlib import asynccontextmanager
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Numeric encoding for metrics
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+class CircuitOpen(Exception):
+    """Call rejected without trying because the circuit is open"""
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a half-open probe phase"""
+
+    def __init__(self, name: str, failure_threshold: int, cooldown_seconds: float,
+                 half_open_max_calls: int = 1, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = max(failure_threshold, 1)
+        self.cooldown_seconds = cooldown_seconds
+        self.half_open_max_calls = max(half_open_max_calls, 1)
+        self.clock = clock
+        self._state = CLOSED
+        self.opened_at = 0.0
+        self.consecutive_failures = 0
+        self.probes_in_flight = 0
+        self.times_opened = 0
+        self.rejected = 0
+        self.failures = 0
+        self.successes = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and self.clock() - self.opened_at >= self.cooldown_seconds:
+            self._state = HALF_OPEN
+            self.probes_in_flight = 0
+        return self._state
+
+    def _open(self):
+        self._state = OPEN
+        self.opened_at = self.clock()
+        self.times_opened += 1
+
+    def check(self):
+        """Raise CircuitOpen while open, without taking a half-open probe slot"""
+        if self.state == OPEN:
+            self.rejected += 1
+            raise CircuitOpen(self.name)
+
+    def before_call(self):
+        """Raise CircuitOpen unless a call may go through now"""
+        state = self.state
+        if state == OPEN or (state == HALF_OPEN and self.probes_in_flight >= self.half_open_max_calls):
+            self.rejected += 1
+            raise CircuitOpen(self.name)
+        if state == HALF_OPEN:
+            self.probes_in_flight += 1
+
+    def record_success(self):
+        self.successes += 1
+        self.consecutive_failures = 0
+        if self._state == HALF_OPEN:
+            self._state = CLOSED
+            self.probes_in_flight = 0
+
+    def record_failure(self):
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self._state == HALF_OPEN or (
+            self._state == CLOSED and self.consecutive_failures >= self.failure_threshold
+        ):
+            self._open()
+
+    @asynccontextmanager
+    async def call(self):
+        """Guard one call: any exception in the block counts as a failure"""
+        self.before_call()
+        try:
+            yield
+        except Exception:
+            self.record_failure()
+            raise
+        except BaseException:
+            # Cancelled by our caller: says nothing about the dependency
+            if self._state == HALF_OPEN and self.probes_in_flight:
+                self.probes_in_flight -= 1
+            raise
+        else:
+            self.record_success()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+            "failures": self.failures,
+            "successes": self.successes,
+        }
@@ -1,14 +1,44 @@
+import hashlib
+import hmac
 import os
 from decouple import config
 
 # Database
 DATABASE_URL = config("DATABASE_URL")
+DB_POOL_MIN_SIZE = config("DB_POOL_MIN_SIZE", default=5, cast=int)
+DB_POOL_MAX_SIZE = config("DB_POOL_MAX_SIZE", default=20, cast=int)
+# Optional read replica; read-only queries go there when set
+DATABASE_REPLICA_URL = config("DATABASE_REPLICA_URL", default="")
+# After a write, the client reads from the primary for this long (read-your-writes)
+REPLICA_PIN_SECONDS = config("REPLICA_PIN_SECONDS", default=5, cast=int)
+# After a replica error, reads stay on the primary for this long
+REPLICA_RETRY_SECONDS = config("REPLICA_RETRY_SECONDS", default=30, cast=int)
+
+# Storage backend: "postgres" or "memory" (single process, see storage.py)
+STORAGE_BACKEND = config("STORAGE_BACKEND", default="postgres")
+# In-memory backend: temp registrations/sessions expire this long after their last write
+MEMORY_TEMP_TTL_SECONDS = config("MEMORY_TEMP_TTL_SECONDS", default=900, cast=int)
+MEMORY_SWEEP_SECONDS = config("MEMORY_SWEEP_SECONDS", default=60, cast=int)
+
+# Migrations
+MIGRATION_LOCK_TIMEOUT_MS = config("MIGRATION_LOCK_TIMEOUT_MS", default=2000, cast=int)
+MIGRATION_LOCK_RETRIES = config("MIGRATION_LOCK_RETRIES", default=5, cast=int)
+MIGRATION_BATCH_SIZE = config("MIGRATION_BATCH_SIZE", default=1000, cast=int)
+MIGRATION_BATCH_PAUSE_MS = config("MIGRATION_BATCH_PAUSE_MS", default=50, cast=int)
 
 # JWT
 SECRET_KEY = config("SECRET_KEY")
 ALGORITHM = config("ALGORITHM", default="HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = config("ACCESS_TOKEN_EXPIRE_MINUTES", default=1440, cast=int)
 
+def derived_secret(label: str) -> str:
+    """Per-purpose secret derived from SECRET_KEY, so no two features share a key"""
+    return hmac.new(SECRET_KEY.encode(), f"derived-secret:{label}".encode(), hashlib.sha256).hexdigest()
+
+# Password hashing (calibrate with: python calibrate_bcrypt.py)
+BCRYPT_ROUNDS = config("BCRYPT_ROUNDS", default=12, cast=int)
+PASSWORD_HASH_TARGET_MS = config("PASSWORD_HASH_TARGET_MS", default=250, cast=int)
+
 # Email
 SMTP_SERVER = config("SMTP_SERVER")
 SMTP_PORT = config("SMTP_PORT", cast=int)
@@ -16,14 +46,120 @@ SMTP_USERNAME = config("SMTP_USERNAME")
 SMTP_PASSWORD = config("SMTP_PASSWORD")
 FROM_EMAIL = config("FROM_EMAIL")
 ADMIN_EMAIL = config("ADMIN_EMAIL", default="admin@example.com")
+# Per-operation (connect, each SMTP command) and whole-delivery timeouts
+SMTP_CONNECT_TIMEOUT_SECONDS = config("SMTP_CONNECT_TIMEOUT_SECONDS", default=5, cast=float)
+SMTP_SEND_TIMEOUT_SECONDS = config("SMTP_SEND_TIMEOUT_SECONDS", default=15, cast=float)
+# Circuit breaker: open after this many consecutive failures, probe again after the cooldown
+SMTP_FAILURE_THRESHOLD = config("SMTP_FAILURE_THRESHOLD", default=5, cast=int)
+SMTP_COOLDOWN_SECONDS = config("SMTP_COOLDOWN_SECONDS", default=30, cast=float)
+SMTP_HALF_OPEN_PROBES = config("SMTP_HALF_OPEN_PROBES", default=1, cast=int)
 
 # OTP
 OTP_EXPIRE_MINUTES = config("OTP_EXPIRE_MINUTES", default=5, cast=int)
 SESSION_EXPIRE_MINUTES = config("SESSION_EXPIRE_MINUTES", default=5, cast=int)
 AUTH_SESSION_EXPIRE_MINUTES = config("AUTH_SESSION_EXPIRE_MINUTES", default=1440, cast=int)
 
+# Admin search: deepest result (page * page_size) a search may page to
+SEARCH_MAX_WINDOW = config("SEARCH_MAX_WINDOW", default=1000, cast=int)
+
+# Admin dashboard counters (see counters.py)
+COUNTER_SHARDS = config("COUNTER_SHARDS", default=8, cast=int)
+COUNTER_RECONCILE_SECONDS = config("COUNTER_RECONCILE_SECONDS", default=300, cast=int)
+
+# Server-sent events (see events.py)
+SSE_HEARTBEAT_SECONDS = config("SSE_HEARTBEAT_SECONDS", default=15, cast=int)
+SSE_QUEUE_SIZE = config("SSE_QUEUE_SIZE", default=100, cast=int)
+SSE_MAX_SUBSCRIBERS = config("SSE_MAX_SUBSCRIBERS", default=10000, cast=int)
+
+# Duplicate email/phone pre-check for /auth/register (see bloom.py)
+BLOOM_EXPECTED_ITEMS = config("BLOOM_EXPECTED_ITEMS", default=1000000, cast=int)
+BLOOM_FALSE_POSITIVE_RATE = config("BLOOM_FALSE_POSITIVE_RATE", default=0.01, cast=float)
+# Rebuild from a fresh scan this often (only after deletions) to forget deleted users
+BLOOM_REBUILD_SECONDS = config("BLOOM_REBUILD_SECONDS", default=3600, cast=float)
+
+# Admission control (see admission.py): concurrency limit, wait queue size and
+# longest queue wait before a request is shed with 503
+ADMISSION_MAX_REQUESTS = config("ADMISSION_MAX_REQUESTS", default=200, cast=int)
+ADMISSION_QUEUE_SIZE = config("ADMISSION_QUEUE_SIZE", default=500, cast=int)
+ADMISSION_MAX_QUEUE_MS = config("ADMISSION_MAX_QUEUE_MS", default=2000, cast=int)
+HASHING_CONCURRENCY = config("HASHING_CONCURRENCY", default=os.cpu_count() or 1, cast=int)
+HASHING_QUEUE_SIZE = config("HASHING_QUEUE_SIZE", default=64, cast=int)
+HASHING_MAX_QUEUE_MS = config("HASHING_MAX_QUEUE_MS", default=2000, cast=int)
+ADMIN_QUERY_CONCURRENCY = config("ADMIN_QUERY_CONCURRENCY", default=max(DB_POOL_MAX_SIZE // 4, 1), cast=int)
+ADMIN_QUERY_QUEUE_SIZE = config("ADMIN_QUERY_QUEUE_SIZE", default=32, cast=int)
+ADMIN_QUERY_MAX_QUEUE_MS = config("ADMIN_QUERY_MAX_QUEUE_MS", default=3000, cast=int)
+SMTP_CONCURRENCY = config("SMTP_CONCURRENCY", default=5, cast=int)
+SMTP_QUEUE_SIZE = config("SMTP_QUEUE_SIZE", default=100, cast=int)
+SMTP_MAX_QUEUE_MS = config("SMTP_MAX_QUEUE_MS", default=5000, cast=int)
+
+# Session cache shared by the worker processes (see session_cache.py)
+SESSION_CACHE_ENABLED = config("SESSION_CACHE_ENABLED", default=False, cast=bool)
+SESSION_CACHE_PATH = config("SESSION_CACHE_PATH", default="/dev/shm/auth_session_cache")
+# Power of two; 64 bytes each (65536 slots = 4 MiB)
+SESSION_CACHE_SLOTS = config("SESSION_CACHE_SLOTS", default=65536, cast=int)
+SESSION_CACHE_TTL_SECONDS = config("SESSION_CACHE_TTL_SECONDS", default=30, cast=float)
+
+# Token introspection for internal services and reverse proxies
+# (/auth/internal/*; disabled while INTERNAL_API_TOKEN is empty)
+INTERNAL_API_TOKEN = config("INTERNAL_API_TOKEN", default="")
+INTROSPECT_MAX_TOKENS = config("INTROSPECT_MAX_TOKENS", default=100, cast=int)
+# Longest time a caller may cache an answer (a logout shows up after at most this)
+INTROSPECT_MAX_AGE_SECONDS = config("INTROSPECT_MAX_AGE_SECONDS", default=30, cast=int)
+
+# API keys for machine clients (see api_keys.py); the pepper keys the stored
+# hashes (changing it invalidates every issued key)
+API_KEY_PEPPER = config("API_KEY_PEPPER", default=derived_secret("api-key-pepper"))
+# Keys with role "admin" pass require_admin and never expire: off unless needed
+API_KEY_ADMIN_ENABLED = config("API_KEY_ADMIN_ENABLED", default=False, cast=bool)
+API_KEY_CACHE_SIZE = config("API_KEY_CACHE_SIZE", default=10000, cast=int)
+API_KEY_CACHE_TTL_SECONDS = config("API_KEY_CACHE_TTL_SECONDS", default=60, cast=float)
+
+# Authentication audit log (see audit.py)
+AUDIT_ENABLED = config("AUDIT_ENABLED", default=True, cast=bool)
+AUDIT_BUFFER_SIZE = config("AUDIT_BUFFER_SIZE", default=100000, cast=int)
+AUDIT_BATCH_SIZE = config("AUDIT_BATCH_SIZE", default=5000, cast=int)
+AUDIT_FLUSH_MS = config("AUDIT_FLUSH_MS", default=500, cast=int)
+# What a full buffer loses: "drop_newest" or "drop_oldest"
+AUDIT_OVERFLOW = config("AUDIT_OVERFLOW", default="drop_newest")
+AUDIT_RETENTION_DAYS = config("AUDIT_RETENTION_DAYS", default=90, cast=int)
+AUDIT_PARTITIONS_AHEAD = config("AUDIT_PARTITIONS_AHEAD", default=3, cast=int)
+AUDIT_MAINTENANCE_SECONDS = config("AUDIT_MAINTENANCE_SECONDS", default=3600, cast=int)
+
+# Event-loop stall detector (see loop_monitor.py): heartbeat period and the
+# lag past which the loop thread's stack is captured
+LOOP_MONITOR_ENABLED = config("LOOP_MONITOR_ENABLED", default=True, cast=bool)
+LOOP_MONITOR_INTERVAL_MS = config("LOOP_MONITOR_INTERVAL_MS", default=100, cast=int)
+LOOP_STALL_THRESHOLD_MS = config("LOOP_STALL_THRESHOLD_MS", default=100, cast=int)
+# Distinct blocking sites remembered (least frequent forgotten first)
+LOOP_STALL_SITES = config("LOOP_STALL_SITES", default=50, cast=int)
+
+# On-demand memory profiling (see memory_diagnostics.py); tracemalloc stays off
+# until started through /auth/admin/diagnostics/memory/tracemalloc/start
+MEMORY_TRACEMALLOC_FRAMES = config("MEMORY_TRACEMALLOC_FRAMES", default=1, cast=int)
+MEMORY_SNAPSHOTS_KEPT = config("MEMORY_SNAPSHOTS_KEPT", default=4, cast=int)
+
+# Traffic capture for replay tests (see traffic_capture.py); "{pid}" in the
+# path gives each worker its own file
+TRAFFIC_CAPTURE_ENABLED = config("TRAFFIC_CAPTURE_ENABLED", default=False, cast=bool)
+TRAFFIC_CAPTURE_PATH = config("TRAFFIC_CAPTURE_PATH", default="traffic-{pid}.jsonl")
+TRAFFIC_CAPTURE_SAMPLE_RATE = config("TRAFFIC_CAPTURE_SAMPLE_RATE", default=1.0, cast=float)
+TRAFFIC_CAPTURE_BUFFER_SIZE = config("TRAFFIC_CAPTURE_BUFFER_SIZE", default=100000, cast=int)
+TRAFFIC_CAPTURE_FLUSH_MS = config("TRAFFIC_CAPTURE_FLUSH_MS", default=1000, cast=int)
+# Keys the anonymised cookie identities (same key = same identity in every worker's file)
+TRAFFIC_CAPTURE_KEY = config("TRAFFIC_CAPTURE_KEY", default=derived_secret("traffic-capture"))
+
+# Warm-up (see warmup.py); /ready reports 503 until it completes
+WARMUP_ENABLED = config("WARMUP_ENABLED", default=True, cast=bool)
+WARMUP_SMTP = config("WARMUP_SMTP", default=False, cast=bool)
+
+# Logging (see logging_service.py)
+LOG_LEVEL = config("LOG_LEVEL", default="INFO")
+LOG_QUEUE_SIZE = config("LOG_QUEUE_SIZE", default=10000, cast=int)
+
 # Environment
 ENVIRONMENT = config("ENVIRONMENT", default="development")
+# Serve /docs and /openapi.json (off in production unless enabled explicitly)
+OPENAPI_ENABLED = config("OPENAPI_ENABLED", default=ENVIRONMENT != "production", cast=bool)
 
 FRONTEND_ORIGINS = [
     o.strip() for o in config(
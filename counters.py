@@ -0,0 +1,127 @@
+"""
+Incrementally maintained admin dashboard counters.
+
+Handlers adjust the counters in the same transaction as the write they count,
+so reads are a handful of primary-key rows instead of COUNT(*) over large
+tables. Each counter is striped over COUNTER_SHARDS rows so concurrent logins
+do not queue on a single row lock; reads sum the stripes.
+
+A periodic reconciliation job recomputes the true values in a REPEATABLE READ
+snapshot, compares them with the counters as of the same snapshot, and applies
+the difference as a delta. No lock is held on the counters while counting.
+
+live_sessions is only decremented when a session row is deleted (logout,
+login replacing it, user deletion); sessions that simply expire stay counted
+until the next reconciliation. So in PostgreSQL the value can overstate live
+sessions by those that expired in the last COUNTER_RECONCILE_SECONDS. The
+memory backend purges expired sessions before counting and is exact.
+"""
+import asyncio
+import random
+import sqlalchemy
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from config import COUNTER_SHARDS, COUNTER_RECONCILE_SECONDS
+from database import database, admin_counters_table, users_table, auth_sessions_table
+from logging_service import get_logger
+
+logger = get_logger(__name__)
+
+PENDING_USERS = "pending_users"
+ACTIVE_USERS = "active_users"
+LIVE_SESSIONS = "live_sessions"
+COUNTER_NAMES = (PENDING_USERS, ACTIVE_USERS, LIVE_SESSIONS)
+
+# Arbitrary constant so only one worker reconciles at a time
+RECONCILE_LOCK_KEY = 7_260_033
+
+def user_counter_deltas(user, sign: int = 1) -> dict:
+    """Counter deltas for adding (sign=1) or removing (sign=-1) a user row"""
+    if not user.is_approved:
+        return {PENDING_USERS: sign}
+    if user.is_active:
+        return {ACTIVE_USERS: sign}
+    return {}
+
+async def adjust(deltas: dict, db=database):
+    """Add deltas to the counters (call inside the write's transaction)"""
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    value = sqlalchemy.case(
+        *[(admin_counters_table.c.name == name, delta) for name, delta in deltas.items()],
+        else_=0
+    )
+    query = admin_counters_table.update().where(
+        sqlalchemy.and_(
+            admin_counters_table.c.name.in_(list(deltas)),
+            admin_counters_table.c.shard == random.randrange(COUNTER_SHARDS)
+        )
+    ).values(value=admin_counters_table.c.value + value)
+    await db.execute(query)
+
+async def read_counters(db=database) -> dict:
+    """Current counter values: one row per stripe, independent of table sizes"""
+    query = sqlalchemy.select(
+        admin_counters_table.c.name,
+        sqlalchemy.func.sum(admin_counters_table.c.value).label("value")
+    ).group_by(admin_counters_table.c.name)
+    rows = await db.fetch_all(query)
+    values = {name: 0 for name in COUNTER_NAMES}
+    values.update({row.name: int(row.value) for row in rows})
+    return values
+
+def true_counts_query():
+    """Recompute the counters from the source tables"""
+    return sqlalchemy.select(
+        sqlalchemy.select(sqlalchemy.func.count()).select_from(users_table).where(
+            users_table.c.is_approved == False
+        ).scalar_subquery().label(PENDING_USERS),
+        sqlalchemy.select(sqlalchemy.func.count()).select_from(users_table).where(
+            sqlalchemy.and_(users_table.c.is_approved == True, users_table.c.is_active == True)
+        ).scalar_subquery().label(ACTIVE_USERS),
+        sqlalchemy.select(sqlalchemy.func.count()).select_from(auth_sessions_table).where(
+            auth_sessions_table.c.expires_at > sqlalchemy.func.timezone("utc", sqlalchemy.func.now())
+        ).scalar_subquery().label(LIVE_SESSIONS),
+    )
+
+async def ensure_rows(db=database):
+    """Create any missing counter stripes (value 0; reconciliation fills them)"""
+    rows = [
+        {"name": name, "shard": shard, "value": 0}
+        for name in COUNTER_NAMES for shard in range(COUNTER_SHARDS)
+    ]
+    query = pg_insert(admin_counters_table).values(rows).on_conflict_do_nothing()
+    await db.execute(query)
+
+async def reconcile(db=database) -> dict:
+    """Correct counter drift; returns the applied deltas (empty if skipped)"""
+    await ensure_rows(db)
+    async with db.connection() as connection:
+        # Session-level lock, held until the correction is committed
+        lock = sqlalchemy.select(sqlalchemy.func.pg_try_advisory_lock(RECONCILE_LOCK_KEY))
+        if not await connection.fetch_val(lock):
+            return {}
+        try:
+            async with connection.transaction(isolation="repeatable_read"):
+                # Both reads see the same snapshot, so their difference is
+                # exact even while handlers keep adjusting the counters
+                counters = await read_counters(connection)
+                actual = await connection.fetch_one(true_counts_query())
+            drift = {name: actual[name] - counters[name] for name in COUNTER_NAMES}
+            # Applied in a new transaction; increments after the snapshot are kept
+            await adjust(drift, connection)
+        finally:
+            unlock = sqlalchemy.select(sqlalchemy.func.pg_advisory_unlock(RECONCILE_LOCK_KEY))
+            await connection.fetch_val(unlock)
+    if any(drift.values()):
+        logger.info("Counters reconciled", extra={"fields": {"drift": drift}})
+    return drift
+
+async def run_reconciliation(interval: float = COUNTER_RECONCILE_SECONDS):
+    """Background task: reconcile once at startup and then every interval"""
+    while True:
+        try:
+            await reconcile()
+        except Exception as e:
+            logger.error("Counter reconciliation failed", extra={"fields": {"error": str(e)}})
+        await asyncio.sleep(interval)
@@ -1,13 +1,33 @@
+import time
 import databases
 import sqlalchemy
-from config import DATABASE_URL
+from config import (
+    DATABASE_URL, DATABASE_REPLICA_URL, REPLICA_PIN_SECONDS, REPLICA_RETRY_SECONDS,
+    DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE
+)
+from logging_service import get_logger
+
+logger = get_logger(__name__)
 
 # Database connection
-database = databases.Database(DATABASE_URL)
+database = databases.Database(DATABASE_URL, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE)
+
+# Optional read replica
+replica_database = (
+    databases.Database(DATABASE_REPLICA_URL, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE)
+    if DATABASE_REPLICA_URL else None
+)
+
+# Cookie telling us the client wrote recently and must read from the primary.
+# A cookie (not process memory) so the pin holds across uvicorn workers.
+PRIMARY_PIN_COOKIE = "read_primary"
 
 # SQLAlchemy metadata
 metadata = sqlalchemy.MetaData()
 
+# Change version for delta sync: bumped on every user insert/approve/delete
+users_change_seq = sqlalchemy.Sequence("users_change_seq", metadata=metadata)
+
 # Define tables
 users_table = sqlalchemy.Table(
     "users",
@@ -23,7 +43,39 @@ users_table = sqlalchemy.Table(
     sqlalchemy.Column("is_approved", sqlalchemy.Boolean, default=False),
     sqlalchemy.Column("approved_at", sqlalchemy.DateTime, nullable=True),
     sqlalchemy.Column("approved_by", sqlalchemy.dialects.postgresql.UUID(as_uuid=True), nullable=True),
-    sqlalchemy.Column("created_at", sqlalchemy.DateTime, server_default=sqlalchemy.text("CURRENT_TIMESTAMP"))
+    sqlalchemy.Column("created_at", sqlalchemy.DateTime, server_default=sqlalchemy.text("CURRENT_TIMESTAMP")),
+    sqlalchemy.Column("version", sqlalchemy.BigInteger, nullable=False,
+                     server_default=sqlalchemy.text("nextval('users_change_seq')"))
+)
+sqlalchemy.Index("idx_users_version", users_table.c.version)
+
+# Admin search indexes: text_pattern_ops btrees serve prefix matches
+# (LIKE 'abc%'), pg_trgm GIN indexes serve substring matches (ILIKE '%abc%')
+sqlalchemy.event.listen(
+    metadata, "before_create", sqlalchemy.DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+)
+sqlalchemy.Index(
+    "idx_users_name_prefix", sqlalchemy.func.lower(users_table.c.name).label("name_lower"),
+    postgresql_ops={"name_lower": "text_pattern_ops"}
+)
+sqlalchemy.Index(
+    "idx_users_email_prefix", sqlalchemy.func.lower(users_table.c.email).label("email_lower"),
+    postgresql_ops={"email_lower": "text_pattern_ops"}
+)
+sqlalchemy.Index(
+    "idx_users_phone_prefix", users_table.c.phone,
+    postgresql_ops={"phone": "text_pattern_ops"}
+)
+for _column in ("name", "email", "phone"):
+    sqlalchemy.Index(
+        f"idx_users_{_column}_trgm", users_table.c[_column],
+        postgresql_using="gin", postgresql_ops={_column: "gin_trgm_ops"}
+    )
+
+# Pending-users listing (newest first)
+sqlalchemy.Index(
+    "idx_users_pending_created_at", users_table.c.created_at.desc(),
+    postgresql_where=users_table.c.is_approved == False
 )
 
 temp_registrations_table = sqlalchemy.Table(
@@ -64,17 +116,151 @@ auth_sessions_table = sqlalchemy.Table(
     sqlalchemy.Column("created_at", sqlalchemy.DateTime, server_default=sqlalchemy.text("CURRENT_TIMESTAMP"))
 )
 
-# Create engine for table creation
-engine = sqlalchemy.create_engine(DATABASE_URL)
+# Deleted users, so delta-sync clients learn about deletions
+user_tombstones_table = sqlalchemy.Table(
+    "user_tombstones",
+    metadata,
+    sqlalchemy.Column("user_id", sqlalchemy.dialects.postgresql.UUID(as_uuid=True), primary_key=True),
+    sqlalchemy.Column("version", sqlalchemy.BigInteger, nullable=False),
+    sqlalchemy.Column("deleted_at", sqlalchemy.DateTime, server_default=sqlalchemy.text("CURRENT_TIMESTAMP"))
+)
+sqlalchemy.Index("idx_user_tombstones_version", user_tombstones_table.c.version)
+
+# Striped counters for the admin dashboard (see counters.py)
+admin_counters_table = sqlalchemy.Table(
+    "admin_counters",
+    metadata,
+    sqlalchemy.Column("name", sqlalchemy.String(50), primary_key=True),
+    sqlalchemy.Column("shard", sqlalchemy.SmallInteger, primary_key=True),
+    sqlalchemy.Column("value", sqlalchemy.BigInteger, nullable=False, server_default=sqlalchemy.text("0"))
+)
+
+# API keys for machine clients (see api_keys.py)
+api_keys_table = sqlalchemy.Table(
+    "api_keys",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.dialects.postgresql.UUID(as_uuid=True), primary_key=True),
+    sqlalchemy.Column("name", sqlalchemy.String(100), nullable=False),
+    sqlalchemy.Column("prefix", sqlalchemy.String(32), unique=True, nullable=False),
+    sqlalchemy.Column("key_hash", sqlalchemy.String(64), nullable=False),
+    sqlalchemy.Column("role", sqlalchemy.String(50), nullable=False, server_default="service"),
+    sqlalchemy.Column("created_by", sqlalchemy.dialects.postgresql.UUID(as_uuid=True), nullable=True),
+    sqlalchemy.Column("created_at", sqlalchemy.DateTime, server_default=sqlalchemy.text("CURRENT_TIMESTAMP")),
+    sqlalchemy.Column("revoked_at", sqlalchemy.DateTime, nullable=True)
+)
+
+# Append-only audit log, range-partitioned by day (see audit.py)
+audit_log_table = sqlalchemy.Table(
+    "audit_log",
+    metadata,
+    sqlalchemy.Column("occurred_at", sqlalchemy.DateTime, nullable=False),
+    sqlalchemy.Column("event", sqlalchemy.String(50), nullable=False),
+    sqlalchemy.Column("outcome", sqlalchemy.String(20), nullable=False),
+    sqlalchemy.Column("user_id", sqlalchemy.dialects.postgresql.UUID(as_uuid=True), nullable=True),
+    sqlalchemy.Column("actor_id", sqlalchemy.dialects.postgresql.UUID(as_uuid=True), nullable=True),
+    sqlalchemy.Column("identifier", sqlalchemy.String(255), nullable=True),
+    sqlalchemy.Column("ip", sqlalchemy.String(45), nullable=True),
+    sqlalchemy.Column("request_id", sqlalchemy.String(64), nullable=True),
+    postgresql_partition_by="RANGE (occurred_at)"
+)
+
+sqlalchemy.Index("idx_audit_log_user_id", audit_log_table.c.user_id, audit_log_table.c.occurred_at)
+
+class ReadRouter:
+    """Route read-only queries to the replica, falling back to the primary.
+
+    Reads use the primary when no replica is configured, when the request is
+    pinned after a write, or while the replica is marked unhealthy.
+    """
+
+    def __init__(self, primary, replica=None, retry_seconds: float = REPLICA_RETRY_SECONDS,
+                 clock=time.monotonic):
+        self.primary = primary
+        self.replica = replica
+        self.retry_seconds = retry_seconds
+        self.clock = clock
+        self.unhealthy_until = 0.0
+
+    @property
+    def replica_healthy(self) -> bool:
+        return self.replica is not None and self.clock() >= self.unhealthy_until
+
+    def mark_unhealthy(self):
+        self.unhealthy_until = self.clock() + self.retry_seconds
+
+    def database_for(self, request=None):
+        """Pick the database that should serve a read for this request"""
+        if not self.replica_healthy or is_pinned_to_primary(request):
+            return self.primary
+        return self.replica
+
+    async def _read(self, method: str, query, request=None):
+        db = self.database_for(request)
+        if db is self.primary:
+            return await getattr(db, method)(query)
+        try:
+            if not db.is_connected:
+                await db.connect()
+            return await getattr(db, method)(query)
+        except Exception as e:
+            logger.warning("Replica read failed, using primary", extra={"fields": {"error": str(e)}})
+            self.mark_unhealthy()
+            return await getattr(self.primary, method)(query)
+
+    async def fetch_one(self, query, request=None):
+        return await self._read("fetch_one", query, request)
+
+    async def fetch_all(self, query, request=None):
+        return await self._read("fetch_all", query, request)
+
+def is_pinned_to_primary(request) -> bool:
+    """Check if the request carries a recent-write pin"""
+    return request is not None and request.cookies.get(PRIMARY_PIN_COOKIE) is not None
+
+def pin_primary(response, seconds: int = REPLICA_PIN_SECONDS):
+    """Make the client's next reads go to the primary (read-your-writes)"""
+    if replica_database is None:
+        return
+    response.set_cookie(
+        key=PRIMARY_PIN_COOKIE,
+        value="1",
+        httponly=True,
+        secure=False,
+        samesite="lax",
+        path="/",
+        max_age=seconds
+    )
+
+read_router = ReadRouter(database, replica_database)
+
+# Sync engine for table creation, created on first use so importing this
+# module does not load psycopg2 and the dialect machinery
+_engine = None
+
+def get_engine():
+    """Get (and lazily create) the sync SQLAlchemy engine"""
+    global _engine
+    if _engine is None:
+        _engine = sqlalchemy.create_engine(DATABASE_URL)
+    return _engine
 
 async def connect_db():
     """Connect to database"""
     await database.connect()
+    if replica_database is not None:
+        try:
+            await replica_database.connect()
+        except Exception as e:
+            # Serve everything from the primary until the replica recovers
+            logger.warning("Replica unavailable at startup", extra={"fields": {"error": str(e)}})
+            read_router.mark_unhealthy()
 
 async def disconnect_db():
     """Disconnect from database"""
     await database.disconnect()
+    if replica_database is not None and replica_database.is_connected:
+        await replica_database.disconnect()
 
 def create_tables():
     """Create all tables"""
-    metadata.create_all(engine)
+    metadata.create_all(get_engine())
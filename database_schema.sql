@@ -1,5 +1,11 @@
 -- Create database schema for authentication system
 
+-- Trigram matching for admin user search
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Change version for delta sync (bumped on user insert/approve/delete)
+CREATE SEQUENCE users_change_seq;
+
 -- Users table
 CREATE TABLE users (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
@@ -12,7 +18,15 @@ CREATE TABLE users (
     is_approved BOOLEAN DEFAULT FALSE,
     approved_at TIMESTAMP NULL,
     approved_by UUID NULL,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    version BIGINT NOT NULL DEFAULT nextval('users_change_seq')
+);
+
+-- Deleted users, so delta-sync clients learn about deletions
+CREATE TABLE user_tombstones (
+    user_id UUID PRIMARY KEY,
+    version BIGINT NOT NULL,
+    deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
 -- Temporary registrations table for OTP verification
@@ -45,9 +59,54 @@ CREATE TABLE auth_sessions (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Admin dashboard counters, striped over several rows per counter
+-- (maintained by the API, corrected periodically by counters.reconcile)
+CREATE TABLE admin_counters (
+    name VARCHAR(50) NOT NULL,
+    shard SMALLINT NOT NULL,
+    value BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (name, shard)
+);
+
+-- API keys for machine clients: public prefix + HMAC of the key (see api_keys.py)
+CREATE TABLE api_keys (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    name VARCHAR(100) NOT NULL,
+    prefix VARCHAR(32) UNIQUE NOT NULL,
+    key_hash VARCHAR(64) NOT NULL,
+    role VARCHAR(50) NOT NULL DEFAULT 'service',
+    created_by UUID NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    revoked_at TIMESTAMP NULL
+);
+
+-- Append-only authentication audit log, partitioned by day
+-- (partitions audit_log_pYYYYMMDD are created and dropped by the API, see audit.py)
+CREATE TABLE audit_log (
+    occurred_at TIMESTAMP NOT NULL,
+    event VARCHAR(50) NOT NULL,
+    outcome VARCHAR(20) NOT NULL,
+    user_id UUID,
+    actor_id UUID,
+    identifier VARCHAR(255),
+    ip VARCHAR(45),
+    request_id VARCHAR(64)
+) PARTITION BY RANGE (occurred_at);
+
 -- Indexes for better performance
 CREATE INDEX idx_users_email ON users(email);
 CREATE INDEX idx_users_phone ON users(phone);
+CREATE INDEX idx_users_version ON users(version);
+CREATE INDEX idx_users_pending_created_at ON users(created_at DESC) WHERE is_approved = FALSE;
+CREATE INDEX idx_user_tombstones_version ON user_tombstones(version);
+CREATE INDEX idx_audit_log_user_id ON audit_log(user_id, occurred_at);
+-- Admin search: prefix (text_pattern_ops) and substring (trigram) matches
+CREATE INDEX idx_users_name_prefix ON users (lower(name) text_pattern_ops);
+CREATE INDEX idx_users_email_prefix ON users (lower(email) text_pattern_ops);
+CREATE INDEX idx_users_phone_prefix ON users (phone text_pattern_ops);
+CREATE INDEX idx_users_name_trgm ON users USING gin (name gin_trgm_ops);
+CREATE INDEX idx_users_email_trgm ON users USING gin (email gin_trgm_ops);
+CREATE INDEX idx_users_phone_trgm ON users USING gin (phone gin_trgm_ops);
 CREATE INDEX idx_temp_registrations_email ON temp_registrations(email);
 CREATE INDEX idx_temp_registrations_phone ON temp_registrations(phone);
 CREATE INDEX idx_temp_sessions_user_id ON temp_sessions(user_id);
@@ -0,0 +1,93 @@
+"""
+Admin-only runtime diagnostics of the worker that answers the request.
+
+Each worker process keeps its own numbers; repeat a call (or scrape
+/metrics of every worker) to see them all.
+"""
+import os
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Query, status
+from auth_routes import require_admin
+from loop_monitor import loop_monitor
+from memory_diagnostics import memory_diagnostics, MemoryDiagnosticsBusy, UnknownSnapshot, NotTracing
+
+router = APIRouter(prefix="/auth/admin/diagnostics", tags=["Diagnostics"])
+
+GROUP_BY_PATTERN = "^(lineno|filename|traceback)$"
+
+# Helper to map profiler errors to responses
+async def profiled(call):
+    try:
+        return await call
+    except MemoryDiagnosticsBusy:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"status": "error", "message": "Một phép đo bộ nhớ khác đang chạy, vui lòng thử lại sau"}
+        )
+    except UnknownSnapshot:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail={"status": "error", "message": "Snapshot không tồn tại"}
+        )
+    except NotTracing:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"status": "error", "message": "tracemalloc chưa được bật"}
+        )
+
+@router.get("/loop")
+async def event_loop_stalls(top: int = Query(10, ge=1, le=100), admin_user = Depends(require_admin)):
+    """Event-loop lag and the most frequent blocking call sites (Admin only)"""
+    return {"pid": os.getpid(), **loop_monitor.stats(top)}
+
+@router.get("/memory")
+async def memory_overview(admin_user = Depends(require_admin)):
+    """RSS of each worker, GC generation stats and tracemalloc status (Admin only)"""
+    return memory_diagnostics.overview()
+
+@router.get("/memory/objects")
+async def memory_objects(top: int = Query(30, ge=1, le=500), admin_user = Depends(require_admin)):
+    """Live objects by type, most numerous first (Admin only, walks the whole heap)"""
+    return {"pid": os.getpid(), "objects": await profiled(memory_diagnostics.object_counts(top))}
+
+@router.post("/memory/tracemalloc/start")
+async def start_tracemalloc(frames: Optional[int] = Query(None, ge=1, le=64), admin_user = Depends(require_admin)):
+    """Start tracing allocations in this worker (Admin only)"""
+    return memory_diagnostics.start(frames)
+
+@router.post("/memory/tracemalloc/stop")
+async def stop_tracemalloc(admin_user = Depends(require_admin)):
+    """Stop tracing and free the traces; kept snapshots stay diffable (Admin only)"""
+    return memory_diagnostics.stop()
+
+@router.post("/memory/snapshots", status_code=status.HTTP_201_CREATED)
+async def take_memory_snapshot(admin_user = Depends(require_admin)):
+    """Take a tracemalloc snapshot (Admin only)"""
+    return {"pid": os.getpid(), **await profiled(memory_diagnostics.take_snapshot())}
+
+@router.delete("/memory/snapshots")
+async def clear_memory_snapshots(admin_user = Depends(require_admin)):
+    """Drop all kept snapshots (Admin only)"""
+    memory_diagnostics.clear()
+    return memory_diagnostics.status()
+
+@router.get("/memory/snapshots/{snapshot_id}")
+async def memory_snapshot_top(
+    snapshot_id: int,
+    group_by: str = Query("lineno", pattern=GROUP_BY_PATTERN),
+    top: int = Query(20, ge=1, le=500),
+    admin_user = Depends(require_admin)
+):
+    """Largest allocation sites of a snapshot (Admin only)"""
+    return {"stats": await profiled(memory_diagnostics.top(snapshot_id, group_by, top))}
+
+@router.get("/memory/diff")
+async def memory_snapshot_diff(
+    base: int,
+    target: int,
+    group_by: str = Query("lineno", pattern=GROUP_BY_PATTERN),
+    top: int = Query(20, ge=1, le=500),
+    admin_user = Depends(require_admin)
+):
+    """What grew between two snapshots, by allocation site (Admin only)"""
+    return {"stats": await profiled(memory_diagnostics.diff(base, target, group_by, top))}
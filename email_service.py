@@ -1,8 +1,60 @@
 import aiosmtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from config import SMTP_SERVER, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD, FROM_EMAIL, ADMIN_EMAIL
+from config import (
+    SMTP_SERVER, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD, FROM_EMAIL, ADMIN_EMAIL,
+    SMTP_CONNECT_TIMEOUT_SECONDS, SMTP_SEND_TIMEOUT_SECONDS,
+    SMTP_FAILURE_THRESHOLD, SMTP_COOLDOWN_SECONDS, SMTP_HALF_OPEN_PROBES
+)
 import asyncio
+from logging_service import get_logger
+from circuit_breaker import CircuitBreaker, CircuitOpen, STATE_VALUES
+import admission
+import metrics
+
+logger = get_logger(__name__)
+
+# Fails fast while the SMTP server is down instead of waiting out timeouts
+smtp_breaker = CircuitBreaker(
+    "smtp", SMTP_FAILURE_THRESHOLD, SMTP_COOLDOWN_SECONDS, SMTP_HALF_OPEN_PROBES
+)
+metrics.gauge(
+    "smtp_circuit_state", "SMTP circuit breaker state (0 closed, 1 half-open, 2 open)",
+    lambda: STATE_VALUES[smtp_breaker.state]
+)
+metrics.gauge(
+    "smtp_circuit_events", "SMTP deliveries by outcome since start",
+    lambda: {
+        (("outcome", "success"),): smtp_breaker.successes,
+        (("outcome", "failure"),): smtp_breaker.failures,
+        (("outcome", "rejected"),): smtp_breaker.rejected,
+    }
+)
+
+async def deliver(message, hostname: str = SMTP_SERVER, port: int = SMTP_PORT, start_tls: bool = True,
+                  username=SMTP_USERNAME, password=SMTP_PASSWORD, breaker: CircuitBreaker = smtp_breaker,
+                  connect_timeout: float = SMTP_CONNECT_TIMEOUT_SECONDS,
+                  send_timeout: float = SMTP_SEND_TIMEOUT_SECONDS):
+    """Send a message through the circuit breaker, with bounded waits.
+
+    Raises CircuitOpen without connecting while the circuit is open.
+    """
+    # Checked before queueing for an SMTP slot, so an open circuit costs nothing
+    breaker.check()
+    async with admission.smtp.slot():
+        async with breaker.call():
+            await asyncio.wait_for(
+                aiosmtplib.send(
+                    message,
+                    hostname=hostname,
+                    port=port,
+                    start_tls=start_tls,
+                    username=username,
+                    password=password,
+                    timeout=connect_timeout,
+                ),
+                timeout=send_timeout
+            )
 
 async def send_email(to_email: str, subject: str, body: str) -> bool:
     """Send email using SMTP"""
@@ -16,18 +68,17 @@ async def send_email(to_email: str, subject: str, body: str) -> bool:
         # Add body to email
         message.attach(MIMEText(body, "plain"))
         
-        # Send email
-        await aiosmtplib.send(
-            message,
-            hostname=SMTP_SERVER,
-            port=SMTP_PORT,
-            start_tls=True,
-            username=SMTP_USERNAME,
-            password=SMTP_PASSWORD,
-        )
+        # Send email (Overloaded propagates as a 503; callers that already
+        # changed state must catch it)
+        await deliver(message)
         return True
+    except admission.Overloaded:
+        raise
+    except CircuitOpen:
+        logger.warning("Email not sent: SMTP circuit open", extra={"fields": {"to_email": to_email, "subject": subject}})
+        return False
     except Exception as e:
-        print(f"Error sending email: {e}")
+        logger.error("Error sending email", extra={"fields": {"to_email": to_email, "subject": subject, "error": str(e)}})
         return False
 
 async def send_otp_email(to_email: str, otp: str, purpose: str = "verification") -> bool:
@@ -78,7 +129,7 @@ async def send_otp_email(to_email: str, otp: str, purpose: str = "verification")
 # Mock SMS function (you would integrate with a real SMS service)
 async def send_sms(phone: str, message: str) -> bool:
     """Send SMS (mock implementation)"""
-    print(f"SMS to {phone}: {message}")
+    logger.info("SMS sent", extra={"fields": {"phone": phone, "sms_text": message}})
     # In production, integrate with SMS service like Twilio, AWS SNS, etc.
     return True
 
@@ -112,5 +163,5 @@ async def send_admin_notification(user_data: dict) -> bool:
     try:
         return await send_email(ADMIN_EMAIL, subject, body)
     except Exception as e:
-        print(f"Error sending admin notification: {e}")
+        logger.error("Error sending admin notification", extra={"fields": {"error": str(e)}})
         return False
@@ -0,0 +1,158 @@
+"""
+Registration/approval event stream (server-sent events).
+
+Handlers call `notify()` inside their write transaction; Postgres delivers the
+NOTIFY on commit to every worker's listener connection, which fans the event
+out to that worker's SSE subscribers through an in-process broadcaster.
+
+Each subscriber owns a small bounded queue. A subscriber that falls that far
+behind is disconnected (the browser's EventSource reconnects) instead of
+letting its backlog grow without limit. Idle connections cost one parked
+coroutine and a heartbeat comment every SSE_HEARTBEAT_SECONDS.
+"""
+import asyncio
+import json
+from typing import Callable, Optional
+import asyncpg
+import sqlalchemy
+from config import DATABASE_URL, SSE_HEARTBEAT_SECONDS, SSE_QUEUE_SIZE, SSE_MAX_SUBSCRIBERS
+from database import database
+from logging_service import get_logger
+
+logger = get_logger(__name__)
+
+CHANNEL = "user_events"
+
+USER_REGISTERED = "user.registered"
+USER_APPROVED = "user.approved"
+USER_EVENT_TYPES = (USER_REGISTERED, USER_APPROVED)
+# Not streamed to browsers; consumed by api_keys.api_key_cache
+API_KEY_REVOKED = "api_key.revoked"
+
+class Subscription:
+    """One SSE client: a bounded queue plus an event filter"""
+
+    def __init__(self, accepts: Callable[[dict], bool], queue_size: int):
+        self.accepts = accepts
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+class Broadcaster:
+    """In-process fan-out of events to SSE subscribers"""
+
+    def __init__(self, queue_size: int = SSE_QUEUE_SIZE, max_subscribers: int = SSE_MAX_SUBSCRIBERS):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.subscribers = set()
+        # Synchronous in-process consumers (e.g. bloom.identifier_filter)
+        self.observers = []
+
+    def subscribe(self, accepts: Callable[[dict], bool] = lambda event: True) -> Optional[Subscription]:
+        """Register a subscriber; None when the worker is at capacity"""
+        if len(self.subscribers) >= self.max_subscribers:
+            return None
+        subscription = Subscription(accepts, self.queue_size)
+        self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self.subscribers.discard(subscription)
+
+    def publish(self, event: dict):
+        for observer in self.observers:
+            observer(event)
+        for subscription in list(self.subscribers):
+            if subscription.overflowed or not subscription.accepts(event):
+                continue
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Backpressure: drop the slow consumer, never buffer unboundedly
+                subscription.overflowed = True
+                self.unsubscribe(subscription)
+
+broadcaster = Broadcaster()
+
+async def notify(event_type: str, db=database, **data):
+    """Queue an event; Postgres delivers it when the transaction commits"""
+    payload = json.dumps({"type": event_type, **data}, default=str)
+    await db.execute(sqlalchemy.select(sqlalchemy.func.pg_notify(CHANNEL, payload)))
+
+def format_sse(event: dict) -> str:
+    lines = [f"event: {event['type']}"]
+    if event.get("version") is not None:
+        lines.append(f"id: {event['version']}")
+    lines.append(f"data: {json.dumps(event, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+async def stream(subscription: Subscription, initial=(), close_after: Callable[[dict], bool] = lambda event: False,
+                 transform: Callable[[dict], dict] = lambda event: event, heartbeat: float = SSE_HEARTBEAT_SECONDS):
+    """Yield SSE frames for a subscription until the client goes away"""
+    try:
+        yield "retry: 5000\n\n"
+        for event in initial:
+            yield format_sse(transform(event))
+            if close_after(event):
+                return
+        while not subscription.overflowed:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield format_sse(transform(event))
+            if close_after(event):
+                return
+    finally:
+        broadcaster.unsubscribe(subscription)
+
+class NotificationListener:
+    """Dedicated LISTEN connection feeding the broadcaster, reconnecting on loss"""
+
+    def __init__(self, url: str = DATABASE_URL, channel: str = CHANNEL):
+        self.url = url
+        self.channel = channel
+        self.task: Optional[asyncio.Task] = None
+
+    def _on_notification(self, connection, pid, channel, payload):
+        try:
+            broadcaster.publish(json.loads(payload))
+        except ValueError:
+            logger.warning("Ignoring malformed notification", extra={"fields": {"channel": channel}})
+
+    async def _run(self):
+        delay = 1
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self.url)
+                lost = asyncio.Event()
+                connection.add_termination_listener(lambda conn: lost.set())
+                await connection.add_listener(self.channel, self._on_notification)
+                delay = 1
+                await lost.wait()
+                logger.warning("Notification listener connection lost")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Notification listener failed", extra={"fields": {"error": str(e)}})
+            finally:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+listener = NotificationListener()
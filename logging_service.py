@@ -0,0 +1,192 @@
+"""
+Structured, non-blocking logging.
+
+Records are put on an in-process queue by the caller (never blocking: when the
+queue is full the record is dropped and counted) and formatted as JSON lines
+and written to stdout by a background thread. Each record carries the
+request id of the request that produced it, and OTP codes, phone numbers
+and email addresses are redacted before anything is written.
+
+shutdown_logging() flushes and detaches the writer; setup_logging() (called
+again on app startup) re-attaches it, so a process that runs several app
+lifespans (tests, reloads) keeps its logs.
+
+Usage:
+    from logging_service import get_logger
+    logger = get_logger(__name__)
+    logger.info("SMS sent", extra={"fields": {"phone": phone}})
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import re
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from config import LOG_LEVEL, LOG_QUEUE_SIZE
+
+# Correlation id of the request being handled (set by RequestIdMiddleware)
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+REDACTED = "[REDACTED]"
+SENSITIVE_FIELDS = {"otp", "otp_code", "password", "password_hash", "session_token", "auth_session_id", "sms_text"}
+PHONE_FIELDS = {"phone", "to_phone"}
+EMAIL_FIELDS = {"email", "to_email"}
+PHONE_PATTERN = re.compile(r"(?<!\d)\d{7,8}(\d{3})(?!\d)")  # 10-11 digits, keep the last 3
+OTP_PATTERN = re.compile(r"(?<!\d)\d{6}(?!\d)")
+EMAIL_PATTERN = re.compile(r"([\w.%+-])[\w.%+-]*@([\w-]+(?:\.[\w-]+)+)")  # keep the first character and domain
+
+def mask_phone(phone: str) -> str:
+    phone = str(phone)
+    return "*" * max(len(phone) - 3, 0) + phone[-3:]
+
+def mask_email(email: str) -> str:
+    local, _, domain = str(email).rpartition("@")
+    return f"{local[:1]}***@{domain}" if local else "***"
+
+def redact_text(text: str) -> str:
+    """Mask email addresses, phone numbers and OTP-like codes inside free text"""
+    text = EMAIL_PATTERN.sub(r"\1***@\2", text)
+    text = PHONE_PATTERN.sub(lambda m: "*" * (len(m.group(0)) - 3) + m.group(1), text)
+    return OTP_PATTERN.sub("******", text)
+
+def redact_fields(fields: dict) -> dict:
+    redacted = {}
+    for key, value in fields.items():
+        if key in SENSITIVE_FIELDS:
+            redacted[key] = REDACTED
+        elif key in PHONE_FIELDS and value is not None:
+            redacted[key] = mask_phone(value)
+        elif key in EMAIL_FIELDS and value is not None:
+            redacted[key] = mask_email(value)
+        elif isinstance(value, str):
+            redacted[key] = redact_text(value)
+        else:
+            redacted[key] = value
+    return redacted
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with redaction applied"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": redact_text(record.getMessage()),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry["fields"] = redact_fields(fields)
+        exc_text = record.exc_text or (self.formatException(record.exc_info) if record.exc_info else None)
+        if exc_text:
+            entry["exc"] = redact_text(exc_text)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking when full"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Capture the request id and message arguments in the caller's
+        # context; JSON formatting and redaction happen on the listener thread
+        record.request_id = request_id_var.get()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_listener = None
+_queue_handler = None
+_atexit_registered = False
+
+def setup_logging(stream=None, queue_size: int = LOG_QUEUE_SIZE, level: str = LOG_LEVEL):
+    """Install the queue handler on the `auth` logger and start the writer thread"""
+    global _listener, _queue_handler, _atexit_registered
+    if _listener is not None:
+        return _queue_handler
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter())
+
+    _queue_handler = NonBlockingQueueHandler(log_queue)
+    app_logger = logging.getLogger("auth")
+    app_logger.setLevel(level.upper())
+    app_logger.addHandler(_queue_handler)
+    app_logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+    _listener.start()
+    if not _atexit_registered:
+        atexit.register(shutdown_logging)
+        _atexit_registered = True
+    return _queue_handler
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread (setup_logging restarts it)"""
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    _listener.stop()
+    logging.getLogger("auth").removeHandler(_queue_handler)
+    _listener = None
+    _queue_handler = None
+
+def dropped_records() -> int:
+    return _queue_handler.dropped if _queue_handler else 0
+
+def get_logger(name: str) -> logging.Logger:
+    """Get a logger under the `auth` namespace, setting up logging on first use"""
+    setup_logging()
+    return logging.getLogger(f"auth.{name}")
+
+class RequestIdMiddleware:
+    """Pure ASGI middleware assigning a correlation id to each request.
+
+    Reuses an incoming X-Request-ID header when present and echoes the id
+    back in the response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope.get("headers", []):
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-request-id", request_id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
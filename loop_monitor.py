@@ -0,0 +1,179 @@
+"""
+Event-loop stall detector.
+
+A heartbeat task sleeps LOOP_MONITOR_INTERVAL_MS at a time and records how
+late it wakes up: that lag is how long the loop could not run anything else
+(bcrypt or a big pydantic list built on the loop, a blocking print, ...).
+Lags go into the `event_loop_lag_seconds` histogram in /metrics.
+
+Once the loop is blocked the heartbeat cannot report until it is too late to
+see the culprit, so a watchdog thread checks the heartbeat's age. When it is
+more than LOOP_STALL_THRESHOLD_MS overdue, the thread captures the loop
+thread's stack (sys._current_frames), once per stall. Stacks are grouped by
+their innermost frame in application code (not the stdlib or site-packages),
+e.g. "utils.py:42 in verify_password"; the most frequent sites are in
+/metrics (`event_loop_stall_site`) and GET /auth/admin/diagnostics/loop.
+"""
+import asyncio
+import bisect
+import os
+import sys
+import sysconfig
+import threading
+import time
+import traceback
+from typing import Optional
+from config import LOOP_MONITOR_ENABLED, LOOP_MONITOR_INTERVAL_MS, LOOP_STALL_THRESHOLD_MS, LOOP_STALL_SITES
+from logging_service import get_logger
+import metrics
+
+logger = get_logger(__name__)
+
+# Histogram bucket upper bounds, seconds
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Frames kept per reported stack
+STACK_DEPTH = 12
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+LIBRARY_PATHS = tuple(sorted({
+    sysconfig.get_paths()[name] for name in ("stdlib", "platstdlib", "purelib", "platlib")
+}))
+
+def is_library(filename: str) -> bool:
+    return filename.startswith("<") or filename.startswith(LIBRARY_PATHS)
+
+def short_path(filename: str) -> str:
+    return os.path.relpath(filename, ROOT) if filename.startswith(ROOT) else filename
+
+def blocking_site(stack: traceback.StackSummary) -> str:
+    """Innermost application frame of a stack (innermost frame if there is none)"""
+    frame = next((frame for frame in reversed(stack) if not is_library(frame.filename)), stack[-1])
+    return f"{short_path(frame.filename)}:{frame.lineno} in {frame.name}"
+
+class LoopMonitor:
+    """Heartbeat task measuring loop lag plus a watchdog thread capturing stalls"""
+
+    def __init__(self, interval_ms: int = LOOP_MONITOR_INTERVAL_MS, threshold_ms: int = LOOP_STALL_THRESHOLD_MS,
+                 max_sites: int = LOOP_STALL_SITES, enabled: bool = LOOP_MONITOR_ENABLED, clock=time.monotonic):
+        self.interval = interval_ms / 1000
+        self.threshold = threshold_ms / 1000
+        self.max_sites = max_sites
+        self.enabled = enabled
+        self.clock = clock
+        self.bucket_counts = [0] * len(LAG_BUCKETS)
+        self.lag_sum = 0.0
+        self.beats = 0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.captures = 0
+        self.sites = {}  # site -> [count, stack lines]
+        self.sites_lock = threading.Lock()
+        self.last_beat: Optional[float] = None
+        self.loop_thread_id: Optional[int] = None
+        self.task: Optional[asyncio.Task] = None
+        self.watchdog: Optional[threading.Thread] = None
+        self.stopping = threading.Event()
+
+    def observe(self, lag: float):
+        index = bisect.bisect_left(LAG_BUCKETS, lag)
+        if index < len(self.bucket_counts):
+            self.bucket_counts[index] += 1
+        self.lag_sum += lag
+        self.beats += 1
+        self.max_lag = max(self.max_lag, lag)
+        if lag >= self.threshold:
+            self.stalls += 1
+
+    def lag_histogram(self) -> tuple:
+        """Cumulative buckets, sum and count for metrics.histogram"""
+        cumulative, buckets = 0, []
+        for upper_bound, count in zip(LAG_BUCKETS, self.bucket_counts):
+            cumulative += count
+            buckets.append((upper_bound, cumulative))
+        return buckets, self.lag_sum, self.beats
+
+    def record_stall(self, stack: traceback.StackSummary):
+        site = blocking_site(stack)
+        with self.sites_lock:
+            entry = self.sites.get(site)
+            if entry is None:
+                if len(self.sites) >= self.max_sites:
+                    del self.sites[min(self.sites, key=lambda known: self.sites[known][0])]
+                entry = self.sites[site] = [0, [
+                    f"{short_path(frame.filename)}:{frame.lineno} in {frame.name}"
+                    for frame in stack[-STACK_DEPTH:]
+                ]]
+            entry[0] += 1
+            self.captures += 1
+        logger.warning("Event loop blocked", extra={"fields": {"site": site}})
+
+    def top_sites(self, limit: int = 10) -> list:
+        with self.sites_lock:
+            ranked = sorted(self.sites.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+        return [{"site": site, "count": count, "stack": stack} for site, (count, stack) in ranked]
+
+    def stats(self, limit: int = 10) -> dict:
+        return {
+            "enabled": self.task is not None,
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "beats": self.beats,
+            "stalls": self.stalls,
+            "captures": self.captures,
+            "max_lag_ms": round(self.max_lag * 1000, 3),
+            "top_sites": self.top_sites(limit),
+        }
+
+    async def _heartbeat(self):
+        while True:
+            expected = self.clock() + self.interval
+            await asyncio.sleep(self.interval)
+            self.last_beat = self.clock()
+            self.observe(max(self.last_beat - expected, 0.0))
+
+    def _watch(self):
+        captured_beat = None
+        # Check often enough to catch stalls just over the threshold
+        while not self.stopping.wait(min(self.interval, self.threshold) / 2):
+            beat = self.last_beat
+            if beat is None or beat == captured_beat:
+                continue
+            if self.clock() - beat > self.interval + self.threshold:
+                frame = sys._current_frames().get(self.loop_thread_id)
+                if frame is not None:
+                    self.record_stall(traceback.extract_stack(frame))
+                # One capture per stall: wait for the next heartbeat
+                captured_beat = beat
+
+    def start(self):
+        """Start monitoring the running loop (call from the loop thread)"""
+        if not self.enabled or self.task is not None:
+            return
+        self.loop_thread_id = threading.get_ident()
+        self.last_beat = self.clock()
+        self.stopping.clear()
+        self.task = asyncio.create_task(self._heartbeat())
+        self.watchdog = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self.watchdog.start()
+
+    async def stop(self):
+        if self.task is None:
+            return
+        self.stopping.set()
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+        self.watchdog.join()
+        self.watchdog = None
+
+loop_monitor = LoopMonitor()
+
+metrics.histogram("event_loop_lag_seconds", "How late the loop monitor's heartbeat woke up",
+                  lambda: loop_monitor.lag_histogram())
+metrics.gauge("event_loop_stalls", "Heartbeats later than LOOP_STALL_THRESHOLD_MS", lambda: loop_monitor.stalls)
+metrics.gauge("event_loop_stall_site", "Captured stalls by blocking application frame (top 10)", lambda: {
+    (("site", site["site"]),): site["count"] for site in loop_monitor.top_sites(10)
+})
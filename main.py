@@ -1,17 +1,39 @@
-from fastapi import FastAPI, HTTPException, Request, Depends
+import asyncio
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from auth_routes import router as auth_router
-from database import connect_db, disconnect_db, create_tables
-from config import FRONTEND_ORIGINS
-import uvicorn
+from diagnostics import router as diagnostics_router
+from database import create_tables
+from storage import get_storage
+from config import FRONTEND_ORIGINS, OPENAPI_ENABLED, WARMUP_ENABLED, TRAFFIC_CAPTURE_ENABLED
+from logging_service import RequestIdMiddleware, setup_logging, shutdown_logging
+from admission import AdmissionMiddleware
+from auth_middleware import AuthMiddleware
+import warmup
+import metrics
+import events
+import bloom
+import api_keys
+from audit import audit_log
+from loop_monitor import loop_monitor
+from traffic_capture import TrafficCaptureMiddleware, traffic_recorder
 
 # Create FastAPI app
 app = FastAPI(
     title="Authentication API",
     description="API for user registration and login with OTP verification",
-    version="1.0.0"
+    version="1.0.0",
+    openapi_url="/openapi.json" if OPENAPI_ENABLED else None,
+    docs_url="/docs" if OPENAPI_ENABLED else None,
+    redoc_url="/redoc" if OPENAPI_ENABLED else None,
 )
 
+# Per-request auth context (only for admitted requests)
+app.add_middleware(AuthMiddleware)
+# Inside CORS, so shed responses still get CORS and request-id headers
+app.add_middleware(AdmissionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:5173"],  # <-- phải là list
@@ -19,21 +41,55 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(RequestIdMiddleware)
+# Outermost, so captured durations include every middleware (see replay_traffic.py)
+if TRAFFIC_CAPTURE_ENABLED:
+    app.add_middleware(TrafficCaptureMiddleware)
 # Include routers
 app.include_router(auth_router)
+app.include_router(diagnostics_router)
 
 # Startup and shutdown events
 @app.on_event("startup")
 async def startup():
-    """Connect to database on startup"""
-    await connect_db()
+    """Connect to storage on startup"""
+    # Re-attach the log writer if an earlier shutdown in this process stopped it
+    setup_logging()
+    # Postgres also starts the event listener and counter reconciliation
+    await get_storage().connect()
     # Optionally create tables (better to use migrations in production)
     # create_tables()
+    if OPENAPI_ENABLED:
+        # Build the schema in the background instead of on the first /docs hit
+        app.state.openapi_task = asyncio.create_task(run_in_threadpool(app.openapi))
+    # Registrations from other workers reach the duplicate pre-check via events
+    events.broadcaster.observers.append(bloom.identifier_filter.observe)
+    # Revoked API keys leave every worker's cache
+    events.broadcaster.observers.append(api_keys.api_key_cache.observe)
+    # Duplicate email/phone pre-check for /register (rebuilt after deletions)
+    app.state.bloom_task = asyncio.create_task(bloom.build_identifier_filter())
+    # Batched audit log writer and partition maintenance
+    audit_log.start()
+    # Event-loop lag histogram and blocking-call capture
+    loop_monitor.start()
+    if TRAFFIC_CAPTURE_ENABLED:
+        traffic_recorder.start()
+    # Warm up in the background; /ready reports 503 until it is done
+    if WARMUP_ENABLED:
+        app.state.warmup_task = asyncio.create_task(warmup.warm_up())
+    else:
+        warmup.state["ready"] = True
 
 @app.on_event("shutdown")
 async def shutdown():
-    """Disconnect from database on shutdown"""
-    await disconnect_db()
+    """Disconnect from storage on shutdown"""
+    app.state.bloom_task.cancel()
+    await loop_monitor.stop()
+    # Write out buffered audit events while storage is still connected
+    await audit_log.stop()
+    await traffic_recorder.stop()
+    await get_storage().disconnect()
+    shutdown_logging()
 
 # Health check endpoint
 @app.get("/health")
@@ -41,6 +97,23 @@ async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "message": "API is running"}
 
+# Readiness endpoint (load balancers should route traffic only once ready)
+@app.get("/ready")
+async def readiness_check():
+    """Readiness check endpoint"""
+    if not warmup.state["ready"]:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "warming_up", "steps": warmup.state["steps"]}
+        )
+    return {"status": "ready", "steps": warmup.state["steps"]}
+
+# Prometheus metrics
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """Metrics endpoint (Prometheus text format)"""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 # Root endpoint
 @app.get("/")
 async def root():
@@ -48,10 +121,11 @@ async def root():
     return {
         "message": "Authentication API",
         "version": "1.0.0",
-        "docs": "/docs"
+        "docs": "/docs" if OPENAPI_ENABLED else None
     }
 
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
@@ -0,0 +1,178 @@
+"""
+On-demand memory profiling of a worker.
+
+Nothing runs until an admin asks: tracemalloc is off by default (no
+allocation hooks, no overhead) and is started and stopped at runtime through
+/auth/admin/diagnostics/memory/*. While it runs, snapshots are kept in this
+worker (at most MEMORY_SNAPSHOTS_KEPT, oldest dropped) and any two can be
+diffed by allocation site, e.g. to see what the admin listings leave behind.
+
+The expensive calls (snapshot, diff, counting objects by type) run in the
+thread pool so the loop keeps serving, and only one runs at a time: a
+second caller gets MemoryDiagnosticsBusy instead of piling more work on a
+loaded worker.
+
+RSS comes from /proc (Linux); sibling workers are found as the other
+children of this worker's parent (uvicorn/gunicorn master).
+"""
+import asyncio
+import gc
+import os
+import resource
+import time
+import tracemalloc
+from collections import Counter, OrderedDict
+from itertools import count
+from typing import Optional
+from fastapi.concurrency import run_in_threadpool
+from config import MEMORY_TRACEMALLOC_FRAMES, MEMORY_SNAPSHOTS_KEPT
+import metrics
+
+# Allocations of the profiler itself, never interesting
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+class MemoryDiagnosticsBusy(Exception):
+    """Another snapshot, diff or object count is running in this worker"""
+
+class UnknownSnapshot(KeyError):
+    pass
+
+class NotTracing(Exception):
+    """A snapshot was asked for while tracemalloc is off"""
+
+def rss_bytes(pid="self") -> Optional[int]:
+    """Resident set size of a process (None when /proc is unavailable)"""
+    try:
+        with open(f"/proc/{pid}/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def peak_rss_bytes() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def worker_pids() -> list:
+    """This process and its siblings (the other workers of the same master)"""
+    parent = os.getppid()
+    try:
+        with open(f"/proc/{parent}/task/{parent}/children") as children:
+            pids = [int(pid) for pid in children.read().split()]
+    except (OSError, ValueError):
+        pids = []
+    return sorted(set(pids) | {os.getpid()})
+
+def object_counts(limit: int) -> list:
+    counts = Counter(type(obj).__qualname__ for obj in gc.get_objects())
+    return [{"type": name, "count": total} for name, total in counts.most_common(limit)]
+
+def format_stat(stat) -> dict:
+    return {
+        "site": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+        "size_bytes": stat.size,
+        "size_diff_bytes": getattr(stat, "size_diff", None),
+        "count": stat.count,
+        "count_diff": getattr(stat, "count_diff", None),
+    }
+
+class MemoryDiagnostics:
+    """tracemalloc toggle, retained snapshots and one-at-a-time heavy calls"""
+
+    def __init__(self, max_snapshots: int = MEMORY_SNAPSHOTS_KEPT, frames: int = MEMORY_TRACEMALLOC_FRAMES):
+        self.max_snapshots = max_snapshots
+        self.frames = frames
+        self.snapshots = OrderedDict()  # id -> (taken_at, snapshot)
+        self.ids = count(1)
+        self.lock = asyncio.Lock()
+
+    async def _exclusive(self, func, *args):
+        if self.lock.locked():
+            raise MemoryDiagnosticsBusy()
+        async with self.lock:
+            return await run_in_threadpool(func, *args)
+
+    def start(self, frames: Optional[int] = None) -> dict:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames or self.frames)
+        return self.status()
+
+    def stop(self) -> dict:
+        """Stop tracing and free its traces (kept snapshots stay diffable)"""
+        tracemalloc.stop()
+        return self.status()
+
+    def status(self) -> dict:
+        tracing = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+        return {
+            "tracing": tracing,
+            "frames": tracemalloc.get_traceback_limit() if tracing else None,
+            "traced_bytes": current,
+            "traced_peak_bytes": peak,
+            "tracemalloc_overhead_bytes": tracemalloc.get_tracemalloc_memory() if tracing else 0,
+            "snapshots": [
+                {"id": snapshot_id, "taken_at": taken_at} for snapshot_id, (taken_at, _) in self.snapshots.items()
+            ],
+        }
+
+    def overview(self) -> dict:
+        """Cheap numbers: RSS per worker, GC generations, tracing status"""
+        return {
+            "pid": os.getpid(),
+            "rss_bytes": rss_bytes(),
+            "peak_rss_bytes": peak_rss_bytes(),
+            "workers": [{"pid": pid, "rss_bytes": rss_bytes(pid)} for pid in worker_pids()],
+            "gc": {
+                "enabled": gc.isenabled(),
+                "counts": gc.get_count(),
+                "thresholds": gc.get_threshold(),
+                "generations": gc.get_stats(),
+                "uncollectable": len(gc.garbage),
+            },
+            "tracemalloc": self.status(),
+        }
+
+    async def take_snapshot(self) -> dict:
+        if not tracemalloc.is_tracing():
+            raise NotTracing()
+        try:
+            snapshot = await self._exclusive(lambda: tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS))
+        except RuntimeError:
+            # Stopped by another request meanwhile
+            raise NotTracing()
+        snapshot_id = next(self.ids)
+        self.snapshots[snapshot_id] = (time.time(), snapshot)
+        while len(self.snapshots) > self.max_snapshots:
+            self.snapshots.popitem(last=False)
+        return {"id": snapshot_id, "traces": len(snapshot.traces)}
+
+    def _snapshot(self, snapshot_id: int):
+        if snapshot_id not in self.snapshots:
+            raise UnknownSnapshot(snapshot_id)
+        return self.snapshots[snapshot_id][1]
+
+    async def top(self, snapshot_id: int, group_by: str = "lineno", limit: int = 20) -> list:
+        snapshot = self._snapshot(snapshot_id)
+        stats = await self._exclusive(snapshot.statistics, group_by)
+        return [format_stat(stat) for stat in stats[:limit]]
+
+    async def diff(self, base_id: int, target_id: int, group_by: str = "lineno", limit: int = 20) -> list:
+        """Largest growth first, grouped by allocation site"""
+        base, target = self._snapshot(base_id), self._snapshot(target_id)
+        stats = await self._exclusive(target.compare_to, base, group_by)
+        return [format_stat(stat) for stat in stats[:limit]]
+
+    async def object_counts(self, limit: int = 30) -> list:
+        return await self._exclusive(object_counts, limit)
+
+    def clear(self):
+        self.snapshots.clear()
+
+memory_diagnostics = MemoryDiagnostics()
+
+metrics.gauge("process_resident_memory_bytes", "Resident memory of this worker", lambda: rss_bytes() or 0)
+metrics.gauge("tracemalloc_traced_bytes", "Memory traced by tracemalloc (0 while off)",
+              lambda: tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0)
@@ -0,0 +1,70 @@
+"""
+Prometheus text-format metrics (served at GET /metrics).
+
+Modules register gauges whose values are read at scrape time, so nothing is
+computed on the request path:
+
+    metrics.gauge("smtp_circuit_state", "0 closed, 1 half-open, 2 open",
+                  lambda: STATE_VALUES[breaker.state])
+
+A collector may return a number or a dict mapping label dicts (as tuples of
+(name, value) pairs) to numbers.
+
+Histograms are kept by their owner too; the collector returns cumulative
+bucket counts, the sum and the count:
+
+    metrics.histogram("event_loop_lag_seconds", "...", loop_monitor.lag_histogram)
+"""
+from typing import Callable, Union
+from logging_service import get_logger
+
+logger = get_logger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_gauges = {}
+_histograms = {}
+
+def gauge(name: str, help_text: str, collect: Callable[[], Union[float, dict]]):
+    """Register (or replace) a gauge read at scrape time"""
+    _gauges[name] = (help_text, collect)
+
+def histogram(name: str, help_text: str, collect: Callable[[], tuple]):
+    """Register (or replace) a histogram: collect() -> ([(upper_bound, cumulative_count)], sum, count)"""
+    _histograms[name] = (help_text, collect)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(pairs) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+def render() -> str:
+    lines = []
+    for name, (help_text, collect) in sorted(_gauges.items()):
+        try:
+            value = collect()
+        except Exception as e:
+            logger.warning("Metric collection failed", extra={"fields": {"metric": name, "error": str(e)}})
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        samples = value.items() if isinstance(value, dict) else [((), value)]
+        for labels, sample in samples:
+            lines.append(f"{name}{_labels(labels)} {float(sample)}")
+    for name, (help_text, collect) in sorted(_histograms.items()):
+        try:
+            buckets, total, count = collect()
+        except Exception as e:
+            logger.warning("Metric collection failed", extra={"fields": {"metric": name, "error": str(e)}})
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for upper_bound, cumulative in buckets:
+            lines.append(f'{name}_bucket{{le="{upper_bound}"}} {float(cumulative)}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {float(count)}')
+        lines.append(f"{name}_sum {float(total)}")
+        lines.append(f"{name}_count {float(count)}")
+    return "\n".join(lines) + "\n"
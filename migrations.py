@@ -0,0 +1,491 @@
+#!/usr/bin/env python3
+"""
+Versioned, online-safe schema migrations.
+
+Every migration has a version number and a list of steps. Applied versions are
+recorded in the `schema_migrations` table, and finished steps of a partially
+applied migration are recorded in `schema_migration_progress`, so an interrupted
+run resumes where it stopped instead of starting over.
+
+Step types:
+- SQL: DDL/DML run in a short transaction with `lock_timeout` and retry
+- CreateIndexConcurrently: `CREATE [UNIQUE] INDEX CONCURRENTLY`, cleaning up
+  invalid leftovers from a previous failed build
+- Backfill: chunked, throttled `UPDATE` walking the primary key, with the last
+  processed key persisted after each batch
+
+Usage:
+    python migrations.py status
+    python migrations.py migrate [--target VERSION]
+"""
+import argparse
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import asyncpg
+
+from config import (
+    DATABASE_URL,
+    MIGRATION_LOCK_TIMEOUT_MS,
+    MIGRATION_LOCK_RETRIES,
+    MIGRATION_BATCH_SIZE,
+    MIGRATION_BATCH_PAUSE_MS,
+)
+
+# Arbitrary constant so only one runner migrates a database at a time
+ADVISORY_LOCK_KEY = 7_260_026
+
+HISTORY_DDL = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    duration_ms INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS schema_migration_progress (
+    version INTEGER NOT NULL,
+    step INTEGER NOT NULL,
+    done BOOLEAN NOT NULL DEFAULT FALSE,
+    last_key TEXT NULL,
+    rows_done BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (version, step)
+);
+"""
+
+
+@dataclass
+class Step:
+    """Base class for a migration step"""
+    # Optional SQL returning a boolean; the step is skipped when it is false
+    condition: Optional[str] = field(default=None, kw_only=True)
+
+    def describe(self) -> str:
+        return self.__class__.__name__
+
+    async def run(self, conn: asyncpg.Connection, version: int, index: int):
+        raise NotImplementedError
+
+
+@dataclass
+class SQL(Step):
+    """Run a statement in its own transaction, bounded by lock_timeout"""
+    sql: str
+
+    def describe(self) -> str:
+        return " ".join(self.sql.split())[:80]
+
+    async def run(self, conn, version, index):
+        async def apply():
+            async with conn.transaction():
+                await set_lock_timeout(conn, local=True)
+                await conn.execute(self.sql)
+
+        await with_lock_retry(apply)
+
+
+@dataclass
+class CreateIndexConcurrently(Step):
+    """Build an index without blocking writes on the table"""
+    name: str
+    table: str
+    definition: str  # e.g. "(email)" or "USING gin (name gin_trgm_ops)"
+    unique: bool = False
+    where: Optional[str] = None
+
+    def describe(self) -> str:
+        return f"index {self.name} on {self.table}"
+
+    async def run(self, conn, version, index):
+        valid = await conn.fetchval(
+            """
+            SELECT i.indisvalid
+            FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid
+            WHERE c.relname = $1
+            """,
+            self.name,
+        )
+        if valid:
+            return
+        if valid is False:
+            # Left behind by an interrupted concurrent build: must be rebuilt
+            print(f"   dropping invalid index {self.name}")
+            await with_lock_retry(lambda: self._drop(conn))
+
+        unique = "UNIQUE " if self.unique else ""
+        sql = f"CREATE {unique}INDEX CONCURRENTLY IF NOT EXISTS {self.name} ON {self.table} {self.definition}"
+        if self.where:
+            sql += f" WHERE {self.where}"
+
+        async def build():
+            await set_lock_timeout(conn)
+            try:
+                await conn.execute(sql)
+            except asyncpg.exceptions.LockNotAvailableError:
+                # A timed-out concurrent build leaves an invalid index behind
+                await self._drop(conn)
+                raise
+            finally:
+                await conn.execute("RESET lock_timeout")
+
+        await with_lock_retry(build)
+
+    async def _drop(self, conn):
+        await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {self.name}")
+
+
+@dataclass
+class Backfill(Step):
+    """Update rows in primary-key order, one small transaction per batch"""
+    table: str
+    set_sql: str
+    where_sql: str
+    key: str = "id"
+    batch_size: int = MIGRATION_BATCH_SIZE
+    pause_ms: int = MIGRATION_BATCH_PAUSE_MS
+
+    def describe(self) -> str:
+        return f"backfill {self.table} SET {self.set_sql}"
+
+    async def run(self, conn, version, index):
+        progress = await conn.fetchrow(
+            "SELECT last_key, rows_done FROM schema_migration_progress WHERE version = $1 AND step = $2",
+            version, index,
+        )
+        last_key = progress["last_key"] if progress else None
+        rows_done = progress["rows_done"] if progress else 0
+        if last_key:
+            print(f"   resuming after {self.key}={last_key} ({rows_done} rows done)")
+
+        key_type = await self._key_type(conn)
+        while True:
+            # Upper bound of the next batch; keys travel as text so the same
+            # code works for UUID and integer primary keys
+            upper = await conn.fetchval(
+                f"""
+                SELECT {self.key}::text FROM {self.table}
+                WHERE $1::text IS NULL OR {self.key} > $1::text::{key_type}
+                ORDER BY {self.key}
+                OFFSET $2 LIMIT 1
+                """,
+                last_key, self.batch_size - 1,
+            )
+            final = upper is None
+            bounds = [f"({self.where_sql})"]
+            args = []
+            if last_key is not None:
+                args.append(last_key)
+                bounds.append(f"{self.key} > ${len(args)}::text::{key_type}")
+            if not final:
+                args.append(upper)
+                bounds.append(f"{self.key} <= ${len(args)}::text::{key_type}")
+            sql = f"UPDATE {self.table} SET {self.set_sql} WHERE {' AND '.join(bounds)}"
+
+            async def apply_batch():
+                async with conn.transaction():
+                    await set_lock_timeout(conn, local=True)
+                    result = await conn.execute(sql, *args)
+                    count = int(result.split()[-1]) if result else 0
+                    await save_progress(conn, version, index, last_key=upper, rows_delta=count)
+                    return count
+
+            rows_done += await with_lock_retry(apply_batch)
+            if final:
+                break
+            last_key = upper
+            if self.pause_ms:
+                await asyncio.sleep(self.pause_ms / 1000)
+
+        print(f"   backfilled {rows_done} rows")
+
+    async def _key_type(self, conn) -> str:
+        return await conn.fetchval(
+            """
+            SELECT format_type(a.atttypid, a.atttypmod)
+            FROM pg_attribute a
+            WHERE a.attrelid = $1::regclass AND a.attname = $2
+            """,
+            self.table, self.key,
+        )
+
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    steps: List[Step]
+
+
+# Registered migrations, in version order. Never edit an applied migration;
+# add a new one instead.
+MIGRATIONS: List[Migration] = [
+    Migration(1, "users table columns", [
+        SQL("ALTER TABLE users ADD COLUMN IF NOT EXISTS name VARCHAR(100)"),
+        SQL("ALTER TABLE users ADD COLUMN IF NOT EXISTS email VARCHAR(255)"),
+        SQL("ALTER TABLE users ADD COLUMN IF NOT EXISTS phone VARCHAR(20)"),
+        SQL("ALTER TABLE users ADD COLUMN IF NOT EXISTS password_hash TEXT"),
+        SQL("ALTER TABLE users ADD COLUMN IF NOT EXISTS role VARCHAR(50) DEFAULT 'user'"),
+        SQL("ALTER TABLE users ADD COLUMN IF NOT EXISTS is_active BOOLEAN DEFAULT TRUE"),
+        SQL("ALTER TABLE users ADD COLUMN IF NOT EXISTS is_approved BOOLEAN DEFAULT FALSE"),
+        SQL("ALTER TABLE users ADD COLUMN IF NOT EXISTS approved_at TIMESTAMP NULL"),
+        SQL("ALTER TABLE users ADD COLUMN IF NOT EXISTS approved_by UUID NULL"),
+        SQL("ALTER TABLE users ADD COLUMN IF NOT EXISTS created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP"),
+    ]),
+    Migration(2, "backfill users defaults", [
+        Backfill("users", "role = 'user'", "role IS NULL"),
+        Backfill("users", "is_active = TRUE", "is_active IS NULL"),
+        Backfill("users", "is_approved = FALSE", "is_approved IS NULL"),
+        Backfill(
+            "users", "name = full_name", "name IS NULL AND full_name IS NOT NULL",
+            condition="""
+                SELECT EXISTS (
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_name = 'users' AND column_name = 'full_name'
+                )
+            """,
+        ),
+    ]),
+    Migration(3, "users unique email/phone", [
+        CreateIndexConcurrently("users_email_key", "users", "(email)", unique=True),
+        CreateIndexConcurrently("users_phone_key", "users", "(phone)", unique=True),
+    ]),
+    Migration(4, "admin user search indexes", [
+        SQL("CREATE EXTENSION IF NOT EXISTS pg_trgm"),
+        CreateIndexConcurrently("idx_users_name_prefix", "users", "(lower(name) text_pattern_ops)"),
+        CreateIndexConcurrently("idx_users_email_prefix", "users", "(lower(email) text_pattern_ops)"),
+        CreateIndexConcurrently("idx_users_phone_prefix", "users", "(phone text_pattern_ops)"),
+        CreateIndexConcurrently("idx_users_name_trgm", "users", "USING gin (name gin_trgm_ops)"),
+        CreateIndexConcurrently("idx_users_email_trgm", "users", "USING gin (email gin_trgm_ops)"),
+        CreateIndexConcurrently("idx_users_phone_trgm", "users", "USING gin (phone gin_trgm_ops)"),
+    ]),
+    Migration(5, "admin dashboard counters", [
+        # Stripes are created and filled by counters.reconcile on startup
+        SQL("""
+            CREATE TABLE IF NOT EXISTS admin_counters (
+                name VARCHAR(50) NOT NULL,
+                shard SMALLINT NOT NULL,
+                value BIGINT NOT NULL DEFAULT 0,
+                PRIMARY KEY (name, shard)
+            )
+        """),
+    ]),
+    Migration(6, "users change version and tombstones", [
+        SQL("CREATE SEQUENCE IF NOT EXISTS users_change_seq"),
+        # Nullable and without a default first: metadata-only, no rewrite
+        SQL("ALTER TABLE users ADD COLUMN IF NOT EXISTS version BIGINT"),
+        SQL("ALTER TABLE users ALTER COLUMN version SET DEFAULT nextval('users_change_seq')"),
+        Backfill("users", "version = nextval('users_change_seq')", "version IS NULL"),
+        CreateIndexConcurrently("idx_users_version", "users", "(version)"),
+        # NOT NULL without a long exclusive lock: a validated CHECK lets
+        # SET NOT NULL skip the full-table scan
+        SQL("""
+            DO $$ BEGIN
+                ALTER TABLE users ADD CONSTRAINT users_version_not_null CHECK (version IS NOT NULL) NOT VALID;
+            EXCEPTION WHEN duplicate_object THEN NULL;
+            END $$
+        """),
+        SQL("ALTER TABLE users VALIDATE CONSTRAINT users_version_not_null"),
+        SQL("ALTER TABLE users ALTER COLUMN version SET NOT NULL"),
+        SQL("ALTER TABLE users DROP CONSTRAINT IF EXISTS users_version_not_null"),
+        SQL("""
+            CREATE TABLE IF NOT EXISTS user_tombstones (
+                user_id UUID PRIMARY KEY,
+                version BIGINT NOT NULL,
+                deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """),
+        SQL("CREATE INDEX IF NOT EXISTS idx_user_tombstones_version ON user_tombstones (version)"),
+    ]),
+    # Daily partitions are created and dropped by the API (audit.py)
+    Migration(7, "authentication audit log", [
+        SQL("""
+            CREATE TABLE IF NOT EXISTS audit_log (
+                occurred_at TIMESTAMP NOT NULL,
+                event VARCHAR(50) NOT NULL,
+                outcome VARCHAR(20) NOT NULL,
+                user_id UUID,
+                actor_id UUID,
+                identifier VARCHAR(255),
+                ip VARCHAR(45),
+                request_id VARCHAR(64)
+            ) PARTITION BY RANGE (occurred_at)
+        """),
+        SQL("CREATE INDEX IF NOT EXISTS idx_audit_log_user_id ON audit_log (user_id, occurred_at)"),
+    ]),
+    # The pending-users listing otherwise scans and sorts the whole table
+    Migration(8, "pending users index", [
+        CreateIndexConcurrently(
+            "idx_users_pending_created_at", "users", "(created_at DESC)", where="is_approved = FALSE"
+        ),
+    ]),
+    Migration(9, "api keys", [
+        SQL("""
+            CREATE TABLE IF NOT EXISTS api_keys (
+                id UUID PRIMARY KEY,
+                name VARCHAR(100) NOT NULL,
+                prefix VARCHAR(32) UNIQUE NOT NULL,
+                key_hash VARCHAR(64) NOT NULL,
+                role VARCHAR(50) NOT NULL DEFAULT 'service',
+                created_by UUID NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                revoked_at TIMESTAMP NULL
+            )
+        """),
+    ]),
+    # Databases migrated before the indexes followed the idx_ naming
+    Migration(10, "index naming", [
+        SQL("ALTER INDEX IF EXISTS ix_users_version RENAME TO idx_users_version"),
+        SQL("ALTER INDEX IF EXISTS ix_user_tombstones_version RENAME TO idx_user_tombstones_version"),
+        SQL("ALTER INDEX IF EXISTS ix_audit_log_user_id RENAME TO idx_audit_log_user_id"),
+        SQL("ALTER INDEX IF EXISTS ix_users_pending_created_at RENAME TO idx_users_pending_created_at"),
+    ]),
+]
+
+
+async def set_lock_timeout(conn: asyncpg.Connection, local: bool = False):
+    """Bound how long a statement may wait for a lock"""
+    scope = "LOCAL " if local else ""
+    await conn.execute(f"SET {scope}lock_timeout = {int(MIGRATION_LOCK_TIMEOUT_MS)}")
+
+
+async def with_lock_retry(operation):
+    """Run `operation`, retrying with backoff when it times out waiting for a lock"""
+    delay = 0.5
+    for attempt in range(1, MIGRATION_LOCK_RETRIES + 1):
+        try:
+            return await operation()
+        except asyncpg.exceptions.LockNotAvailableError:
+            if attempt == MIGRATION_LOCK_RETRIES:
+                raise
+            print(f"   lock timeout, retry {attempt}/{MIGRATION_LOCK_RETRIES - 1} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+
+async def save_progress(conn, version: int, step: int, done: bool = False,
+                        last_key: Optional[str] = None, rows_delta: int = 0):
+    await conn.execute(
+        """
+        INSERT INTO schema_migration_progress (version, step, done, last_key, rows_done)
+        VALUES ($1, $2, $3, $4, $5)
+        ON CONFLICT (version, step) DO UPDATE SET
+            done = schema_migration_progress.done OR EXCLUDED.done,
+            last_key = COALESCE(EXCLUDED.last_key, schema_migration_progress.last_key),
+            rows_done = schema_migration_progress.rows_done + EXCLUDED.rows_done,
+            updated_at = CURRENT_TIMESTAMP
+        """,
+        version, step, done, last_key, rows_delta,
+    )
+
+
+async def applied_versions(conn: asyncpg.Connection) -> set:
+    rows = await conn.fetch("SELECT version FROM schema_migrations")
+    return {r["version"] for r in rows}
+
+
+async def apply_migration(conn: asyncpg.Connection, migration: Migration):
+    """Apply one migration, skipping steps finished by a previous run"""
+    started = time.monotonic()
+    rows = await conn.fetch(
+        "SELECT step FROM schema_migration_progress WHERE version = $1 AND done",
+        migration.version,
+    )
+    finished = {r["step"] for r in rows}
+
+    for index, step in enumerate(migration.steps):
+        if index in finished:
+            continue
+        if step.condition and not await conn.fetchval(step.condition):
+            print(f" - [{index}] skipped: {step.describe()}")
+        else:
+            print(f" - [{index}] {step.describe()}")
+            await step.run(conn, migration.version, index)
+        await save_progress(conn, migration.version, index, done=True)
+
+    duration_ms = int((time.monotonic() - started) * 1000)
+    async with conn.transaction():
+        await conn.execute(
+            "INSERT INTO schema_migrations (version, name, duration_ms) VALUES ($1, $2, $3)",
+            migration.version, migration.name, duration_ms,
+        )
+        await conn.execute("DELETE FROM schema_migration_progress WHERE version = $1", migration.version)
+
+
+async def migrate(target: Optional[int] = None, database_url: str = DATABASE_URL):
+    """Apply all pending migrations up to `target` (default: latest)"""
+    conn = await asyncpg.connect(database_url)
+    try:
+        await conn.execute(HISTORY_DDL)
+        if not await conn.fetchval("SELECT pg_try_advisory_lock($1)", ADVISORY_LOCK_KEY):
+            print("❌ Another migration run is in progress")
+            return
+        try:
+            applied = await applied_versions(conn)
+            pending = [
+                m for m in MIGRATIONS
+                if m.version not in applied and (target is None or m.version <= target)
+            ]
+            if not pending:
+                print("✅ Database schema is up to date")
+                return
+            for migration in pending:
+                print(f"➕ Applying {migration.version:04d} {migration.name}")
+                await apply_migration(conn, migration)
+            print("✅ Migrations applied successfully!")
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock($1)", ADVISORY_LOCK_KEY)
+    finally:
+        await conn.close()
+
+
+async def run_backfill(step: Backfill, job_id: int, database_url: str = DATABASE_URL):
+    """Run a one-off, resumable backfill outside the versioned history.
+
+    Progress is tracked under the negative pseudo-version `-job_id` so an
+    interrupted run picks up where it stopped when started again.
+    """
+    conn = await asyncpg.connect(database_url)
+    try:
+        await conn.execute(HISTORY_DDL)
+        await step.run(conn, -job_id, 0)
+        await conn.execute("DELETE FROM schema_migration_progress WHERE version = $1", -job_id)
+    finally:
+        await conn.close()
+
+
+async def status(database_url: str = DATABASE_URL):
+    """Print applied and pending migrations"""
+    conn = await asyncpg.connect(database_url)
+    try:
+        await conn.execute(HISTORY_DDL)
+        history = {
+            r["version"]: r for r in await conn.fetch("SELECT * FROM schema_migrations")
+        }
+        for migration in MIGRATIONS:
+            row = history.get(migration.version)
+            if row:
+                print(f"✅ {migration.version:04d} {migration.name} (applied {row['applied_at']}, {row['duration_ms']} ms)")
+            else:
+                print(f"⏳ {migration.version:04d} {migration.name}")
+    finally:
+        await conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Database schema migrations")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="Show applied and pending migrations")
+    migrate_parser = sub.add_parser("migrate", help="Apply pending migrations")
+    migrate_parser.add_argument("--target", type=int, default=None, help="Stop after this version")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        asyncio.run(status())
+    else:
+        asyncio.run(migrate(args.target))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional
+from typing import Optional, List
 import uuid
 from datetime import datetime
+from config import INTROSPECT_MAX_TOKENS
 
 # Registration models
 class RegisterRequest(BaseModel):
@@ -68,6 +69,28 @@ class UserListResponse(BaseModel):
     is_active: bool
     created_at: datetime
 
+class UserChangeResponse(UserListResponse):
+    version: int
+
+class UserChangesResponse(BaseModel):
+    version: int  # pass as `since` on the next call
+    users: List[UserChangeResponse]
+    deleted: List[str]
+    has_more: bool
+
+class UserSearchResponse(BaseModel):
+    items: List[UserListResponse]
+    page: int
+    page_size: int
+    has_more: bool
+
+class AdminStatsResponse(BaseModel):
+    pending_users: int
+    active_users: int
+    live_sessions: int
+    identifier_filter: Optional[dict] = None  # bloom.py pre-check: size, false-positive rate
+    admission: Optional[dict] = None  # admission.py: in-flight, queued and shed per work class
+
 class ApproveUserRequest(BaseModel):
     user_id: str
 
@@ -75,3 +98,35 @@ class AdminResponse(BaseModel):
     status: str
     message: str
     data: Optional[dict] = None
+
+# API key models (see api_keys.py)
+class CreateApiKeyRequest(BaseModel):
+    name: str = Field(..., min_length=1, max_length=100)
+    role: str = Field("service", pattern="^(service|admin)$")
+
+class ApiKeyResponse(BaseModel):
+    id: str
+    name: str
+    prefix: str
+    role: str
+    created_at: Optional[datetime] = None
+    revoked_at: Optional[datetime] = None
+
+class ApiKeyCreatedResponse(BaseModel):
+    status: str
+    message: str
+    key: str  # shown once, never stored
+    api_key: ApiKeyResponse
+
+# Internal token introspection models
+class IntrospectRequest(BaseModel):
+    tokens: List[str] = Field(..., min_length=1, max_length=INTROSPECT_MAX_TOKENS)
+
+class TokenClaims(BaseModel):
+    active: bool
+    user_id: Optional[str] = None
+    role: Optional[str] = None
+    expires_at: Optional[datetime] = None
+
+class IntrospectResponse(BaseModel):
+    results: List[TokenClaims]  # same order as the request
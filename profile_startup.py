@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Startup profiling report.
+
+Runs `python -X importtime -c "import main"` in a fresh interpreter and lists
+the slowest modules, then (optionally) starts uvicorn and measures how long it
+takes until /health answers.
+
+Usage:
+    python profile_startup.py [--top 25] [--module main]
+    python profile_startup.py --serve [--port 8765]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+def import_times(module: str):
+    """Return (total_us, [(self_us, cumulative_us, name), ...]) for importing module"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(self_us), int(cumulative_us), name.rstrip()))
+    total = next((cum for _, cum, name in rows if name.strip() == module), 0)
+    return total, rows
+
+def print_import_report(module: str, top: int):
+    total, rows = import_times(module)
+    print(f"📦 import {module}: {total / 1000:.1f} ms, {len(rows)} modules\n")
+
+    print(f"Top {top} by cumulative time (includes children):")
+    for self_us, cumulative_us, name in sorted(rows, key=lambda r: r[1], reverse=True)[:top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+    print(f"\nTop {top} by self time:")
+    for self_us, cumulative_us, name in sorted(rows, key=lambda r: r[0], reverse=True)[:top]:
+        print(f"  {self_us / 1000:8.1f} ms  {name.strip()}")
+
+def time_to_first_response(port: int, timeout: float = 60.0) -> float:
+    """Start uvicorn and measure seconds until /health returns 200"""
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.02)
+        raise TimeoutError(f"server did not become healthy within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup profiling report")
+    parser.add_argument("--module", default="main", help="Module to import (default: main)")
+    parser.add_argument("--top", type=int, default=25, help="Rows per table")
+    parser.add_argument("--serve", action="store_true", help="Also measure time to first /health response")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    print_import_report(args.module, args.top)
+    if args.serve:
+        elapsed = time_to_first_response(args.port)
+        print(f"\n🚀 First /health response after {elapsed * 1000:.0f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Replay captured traffic against a local instance and compare latencies.
+
+replay: reads capture files (traffic_capture.py) and sends every request at
+its captured offset divided by --speed. The loop is open: a slow server
+never delays the next request, so the capture's inter-arrival pattern, and
+with it the concurrency, is kept. Anonymised identities are mapped onto the
+deterministic rows of seed_dataset.py (pass the same --seed, --users,
+--sessions, ...):
+- each session identity gets its own live, non-admin seeded session token;
+- each temp session or registration identity gets its own seeded row, whose
+  OTP is known, so OTP checks that succeeded in the capture succeed again;
+- logins use seeded users, with the right password when the captured login
+  succeeded.
+Requests an admin made use --admin-api-key (an API key with role admin, so
+the scratch server needs API_KEY_ADMIN_ENABLED=true; /auth/admin/api-keys
+calls then answer 403, since keys cannot manage keys).
+/auth/internal/* requests use --internal-token. Streams (SSE) and
+unmatched paths are skipped. Replays write (logins, approvals, logouts),
+so seed a fresh scratch database for each build.
+
+compare: p50/p90/p99 per route for two files (replay results, or a capture
+as the baseline), and the change. The exit status is 1 when a route's p99
+regressed by more than --threshold percent.
+
+Usage:
+    python seed_dataset.py --truncate --users 100000 --sessions 1000000
+    python replay_traffic.py replay traffic-*.jsonl --base-url http://localhost:8000 \\
+        [--speed 1] [--out replay-a.jsonl] [--admin-api-key KEY] [--internal-token TOKEN]
+    python replay_traffic.py compare replay-a.jsonl replay-b.jsonl [--threshold 10]
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+import time
+import uuid
+from collections import defaultdict
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from itertools import count
+from typing import Optional
+import httpx
+from seed_dataset import (
+    SEED_PASSWORD, PENDING_EVERY, INACTIVE_EVERY, user_id, user_email, session_token, session_is_live,
+    temp_session_id, temp_registration_id, otp
+)
+
+SYNTHETIC_QUERY = {"q": "Nguyen"}
+
+# Helper functions
+def load(paths: list) -> list:
+    records = []
+    for path in paths:
+        with open(path) as lines:
+            records.extend(json.loads(line) for line in lines if line.strip())
+    return records
+
+def latency(record: dict) -> float:
+    """Replay results carry latency_ms, captures duration_ms"""
+    return record["latency_ms"] if "latency_ms" in record else record["duration_ms"]
+
+def percentile(sorted_values: list, p: float) -> float:
+    return sorted_values[max(math.ceil(p / 100 * len(sorted_values)) - 1, 0)]
+
+def max_concurrency(intervals) -> int:
+    """Most intervals (start, end) open at once"""
+    intervals = list(intervals)
+    edges = sorted([(start, 1) for start, _ in intervals] + [(end, -1) for _, end in intervals])
+    current = peak = 0
+    for _, step in edges:
+        current += step
+        peak = max(peak, current)
+    return peak
+
+class IdentityMap:
+    """Anonymised identity -> seeded row, stable for the whole replay"""
+
+    def __init__(self, seed: str, users: int, sessions: int, temp_sessions: int, temp_registrations: int):
+        self.seed = seed
+        self.users = users
+        self.sizes = {"session": sessions, "temp_session": temp_sessions,
+                      "temp_registration": temp_registrations}
+        self.assigned = {}
+        self.cursors = defaultdict(int)
+
+    def _usable(self, kind: str, j: int) -> bool:
+        # Live sessions not owned by the admin (user 0)
+        return kind != "session" or (session_is_live(j) and j % self.users != 0)
+
+    def index(self, kind: str, identity: str) -> int:
+        key = (kind, identity)
+        if key not in self.assigned:
+            j = self.cursors[kind]
+            while not self._usable(kind, j % self.sizes[kind]):
+                j += 1
+            self.cursors[kind] = j + 1
+            # More identities than seeded rows: share rows
+            self.assigned[key] = j % self.sizes[kind]
+        return self.assigned[key]
+
+    def cookie(self, kind: str, identity: str) -> str:
+        j = self.index(kind, identity)
+        if kind == "session":
+            return session_token(self.seed, j)
+        if kind == "temp_session":
+            return str(temp_session_id(self.seed, j))
+        return str(temp_registration_id(self.seed, j))
+
+class Replayer:
+    """Turns captured records back into requests"""
+
+    COOKIES = {"session": "auth_session_id", "temp_session": "temp_session_id",
+               "temp_registration": "temp_registration_id"}
+
+    def __init__(self, identities: IdentityMap, admin_api_key: Optional[str] = None,
+                 api_key: Optional[str] = None, internal_token: Optional[str] = None):
+        self.identities = identities
+        self.admin_api_key = admin_api_key
+        self.api_key = api_key
+        self.internal_token = internal_token
+        self.run = random.randrange(1000)
+        self.counters = defaultdict(count)
+
+    def _user(self, kind: str, usable) -> int:
+        """Next seeded user index (0 < i < users) accepted by `usable`, round robin"""
+        while True:
+            i = next(self.counters[kind]) % (self.identities.users - 1) + 1
+            if usable(i):
+                return i
+
+    def _login_user(self) -> int:
+        return self._user("login", lambda i: i % PENDING_EVERY != PENDING_EVERY - 1
+                          and i % INACTIVE_EVERY != INACTIVE_EVERY - 1)
+
+    def body(self, record: dict, ids: dict) -> Optional[dict]:
+        route, ok = record["route"], record["status"] < 400
+        if route == "/auth/login":
+            return {"identifier": user_email(self._login_user()),
+                    "password": SEED_PASSWORD if ok else "wrong-password"}
+        if route == "/auth/verify-otp" and "temp_session" in ids:
+            return {"otp": otp(self.identities.index("temp_session", ids["temp_session"])) if ok else "000000"}
+        if route == "/auth/verify-registration" and "temp_registration" in ids:
+            j = self.identities.index("temp_registration", ids["temp_registration"])
+            return {"otp": otp(j) if ok else "000000"}
+        if route == "/auth/register":
+            n = next(self.counters["register"])
+            return {"name": f"Replay {n}", "email": f"replay-{self.run}-{n}@example.com",
+                    "phone": f"07{self.run:03d}{n % 100_000:05d}",
+                    "password": SEED_PASSWORD, "confirm_password": SEED_PASSWORD}
+        if route == "/auth/admin/approve-user":
+            pending = self._user("pending", lambda i: i % PENDING_EVERY == PENDING_EVERY - 1)
+            return {"user_id": str(user_id(self.identities.seed, pending))}
+        if route == "/auth/internal/introspect":
+            return {"tokens": [session_token(self.identities.seed, 1)]}
+        if route == "/auth/admin/api-keys" and record["method"] == "POST":
+            return {"name": "replay", "role": "service"}
+        return None
+
+    def path(self, record: dict) -> str:
+        route = record["route"]
+        if "{user_id}" in route:
+            # Deleted users come from the far end of the seeded range
+            victim = self.identities.users - 1 - next(self.counters["delete"]) % (self.identities.users - 1)
+            route = route.replace("{user_id}", str(user_id(self.identities.seed, victim)))
+        if "{key_id}" in route:
+            route = route.replace("{key_id}", str(uuid.uuid4()))
+        return route.replace("{snapshot_id}", "1")
+
+    def request(self, record: dict) -> dict:
+        """Keyword arguments for httpx's request()"""
+        ids = record.get("identities", {})
+        headers = {}
+        cookies = []
+        admin = record.get("role") == "admin" and self.admin_api_key
+        for kind, name in self.COOKIES.items():
+            if kind in ids and not (admin and kind == "session"):
+                cookies.append(f"{name}={self.identities.cookie(kind, ids[kind])}")
+        if cookies:
+            headers["Cookie"] = "; ".join(cookies)
+        if admin:
+            headers["X-API-Key"] = self.admin_api_key
+        elif "api_key" in ids and self.api_key:
+            headers["X-API-Key"] = self.api_key
+        if record["route"].startswith("/auth/internal/") and self.internal_token:
+            headers["X-Internal-Token"] = self.internal_token
+        return {
+            "method": record["method"],
+            "url": self.path(record),
+            "params": {name: SYNTHETIC_QUERY.get(name, "x") if value == "*" else value
+                       for name, value in record.get("query", {}).items()},
+            "headers": headers,
+            "json": self.body(record, ids),
+        }
+
+def replayable(record: dict) -> bool:
+    return record.get("route") is not None and not record.get("stream")
+
+async def schedule(records: list, send, speed: float = 1.0, clock=time.perf_counter) -> list:
+    """Start send(record, due, sent) at each record's offset / speed; returns their results"""
+    started = clock()
+    first = records[0]["ts"]
+    tasks = []
+    for record in records:
+        due = (record["ts"] - first) / speed
+        delay = due - (clock() - started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send(record, due, clock() - started)))
+    return await asyncio.gather(*tasks)
+
+async def replay(args):
+    records = sorted(load(args.captures), key=lambda record: record["ts"])
+    skipped = [record for record in records if not replayable(record)]
+    records = [record for record in records if replayable(record)][:args.limit]
+    if not records:
+        raise SystemExit("❌ Nothing to replay")
+
+    replayer = Replayer(
+        IdentityMap(args.seed, args.users, args.sessions, args.temp_sessions, args.temp_registrations),
+        admin_api_key=args.admin_api_key, api_key=args.api_key, internal_token=args.internal_token
+    )
+    in_flight = {"now": 0, "peak": 0}
+    # Identities come from the capture, never from responses
+    no_cookies = httpx.Cookies(CookieJar(policy=DefaultCookiePolicy(allowed_domains=[])))
+
+    async with httpx.AsyncClient(base_url=args.base_url, cookies=no_cookies, timeout=args.timeout,
+                                 limits=httpx.Limits(max_connections=args.max_connections)) as client:
+        async def send(record, due, sent):
+            in_flight["now"] += 1
+            in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+            started = time.perf_counter()
+            try:
+                status = (await client.request(**replayer.request(record))).status_code
+            except httpx.HTTPError:
+                status = 0
+            finally:
+                in_flight["now"] -= 1
+            return {
+                "method": record["method"], "route": record["route"], "status": status,
+                "captured_status": record["status"],
+                "latency_ms": round((time.perf_counter() - started) * 1000, 3),
+                "lag_ms": round((sent - due) * 1000, 3),
+            }
+
+        span = records[-1]["ts"] - records[0]["ts"]
+        print(f"▶️  {len(records)} requests over {span:.1f}s at {args.speed}x ({len(skipped)} skipped)")
+        started = time.perf_counter()
+        results = await schedule(records, send, args.speed)
+        elapsed = time.perf_counter() - started
+
+    with open(args.out, "w") as out:
+        out.writelines(json.dumps(result) + "\n" for result in results)
+
+    captured_peak = max_concurrency(
+        (record["ts"], record["ts"] + record["duration_ms"] / 1000) for record in records
+    )
+    mismatched = sum(result["status"] != result["captured_status"] for result in results)
+    lags = sorted(result["lag_ms"] for result in results)
+    print(f"✅ {len(results)} requests in {elapsed:.1f}s -> {args.out}")
+    print(f"   peak concurrency: captured {captured_peak}, replayed {in_flight['peak']}")
+    print(f"   send lag p99: {percentile(lags, 99):.1f} ms (high: the replayer could not keep up)")
+    print(f"   status differs from the capture: {mismatched}")
+    print_table(summarise(results))
+
+def summarise(records: list) -> dict:
+    """(method, route) -> (count, p50, p90, p99) in ms"""
+    latencies = defaultdict(list)
+    for record in records:
+        if replayable(record):
+            latencies[(record["method"], record["route"])].append(latency(record))
+    summary = {}
+    for key, values in latencies.items():
+        values.sort()
+        summary[key] = (len(values), percentile(values, 50), percentile(values, 90), percentile(values, 99))
+    return summary
+
+def print_table(summary: dict):
+    print(f"\n{'route':<48} {'count':>7} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9}")
+    for (method, route), (total, p50, p90, p99) in sorted(summary.items(), key=lambda item: -item[1][0]):
+        print(f"{method + ' ' + route:<48} {total:>7} {p50:9.2f} {p90:9.2f} {p99:9.2f}")
+
+def regressions(base: dict, target: dict, threshold: float, min_count: int) -> list:
+    """Routes whose p99 grew by more than `threshold` percent"""
+    return [
+        key for key in base.keys() & target.keys()
+        if min(base[key][0], target[key][0]) >= min_count and target[key][3] > base[key][3] * (1 + threshold / 100)
+    ]
+
+def compare(args) -> int:
+    base, target = summarise(load([args.base])), summarise(load([args.target]))
+    regressed = set(regressions(base, target, args.threshold, args.min_count))
+
+    def change(before: float, after: float) -> str:
+        return f"{(after - before) / before * 100:+.0f}%" if before else "n/a"
+
+    print(f"{'route':<48} {'count':>13} {'p50 ms':>20} {'p99 ms':>20}")
+    for key in sorted(base.keys() | target.keys(), key=lambda key: -(base.get(key) or target[key])[0]):
+        name = f"{key[0]} {key[1]}"
+        if key not in base or key not in target:
+            print(f"{name:<48} only in {'base' if key in base else 'target'}")
+            continue
+        (n_a, p50_a, _, p99_a), (n_b, p50_b, _, p99_b) = base[key], target[key]
+        flag = "  ⚠️" if key in regressed else ""
+        print(f"{name:<48} {n_a:>6}/{n_b:<6} {p50_a:7.2f}->{p50_b:<7.2f}{change(p50_a, p50_b):>5} "
+              f"{p99_a:7.2f}->{p99_b:<7.2f}{change(p99_a, p99_b):>5}{flag}")
+    if regressed:
+        print(f"\n❌ p99 regressed more than {args.threshold}% on {len(regressed)} route(s)")
+        return 1
+    print("\n✅ No p99 regression")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured traffic and compare latencies")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    replay_parser = commands.add_parser("replay", help="Replay capture files against a server")
+    replay_parser.add_argument("captures", nargs="+")
+    replay_parser.add_argument("--base-url", default="http://localhost:8000")
+    replay_parser.add_argument("--speed", type=float, default=1.0, help="2 = twice as fast as captured")
+    replay_parser.add_argument("--out", default="replay-results.jsonl")
+    replay_parser.add_argument("--limit", type=int, default=None, help="Replay only the first N requests")
+    replay_parser.add_argument("--timeout", type=float, default=30.0)
+    replay_parser.add_argument("--max-connections", type=int, default=1000)
+    replay_parser.add_argument("--admin-api-key", default=None, help="API key with role admin")
+    replay_parser.add_argument("--api-key", default=None, help="API key for captured API-key callers")
+    replay_parser.add_argument("--internal-token", default=None, help="INTERNAL_API_TOKEN of the server")
+    # Must match the seed_dataset.py run
+    replay_parser.add_argument("--seed", default="seed")
+    replay_parser.add_argument("--users", type=int, default=1_000_000)
+    replay_parser.add_argument("--sessions", type=int, default=10_000_000)
+    replay_parser.add_argument("--temp-sessions", type=int, default=50_000)
+    replay_parser.add_argument("--temp-registrations", type=int, default=50_000)
+
+    compare_parser = commands.add_parser("compare", help="Compare latency distributions of two runs")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("target")
+    compare_parser.add_argument("--threshold", type=float, default=10.0, help="Allowed p99 growth, percent")
+    compare_parser.add_argument("--min-count", type=int, default=20, help="Ignore routes with fewer requests")
+
+    args = parser.parse_args()
+    if args.command == "replay":
+        asyncio.run(replay(args))
+    else:
+        sys.exit(compare(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Synthetic dataset generator.
+
+Bulk-loads production-sized users, auth_sessions, temp_sessions and
+temp_registrations tables with COPY, so query plans (test_query_plans.py) and
+load tests see realistic volumes instead of a handful of rows.
+
+Every row is derived from its number and --seed, so the same arguments always
+produce the same ids, emails, phones and session tokens:
+- user i: id user_id(seed, i), email user_email(i), phone user_phone(i),
+  password SEED_PASSWORD; user 0 is an admin, every PENDING_EVERY-th user is
+  pending approval and every INACTIVE_EVERY-th one is deactivated;
+- session j: token session_token(seed, j), owned by user j % users, still
+  valid unless session_is_live(j) is false.
+
+Usage (against a scratch database; --truncate empties the four tables first):
+    python seed_dataset.py [--users 1000000] [--sessions 10000000]
+        [--temp-sessions 50000] [--temp-registrations 50000] [--seed seed]
+        [--truncate] [--database-url postgresql://...]
+"""
+import argparse
+import asyncio
+import hashlib
+import time
+import uuid
+from datetime import datetime, timedelta
+import asyncpg
+import databases
+import counters
+from config import DATABASE_URL
+from migrations import migrate
+from utils import hash_password
+
+SEED_PASSWORD = "password123"
+
+PENDING_EVERY = 100
+INACTIVE_EVERY = 50
+# One session in EXPIRED_EVERY has already expired
+EXPIRED_EVERY = 5
+
+BATCH_SIZE = 100_000
+
+LAST_NAMES = ("Nguyen", "Tran", "Le", "Pham", "Hoang", "Vu", "Dang", "Bui")
+MIDDLE_NAMES = ("Van", "Thi", "Minh", "Duc", "Thu", "Hai")
+FIRST_NAMES = ("An", "Binh", "Chi", "Dung", "Giang", "Linh", "Nam", "Son", "Trang")
+DOMAINS = ("gmail.com", "yahoo.com", "outlook.com", "example.vn")
+
+USER_COLUMNS = (
+    "id", "name", "email", "phone", "password_hash", "role",
+    "is_active", "is_approved", "approved_at", "created_at"
+)
+SESSION_COLUMNS = ("id", "user_id", "session_token", "expires_at", "created_at")
+TEMP_SESSION_COLUMNS = ("id", "user_id", "otp_code", "otp_expires_at", "created_at")
+TEMP_REGISTRATION_COLUMNS = (
+    "id", "name", "email", "phone", "password_hash", "otp_code", "otp_expires_at", "created_at"
+)
+
+# Helper functions (also used to look seeded rows up again)
+def derived_uuid(seed: str, kind: str, i: int) -> uuid.UUID:
+    digest = hashlib.blake2b(f"{seed}:{kind}:{i}".encode(), digest_size=16).digest()
+    return uuid.UUID(bytes=digest, version=4)
+
+def user_id(seed: str, i: int) -> uuid.UUID:
+    return derived_uuid(seed, "user", i)
+
+def user_name(i: int) -> str:
+    return f"{LAST_NAMES[i % 8]} {MIDDLE_NAMES[(i // 8) % 6]} {FIRST_NAMES[(i // 48) % 9]} {i}"
+
+def user_email(i: int) -> str:
+    return f"user{i}@{DOMAINS[i % 4]}"
+
+def user_phone(i: int) -> str:
+    return f"09{i:08d}"
+
+def session_token(seed: str, j: int) -> str:
+    # 64 alphanumeric characters, like utils.generate_session_token
+    return hashlib.sha256(f"{seed}:session:{j}".encode()).hexdigest()
+
+def session_is_live(j: int) -> bool:
+    return j % EXPIRED_EVERY != 0
+
+def temp_session_id(seed: str, j: int) -> uuid.UUID:
+    return derived_uuid(seed, "temp_session", j)
+
+def temp_registration_id(seed: str, j: int) -> uuid.UUID:
+    return derived_uuid(seed, "temp_registration", j)
+
+def otp(j: int) -> str:
+    return f"{j * 7919 % 1_000_000:06d}"
+
+# Row generators
+def user_rows(seed: str, start: int, end: int, password_hash: str, now: datetime):
+    for i in range(start, end):
+        created_at = now - timedelta(minutes=i % 525_600)
+        approved = i % PENDING_EVERY != PENDING_EVERY - 1
+        yield (
+            user_id(seed, i), user_name(i), user_email(i), user_phone(i), password_hash,
+            "admin" if i == 0 else "user",
+            i % INACTIVE_EVERY != INACTIVE_EVERY - 1,
+            approved,
+            created_at + timedelta(hours=1) if approved else None,
+            created_at,
+        )
+
+def session_rows(seed: str, start: int, end: int, users: int, now: datetime):
+    for j in range(start, end):
+        created_at = now - timedelta(seconds=j % 86_400)
+        expires_at = created_at + timedelta(hours=24) if session_is_live(j) else now - timedelta(minutes=1 + j % 1440)
+        yield (derived_uuid(seed, "session", j), user_id(seed, j % users), session_token(seed, j), expires_at, created_at)
+
+def temp_session_rows(seed: str, start: int, end: int, users: int, now: datetime):
+    for j in range(start, end):
+        yield (temp_session_id(seed, j), user_id(seed, j % users), otp(j), now + timedelta(minutes=5), now)
+
+def temp_registration_rows(seed: str, start: int, end: int, password_hash: str, now: datetime):
+    for j in range(start, end):
+        yield (
+            temp_registration_id(seed, j), f"Pending {j}", f"pending{j}@{DOMAINS[j % 4]}",
+            f"08{j:08d}", password_hash, otp(j), now + timedelta(minutes=5), now,
+        )
+
+async def copy_rows(conn: asyncpg.Connection, table: str, columns: tuple, total: int, make_rows):
+    """COPY `total` rows in batches; make_rows(start, end) yields them"""
+    if not total:
+        return
+    print(f"🌱 {table}: {total} rows")
+    started = time.perf_counter()
+    for start in range(0, total, BATCH_SIZE):
+        end = min(start + BATCH_SIZE, total)
+        await conn.copy_records_to_table(table, records=list(make_rows(start, end)), columns=columns)
+        rate = end / (time.perf_counter() - started)
+        print(f"   {end}/{total} ({rate:,.0f} rows/s)")
+
+async def seed(database_url: str, users: int, sessions: int, temp_sessions: int,
+               temp_registrations: int, seed_name: str, truncate: bool):
+    await migrate(database_url=database_url)
+    conn = await asyncpg.connect(database_url)
+    try:
+        tables = "users, auth_sessions, temp_sessions, temp_registrations"
+        if truncate:
+            await conn.execute(f"TRUNCATE {tables}")
+        elif await conn.fetchval("SELECT EXISTS (SELECT 1 FROM users)"):
+            raise SystemExit("❌ users is not empty (use --truncate on a scratch database)")
+
+        password_hash = hash_password(SEED_PASSWORD)
+        now = datetime.utcnow()
+        await copy_rows(conn, "users", USER_COLUMNS, users,
+                        lambda start, end: user_rows(seed_name, start, end, password_hash, now))
+        await copy_rows(conn, "auth_sessions", SESSION_COLUMNS, sessions if users else 0,
+                        lambda start, end: session_rows(seed_name, start, end, users, now))
+        await copy_rows(conn, "temp_sessions", TEMP_SESSION_COLUMNS, min(temp_sessions, users),
+                        lambda start, end: temp_session_rows(seed_name, start, end, users, now))
+        await copy_rows(conn, "temp_registrations", TEMP_REGISTRATION_COLUMNS, temp_registrations,
+                        lambda start, end: temp_registration_rows(seed_name, start, end, password_hash, now))
+
+        print("📊 ANALYZE")
+        await conn.execute(f"ANALYZE {tables}")
+    finally:
+        await conn.close()
+
+    # COPY bypasses the API, so bring the dashboard counters in line
+    db = databases.Database(database_url)
+    await db.connect()
+    try:
+        await counters.reconcile(db)
+    finally:
+        await db.disconnect()
+    print("✅ Dataset seeded")
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load a synthetic dataset with COPY")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--sessions", type=int, default=10_000_000)
+    parser.add_argument("--temp-sessions", type=int, default=50_000)
+    parser.add_argument("--temp-registrations", type=int, default=50_000)
+    parser.add_argument("--seed", default="seed", help="Changes every derived id and token")
+    parser.add_argument("--truncate", action="store_true", help="Empty the seeded tables first")
+    parser.add_argument("--database-url", default=DATABASE_URL)
+    args = parser.parse_args()
+
+    asyncio.run(seed(
+        args.database_url, args.users, args.sessions, args.temp_sessions,
+        args.temp_registrations, args.seed, args.truncate
+    ))
+
+if __name__ == "__main__":
+    main()
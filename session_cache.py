@@ -0,0 +1,297 @@
+"""
+Session cache shared by all worker processes on a host.
+
+A fixed-size open-addressing table in a memory-mapped file (SESSION_CACHE_PATH,
+normally under /dev/shm), so every uvicorn worker sees the sessions any of
+them resolved and the memory is paid once, not once per worker.
+
+Each slot is one 64-byte record:
+    seq u32 | token digest 16B | user id 16B | flags u8 | role u8 | pad 2B |
+    session expiry f64 | cache expiry f64 | pad 8B
+Keys are BLAKE2b digests of the session token; linear probing over at most
+MAX_PROBES slots, evicting the entry closest to expiry when the window is
+full. Deleted entries leave a tombstone so probe chains stay intact.
+
+Readers never lock: each slot carries a seqlock counter that writers make odd
+while they write, and a reader retries (then gives up and misses) when the
+counter was odd or changed under it. Writers serialize across processes with
+flock on the file.
+
+Entries live at most SESSION_CACHE_TTL_SECONDS, which bounds how stale a
+cached role or approval flag can get; logout, login (which replaces the
+user's sessions), approval and deletion invalidate entries immediately.
+
+An invalidation can land while another request is reading the same session
+from the database, before that request fills the cache. So invalidations
+also bump a generation counter (GENERATION_STRIPES of them after the header,
+picked by token digest or user id), and a fill passes the generations it
+saw before its lookup: put() drops it when the token's or the user's
+counter moved meanwhile.
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Optional
+import metrics
+from config import SESSION_CACHE_ENABLED, SESSION_CACHE_PATH, SESSION_CACHE_SLOTS, SESSION_CACHE_TTL_SECONDS
+
+MAGIC = b"AUTHSC02"
+HEADER = struct.Struct("<8sII")
+GENERATION_STRIPES = 1024
+GENERATION = struct.Struct("<I")
+GENERATIONS_OFFSET = 64
+HEADER_SIZE = GENERATIONS_OFFSET + GENERATION_STRIPES * GENERATION.size
+SEQ = struct.Struct("<I")
+RECORD = struct.Struct("<I16s16sBB2xdd8x")
+RECORD_SIZE = RECORD.size
+USER_ID_OFFSET = 4 + 16
+
+USED = 1
+DELETED = 2
+APPROVED = 4
+ACTIVE = 8
+
+ROLES = ("user", "admin")
+
+MAX_PROBES = 8
+READ_RETRIES = 4
+
+def token_digest(token: str) -> bytes:
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+def token_stripe(digest: bytes) -> int:
+    return int.from_bytes(digest[8:12], "little") % GENERATION_STRIPES
+
+def user_stripe(user_id: bytes) -> int:
+    return int.from_bytes(user_id[12:], "little") % GENERATION_STRIPES
+
+def to_epoch(value: datetime) -> float:
+    """Naive UTC datetime (as stored) to epoch seconds"""
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+def from_epoch(value: float) -> datetime:
+    return datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None)
+
+class SharedSessionCache:
+    """Open-addressing session table in a shared memory-mapped file"""
+
+    def __init__(self, path: str = SESSION_CACHE_PATH, slots: int = SESSION_CACHE_SLOTS,
+                 ttl_seconds: float = SESSION_CACHE_TTL_SECONDS, clock=time.time):
+        if slots & (slots - 1):
+            raise ValueError("SESSION_CACHE_SLOTS must be a power of two")
+        self.path = path
+        self.slots = slots
+        self.mask = slots - 1
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.size = HEADER_SIZE + slots * RECORD_SIZE
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_fills = 0
+
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        with self._locked():
+            if os.fstat(self.fd).st_size != self.size:
+                os.ftruncate(self.fd, 0)
+                os.ftruncate(self.fd, self.size)
+            self.buffer = mmap.mmap(self.fd, self.size)
+            if HEADER.unpack_from(self.buffer, 0) != (MAGIC, slots, RECORD_SIZE):
+                # New file, or one laid out by a different configuration
+                self.buffer[:] = bytes(self.size)
+                HEADER.pack_into(self.buffer, 0, MAGIC, slots, RECORD_SIZE)
+
+    def close(self):
+        self.buffer.close()
+        os.close(self.fd)
+
+    @contextmanager
+    def _locked(self):
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def _offsets(self, digest: bytes):
+        home = int.from_bytes(digest[:8], "little")
+        for probe in range(MAX_PROBES):
+            yield HEADER_SIZE + ((home + probe) & self.mask) * RECORD_SIZE
+
+    def _read(self, offset: int):
+        """Consistent snapshot of one record, or None if writers kept changing it"""
+        for _ in range(READ_RETRIES):
+            record = RECORD.unpack_from(self.buffer, offset)
+            if not record[0] & 1 and SEQ.unpack_from(self.buffer, offset)[0] == record[0]:
+                return record
+        return None
+
+    def _write(self, offset: int, *fields):
+        """Overwrite one record (caller holds the lock)"""
+        seq = SEQ.unpack_from(self.buffer, offset)[0]
+        SEQ.pack_into(self.buffer, offset, (seq + 1) & 0xFFFFFFFF)
+        RECORD.pack_into(self.buffer, offset, (seq + 1) & 0xFFFFFFFF, *fields)
+        SEQ.pack_into(self.buffer, offset, (seq + 2) & 0xFFFFFFFF)
+
+    def _changed_since(self, stripe: int, since: bytes) -> bool:
+        offset = stripe * GENERATION.size
+        return GENERATION.unpack_from(self.buffer, GENERATIONS_OFFSET + offset) != GENERATION.unpack_from(since, offset)
+
+    def _bump(self, stripe: int):
+        """Advance one generation counter (caller holds the lock)"""
+        offset = GENERATIONS_OFFSET + stripe * GENERATION.size
+        GENERATION.pack_into(self.buffer, offset, (GENERATION.unpack_from(self.buffer, offset)[0] + 1) & 0xFFFFFFFF)
+
+    def generations(self) -> bytes:
+        """Snapshot of the invalidation counters, taken before a database lookup (see put)"""
+        return self.buffer[GENERATIONS_OFFSET:HEADER_SIZE]
+
+    def _delete(self, offset: int):
+        self._write(offset, bytes(16), bytes(16), DELETED, 0, 0.0, 0.0)
+
+    def get(self, token: str):
+        """Cached principal (id, role, is_approved, is_active, session_expires_at) or None"""
+        digest = token_digest(token)
+        now = self.clock()
+        for offset in self._offsets(digest):
+            record = self._read(offset)
+            if record is None:
+                break
+            _, key, user_id, flags, role, expires_at, valid_until = record
+            if not flags:
+                break  # never used: end of the probe chain
+            if flags & USED and key == digest:
+                if now >= expires_at or now >= valid_until:
+                    break
+                self.hits += 1
+                return SimpleNamespace(
+                    id=uuid.UUID(bytes=user_id),
+                    role=ROLES[role],
+                    is_approved=bool(flags & APPROVED),
+                    is_active=bool(flags & ACTIVE),
+                    session_expires_at=from_epoch(expires_at),
+                )
+        self.misses += 1
+        return None
+
+    def put(self, token: str, user, session_expires_at: datetime, since: Optional[bytes] = None):
+        """Cache the principal of a session resolved from the database
+
+        `since` is generations() from before the lookup: the fill is dropped
+        if the session or its user was invalidated after it.
+        """
+        digest = token_digest(token)
+        user_bytes = uuid.UUID(str(user.id)).bytes
+        now = self.clock()
+        flags = USED | (APPROVED if user.is_approved else 0) | (ACTIVE if user.is_active else 0)
+        fields = (
+            digest, user_bytes, flags, ROLES.index(user.role) if user.role in ROLES else 0,
+            to_epoch(session_expires_at), now + self.ttl_seconds
+        )
+        with self._locked():
+            if since is not None and (
+                self._changed_since(token_stripe(digest), since) or self._changed_since(user_stripe(user_bytes), since)
+            ):
+                self.stale_fills += 1
+                return
+            target = free = victim = None
+            victim_expiry = None
+            for offset in self._offsets(digest):
+                _, key, _, slot_flags, _, expires_at, valid_until = RECORD.unpack_from(self.buffer, offset)
+                if slot_flags & USED and key == digest:
+                    target = offset
+                    break
+                live = slot_flags & USED and now < min(expires_at, valid_until)
+                if not live:
+                    if free is None:
+                        free = offset
+                    if not slot_flags:
+                        break  # nothing further along this chain
+                elif victim_expiry is None or min(expires_at, valid_until) < victim_expiry:
+                    victim, victim_expiry = offset, min(expires_at, valid_until)
+            if target is None:
+                target = free
+            if target is None:
+                target = victim
+                self.evictions += 1
+            self._write(target, *fields)
+
+    def invalidate(self, token: str):
+        """Forget one session (logout)"""
+        digest = token_digest(token)
+        with self._locked():
+            self._bump(token_stripe(digest))
+            for offset in self._offsets(digest):
+                _, key, _, flags, _, _, _ = RECORD.unpack_from(self.buffer, offset)
+                if not flags:
+                    return
+                if flags & USED and key == digest:
+                    self._delete(offset)
+                    return
+
+    def invalidate_user(self, user_id):
+        """Forget every session of a user (login, approval, deletion)"""
+        needle = uuid.UUID(str(user_id)).bytes
+        with self._locked():
+            self._bump(user_stripe(needle))
+            position = self.buffer.find(needle, HEADER_SIZE)
+            while position != -1:
+                offset = position - USER_ID_OFFSET
+                if (offset - HEADER_SIZE) % RECORD_SIZE == 0:
+                    _, _, stored, flags, _, _, _ = RECORD.unpack_from(self.buffer, offset)
+                    if flags & USED and stored == needle:
+                        self._delete(offset)
+                position = self.buffer.find(needle, position + 1)
+
+    def stats(self) -> dict:
+        return {
+            "slots": self.slots,
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "stale_fills": self.stale_fills,
+        }
+
+_cache: Optional[SharedSessionCache] = None
+_opened = False
+
+def get_session_cache() -> Optional[SharedSessionCache]:
+    """The process's view of the shared cache (None when disabled); opened on first use"""
+    global _cache, _opened
+    if not _opened:
+        _opened = True
+        if SESSION_CACHE_ENABLED:
+            _cache = SharedSessionCache()
+    return _cache
+
+def set_session_cache(cache: Optional[SharedSessionCache]):
+    """Replace the cache (tests and benchmarks)"""
+    global _cache, _opened
+    _cache, _opened = cache, True
+
+def invalidate(token: str):
+    cache = get_session_cache()
+    if cache is not None:
+        cache.invalidate(token)
+
+def invalidate_user(user_id):
+    cache = get_session_cache()
+    if cache is not None:
+        cache.invalidate_user(user_id)
+
+def _stat(attribute):
+    return lambda: _cache.stats()[attribute] if _cache is not None else 0
+
+metrics.gauge("session_cache_hits", "Shared session cache hits in this worker", _stat("hits"))
+metrics.gauge("session_cache_misses", "Shared session cache misses in this worker", _stat("misses"))
+metrics.gauge("session_cache_evictions", "Live entries evicted by this worker", _stat("evictions"))
+metrics.gauge("session_cache_stale_fills", "Fills dropped because the session was invalidated during the lookup",
+              _stat("stale_fills"))
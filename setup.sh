@@ -24,8 +24,8 @@ echo "2. Create your database"
 echo "3. Run the SQL schema:"
 echo "   psql -d your_database -f database_schema.sql"
 echo ""
-echo "OR run the schema update script:"
-echo "   python update_schema.py"
+echo "OR apply the versioned migrations:"
+echo "   python migrations.py migrate"
 echo ""
 
 # Admin setup
@@ -44,7 +44,7 @@ echo ""
 
 echo "🎯 Next steps:"
 echo "1. Configure PostgreSQL database"
-echo "2. Run: python update_schema.py (to add approval columns)"
+echo "2. Run: python migrations.py migrate (to apply schema migrations)"
 echo "3. Run: python create_admin.py (to create admin user)"
 echo "4. Update .env file with your settings"
 echo "5. Run: python main.py (to start the API)"
@@ -0,0 +1,64 @@
+"""
+Single-flight coalescing of concurrent identical lookups.
+
+`await flight.do(key, func)` runs `func()` once per key at a time: callers
+that arrive while a call for the same key is in flight await that call
+instead of starting their own, and all of them get its result or exception.
+The key is forgotten as soon as the call finishes, so nothing is cached and
+later callers always see fresh data.
+
+The call runs in its own task and callers await it through asyncio.shield:
+a caller that is cancelled (client disconnected) stops waiting without
+cancelling the lookup for the others. If every caller goes away the call
+still completes and its result is dropped.
+
+Coalescing counts are exported in /metrics per flight name.
+"""
+import asyncio
+from typing import Awaitable, Callable, Hashable
+import metrics
+
+class SingleFlight:
+    """Share one in-flight call among concurrent callers with the same key"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.in_flight = {}
+        self.calls = 0
+        self.coalesced = 0
+        _flights[name] = self
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable]):
+        self.calls += 1
+        task = self.in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self.in_flight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, key, task: asyncio.Task):
+        if self.in_flight.get(key) is task:
+            del self.in_flight[key]
+        # Mark the exception retrieved when every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "ratio": self.coalesced / self.calls if self.calls else 0.0,
+            "in_flight": len(self.in_flight),
+        }
+
+_flights = {}
+
+def _per_flight(attribute):
+    return lambda: {(("name", name),): flight.stats()[attribute] for name, flight in _flights.items()}
+
+metrics.gauge("singleflight_calls", "Lookups requested per single-flight group", _per_flight("calls"))
+metrics.gauge("singleflight_coalesced", "Lookups served by another caller's in-flight call", _per_flight("coalesced"))
+metrics.gauge("singleflight_coalescing_ratio", "Share of lookups that were coalesced", _per_flight("ratio"))
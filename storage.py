@@ -0,0 +1,189 @@
+"""
+Storage interface for users, temp registrations, temp sessions and auth sessions.
+
+Routes talk to `get_storage()` instead of the database directly. Two backends:
+- "postgres" (storage_postgres.py): the production backend.
+- "memory" (storage_memory.py): indexed dicts with TTL expiry, for local
+  development, tests and CPU-only load tests of the HTTP and bcrypt layers.
+
+Select one with STORAGE_BACKEND. Rows are returned as objects with attribute
+access (`user.email`), whichever backend produced them.
+
+Reads that accept `request` may be served by a read replica (see
+database.ReadRouter); without it they go to the primary and always run a
+query of their own, so the row is never older than the call (what cache
+fills and re-checks after a refusal rely on).
+"""
+from typing import Optional
+from config import STORAGE_BACKEND
+
+# Column order of an audit record (see audit.py)
+AUDIT_COLUMNS = ("occurred_at", "event", "outcome", "user_id", "actor_id", "identifier", "ip", "request_id")
+
+class DuplicateUserError(Exception):
+    """Email or phone already belongs to a user"""
+
+class Storage:
+    """Operations the auth routes need from persistence"""
+
+    name = "base"
+
+    async def connect(self):
+        """Open connections and start backend-specific background tasks"""
+
+    async def disconnect(self):
+        """Stop background tasks and close connections"""
+
+    # Users
+    async def get_user(self, user_id, request=None):
+        raise NotImplementedError
+
+    async def get_user_by_email(self, email: str, request=None):
+        raise NotImplementedError
+
+    async def get_user_by_phone(self, phone: str, request=None):
+        raise NotImplementedError
+
+    async def identifier_taken(self, email: str, phone: str) -> bool:
+        """Whether the email or the phone already belongs to a user"""
+        raise NotImplementedError
+
+    async def iter_identifiers(self):
+        """Yield (email, phone) for every user (streaming, for bloom.py)"""
+        raise NotImplementedError
+        yield
+
+    async def create_user(self, user: dict) -> int:
+        """Insert a user and publish `user.registered`; returns its change version.
+
+        Raises DuplicateUserError if the email or phone is taken.
+        """
+        raise NotImplementedError
+
+    async def approve_user(self, user_id, approved_by):
+        """Approve a pending user and publish `user.approved`.
+
+        Returns the updated user's `is_active` and `version`, or None if the
+        user does not exist or was already approved.
+        """
+        raise NotImplementedError
+
+    async def delete_user(self, user_id):
+        """Delete a user with their sessions, leaving a tombstone.
+
+        Returns the deleted user's `is_approved` and `is_active`, or None.
+        """
+        raise NotImplementedError
+
+    async def replace_password_hash(self, user_id, old_hash: str, new_hash: str):
+        """Swap the hash only if it is still `old_hash`"""
+        raise NotImplementedError
+
+    async def list_users(self, pending_only: bool = False, request=None) -> list:
+        """Users, newest first"""
+        raise NotImplementedError
+
+    async def search_users(self, q: str, fields, limit: int, offset: int, request=None) -> list:
+        """Users ranked by exact, prefix then substring match; up to limit + 1 rows"""
+        raise NotImplementedError
+
+    async def users_version(self, request=None) -> int:
+        """Latest change version across users and deletions"""
+        raise NotImplementedError
+
+    async def user_changes(self, since: int, limit: int, request=None):
+        """(users, tombstones) changed after `since`, each ordered by version, up to limit + 1 each"""
+        raise NotImplementedError
+
+    async def admin_counts(self, request=None) -> dict:
+        """Pending users, active users and live sessions"""
+        raise NotImplementedError
+
+    # Temp registrations
+    async def replace_temp_registration(self, registration: dict):
+        """Store a registration, dropping pending ones for the same email/phone"""
+        raise NotImplementedError
+
+    async def get_temp_registration(self, registration_id):
+        raise NotImplementedError
+
+    async def update_temp_registration_otp(self, registration_id, otp_code: str, otp_expires_at):
+        raise NotImplementedError
+
+    async def delete_temp_registration(self, registration_id):
+        raise NotImplementedError
+
+    # Temp (login) sessions
+    async def replace_temp_session(self, temp_session: dict):
+        """Store a login OTP session, dropping the user's previous ones"""
+        raise NotImplementedError
+
+    async def get_temp_session(self, temp_session_id):
+        raise NotImplementedError
+
+    async def update_temp_session_otp(self, temp_session_id, otp_code: str, otp_expires_at):
+        raise NotImplementedError
+
+    async def delete_temp_session(self, temp_session_id):
+        raise NotImplementedError
+
+    # Auth sessions
+    async def replace_auth_session(self, auth_session: dict):
+        """Store a login session, replacing the user's previous ones"""
+        raise NotImplementedError
+
+    async def get_auth_session(self, session_token: str, request=None):
+        raise NotImplementedError
+
+    async def delete_auth_session(self, session_token: str):
+        raise NotImplementedError
+
+    async def introspect_sessions(self, session_tokens: list, request=None) -> list:
+        """Rows (session_token, expires_at, user_id, role) for the tokens that exist, in one query"""
+        raise NotImplementedError
+
+    # API keys (see api_keys.py)
+    async def create_api_key(self, api_key: dict):
+        raise NotImplementedError
+
+    async def get_api_key_by_prefix(self, prefix: str):
+        raise NotImplementedError
+
+    async def list_api_keys(self) -> list:
+        raise NotImplementedError
+
+    async def revoke_api_key(self, key_id):
+        """Mark a key revoked and announce it; returns the row, or None if missing or already revoked"""
+        raise NotImplementedError
+
+    # Audit log (see audit.py)
+    async def write_audit_events(self, records: list):
+        """Append a batch of audit records (tuples in AUDIT_COLUMNS order)"""
+        raise NotImplementedError
+
+    async def maintain_audit_partitions(self):
+        """Create upcoming audit partitions and drop expired ones"""
+
+_storage: Optional[Storage] = None
+
+def create_storage(backend: str = STORAGE_BACKEND) -> Storage:
+    """Build a backend by name"""
+    if backend == "postgres":
+        from storage_postgres import PostgresStorage
+        return PostgresStorage()
+    if backend == "memory":
+        from storage_memory import MemoryStorage
+        return MemoryStorage()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+def get_storage() -> Storage:
+    """The process-wide storage backend"""
+    global _storage
+    if _storage is None:
+        _storage = create_storage()
+    return _storage
+
+def set_storage(storage: Storage):
+    """Replace the process-wide backend (tests, benchmarks)"""
+    global _storage
+    _storage = storage
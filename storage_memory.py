@@ -0,0 +1,405 @@
+"""
+In-memory storage backend (see storage.py).
+
+Everything lives in dicts keyed by id plus secondary indexes (email, phone,
+user id, session token), so every route operation is O(1) except the admin
+listing, search and delta-sync scans. Temp registrations and temp sessions
+expire MEMORY_TEMP_TTL_SECONDS after their last write, auth sessions at their
+`expires_at`; expired entries are skipped on read and purged by a sweep task
+driven by a deadline heap.
+
+Single process only: nothing is shared between workers or survives a restart.
+Events go straight to the in-process broadcaster (events.py).
+"""
+import asyncio
+import heapq
+import itertools
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import counters
+import events
+from config import MEMORY_TEMP_TTL_SECONDS, MEMORY_SWEEP_SECONDS
+from storage import Storage, DuplicateUserError
+from logging_service import get_logger
+
+logger = get_logger(__name__)
+
+# Most recent audit records kept (oldest are discarded)
+AUDIT_RETAINED = 100000
+
+# Shorter search terms only match as prefixes (as in the Postgres backend)
+MIN_SUBSTRING_LENGTH = 3
+
+USER_DEFAULTS = {
+    "role": "user",
+    "is_active": True,
+    "is_approved": False,
+    "approved_at": None,
+    "approved_by": None,
+}
+
+def _row(values: dict) -> SimpleNamespace:
+    """Detached copy, so callers cannot mutate stored state"""
+    return SimpleNamespace(**values)
+
+class MemoryStorage(Storage):
+    """Indexed dicts with TTL expiry"""
+
+    name = "memory"
+
+    def __init__(self, temp_ttl_seconds: float = MEMORY_TEMP_TTL_SECONDS,
+                 sweep_seconds: float = MEMORY_SWEEP_SECONDS, clock=datetime.utcnow):
+        self.temp_ttl = timedelta(seconds=temp_ttl_seconds)
+        self.sweep_seconds = sweep_seconds
+        self.clock = clock
+        self.sweep_task = None
+
+        self.users = {}
+        self.users_by_email = {}
+        self.users_by_phone = {}
+        self.tombstones = {}
+        self.version = 0
+        self.counts = {name: 0 for name in counters.COUNTER_NAMES}
+
+        self.temp_registrations = {}
+        self.temp_registrations_by_email = {}
+        self.temp_registrations_by_phone = {}
+        self.temp_sessions = {}
+        self.temp_sessions_by_user = {}
+        self.auth_sessions = {}
+        self.auth_sessions_by_user = {}
+
+        self.api_keys = {}
+        self.api_keys_by_prefix = {}
+        self.audit_events = deque(maxlen=AUDIT_RETAINED)
+
+        # (deadline, tiebreak, kind, key); stale entries are skipped on pop
+        self.deadlines = []
+        self.sequence = itertools.count()
+
+    async def connect(self):
+        if self.sweep_task is None:
+            self.sweep_task = asyncio.create_task(self._sweep_forever())
+
+    async def disconnect(self):
+        if self.sweep_task is not None:
+            self.sweep_task.cancel()
+            self.sweep_task = None
+
+    # Expiry
+    def _expire_at(self, kind: str, key, deadline: datetime):
+        heapq.heappush(self.deadlines, (deadline, next(self.sequence), kind, key))
+
+    def _live(self, entry: dict):
+        if entry is None or entry["_expires_at"] <= self.clock():
+            return None
+        return entry
+
+    def sweep(self) -> int:
+        """Purge entries whose deadline has passed; returns how many"""
+        now = self.clock()
+        purged = 0
+        while self.deadlines and self.deadlines[0][0] <= now:
+            _, _, kind, key = heapq.heappop(self.deadlines)
+            table = getattr(self, kind)
+            entry = table.get(key)
+            # Rewritten entries were re-armed with a later deadline
+            if entry is not None and entry["_expires_at"] <= now:
+                getattr(self, f"_drop_{kind}")(key)
+                purged += 1
+        return purged
+
+    async def _sweep_forever(self):
+        while True:
+            await asyncio.sleep(self.sweep_seconds)
+            purged = self.sweep()
+            if purged:
+                logger.debug("Expired entries purged", extra={"fields": {"count": purged}})
+
+    def _next_version(self) -> int:
+        self.version += 1
+        return self.version
+
+    def _adjust(self, deltas: dict):
+        for name, delta in deltas.items():
+            self.counts[name] += delta
+
+    # Users
+    async def get_user(self, user_id, request=None):
+        user = self.users.get(str(user_id))
+        return _row(user) if user else None
+
+    async def get_user_by_email(self, email: str, request=None):
+        return await self.get_user(self.users_by_email.get(email))
+
+    async def get_user_by_phone(self, phone: str, request=None):
+        return await self.get_user(self.users_by_phone.get(phone))
+
+    async def identifier_taken(self, email: str, phone: str) -> bool:
+        return email in self.users_by_email or phone in self.users_by_phone
+
+    async def iter_identifiers(self):
+        for user in list(self.users.values()):
+            yield user["email"], user["phone"]
+
+    async def create_user(self, user: dict) -> int:
+        if await self.identifier_taken(user["email"], user["phone"]):
+            raise DuplicateUserError()
+        user = {**USER_DEFAULTS, "created_at": self.clock(), **user, "id": str(user["id"])}
+        user["version"] = self._next_version()
+        self.users[user["id"]] = user
+        self.users_by_email[user["email"]] = user["id"]
+        self.users_by_phone[user["phone"]] = user["id"]
+        self._adjust(counters.user_counter_deltas(_row(user)))
+        events.broadcaster.publish({
+            "type": events.USER_REGISTERED,
+            "user_id": user["id"],
+            "name": user["name"],
+            "email": user["email"],
+            "phone": user["phone"],
+            "version": user["version"],
+        })
+        return user["version"]
+
+    async def approve_user(self, user_id, approved_by):
+        user = self.users.get(str(user_id))
+        if user is None or user["is_approved"]:
+            return None
+        user.update(
+            is_approved=True,
+            approved_at=self.clock(),
+            approved_by=approved_by,
+            version=self._next_version()
+        )
+        self._adjust({
+            counters.PENDING_USERS: -1,
+            counters.ACTIVE_USERS: 1 if user["is_active"] else 0
+        })
+        events.broadcaster.publish({
+            "type": events.USER_APPROVED,
+            "user_id": user["id"],
+            "name": user["name"],
+            "email": user["email"],
+            "version": user["version"],
+        })
+        return _row(user)
+
+    async def delete_user(self, user_id):
+        user_id = str(user_id)
+        user = self.users.pop(user_id, None)
+        if user is None:
+            return None
+        del self.users_by_email[user["email"]]
+        del self.users_by_phone[user["phone"]]
+        sessions = list(self.auth_sessions_by_user.get(user_id, ()))
+        for token in sessions:
+            self._drop_auth_sessions(token)
+        temp_session_id = self.temp_sessions_by_user.get(user_id)
+        if temp_session_id is not None:
+            self._drop_temp_sessions(temp_session_id)
+        self.tombstones[user_id] = {
+            "user_id": user_id, "version": self._next_version(), "deleted_at": self.clock()
+        }
+        self._adjust(counters.user_counter_deltas(_row(user), sign=-1))
+        return _row(user)
+
+    async def replace_password_hash(self, user_id, old_hash: str, new_hash: str):
+        user = self.users.get(str(user_id))
+        if user is not None and user["password_hash"] == old_hash:
+            user["password_hash"] = new_hash
+
+    async def list_users(self, pending_only: bool = False, request=None) -> list:
+        users = [
+            user for user in self.users.values()
+            if not pending_only or not user["is_approved"]
+        ]
+        users.sort(key=lambda user: user["created_at"], reverse=True)
+        return [_row(user) for user in users]
+
+    async def search_users(self, q: str, fields, limit: int, offset: int, request=None) -> list:
+        # Linear scan: same ranking as Postgres minus the trigram similarity
+        term = q.strip().lower()
+        ranked = []
+        for user in self.users.values():
+            best = None
+            for name in fields:
+                value = user[name] if name == "phone" else user[name].lower()
+                if value == term:
+                    rank = 0
+                elif value.startswith(term):
+                    rank = 1
+                elif len(term) >= MIN_SUBSTRING_LENGTH and term in value:
+                    rank = 2
+                else:
+                    continue
+                best = rank if best is None else min(best, rank)
+            if best is not None:
+                ranked.append((best, user))
+        ranked.sort(key=lambda match: match[1]["created_at"], reverse=True)
+        ranked.sort(key=lambda match: match[0])
+        return [_row(user) for _, user in ranked[offset:offset + limit + 1]]
+
+    async def users_version(self, request=None) -> int:
+        return self.version
+
+    async def user_changes(self, since: int, limit: int, request=None):
+        users = sorted(
+            (user for user in self.users.values() if user["version"] > since),
+            key=lambda user: user["version"]
+        )[:limit + 1]
+        tombstones = sorted(
+            (tombstone for tombstone in self.tombstones.values() if tombstone["version"] > since),
+            key=lambda tombstone: tombstone["version"]
+        )[:limit + 1]
+        return [_row(user) for user in users], [_row(tombstone) for tombstone in tombstones]
+
+    async def admin_counts(self, request=None) -> dict:
+        self.sweep()
+        return {**self.counts, counters.LIVE_SESSIONS: len(self.auth_sessions)}
+
+    # Temp registrations
+    def _drop_temp_registrations(self, registration_id):
+        registration = self.temp_registrations.pop(registration_id, None)
+        if registration is None:
+            return
+        if self.temp_registrations_by_email.get(registration["email"]) == registration_id:
+            del self.temp_registrations_by_email[registration["email"]]
+        if self.temp_registrations_by_phone.get(registration["phone"]) == registration_id:
+            del self.temp_registrations_by_phone[registration["phone"]]
+
+    def _touch(self, kind: str, entry: dict, key):
+        entry["_expires_at"] = self.clock() + self.temp_ttl
+        self._expire_at(kind, key, entry["_expires_at"])
+
+    async def replace_temp_registration(self, registration: dict):
+        for index, value in ((self.temp_registrations_by_email, registration["email"]),
+                             (self.temp_registrations_by_phone, registration["phone"])):
+            existing = index.get(value)
+            if existing is not None:
+                self._drop_temp_registrations(existing)
+        registration_id = str(registration["id"])
+        entry = {"created_at": self.clock(), **registration, "id": registration_id}
+        self.temp_registrations[registration_id] = entry
+        self.temp_registrations_by_email[entry["email"]] = registration_id
+        self.temp_registrations_by_phone[entry["phone"]] = registration_id
+        self._touch("temp_registrations", entry, registration_id)
+
+    async def get_temp_registration(self, registration_id):
+        entry = self._live(self.temp_registrations.get(str(registration_id)))
+        return _row(entry) if entry else None
+
+    async def update_temp_registration_otp(self, registration_id, otp_code: str, otp_expires_at):
+        entry = self.temp_registrations.get(str(registration_id))
+        if entry is not None:
+            entry.update(otp_code=otp_code, otp_expires_at=otp_expires_at)
+            self._touch("temp_registrations", entry, entry["id"])
+
+    async def delete_temp_registration(self, registration_id):
+        self._drop_temp_registrations(str(registration_id))
+
+    # Temp (login) sessions
+    def _drop_temp_sessions(self, temp_session_id):
+        temp_session = self.temp_sessions.pop(temp_session_id, None)
+        if temp_session is not None and self.temp_sessions_by_user.get(temp_session["user_id"]) == temp_session_id:
+            del self.temp_sessions_by_user[temp_session["user_id"]]
+
+    async def replace_temp_session(self, temp_session: dict):
+        user_id = str(temp_session["user_id"])
+        existing = self.temp_sessions_by_user.get(user_id)
+        if existing is not None:
+            self._drop_temp_sessions(existing)
+        temp_session_id = str(temp_session["id"])
+        entry = {"created_at": self.clock(), **temp_session, "id": temp_session_id, "user_id": user_id}
+        self.temp_sessions[temp_session_id] = entry
+        self.temp_sessions_by_user[user_id] = temp_session_id
+        self._touch("temp_sessions", entry, temp_session_id)
+
+    async def get_temp_session(self, temp_session_id):
+        entry = self._live(self.temp_sessions.get(str(temp_session_id)))
+        return _row(entry) if entry else None
+
+    async def update_temp_session_otp(self, temp_session_id, otp_code: str, otp_expires_at):
+        entry = self.temp_sessions.get(str(temp_session_id))
+        if entry is not None:
+            entry.update(otp_code=otp_code, otp_expires_at=otp_expires_at)
+            self._touch("temp_sessions", entry, entry["id"])
+
+    async def delete_temp_session(self, temp_session_id):
+        self._drop_temp_sessions(str(temp_session_id))
+
+    # Auth sessions
+    def _drop_auth_sessions(self, session_token: str):
+        auth_session = self.auth_sessions.pop(session_token, None)
+        if auth_session is None:
+            return
+        tokens = self.auth_sessions_by_user.get(auth_session["user_id"])
+        if tokens is not None:
+            tokens.discard(session_token)
+            if not tokens:
+                del self.auth_sessions_by_user[auth_session["user_id"]]
+
+    async def replace_auth_session(self, auth_session: dict):
+        user_id = str(auth_session["user_id"])
+        for token in list(self.auth_sessions_by_user.get(user_id, ())):
+            self._drop_auth_sessions(token)
+        entry = {
+            "created_at": self.clock(),
+            **auth_session,
+            "id": str(auth_session.get("id") or uuid.uuid4()),
+            "user_id": user_id,
+            "_expires_at": auth_session["expires_at"],
+        }
+        self.auth_sessions[entry["session_token"]] = entry
+        self.auth_sessions_by_user.setdefault(user_id, set()).add(entry["session_token"])
+        self._expire_at("auth_sessions", entry["session_token"], entry["_expires_at"])
+
+    async def get_auth_session(self, session_token: str, request=None):
+        entry = self._live(self.auth_sessions.get(session_token))
+        return _row(entry) if entry else None
+
+    async def delete_auth_session(self, session_token: str):
+        self._drop_auth_sessions(session_token)
+
+    async def introspect_sessions(self, session_tokens: list, request=None) -> list:
+        rows = []
+        for session_token in session_tokens:
+            entry = self._live(self.auth_sessions.get(session_token))
+            user = self.users.get(entry["user_id"]) if entry else None
+            if user is not None:
+                rows.append(_row({
+                    "session_token": session_token,
+                    "expires_at": entry["expires_at"],
+                    "user_id": user["id"],
+                    "role": user["role"],
+                    "is_active": user["is_active"],
+                    "is_approved": user["is_approved"],
+                }))
+        return rows
+
+    # API keys
+    async def create_api_key(self, api_key: dict):
+        entry = {"created_by": None, "created_at": self.clock(), "revoked_at": None, **api_key,
+                 "id": str(api_key["id"])}
+        self.api_keys[entry["id"]] = entry
+        self.api_keys_by_prefix[entry["prefix"]] = entry["id"]
+
+    async def get_api_key_by_prefix(self, prefix: str):
+        entry = self.api_keys.get(self.api_keys_by_prefix.get(prefix))
+        return _row(entry) if entry else None
+
+    async def list_api_keys(self) -> list:
+        return [_row(entry) for entry in sorted(self.api_keys.values(), key=lambda e: e["created_at"], reverse=True)]
+
+    async def revoke_api_key(self, key_id):
+        entry = self.api_keys.get(str(key_id))
+        if entry is None or entry["revoked_at"] is not None:
+            return None
+        entry["revoked_at"] = self.clock()
+        events.broadcaster.publish({"type": events.API_KEY_REVOKED, "prefix": entry["prefix"]})
+        return _row(entry)
+
+    # Audit log
+    async def write_audit_events(self, records: list):
+        self.audit_events.extend(records)
@@ -0,0 +1,500 @@
+"""
+Postgres storage backend (see storage.py).
+
+Writes that change what the admin dashboard counts adjust the striped
+counters (counters.py) in the same transaction, and writes that bump a user's
+change version take the users-version lock and publish their event with
+pg_notify (events.py), so it is delivered on commit. Concurrent identical
+session and user point reads made for a request are coalesced
+(singleflight.py); reads without one are not (see storage.py).
+"""
+import asyncio
+import asyncpg
+import sqlalchemy
+from sqlalchemy.dialects.postgresql import ARRAY
+from datetime import datetime, date, timedelta
+from types import SimpleNamespace
+import counters
+import events
+from database import (
+    database, read_router, connect_db, disconnect_db, users_table, temp_registrations_table,
+    temp_sessions_table, auth_sessions_table, user_tombstones_table, users_change_seq, api_keys_table
+)
+from storage import Storage, DuplicateUserError, AUDIT_COLUMNS
+from singleflight import SingleFlight
+from config import AUDIT_RETENTION_DAYS, AUDIT_PARTITIONS_AHEAD
+from logging_service import get_logger
+
+logger = get_logger(__name__)
+
+# Arbitrary constant for the users-version advisory lock
+USERS_VERSION_LOCK_KEY = 7_260_034
+
+async def lock_users_version(db=database):
+    """Serialize transactions that take a users_change_seq value.
+
+    Sequence values are handed out before commit, so without this a change
+    with a lower version could become visible after a client has already
+    synced past it. Held until the surrounding transaction ends; only user
+    inserts, approvals and deletions take it.
+    """
+    await db.execute(
+        sqlalchemy.select(sqlalchemy.func.pg_advisory_xact_lock(USERS_VERSION_LOCK_KEY))
+    )
+
+# Arbitrary constant for the audit partition maintenance lock
+AUDIT_MAINTENANCE_LOCK_KEY = 7_260_040
+
+AUDIT_PARTITION_PREFIX = "audit_log_p"
+
+def audit_partition_name(day: date) -> str:
+    return f"{AUDIT_PARTITION_PREFIX}{day:%Y%m%d}"
+
+async def maintain_audit_partitions(conn: asyncpg.Connection, today: date,
+                                    retention_days: int = AUDIT_RETENTION_DAYS,
+                                    ahead: int = AUDIT_PARTITIONS_AHEAD):
+    """Create daily audit partitions up to `ahead` days out, drop expired ones.
+
+    Expired days are removed with DROP TABLE, which is instant and leaves no
+    dead tuples, instead of a DELETE over millions of rows. Only one worker
+    does this at a time; the others skip the round.
+    """
+    async with conn.transaction():
+        if not await conn.fetchval("SELECT pg_try_advisory_xact_lock($1)", AUDIT_MAINTENANCE_LOCK_KEY):
+            return
+        # Do not queue behind long readers of the parent (would block inserts)
+        await conn.execute("SET LOCAL lock_timeout = '5s'")
+        for offset in range(ahead + 1):
+            day = today + timedelta(days=offset)
+            await conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {audit_partition_name(day)} PARTITION OF audit_log "
+                f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+            )
+        partitions = await conn.fetch(
+            """
+            SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'audit_log'::regclass
+            """
+        )
+        oldest_kept = today - timedelta(days=retention_days)
+        for row in partitions:
+            name = row["relname"]
+            try:
+                day = datetime.strptime(name[len(AUDIT_PARTITION_PREFIX):], "%Y%m%d").date()
+            except ValueError:
+                continue
+            if name.startswith(AUDIT_PARTITION_PREFIX) and day < oldest_kept:
+                await conn.execute(f"DROP TABLE {name}")
+                logger.info("Audit partition dropped", extra={"fields": {"partition": name}})
+
+# Hot read queries, also EXPLAINed by test_query_plans.py
+def user_by_id_query(user_id):
+    return sqlalchemy.select(users_table).where(users_table.c.id == user_id)
+
+def user_by_email_query(email: str):
+    return sqlalchemy.select(users_table).where(users_table.c.email == email)
+
+def user_by_phone_query(phone: str):
+    return sqlalchemy.select(users_table).where(users_table.c.phone == phone)
+
+def identifier_taken_query(email: str, phone: str):
+    return sqlalchemy.select(users_table.c.id).where(
+        sqlalchemy.or_(
+            users_table.c.email == email,
+            users_table.c.phone == phone
+        )
+    )
+
+def list_users_query(pending_only: bool = False):
+    query = sqlalchemy.select(users_table).order_by(users_table.c.created_at.desc())
+    if pending_only:
+        query = query.where(users_table.c.is_approved == False)
+    return query
+
+def users_version_query():
+    # Two index probes
+    return sqlalchemy.select(
+        sqlalchemy.func.greatest(
+            sqlalchemy.select(sqlalchemy.func.max(users_table.c.version)).scalar_subquery(),
+            sqlalchemy.select(sqlalchemy.func.max(user_tombstones_table.c.version)).scalar_subquery(),
+            0
+        ).label("version")
+    )
+
+def temp_registration_query(registration_id):
+    return sqlalchemy.select(temp_registrations_table).where(
+        temp_registrations_table.c.id == registration_id
+    )
+
+def temp_session_query(temp_session_id):
+    return sqlalchemy.select(temp_sessions_table).where(
+        temp_sessions_table.c.id == temp_session_id
+    )
+
+def auth_session_query(session_token: str):
+    return sqlalchemy.select(auth_sessions_table).where(
+        auth_sessions_table.c.session_token == session_token
+    )
+
+# Concurrent identical point reads share one query (see singleflight.py):
+# page-load bursts resolving the same session, login retry storms
+session_flight = SingleFlight("auth_session")
+user_flight = SingleFlight("user")
+
+def introspect_sessions_query(session_tokens: list):
+    # One round trip for the whole batch: session_token = ANY($1)
+    return sqlalchemy.select(
+        auth_sessions_table.c.session_token,
+        auth_sessions_table.c.expires_at,
+        users_table.c.id.label("user_id"),
+        users_table.c.role,
+        users_table.c.is_active,
+        users_table.c.is_approved
+    ).select_from(
+        auth_sessions_table.join(users_table, users_table.c.id == auth_sessions_table.c.user_id)
+    ).where(
+        auth_sessions_table.c.session_token == sqlalchemy.any_(
+            sqlalchemy.bindparam("session_tokens", session_tokens, type_=ARRAY(sqlalchemy.Text))
+        )
+    )
+
+# Shorter terms have no trigrams, so they only match as prefixes
+MIN_SUBSTRING_LENGTH = 3
+
+LIKE_ESCAPE = "!"
+
+def escape_like(term: str) -> str:
+    """Escape LIKE wildcards in user input (with LIKE_ESCAPE)"""
+    for char in (LIKE_ESCAPE, "%", "_"):
+        term = term.replace(char, LIKE_ESCAPE + char)
+    return term
+
+def build_user_search_query(q: str, fields, limit: int, offset: int):
+    """Build the ranked admin search query.
+
+    Each field contributes at most `offset + limit + 1` candidates from an
+    index: prefix matches via the text_pattern_ops btrees (exact matches rank
+    first), substring matches via the trigram GIN indexes. Only that bounded
+    candidate set is ranked, so latency does not grow with the table.
+
+    Every candidate scan is cut in the final order (its own rank, then
+    similarity, newest first, id). A user's final rank is the best over the
+    scans, so anything ahead of a user in the scan that ranks it best is also
+    ahead of it overall: the candidates always hold the true top
+    `offset + limit + 1`, and consecutive pages are slices of one ranking,
+    without repeats or gaps. The price is that a short prefix or a common
+    substring scores all of its matches before taking the best.
+    """
+    term = q.strip().lower()
+    pattern = escape_like(term)
+    window = offset + limit + 1
+    similarity = sqlalchemy.func.greatest(
+        *[sqlalchemy.func.similarity(users_table.c[name], term) for name in fields], 0
+    )
+    order = (similarity.desc(), users_table.c.created_at.desc(), users_table.c.id)
+    candidates = []
+    for name in fields:
+        column = users_table.c[name]
+        key = column if name == "phone" else sqlalchemy.func.lower(column)
+        rank = sqlalchemy.case((key == term, 0), else_=1)
+        candidates.append(
+            sqlalchemy.select(users_table.c.id, rank.label("rank"))
+            .where(key.like(pattern + "%", escape=LIKE_ESCAPE)).order_by(rank, *order).limit(window)
+        )
+        if len(term) >= MIN_SUBSTRING_LENGTH:
+            candidates.append(
+                sqlalchemy.select(users_table.c.id, sqlalchemy.literal(2).label("rank"))
+                .where(column.ilike("%" + pattern + "%", escape=LIKE_ESCAPE)).order_by(*order).limit(window)
+            )
+
+    matches = sqlalchemy.union_all(*candidates).subquery("matches")
+    best = sqlalchemy.select(
+        matches.c.id, sqlalchemy.func.min(matches.c.rank).label("rank")
+    ).group_by(matches.c.id).subquery("best")
+    return sqlalchemy.select(users_table).join(
+        best, users_table.c.id == best.c.id
+    ).order_by(best.c.rank, *order).offset(offset).limit(limit + 1)
+
+class PostgresStorage(Storage):
+    """Storage on the primary database, with replica reads via read_router"""
+
+    name = "postgres"
+
+    def __init__(self):
+        self.counters_task = None
+
+    async def connect(self):
+        await connect_db()
+        # LISTEN for registration/approval events feeding the SSE streams
+        events.listener.start()
+        # Counter drift correction (first pass also creates missing stripes)
+        self.counters_task = asyncio.create_task(counters.run_reconciliation())
+
+    async def disconnect(self):
+        if self.counters_task is not None:
+            self.counters_task.cancel()
+            self.counters_task = None
+        await events.listener.stop()
+        await disconnect_db()
+
+    async def _fetch_one(self, query, request=None):
+        if request is None:
+            return await database.fetch_one(query)
+        return await read_router.fetch_one(query, request)
+
+    async def _fetch_one_coalesced(self, flight: SingleFlight, key, query, request=None):
+        if request is None:
+            # Joining a call already in flight could return a row read before
+            # a logout the caller has seen, which a session cache fill would
+            # then pass off as current
+            return await database.fetch_one(query)
+        # Only callers served by the same database may share a result
+        primary = read_router.database_for(request) is database
+        return await flight.do((key, primary), lambda: self._fetch_one(query, request))
+
+    async def _fetch_all(self, query, request=None):
+        if request is None:
+            return await database.fetch_all(query)
+        return await read_router.fetch_all(query, request)
+
+    # Users
+    async def get_user(self, user_id, request=None):
+        return await self._fetch_one_coalesced(user_flight, ("id", str(user_id)), user_by_id_query(user_id), request)
+
+    async def get_user_by_email(self, email: str, request=None):
+        return await self._fetch_one_coalesced(user_flight, ("email", email), user_by_email_query(email), request)
+
+    async def get_user_by_phone(self, phone: str, request=None):
+        return await self._fetch_one_coalesced(user_flight, ("phone", phone), user_by_phone_query(phone), request)
+
+    async def identifier_taken(self, email: str, phone: str) -> bool:
+        # Primary: this guards a write
+        return await database.fetch_one(identifier_taken_query(email, phone)) is not None
+
+    async def iter_identifiers(self):
+        # Server-side cursor, so the table is never held in memory at once
+        query = sqlalchemy.select(users_table.c.email, users_table.c.phone)
+        async for row in database.iterate(query):
+            yield row.email, row.phone
+
+    async def create_user(self, user: dict) -> int:
+        insert_query = users_table.insert().values(user).returning(users_table.c.version)
+        try:
+            async with database.transaction():
+                await lock_users_version()
+                created = await database.fetch_one(insert_query)
+                await counters.adjust(counters.user_counter_deltas(SimpleNamespace(**user)))
+                # Delivered to the admin event stream (and other workers' filters) on commit
+                await events.notify(
+                    events.USER_REGISTERED,
+                    user_id=str(user["id"]),
+                    name=user["name"],
+                    email=user["email"],
+                    phone=user["phone"],
+                    version=created.version
+                )
+        except asyncpg.UniqueViolationError:
+            raise DuplicateUserError()
+        return created.version
+
+    async def approve_user(self, user_id, approved_by):
+        # The is_approved guard makes concurrent approvals count only once
+        update_query = users_table.update().where(
+            sqlalchemy.and_(
+                users_table.c.id == user_id,
+                users_table.c.is_approved == False
+            )
+        ).values(
+            is_approved=True,
+            approved_at=datetime.utcnow(),
+            approved_by=approved_by,
+            version=users_change_seq.next_value()
+        ).returning(users_table.c.name, users_table.c.email, users_table.c.is_active, users_table.c.version)
+        async with database.transaction():
+            await lock_users_version()
+            approved = await database.fetch_one(update_query)
+            if approved:
+                await counters.adjust({
+                    counters.PENDING_USERS: -1,
+                    counters.ACTIVE_USERS: 1 if approved.is_active else 0
+                })
+                await events.notify(
+                    events.USER_APPROVED,
+                    user_id=str(user_id),
+                    name=approved.name,
+                    email=approved.email,
+                    version=approved.version
+                )
+        return approved
+
+    async def delete_user(self, user_id):
+        # Sessions first, so the counters know how many went away
+        delete_sessions_query = sqlalchemy.delete(auth_sessions_table).where(
+            auth_sessions_table.c.user_id == user_id
+        ).returning(auth_sessions_table.c.id)
+        delete_query = sqlalchemy.delete(users_table).where(
+            users_table.c.id == user_id
+        ).returning(users_table.c.is_approved, users_table.c.is_active)
+        async with database.transaction():
+            await lock_users_version()
+            sessions = await database.fetch_all(delete_sessions_query)
+            deleted = await database.fetch_one(delete_query)
+            if deleted:
+                await database.execute(user_tombstones_table.insert().values(
+                    user_id=user_id, version=users_change_seq.next_value()
+                ))
+            deltas = counters.user_counter_deltas(deleted, sign=-1) if deleted else {}
+            deltas[counters.LIVE_SESSIONS] = -len(sessions)
+            await counters.adjust(deltas)
+        return deleted
+
+    async def replace_password_hash(self, user_id, old_hash: str, new_hash: str):
+        update_query = sqlalchemy.update(users_table).where(
+            sqlalchemy.and_(
+                users_table.c.id == user_id,
+                users_table.c.password_hash == old_hash
+            )
+        ).values(password_hash=new_hash)
+        await database.execute(update_query)
+
+    async def list_users(self, pending_only: bool = False, request=None) -> list:
+        return await self._fetch_all(list_users_query(pending_only), request)
+
+    async def search_users(self, q: str, fields, limit: int, offset: int, request=None) -> list:
+        return await self._fetch_all(build_user_search_query(q, fields, limit, offset), request)
+
+    async def users_version(self, request=None) -> int:
+        row = await self._fetch_one(users_version_query(), request)
+        return int(row.version)
+
+    async def user_changes(self, since: int, limit: int, request=None):
+        users_query = sqlalchemy.select(users_table).where(
+            users_table.c.version > since
+        ).order_by(users_table.c.version).limit(limit + 1)
+        tombstones_query = sqlalchemy.select(user_tombstones_table).where(
+            user_tombstones_table.c.version > since
+        ).order_by(user_tombstones_table.c.version).limit(limit + 1)
+
+        db = read_router.database_for(request) if request is not None else database
+        users = await db.fetch_all(users_query)
+        tombstones = await db.fetch_all(tombstones_query)
+        return users, tombstones
+
+    async def admin_counts(self, request=None) -> dict:
+        db = read_router.database_for(request) if request is not None else database
+        return await counters.read_counters(db)
+
+    # Temp registrations
+    async def replace_temp_registration(self, registration: dict):
+        delete_query = sqlalchemy.delete(temp_registrations_table).where(
+            sqlalchemy.or_(
+                temp_registrations_table.c.email == registration["email"],
+                temp_registrations_table.c.phone == registration["phone"]
+            )
+        )
+        await database.execute(delete_query)
+        await database.execute(temp_registrations_table.insert().values(registration))
+
+    async def get_temp_registration(self, registration_id):
+        return await database.fetch_one(temp_registration_query(registration_id))
+
+    async def update_temp_registration_otp(self, registration_id, otp_code: str, otp_expires_at):
+        update_query = sqlalchemy.update(temp_registrations_table).where(
+            temp_registrations_table.c.id == registration_id
+        ).values(otp_code=otp_code, otp_expires_at=otp_expires_at)
+        await database.execute(update_query)
+
+    async def delete_temp_registration(self, registration_id):
+        delete_query = sqlalchemy.delete(temp_registrations_table).where(
+            temp_registrations_table.c.id == registration_id
+        )
+        await database.execute(delete_query)
+
+    # Temp (login) sessions
+    async def replace_temp_session(self, temp_session: dict):
+        delete_query = sqlalchemy.delete(temp_sessions_table).where(
+            temp_sessions_table.c.user_id == temp_session["user_id"]
+        )
+        await database.execute(delete_query)
+        await database.execute(temp_sessions_table.insert().values(temp_session))
+
+    async def get_temp_session(self, temp_session_id):
+        return await database.fetch_one(temp_session_query(temp_session_id))
+
+    async def update_temp_session_otp(self, temp_session_id, otp_code: str, otp_expires_at):
+        update_query = sqlalchemy.update(temp_sessions_table).where(
+            temp_sessions_table.c.id == temp_session_id
+        ).values(otp_code=otp_code, otp_expires_at=otp_expires_at)
+        await database.execute(update_query)
+
+    async def delete_temp_session(self, temp_session_id):
+        delete_query = sqlalchemy.delete(temp_sessions_table).where(
+            temp_sessions_table.c.id == temp_session_id
+        )
+        await database.execute(delete_query)
+
+    # Auth sessions
+    async def replace_auth_session(self, auth_session: dict):
+        delete_query = sqlalchemy.delete(auth_sessions_table).where(
+            auth_sessions_table.c.user_id == auth_session["user_id"]
+        ).returning(auth_sessions_table.c.id)
+        async with database.transaction():
+            replaced = await database.fetch_all(delete_query)
+            await database.execute(auth_sessions_table.insert().values(auth_session))
+            await counters.adjust({counters.LIVE_SESSIONS: 1 - len(replaced)})
+
+    async def get_auth_session(self, session_token: str, request=None):
+        return await self._fetch_one_coalesced(
+            session_flight, session_token, auth_session_query(session_token), request
+        )
+
+    async def delete_auth_session(self, session_token: str):
+        delete_query = sqlalchemy.delete(auth_sessions_table).where(
+            auth_sessions_table.c.session_token == session_token
+        ).returning(auth_sessions_table.c.id)
+        async with database.transaction():
+            deleted = await database.fetch_all(delete_query)
+            await counters.adjust({counters.LIVE_SESSIONS: -len(deleted)})
+
+    async def introspect_sessions(self, session_tokens: list, request=None) -> list:
+        return await self._fetch_all(introspect_sessions_query(session_tokens), request)
+
+    # API keys
+    async def create_api_key(self, api_key: dict):
+        await database.execute(api_keys_table.insert().values(api_key))
+
+    async def get_api_key_by_prefix(self, prefix: str):
+        return await database.fetch_one(
+            sqlalchemy.select(api_keys_table).where(api_keys_table.c.prefix == prefix)
+        )
+
+    async def list_api_keys(self) -> list:
+        return await database.fetch_all(
+            sqlalchemy.select(api_keys_table).order_by(api_keys_table.c.created_at.desc())
+        )
+
+    async def revoke_api_key(self, key_id):
+        update_query = api_keys_table.update().where(
+            sqlalchemy.and_(
+                api_keys_table.c.id == key_id,
+                api_keys_table.c.revoked_at == None
+            )
+        ).values(revoked_at=datetime.utcnow()).returning(api_keys_table)
+        async with database.transaction():
+            revoked = await database.fetch_one(update_query)
+            if revoked:
+                # Every worker drops the key from its cache on commit
+                await events.notify(events.API_KEY_REVOKED, prefix=revoked.prefix)
+        return revoked
+
+    # Audit log
+    async def write_audit_events(self, records: list):
+        # One COPY per batch; Postgres routes rows to the daily partitions
+        async with database.connection() as connection:
+            await connection.raw_connection.copy_records_to_table(
+                "audit_log", records=records, columns=AUDIT_COLUMNS
+            )
+
+    async def maintain_audit_partitions(self):
+        async with database.connection() as connection:
+            await maintain_audit_partitions(connection.raw_connection, datetime.utcnow().date())
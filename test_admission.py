@@ -0,0 +1,103 @@
+"""
+Tests for admission control and load shedding
+Run with: pytest test_admission.py
+"""
+
+import asyncio
+import pytest
+from admission import WorkClass, Overloaded, AdmissionMiddleware
+
+async def hold(work_class, release: asyncio.Event):
+    async with work_class.slot():
+        await release.wait()
+
+class TestWorkClass:
+
+    @pytest.mark.asyncio
+    async def test_full_queue_sheds_immediately(self):
+        """Past limit + queue_size, work is rejected without waiting"""
+        work = WorkClass("test", limit=1, queue_size=1, max_queue_ms=1000)
+        release = asyncio.Event()
+        holders = [asyncio.create_task(hold(work, release)) for _ in range(2)]
+        await asyncio.sleep(0)
+
+        with pytest.raises(Overloaded) as shed:
+            await work.acquire()
+        assert shed.value.status_code == 503
+        assert shed.value.headers["Retry-After"] == "1"
+        assert work.shed_queue_full == 1
+
+        release.set()
+        await asyncio.gather(*holders)
+        assert work.in_flight == 0
+
+    @pytest.mark.asyncio
+    async def test_queue_age_sheds(self):
+        """A waiter that is not admitted within max_queue_ms is shed"""
+        work = WorkClass("test", limit=1, queue_size=10, max_queue_ms=20)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(work, release))
+        await asyncio.sleep(0)
+
+        with pytest.raises(Overloaded):
+            await work.acquire()
+        assert work.shed_queue_age == 1
+        assert not work.waiters
+
+        release.set()
+        await holder
+        assert work.in_flight == 0
+
+    @pytest.mark.asyncio
+    async def test_release_hands_off_in_fifo_order(self):
+        work = WorkClass("test", limit=1, queue_size=10, max_queue_ms=1000)
+        order = []
+
+        async def job(name):
+            async with work.slot():
+                order.append(name)
+                await asyncio.sleep(0.001)
+
+        await asyncio.gather(*(job(i) for i in range(5)))
+        assert order == [0, 1, 2, 3, 4]
+        assert work.in_flight == 0
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_does_not_leak_slot(self):
+        work = WorkClass("test", limit=1, queue_size=10, max_queue_ms=1000)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(work, release))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(work.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+
+        release.set()
+        await holder
+        assert work.in_flight == 0 and not work.waiters
+
+class TestAdmissionMiddleware:
+
+    @pytest.mark.asyncio
+    async def test_exempt_paths_bypass_a_full_limiter(self):
+        """/auth/me is served while ordinary requests are shed"""
+        work = WorkClass("test", limit=1, queue_size=0, max_queue_ms=1000)
+        await work.acquire()  # saturated by a login flood
+        served = []
+
+        async def app(scope, receive, send):
+            served.append(scope["path"])
+
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        middleware = AdmissionMiddleware(app, work, exempt_paths={"/auth/me"})
+        await middleware({"type": "http", "path": "/auth/me"}, None, send)
+        await middleware({"type": "http", "path": "/auth/login", "headers": []}, None, send)
+
+        assert served == ["/auth/me"]
+        assert sent[0]["status"] == 503
+        assert (b"retry-after", b"1") in sent[0]["headers"]
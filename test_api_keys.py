@@ -0,0 +1,189 @@
+"""
+Tests for API keys for machine clients
+Run with: pytest test_api_keys.py
+"""
+
+import hashlib
+import hmac
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+import api_keys
+import events
+from config import SECRET_KEY
+from api_keys import ApiKeyCache, authenticate, generate_api_key, parse_prefix
+from main import app
+from storage import set_storage
+from test_auth_middleware import CountingStorage, log_in
+
+class ApiKeyCountingStorage(CountingStorage):
+    def __init__(self):
+        super().__init__()
+        self.key_lookups = 0
+
+    async def get_api_key_by_prefix(self, prefix):
+        self.key_lookups += 1
+        return await super().get_api_key_by_prefix(prefix)
+
+@pytest_asyncio.fixture
+async def store(monkeypatch):
+    monkeypatch.setattr(api_keys, "api_key_cache", ApiKeyCache())
+    events.broadcaster.observers.append(api_keys.api_key_cache.observe)
+    store = ApiKeyCountingStorage()
+    set_storage(store)
+    yield store
+    set_storage(None)
+    events.broadcaster.observers.remove(api_keys.api_key_cache.observe)
+
+@pytest_asyncio.fixture
+async def admin(store):
+    token = await log_in(store, role="admin")
+    async with AsyncClient(app=app, base_url="http://test", cookies={"auth_session_id": token}) as client:
+        yield client
+
+@pytest.fixture
+def admin_keys_enabled(monkeypatch):
+    monkeypatch.setattr(api_keys, "API_KEY_ADMIN_ENABLED", True)
+
+async def issue(admin, role="service") -> dict:
+    response = await admin.post("/auth/admin/api-keys", json={"name": "billing", "role": role})
+    assert response.status_code == 201
+    return response.json()
+
+class TestKeyFormat:
+
+    def test_prefix_round_trip(self):
+        key, prefix = generate_api_key()
+        assert parse_prefix(key) == prefix
+        assert parse_prefix("ak_short_secret") is None
+        assert parse_prefix("not-a-key") is None
+
+    def test_pepper_is_not_the_session_secret(self):
+        key, _ = generate_api_key()
+        assert api_keys.API_KEY_PEPPER != SECRET_KEY
+        assert api_keys.hash_api_key(key) != hmac.new(SECRET_KEY.encode(), key.encode(), hashlib.sha256).hexdigest()
+
+    def test_cache_expires_and_evicts(self):
+        now = [0.0]
+        cache = ApiKeyCache(max_entries=2, ttl_seconds=10, clock=lambda: now[0])
+        for prefix in ("a", "b", "c"):
+            cache.put(prefix, "hash", None)
+        assert cache.get("a") is None and cache.get("c") is not None
+        now[0] = 10
+        assert cache.get("c") is None
+
+class TestApiKeyRoutes:
+
+    @pytest.mark.asyncio
+    async def test_issue_list_and_use(self, admin, store):
+        created = await issue(admin)
+        key = created["key"]
+        assert created["api_key"]["prefix"] == parse_prefix(key)
+        # Only the prefix and the keyed hash are stored
+        assert [row["key_hash"] for row in store.api_keys.values()] == [api_keys.hash_api_key(key)]
+
+        listed = (await admin.get("/auth/admin/api-keys")).json()
+        assert [item["id"] for item in listed] == [created["api_key"]["id"]]
+        assert "key" not in listed[0] and "key_hash" not in listed[0]
+
+        async with AsyncClient(app=app, base_url="http://test") as client:
+            headers = {"Authorization": f"Bearer {key}"}
+            assert (await client.get("/auth/me", headers=headers)).status_code == 401
+            # Service keys are not admins
+            assert (await client.get("/auth/admin/stats", headers=headers)).status_code == 403
+            assert (await client.get("/auth/admin/stats", headers={"X-API-Key": key})).status_code == 403
+
+    @pytest.mark.asyncio
+    async def test_verified_from_cache(self, admin, store, admin_keys_enabled):
+        key = (await issue(admin, role="admin"))["key"]
+        store.key_lookups = store.lookups = 0
+        async with AsyncClient(app=app, base_url="http://test", headers={"X-API-Key": key}) as client:
+            for _ in range(3):
+                assert (await client.get("/auth/admin/stats")).status_code == 200
+        assert store.key_lookups == 1
+        assert store.lookups == 0
+
+    @pytest.mark.asyncio
+    async def test_wrong_secret_rejected(self, admin, store, admin_keys_enabled):
+        key = (await issue(admin, role="admin"))["key"]
+        forged = key[:-4] + ("AAAA" if not key.endswith("AAAA") else "BBBB")
+        assert await authenticate(key) is not None
+        assert await authenticate(forged) is None
+        async with AsyncClient(app=app, base_url="http://test", headers={"X-API-Key": forged}) as client:
+            assert (await client.get("/auth/admin/stats")).status_code == 403
+
+    @pytest.mark.asyncio
+    async def test_revocation_takes_effect_immediately(self, admin, store, admin_keys_enabled):
+        created = await issue(admin, role="admin")
+        key = created["key"]
+        async with AsyncClient(app=app, base_url="http://test", headers={"X-API-Key": key}) as client:
+            assert (await client.get("/auth/admin/stats")).status_code == 200
+            response = await admin.delete(f"/auth/admin/api-keys/{created['api_key']['id']}")
+            assert response.status_code == 200
+            assert (await client.get("/auth/admin/stats")).status_code == 403
+        response = await admin.delete(f"/auth/admin/api-keys/{created['api_key']['id']}")
+        assert response.status_code == 404
+
+    @pytest.mark.asyncio
+    async def test_revocation_event_clears_other_workers(self, admin, store):
+        key = (await issue(admin))["key"]
+        assert await authenticate(key) is not None
+        # Another worker revoked it: only the event reaches this one
+        events.broadcaster.publish({"type": events.API_KEY_REVOKED, "prefix": parse_prefix(key)})
+        assert api_keys.api_key_cache.get(parse_prefix(key)) is None
+
+    @pytest.mark.asyncio
+    async def test_revocation_during_lookup_not_cached(self, admin, store, monkeypatch):
+        key = (await issue(admin))["key"]
+        prefix = parse_prefix(key)
+        read = store.get_api_key_by_prefix
+
+        async def read_then_revoked(prefix):
+            row = await read(prefix)
+            # The revocation commits and its event arrives before the read returns
+            events.broadcaster.publish({"type": events.API_KEY_REVOKED, "prefix": prefix})
+            return row
+
+        monkeypatch.setattr(store, "get_api_key_by_prefix", read_then_revoked)
+        assert await authenticate(key) is not None
+        assert api_keys.api_key_cache.get(prefix) is None
+
+class TestAdminKeys:
+
+    @pytest.mark.asyncio
+    async def test_admin_keys_off_by_default(self, admin, store, monkeypatch):
+        response = await admin.post("/auth/admin/api-keys", json={"name": "ops", "role": "admin"})
+        assert response.status_code == 400
+        # A key issued while they were allowed stops working once they are not
+        monkeypatch.setattr(api_keys, "API_KEY_ADMIN_ENABLED", True)
+        key = (await issue(admin, role="admin"))["key"]
+        monkeypatch.setattr(api_keys, "API_KEY_ADMIN_ENABLED", False)
+        api_keys.api_key_cache.entries.clear()
+        assert await authenticate(key) is None
+
+    @pytest.mark.asyncio
+    async def test_keys_cannot_manage_keys(self, admin, store, admin_keys_enabled):
+        key = (await issue(admin, role="admin"))["key"]
+        async with AsyncClient(app=app, base_url="http://test", headers={"X-API-Key": key}) as client:
+            assert (await client.get("/auth/admin/stats")).status_code == 200
+            assert (await client.get("/auth/admin/api-keys")).status_code == 403
+            response = await client.post("/auth/admin/api-keys", json={"name": "more", "role": "admin"})
+            assert response.status_code == 403
+
+    @pytest.mark.asyncio
+    async def test_admin_key_actions_audited_by_prefix(self, admin, store, admin_keys_enabled, monkeypatch):
+        recorded = []
+        monkeypatch.setattr("auth_routes.audit_log.record", lambda event, request=None, **fields: recorded.append(
+            (event, fields)
+        ))
+        key = (await issue(admin, role="admin"))["key"]
+        await log_in(store)
+        pending = next(user for user in store.users.values() if user["role"] == "user")
+        pending["is_approved"] = False
+        async with AsyncClient(app=app, base_url="http://test", headers={"X-API-Key": key}) as client:
+            response = await client.post("/auth/admin/approve-user", json={"user_id": pending["id"]})
+        assert response.status_code == 200
+        assert store.users[pending["id"]]["approved_by"] is None
+        assert recorded[-1] == ("admin.approve_user", {
+            "user_id": pending["id"], "actor_id": None, "identifier": f"api_key:{parse_prefix(key)}"
+        })
@@ -0,0 +1,136 @@
+"""
+Tests for the batched audit log
+Run with: pytest test_audit.py
+"""
+
+import asyncio
+from datetime import date
+import asyncpg
+import pytest
+from audit import AuditLog, DROP_NEWEST, DROP_OLDEST, IDENTIFIER_WIDTH
+from storage_memory import MemoryStorage
+from storage_postgres import audit_partition_name
+
+class FailingStorage:
+    """Sink that fails a given number of writes before accepting them"""
+
+    def __init__(self, failures: int, error=ConnectionError("database unavailable")):
+        self.failures = failures
+        self.error = error
+        self.written = []
+
+    async def write_audit_events(self, records: list):
+        if self.failures:
+            self.failures -= 1
+            raise self.error
+        self.written.extend(records)
+
+    async def maintain_audit_partitions(self):
+        pass
+
+def events_of(records):
+    return [record[1] for record in records]
+
+class TestAuditLog:
+
+    def test_drop_newest_keeps_buffered_events(self):
+        log = AuditLog(capacity=2, overflow=DROP_NEWEST, enabled=True, store=MemoryStorage())
+        for event in ("a", "b", "c"):
+            log.record(event)
+        assert events_of(log.buffer) == ["a", "b"]
+        assert log.dropped == 1
+
+    def test_drop_oldest_keeps_latest_events(self):
+        log = AuditLog(capacity=2, overflow=DROP_OLDEST, enabled=True, store=MemoryStorage())
+        for event in ("a", "b", "c"):
+            log.record(event)
+        assert events_of(log.buffer) == ["b", "c"]
+        assert log.dropped == 1
+
+    def test_unknown_overflow_policy_rejected(self):
+        with pytest.raises(ValueError):
+            AuditLog(overflow="block")
+
+    @pytest.mark.asyncio
+    async def test_flush_writes_in_batches(self):
+        store = MemoryStorage()
+        log = AuditLog(capacity=100, batch_size=4, enabled=True, store=store)
+        for i in range(10):
+            log.record("login.password", user_id=i, identifier=f"user{i}@example.com")
+
+        assert await log.flush() == 10
+        assert len(store.audit_events) == 10
+        assert store.audit_events[0][3] == "0"
+        assert not log.buffer and log.written == 10
+
+    @pytest.mark.asyncio
+    async def test_batch_size_wakes_flusher_before_interval(self):
+        store = MemoryStorage()
+        log = AuditLog(capacity=100, batch_size=3, flush_ms=60000, enabled=True, store=store)
+        log.start()
+        try:
+            for _ in range(3):
+                log.record("logout")
+            for _ in range(100):
+                if store.audit_events:
+                    break
+                await asyncio.sleep(0.001)
+            assert len(store.audit_events) == 3
+        finally:
+            await log.stop()
+
+    @pytest.mark.asyncio
+    async def test_failed_flush_is_retried_in_order(self):
+        store = FailingStorage(failures=1)
+        log = AuditLog(capacity=100, batch_size=2, enabled=True, store=store)
+        for event in ("a", "b", "c"):
+            log.record(event)
+
+        assert await log.flush() == 0
+        assert events_of(log.buffer) == ["a", "b", "c"]
+        assert log.flush_failures == 1
+
+        assert await log.flush() == 3
+        assert events_of(store.written) == ["a", "b", "c"]
+
+    @pytest.mark.asyncio
+    async def test_rejected_batch_dropped_not_retried(self):
+        """A batch the database refuses for its content must not block later events"""
+        store = FailingStorage(failures=1, error=asyncpg.exceptions.StringDataRightTruncationError(
+            "value too long for type character varying(255)"
+        ))
+        log = AuditLog(capacity=100, batch_size=2, enabled=True, store=store)
+        for event in ("a", "b", "c"):
+            log.record(event)
+
+        assert await log.flush() == 1
+        assert events_of(store.written) == ["c"]
+        assert log.dropped == 2 and log.flush_failures == 1 and not log.buffer
+
+        log.record("d")
+        assert await log.flush() == 1
+        assert events_of(store.written) == ["c", "d"]
+
+    def test_long_fields_clipped_to_column_width(self):
+        log = AuditLog(capacity=10, enabled=True, store=MemoryStorage())
+        log.record("login.password" * 10, outcome="failure" * 10, identifier="a" * 300 + "@example.com")
+        (record,) = log.buffer
+        assert len(record[1]) == 50 and len(record[2]) == 20
+        assert len(record[5]) == IDENTIFIER_WIDTH
+
+    @pytest.mark.asyncio
+    async def test_stop_flushes_remaining_events(self):
+        store = MemoryStorage()
+        log = AuditLog(capacity=100, batch_size=100, flush_ms=60000, enabled=True, store=store)
+        log.start()
+        log.record("logout")
+        await log.stop()
+        assert events_of(store.audit_events) == ["logout"]
+
+    def test_disabled_log_records_nothing(self):
+        log = AuditLog(enabled=False, store=MemoryStorage())
+        log.record("logout")
+        assert not log.buffer
+
+def test_partition_names_sort_by_day():
+    assert audit_partition_name(date(2024, 3, 9)) == "audit_log_p20240309"
@@ -1,32 +1,98 @@
 """
 Test file for the authentication API
 Run with: pytest test_auth.py
+
+Every storage test runs against the in-memory backend. To also run them
+against Postgres, point DATABASE_URL at a disposable database (all rows are
+deleted afterwards) and set AUTH_TEST_POSTGRES=1.
 """
 
+import os
+import uuid
+from types import SimpleNamespace
 import pytest
-import asyncio
+import pytest_asyncio
 from httpx import AsyncClient
 from main import app
-from database import database, temp_registrations_table, users_table, temp_sessions_table, auth_sessions_table
-import sqlalchemy
+from storage import create_storage, set_storage
+from storage_memory import MemoryStorage
+from test_auth_middleware import log_in
+import admission
+import calibrate_bcrypt
+from utils import build_pwd_context, hash_password, password_needs_rehash, verify_password
+
+BACKENDS = [
+    "memory",
+    pytest.param("postgres", marks=pytest.mark.skipif(
+        not os.environ.get("AUTH_TEST_POSTGRES"), reason="AUTH_TEST_POSTGRES not set"
+    )),
+]
 
-@pytest.fixture
+@pytest_asyncio.fixture
 async def client():
     """Create test client"""
     async with AsyncClient(app=app, base_url="http://test") as ac:
         yield ac
 
-@pytest.fixture
-async def setup_database():
-    """Setup test database"""
-    await database.connect()
-    yield
-    # Clean up test data
-    await database.execute(sqlalchemy.delete(auth_sessions_table))
-    await database.execute(sqlalchemy.delete(temp_sessions_table))
-    await database.execute(sqlalchemy.delete(temp_registrations_table))
-    await database.execute(sqlalchemy.delete(users_table))
-    await database.disconnect()
+@pytest_asyncio.fixture(params=BACKENDS)
+async def setup_database(request):
+    """Setup test storage"""
+    store = create_storage(request.param)
+    set_storage(store)
+    await store.connect()
+    yield store
+    if request.param == "postgres":
+        # Clean up test data
+        import sqlalchemy
+        from database import (
+            database, temp_registrations_table, users_table, temp_sessions_table,
+            auth_sessions_table, user_tombstones_table
+        )
+        await database.execute(sqlalchemy.delete(auth_sessions_table))
+        await database.execute(sqlalchemy.delete(temp_sessions_table))
+        await database.execute(sqlalchemy.delete(temp_registrations_table))
+        await database.execute(sqlalchemy.delete(users_table))
+        await database.execute(sqlalchemy.delete(user_tombstones_table))
+    await store.disconnect()
+    set_storage(None)
+
+async def create_user(store, email="test@example.com", phone="0987654321", password="password123", approved=True):
+    """Insert a user directly through the storage backend"""
+    user_id = str(uuid.uuid4())
+    await store.create_user({
+        "id": user_id,
+        "name": "Test User",
+        "email": email,
+        "phone": phone,
+        "password_hash": hash_password(password),
+        "role": "user",
+        "is_active": True,
+        "is_approved": False
+    })
+    if approved:
+        await store.approve_user(user_id, None)
+    return user_id
+
+class LaggingReplicaStorage(MemoryStorage):
+    """Memory backend whose replica reads (those given a request) predate every approval"""
+
+    def __init__(self):
+        super().__init__()
+        self.primary_reads = 0
+
+    async def get_user_by_email(self, email: str, request=None):
+        user = await super().get_user_by_email(email)
+        if request is None:
+            self.primary_reads += 1
+            return user
+        return SimpleNamespace(**{**vars(user), "is_approved": False}) if user else None
+
+@pytest_asyncio.fixture
+async def lagging_store():
+    store = LaggingReplicaStorage()
+    set_storage(store)
+    yield store
+    set_storage(None)
 
 class TestRegistration:
     
@@ -65,14 +131,8 @@ class TestRegistration:
     @pytest.mark.asyncio
     async def test_register_duplicate_email(self, client: AsyncClient, setup_database):
         """Test registration with duplicate email"""
-        # First registration
-        await client.post("/auth/register", json={
-            "name": "Test User 1",
-            "email": "test@example.com",
-            "phone": "0987654321",
-            "password": "password123",
-            "confirm_password": "password123"
-        })
+        # Existing user (a pending registration alone does not reserve the email)
+        await create_user(setup_database)
         
         # Try to register with same email
         response = await client.post("/auth/register", json={
@@ -100,6 +160,214 @@ class TestLogin:
         assert response.status_code == 401
         data = response.json()
         assert data["detail"]["status"] == "error"
+    
+    @pytest.mark.asyncio
+    async def test_login_requires_approval(self, client: AsyncClient, setup_database):
+        """Test login before admin approval"""
+        await create_user(setup_database, approved=False)
+        response = await client.post("/auth/login", json={
+            "identifier": "test@example.com",
+            "password": "password123"
+        })
+        
+        assert response.status_code == 403
+    
+    @pytest.mark.asyncio
+    async def test_login_after_approval_not_refused_by_replica(self, client: AsyncClient, lagging_store):
+        """Approval not yet replicated: login confirms on the primary instead of answering 403"""
+        await create_user(lagging_store)
+        response = await client.post("/auth/login", json={
+            "identifier": "test@example.com",
+            "password": "password123"
+        })
+        assert response.status_code == 200
+        assert lagging_store.primary_reads == 1
+        
+        await create_user(lagging_store, email="pending@example.com", phone="0911111111", approved=False)
+        response = await client.post("/auth/login", json={
+            "identifier": "pending@example.com",
+            "password": "password123"
+        })
+        assert response.status_code == 403
+        assert lagging_store.primary_reads == 2
+    
+    @pytest.mark.asyncio
+    async def test_login_upgrades_low_cost_hash(self, client: AsyncClient, setup_database):
+        """A hash made with an outdated cost is replaced after a successful login"""
+        user_id = await create_user(setup_database)
+        old_hash = build_pwd_context(4).hash("password123")
+        current_hash = (await setup_database.get_user(user_id)).password_hash
+        await setup_database.replace_password_hash(user_id, current_hash, old_hash)
+        assert password_needs_rehash(old_hash)
+        
+        response = await client.post("/auth/login", json={
+            "identifier": "test@example.com",
+            "password": "password123"
+        })
+        assert response.status_code == 200
+        new_hash = (await setup_database.get_user(user_id)).password_hash
+        assert new_hash != old_hash and not password_needs_rehash(new_hash)
+        assert verify_password("password123", new_hash)
+    
+    @pytest.mark.asyncio
+    async def test_login_with_otp(self, client: AsyncClient, setup_database):
+        """Test the full login flow: password, OTP, then /auth/me"""
+        await create_user(setup_database)
+        response = await client.post("/auth/login", json={
+            "identifier": "0987654321",
+            "password": "password123"
+        })
+        assert response.status_code == 200
+        temp_session_id = response.cookies["temp_session_id"]
+        
+        temp_session = await setup_database.get_temp_session(temp_session_id)
+        response = await client.post("/auth/verify-otp", json={"otp": temp_session.otp_code})
+        assert response.status_code == 200
+        assert "auth_session_id" in response.cookies
+        
+        response = await client.get("/auth/me")
+        assert response.status_code == 200
+        assert response.json()["email"] == "test@example.com"
+        
+        response = await client.post("/auth/logout")
+        assert response.status_code == 200
+        client.cookies.delete("auth_session_id")
+        assert (await client.get("/auth/me")).status_code == 401
+
+class TestAdminUsers:
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("path", ["/auth/admin/pending-users", "/auth/admin/all-users"])
+    async def test_listing_revalidates_with_etag(self, client: AsyncClient, setup_database, path):
+        """Unchanged listings answer 304; any user change moves the ETag"""
+        client.cookies.set("auth_session_id", await log_in(setup_database, role="admin"))
+        await create_user(setup_database, approved=False)
+        response = await client.get(path)
+        assert response.status_code == 200 and "test@example.com" in [user["email"] for user in response.json()]
+        etag = response.headers["ETag"]
+        
+        for header in (etag, etag[2:], f'"other", {etag}'):
+            response = await client.get(path, headers={"If-None-Match": header})
+            assert response.status_code == 304 and response.content == b""
+            assert response.headers["ETag"] == etag
+        
+        await create_user(setup_database, email="other@example.com", phone="0911111111", approved=False)
+        response = await client.get(path, headers={"If-None-Match": etag})
+        assert response.status_code == 200 and response.headers["ETag"] != etag
+    
+    @pytest.mark.asyncio
+    async def test_approval_email_sent_once_under_concurrent_approval(self, client: AsyncClient, monkeypatch):
+        """The approval that loses the race answers 400 and sends no email"""
+        store = MemoryStorage()
+        set_storage(store)
+        sent = []
+        
+        async def send_otp_email(to_email, otp, purpose):
+            sent.append((to_email, purpose))
+            return True
+        
+        async def approve_user(user_id, approved_by):
+            # Another admin's approval lands between the check and ours
+            await MemoryStorage.approve_user(store, user_id, approved_by)
+            return await MemoryStorage.approve_user(store, user_id, approved_by)
+        
+        monkeypatch.setattr("auth_routes.send_otp_email", send_otp_email)
+        try:
+            client.cookies.set("auth_session_id", await log_in(store, role="admin"))
+            first = await create_user(store, email="first@example.com", phone="0911111111", approved=False)
+            assert (await client.post("/auth/admin/approve-user", json={"user_id": first})).status_code == 200
+            user_id = await create_user(store, approved=False)
+            monkeypatch.setattr(store, "approve_user", approve_user)
+            response = await client.post("/auth/admin/approve-user", json={"user_id": user_id})
+        finally:
+            set_storage(None)
+        assert response.status_code == 400
+        assert sent == [("first@example.com", "approval")]
+    
+    @pytest.mark.asyncio
+    async def test_approval_succeeds_when_email_is_shed(self, client: AsyncClient, setup_database, monkeypatch):
+        """No SMTP slot after the approval committed: still a success, never a retryable 503"""
+        async def send_otp_email(to_email, otp, purpose):
+            raise admission.Overloaded("smtp", 1)
+        
+        monkeypatch.setattr("auth_routes.send_otp_email", send_otp_email)
+        client.cookies.set("auth_session_id", await log_in(setup_database, role="admin"))
+        user_id = await create_user(setup_database, approved=False)
+        response = await client.post("/auth/admin/approve-user", json={"user_id": user_id})
+        assert response.status_code == 200
+        assert (await setup_database.get_user(user_id)).is_approved
+    
+    @pytest.mark.asyncio
+    async def test_search_pages_are_slices_of_one_ranking(self, client: AsyncClient, setup_database):
+        """Paging never repeats or skips a user, whatever the alphabetical order of the matches"""
+        client.cookies.set("auth_session_id", await log_in(setup_database, role="admin"))
+        names = ["Nguyet", "Ngu", "Nguyen Van A", "Tran Nguyen", "Nguyen", "Le Thi Ngu", "Ngux", "Nguyen B", "Pham"]
+        for i, name in enumerate(names):
+            await setup_database.create_user({
+                "id": str(uuid.uuid4()), "name": name, "email": f"search{i}@example.com", "phone": f"09000000{i:02d}",
+                "password_hash": "-", "role": "user", "is_active": True, "is_approved": True
+            })
+        
+        params = {"q": "ngu", "field": "name"}
+        response = await client.get("/auth/admin/search-users", params={**params, "page_size": 100})
+        ranking = [user["name"] for user in response.json()["items"]]
+        assert len(ranking) == len(names) - 1 and ranking[0] == "Ngu"
+        
+        paged, page = [], 1
+        while True:
+            response = await client.get("/auth/admin/search-users", params={**params, "page": page, "page_size": 2})
+            body = response.json()
+            paged += [user["name"] for user in body["items"]]
+            if not body["has_more"]:
+                break
+            page += 1
+        assert paged == ranking
+    
+    @pytest.mark.asyncio
+    async def test_changes_pages_users_and_tombstones(self, client: AsyncClient, setup_database):
+        """Paging with `since` sees every insert, approval and deletion once, in version order"""
+        admin_token = await log_in(setup_database, role="admin")
+        client.cookies.set("auth_session_id", admin_token)
+        kept = await create_user(setup_database, approved=False)
+        deleted = await create_user(setup_database, email="gone@example.com", phone="0922222222")
+        await setup_database.approve_user(kept, None)
+        await setup_database.delete_user(deleted)
+        
+        since, users, tombstones, pages = 0, {}, [], 0
+        while True:
+            response = await client.get("/auth/admin/users/changes", params={"since": since, "limit": 1})
+            assert response.status_code == 200
+            page = response.json()
+            assert page["version"] > since
+            assert len(page["users"]) + len(page["deleted"]) == 1
+            users.update({user["id"]: user for user in page["users"]})
+            tombstones += page["deleted"]
+            since, pages = page["version"], pages + 1
+            if not page["has_more"]:
+                break
+        
+        assert tombstones == [deleted] and deleted not in users
+        assert users[kept]["is_approved"] and users[kept]["version"] < since
+        assert pages == 3
+        
+        response = await client.get("/auth/admin/users/changes", params={"since": since})
+        assert response.json() == {"version": since, "users": [], "deleted": [], "has_more": False}
+
+class TestBcryptCalibration:
+    
+    def test_picks_highest_cost_within_target(self, monkeypatch):
+        monkeypatch.setattr(calibrate_bcrypt, "measure", lambda rounds, samples: 2 ** (rounds - 10) * 60.0)
+        assert calibrate_bcrypt.calibrate(250, 1) == 12
+    
+    def test_reports_unreachable_target(self, monkeypatch, capsys):
+        """Cost 10 already over budget: no cost is suggested"""
+        monkeypatch.setattr(calibrate_bcrypt, "measure", lambda rounds, samples: 500.0)
+        monkeypatch.setattr("sys.argv", ["calibrate_bcrypt.py", "--target-ms", "250"])
+        assert calibrate_bcrypt.calibrate(250, 1) is None
+        with pytest.raises(SystemExit) as error:
+            calibrate_bcrypt.main()
+        assert "exceeds the 250 ms budget" in str(error.value.code)
+        assert "Suggested setting" not in capsys.readouterr().out
 
 class TestHealthCheck:
     
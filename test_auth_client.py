@@ -0,0 +1,148 @@
+"""
+Tests for the auth_client SDK
+Run with: pytest test_auth_client.py
+"""
+
+import uuid
+import httpx
+import pytest
+import pytest_asyncio
+from auth_client import AsyncAuthClient, AuthClient, AuthAPIError, RetryPolicy, NO_RETRY
+from auth_client.core import SSEParser
+from main import app
+from test_auth import create_user
+from test_auth_middleware import CountingStorage, log_in
+from storage import set_storage
+
+FAST_RETRY = RetryPolicy(backoff=0, jitter=0)
+
+class ListCountingStorage(CountingStorage):
+    def __init__(self):
+        super().__init__()
+        self.listings = 0
+
+    async def list_users(self, *args, **kwargs):
+        self.listings += 1
+        return await super().list_users(*args, **kwargs)
+
+@pytest_asyncio.fixture
+async def store():
+    store = ListCountingStorage()
+    set_storage(store)
+    yield store
+    set_storage(None)
+
+def api_client(**kwargs) -> AsyncAuthClient:
+    return AsyncAuthClient("http://test", transport=httpx.ASGITransport(app=app), retry=NO_RETRY, **kwargs)
+
+async def add_users(store, count: int, name="Client User"):
+    for i in range(count):
+        user_id = str(uuid.uuid4())
+        await store.create_user({
+            "id": user_id, "name": f"{name} {i}", "email": f"{user_id}@example.com", "phone": f"09{i:08d}",
+            "password_hash": "-", "role": "user", "is_active": True, "is_approved": False
+        })
+
+class TestAsyncClient:
+
+    @pytest.mark.asyncio
+    async def test_login_flow_keeps_cookies(self, store):
+        await create_user(store)
+        async with api_client() as client:
+            await client.login("test@example.com", "password123")
+            temp_session = await store.get_temp_session(client.cookies["temp_session_id"])
+            result = await client.verify_otp(temp_session.otp_code)
+            assert result.user.email == "test@example.com"
+            assert client.session_token and "temp_session_id" not in client.cookies
+
+            assert (await client.me()).email == "test@example.com"
+            await client.logout()
+            assert client.session_token is None
+            with pytest.raises(AuthAPIError) as error:
+                await client.me()
+            assert error.value.status_code == 401 and error.value.message == "Chưa đăng nhập"
+
+    @pytest.mark.asyncio
+    async def test_listings_revalidate_with_etag(self, store):
+        await add_users(store, 3)
+        async with api_client(session_token=await log_in(store, role="admin")) as client:
+            first = await client.pending_users()
+            second = await client.pending_users()
+            assert len(first) == 3 and second == first
+            assert store.listings == 1
+
+    @pytest.mark.asyncio
+    async def test_paginated_listings(self, store):
+        await add_users(store, 5, name="Paged")
+        async with api_client(session_token=await log_in(store, role="admin")) as client:
+            found = [user.name async for user in client.iter_search_users("Paged", field="name", page_size=2)]
+            assert sorted(found) == [f"Paged {i}" for i in range(5)]
+
+            pages = [page async for page in client.iter_user_changes(limit=2)]
+            assert len(pages) > 1 and not pages[-1].has_more
+            assert sum(len(page.users) for page in pages) == 6  # and the admin
+
+    @pytest.mark.asyncio
+    async def test_api_keys_and_introspection(self, store, monkeypatch):
+        import auth_routes
+        monkeypatch.setattr(auth_routes, "INTERNAL_API_TOKEN", "internal")
+        monkeypatch.setattr(auth_routes.api_keys, "API_KEY_ADMIN_ENABLED", True)
+        token = await log_in(store, role="admin")
+        async with api_client(session_token=token) as admin:
+            created = await admin.create_api_key("sdk", role="admin")
+            assert [key.prefix for key in await admin.list_api_keys()] == [created.api_key.prefix]
+        async with api_client(api_key=created.key, internal_token="internal") as service:
+            assert (await service.admin_stats()).active_users >= 1
+            claims = await service.introspect([token, "unknown"])
+            assert [claim.active for claim in claims] == [True, False]
+            assert (await service.forward_auth(token)).role == "admin"
+            assert await service.forward_auth("unknown") is None
+
+class TestRetries:
+
+    def test_shed_requests_retried_with_retry_after(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            if len(calls) < 3:
+                return httpx.Response(503, headers={"Retry-After": "0"}, json={"detail": {"message": "busy"}})
+            return httpx.Response(200, json={"status": "success", "message": "ok"})
+
+        with AuthClient("http://test", transport=httpx.MockTransport(handler), retry=FAST_RETRY) as client:
+            assert client.login("a@example.com", "x").status == "success"
+        assert len(calls) == 3
+
+    def test_gives_up_after_attempts(self):
+        handler = lambda request: httpx.Response(503, json={"detail": {"status": "error", "message": "busy"}})
+        with AuthClient("http://test", transport=httpx.MockTransport(handler), retry=FAST_RETRY) as client:
+            with pytest.raises(AuthAPIError) as error:
+                client.me()
+        assert error.value.status_code == 503 and error.value.message == "busy"
+
+    def test_ambiguous_failures_only_retried_when_idempotent(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request.method)
+            if request.method == "POST":
+                return httpx.Response(502)
+            if len(calls) == 2:
+                raise httpx.ReadTimeout("slow", request=request)
+            return httpx.Response(200, json={"status": "ok"})
+
+        with AuthClient("http://test", transport=httpx.MockTransport(handler), retry=FAST_RETRY) as client:
+            with pytest.raises(AuthAPIError):
+                client.logout()
+            assert client.health() == {"status": "ok"}
+        assert calls == ["POST", "GET", "GET"]
+
+class TestSSEParser:
+
+    def test_parses_events_and_skips_comments(self):
+        parser = SSEParser()
+        lines = ["retry: 5000", "", ": keep-alive", "", "event: user.approved", "id: 7",
+                 'data: {"user_id": "u1"}', ""]
+        events = [event for event in map(parser.feed, lines) if event is not None]
+        assert len(events) == 1
+        assert (events[0].type, events[0].id, events[0].data) == ("user.approved", "7", {"user_id": "u1"})
@@ -0,0 +1,104 @@
+"""
+Tests for the per-request authentication context
+Run with: pytest test_auth_middleware.py
+"""
+
+import uuid
+from datetime import datetime, timedelta
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from starlette.requests import Request
+from auth_middleware import AuthMiddleware, AuthContext, SCOPE_KEY, auth_context
+from auth_routes import get_current_user, require_admin
+from main import app
+from storage import set_storage
+from storage_memory import MemoryStorage
+
+class CountingStorage(MemoryStorage):
+    """Memory backend counting the lookups the principal needs"""
+
+    def __init__(self):
+        super().__init__()
+        self.lookups = 0
+
+    async def get_auth_session(self, session_token, request=None):
+        self.lookups += 1
+        return await super().get_auth_session(session_token, request)
+
+    async def get_user(self, user_id, request=None):
+        self.lookups += 1
+        return await super().get_user(user_id, request)
+
+@pytest_asyncio.fixture
+async def store():
+    store = CountingStorage()
+    set_storage(store)
+    yield store
+    set_storage(None)
+
+async def log_in(store, role="user") -> str:
+    """Create a user with a live session; returns the session token"""
+    user_id = str(uuid.uuid4())
+    await store.create_user({
+        "id": user_id, "name": "Test User", "email": f"{user_id}@example.com", "phone": user_id[:10],
+        "password_hash": "-", "role": role, "is_active": True, "is_approved": True
+    })
+    token = uuid.uuid4().hex
+    await store.replace_auth_session({
+        "id": str(uuid.uuid4()), "user_id": user_id, "session_token": token,
+        "expires_at": datetime.utcnow() + timedelta(hours=1)
+    })
+    store.lookups = 0
+    return token
+
+def make_request(cookie: str = "", path: str = "/auth/me") -> Request:
+    headers = [(b"cookie", cookie.encode())] if cookie else []
+    return Request({"type": "http", "method": "GET", "path": path, "headers": headers, "query_string": b""})
+
+class TestAuthContext:
+
+    def test_cookies_parsed_once(self):
+        request = make_request("auth_session_id=abc; temp_session_id=def")
+        context = auth_context(request)
+        assert context.cookie("auth_session_id") == "abc"
+        assert context.cookie("temp_session_id") == "def"
+        assert auth_context(request) is context
+
+    @pytest.mark.asyncio
+    async def test_principal_resolved_once_per_request(self, store):
+        token = await log_in(store, role="admin")
+        request = make_request(f"auth_session_id={token}")
+
+        user = await get_current_user(request)
+        assert await require_admin(request) is user
+        assert await get_current_user(request) is user
+        assert store.lookups == 2  # one session lookup, one user lookup
+
+    @pytest.mark.asyncio
+    async def test_no_cookie_needs_no_lookup(self, store):
+        assert await get_current_user(make_request()) is None
+        assert store.lookups == 0
+
+class TestAuthMiddleware:
+
+    @pytest.mark.asyncio
+    async def test_public_paths_get_no_context(self):
+        seen = {}
+
+        async def inner(scope, receive, send):
+            seen[scope["path"]] = scope.get(SCOPE_KEY)
+
+        middleware = AuthMiddleware(inner)
+        for path in ("/health", "/auth/login", "/auth/me"):
+            await middleware({"type": "http", "path": path, "headers": []}, None, None)
+        assert seen["/health"] is None and seen["/auth/login"] is None
+        assert isinstance(seen["/auth/me"], AuthContext)
+
+    @pytest.mark.asyncio
+    async def test_admin_request_looks_up_principal_once(self, store):
+        token = await log_in(store, role="admin")
+        async with AsyncClient(app=app, base_url="http://test", cookies={"auth_session_id": token}) as client:
+            response = await client.get("/auth/admin/stats")
+        assert response.status_code == 200
+        assert store.lookups == 2
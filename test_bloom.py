@@ -0,0 +1,106 @@
+"""
+Tests for the duplicate email/phone pre-check
+Run with: pytest test_bloom.py
+"""
+
+import pytest
+from bloom import CountingBloomFilter, IdentifierFilter
+
+class FakeStorage:
+    def __init__(self, identifiers):
+        self.identifiers = identifiers
+
+    async def iter_identifiers(self):
+        for email, phone in self.identifiers:
+            yield email, phone
+
+class TestCountingBloomFilter:
+
+    def test_no_false_negatives(self):
+        bloom = CountingBloomFilter(1000, 0.01)
+        keys = [f"user{i}@example.com" for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        assert all(key in bloom for key in keys)
+
+    def test_false_positive_rate_near_target(self):
+        bloom = CountingBloomFilter(10000, 0.01)
+        for i in range(10000):
+            bloom.add(f"member{i}")
+        false_positives = sum(f"other{i}" in bloom for i in range(10000))
+        assert false_positives / 10000 < 0.02
+        assert bloom.estimated_false_positive_rate() == pytest.approx(0.01, rel=0.2)
+
+    def test_remove(self):
+        bloom = CountingBloomFilter(100, 0.01)
+        bloom.add("a")
+        bloom.add("b")
+        bloom.remove("a")
+        assert "a" not in bloom
+        assert "b" in bloom
+
+class TestIdentifierFilter:
+
+    @pytest.mark.asyncio
+    async def test_maybe_until_built(self):
+        """Before the startup scan every check must go to the database"""
+        identifiers = IdentifierFilter(100, 0.01)
+        assert identifiers.might_contain("new@example.com", "0900000000")
+
+        await identifiers.build(FakeStorage([("taken@example.com", "0911111111")]))
+        assert identifiers.might_contain("taken@example.com", "0900000000")
+        assert identifiers.might_contain("new@example.com", "0911111111")
+        assert not identifiers.might_contain("new@example.com", "0900000000")
+        assert identifiers.stats()["queries_skipped"] == 1
+
+    def test_removals_ignored_until_built(self):
+        """Removing a key the scan has not loaded yet must not clear other keys"""
+        identifiers = IdentifierFilter(100, 0.01)
+        identifiers.add("a@example.com", "0900000001")
+        identifiers.remove("a@example.com", "0900000001")
+        identifiers.ready = True
+        assert identifiers.might_contain("a@example.com", "0900000001")
+
+    @pytest.mark.asyncio
+    async def test_deleting_users_never_seen_keeps_other_keys(self):
+        """A worker that missed registrations must not create false negatives when they are deleted"""
+        known = [(f"known{i}@example.com", f"09000{i:05d}") for i in range(50)]
+        identifiers = IdentifierFilter(100, 0.01)
+        await identifiers.build(FakeStorage(known))
+        # Registered on other workers while this one's listener was reconnecting
+        for i in range(500):
+            identifiers.remove(f"missed{i}@example.com", f"08000{i:05d}")
+        assert all(identifiers.might_contain(email, phone) for email, phone in known)
+        assert identifiers.stats()["stale_users"] == 500
+
+    @pytest.mark.asyncio
+    async def test_rebuild_forgets_deleted_users(self):
+        identifiers = IdentifierFilter(100, 0.01)
+        await identifiers.build(FakeStorage([("gone@example.com", "0911111111"), ("kept@example.com", "0922222222")]))
+        identifiers.remove("gone@example.com", "0911111111")
+        assert identifiers.might_contain("gone@example.com", "0900000000")
+
+        await identifiers.build(FakeStorage([("kept@example.com", "0922222222")]))
+        assert not identifiers.might_contain("gone@example.com", "0900000000")
+        assert identifiers.might_contain("kept@example.com", "0900000000")
+        assert identifiers.stale == 0
+
+    @pytest.mark.asyncio
+    async def test_registrations_during_rebuild_kept(self):
+        identifiers = IdentifierFilter(100, 0.01)
+
+        class SlowStorage(FakeStorage):
+            async def iter_identifiers(self):
+                yield "old@example.com", "0911111111"
+                # Another request registers a user mid-scan
+                identifiers.add("new@example.com", "0922222222")
+
+        await identifiers.build(SlowStorage([]))
+        assert identifiers.might_contain("new@example.com", "0900000000")
+        assert identifiers.might_contain("old@example.com", "0900000000")
+
+    def test_observes_other_workers_registrations(self):
+        identifiers = IdentifierFilter(100, 0.01)
+        identifiers.ready = True
+        identifiers.observe({"type": "user.registered", "email": "b@example.com", "phone": "0900000002"})
+        assert identifiers.might_contain("b@example.com", "0999999999")
@@ -0,0 +1,163 @@
+"""
+Tests for the admin dashboard counters
+Run with: pytest test_counters.py
+"""
+
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlalchemy.dialects import postgresql
+import counters
+from counters import PENDING_USERS, ACTIVE_USERS, LIVE_SESSIONS
+from main import app
+from storage import set_storage
+from test_auth_middleware import CountingStorage, log_in
+
+@pytest_asyncio.fixture
+async def store():
+    store = CountingStorage()
+    set_storage(store)
+    yield store
+    set_storage(None)
+
+async def add_user(store, approved=False, active=True) -> str:
+    user_id = str(uuid.uuid4())
+    await store.create_user({
+        "id": user_id, "name": "Counted User", "email": f"{user_id}@example.com", "phone": user_id[:10],
+        "password_hash": "-", "role": "user", "is_active": active, "is_approved": approved
+    })
+    return user_id
+
+def recount(store) -> dict:
+    users = store.users.values()
+    return {
+        PENDING_USERS: sum(not user["is_approved"] for user in users),
+        ACTIVE_USERS: sum(user["is_approved"] and user["is_active"] for user in users),
+    }
+
+def updated_names(statement) -> list:
+    """Counter names in the UPDATE's `name IN (...)` filter"""
+    (names,) = [value for value in statement.params.values() if isinstance(value, list)]
+    return sorted(names)
+
+class FakeDatabase:
+    """Records statements; serves canned counter stripes and true counts"""
+
+    def __init__(self, stripes=(), actual=None, locked=True):
+        self.stripes = [SimpleNamespace(name=name, value=value) for name, value in stripes]
+        self.actual = actual or {}
+        self.locked = locked
+        self.executed = []
+        self.isolation = None
+
+    async def execute(self, query):
+        self.executed.append(query.compile(dialect=postgresql.dialect()))
+
+    async def fetch_all(self, query):
+        return self.stripes
+
+    async def fetch_one(self, query):
+        return self.actual
+
+    async def fetch_val(self, query):
+        return self.locked if "pg_try_advisory_lock" in str(query) else True
+
+    @asynccontextmanager
+    async def connection(self):
+        yield self
+
+    @asynccontextmanager
+    async def transaction(self, isolation=None):
+        self.isolation = isolation
+        yield
+
+    def updates(self):
+        return [statement for statement in self.executed if str(statement).startswith("UPDATE")]
+
+class TestMemoryCounters:
+
+    @pytest.mark.asyncio
+    async def test_counts_follow_writes(self, store):
+        pending = [await add_user(store) for _ in range(3)]
+        await add_user(store, approved=True)
+        await add_user(store, approved=True, active=False)
+        await store.approve_user(pending[0], None)
+        await store.delete_user(pending[1])
+        inactive = await add_user(store, approved=False, active=False)
+        await store.approve_user(inactive, None)
+
+        counts = await store.admin_counts()
+        assert {name: counts[name] for name in (PENDING_USERS, ACTIVE_USERS)} == recount(store)
+        assert counts[PENDING_USERS] == 1 and counts[ACTIVE_USERS] == 2
+
+    @pytest.mark.asyncio
+    async def test_stats_endpoint_excludes_expired_sessions(self, store):
+        token = await log_in(store, role="admin")
+        user_id = await add_user(store, approved=True)
+        await store.replace_auth_session({
+            "id": str(uuid.uuid4()), "user_id": user_id, "session_token": uuid.uuid4().hex,
+            "expires_at": datetime.utcnow() - timedelta(seconds=1)
+        })
+        async with AsyncClient(app=app, base_url="http://test") as client:
+            client.cookies.set("auth_session_id", token)
+            response = await client.get("/auth/admin/stats")
+        assert response.status_code == 200
+        stats = response.json()
+        assert (stats[PENDING_USERS], stats[ACTIVE_USERS], stats[LIVE_SESSIONS]) == (0, 2, 1)
+
+class TestUserCounterDeltas:
+
+    @pytest.mark.parametrize("approved, active, expected", [
+        (False, True, {PENDING_USERS: -1}),
+        (False, False, {PENDING_USERS: -1}),
+        (True, True, {ACTIVE_USERS: -1}),
+        (True, False, {}),
+    ])
+    def test_removal(self, approved, active, expected):
+        user = SimpleNamespace(is_approved=approved, is_active=active)
+        assert counters.user_counter_deltas(user, sign=-1) == expected
+
+class TestAdjust:
+
+    @pytest.mark.asyncio
+    async def test_zero_deltas_skipped(self):
+        db = FakeDatabase()
+        await counters.adjust({PENDING_USERS: 0, LIVE_SESSIONS: 0}, db)
+        assert db.executed == []
+
+    @pytest.mark.asyncio
+    async def test_one_update_on_one_stripe(self):
+        db = FakeDatabase()
+        await counters.adjust({PENDING_USERS: -1, ACTIVE_USERS: 1, LIVE_SESSIONS: 0}, db)
+        (statement,) = db.updates()
+        assert updated_names(statement) == [ACTIVE_USERS, PENDING_USERS]
+        assert 0 <= statement.params["shard_1"] < counters.COUNTER_SHARDS
+
+class TestReconcile:
+
+    @pytest.mark.asyncio
+    async def test_applies_difference_in_snapshot(self):
+        db = FakeDatabase(
+            stripes=[(PENDING_USERS, 5), (ACTIVE_USERS, 10), (LIVE_SESSIONS, 7)],
+            actual={PENDING_USERS: 5, ACTIVE_USERS: 12, LIVE_SESSIONS: 4},
+        )
+        drift = await counters.reconcile(db)
+        assert drift == {PENDING_USERS: 0, ACTIVE_USERS: 2, LIVE_SESSIONS: -3}
+        assert db.isolation == "repeatable_read"
+        (statement,) = db.updates()
+        assert updated_names(statement) == [ACTIVE_USERS, LIVE_SESSIONS]
+
+    @pytest.mark.asyncio
+    async def test_missing_stripes_count_as_zero(self):
+        db = FakeDatabase(actual={PENDING_USERS: 1, ACTIVE_USERS: 0, LIVE_SESSIONS: 0})
+        assert await counters.reconcile(db) == {PENDING_USERS: 1, ACTIVE_USERS: 0, LIVE_SESSIONS: 0}
+
+    @pytest.mark.asyncio
+    async def test_skipped_when_another_worker_holds_the_lock(self):
+        db = FakeDatabase(stripes=[(ACTIVE_USERS, 1)], actual={ACTIVE_USERS: 9}, locked=False)
+        assert await counters.reconcile(db) == {}
+        assert db.updates() == [] and db.isolation is None
@@ -0,0 +1,161 @@
+"""
+Tests for SMTP timeouts and the circuit breaker, against a local stand-in
+SMTP server that can be made slow or unreachable
+Run with: pytest test_email_delivery.py
+"""
+
+import asyncio
+import socket
+import pytest
+import pytest_asyncio
+from email.mime.text import MIMEText
+from circuit_breaker import CircuitBreaker, CircuitOpen, CLOSED, OPEN, HALF_OPEN
+from email_service import deliver
+
+class StandInSMTPServer:
+    """Minimal SMTP server; `delay` stalls the greeting to simulate a slow server"""
+
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.messages = 0
+        self.server = None
+        self.handlers = set()
+
+    async def handle(self, reader, writer):
+        self.handlers.add(asyncio.current_task())
+        try:
+            await asyncio.sleep(self.delay)
+            writer.write(b"220 stand-in ESMTP\r\n")
+            in_data = False
+            while line := await reader.readline():
+                if in_data:
+                    if line == b".\r\n":
+                        in_data = False
+                        self.messages += 1
+                        writer.write(b"250 OK\r\n")
+                    continue
+                command = line[:4].upper()
+                if command == b"EHLO":
+                    writer.write(b"250 stand-in\r\n")
+                elif command == b"DATA":
+                    in_data = True
+                    writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                elif command == b"QUIT":
+                    writer.write(b"221 Bye\r\n")
+                    await writer.drain()
+                    break
+                else:
+                    writer.write(b"250 OK\r\n")
+                await writer.drain()
+        finally:
+            writer.close()
+            self.handlers.discard(asyncio.current_task())
+
+    async def start(self) -> int:
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """Stop listening and end connections still being served (e.g. a stalled greeting)"""
+        self.server.close()
+        handlers = list(self.handlers)
+        for handler in handlers:
+            handler.cancel()
+        await asyncio.gather(*handlers, return_exceptions=True)
+        await self.server.wait_closed()
+
+def unused_port() -> int:
+    """A local port with nothing listening (connections are refused)"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def message():
+    msg = MIMEText("hello")
+    msg["From"] = "app@example.com"
+    msg["To"] = "user@example.com"
+    msg["Subject"] = "test"
+    return msg
+
+async def send(port, breaker, **kwargs):
+    await deliver(
+        message(), hostname="127.0.0.1", port=port, start_tls=False,
+        username=None, password=None, breaker=breaker, **kwargs
+    )
+
+@pytest_asyncio.fixture
+async def smtp_server():
+    server = StandInSMTPServer()
+    port = await server.start()
+    yield server, port
+    await server.stop()
+
+class TestSMTPDelivery:
+
+    @pytest.mark.asyncio
+    async def test_delivers_to_stand_in_server(self, smtp_server):
+        server, port = smtp_server
+        breaker = CircuitBreaker("smtp", failure_threshold=3, cooldown_seconds=30)
+        await send(port, breaker)
+        assert server.messages == 1
+        assert breaker.state == CLOSED
+
+    @pytest.mark.asyncio
+    async def test_slow_server_times_out(self):
+        """A stalled server costs the send timeout, not aiosmtplib's 60s default"""
+        server = StandInSMTPServer(delay=5)
+        port = await server.start()
+        breaker = CircuitBreaker("smtp", failure_threshold=3, cooldown_seconds=30)
+        try:
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            with pytest.raises(Exception):
+                await send(port, breaker, connect_timeout=0.2, send_timeout=0.5)
+            assert loop.time() - started < 1
+            assert breaker.consecutive_failures == 1
+        finally:
+            await server.stop()
+
+    @pytest.mark.asyncio
+    async def test_opens_fails_fast_then_recovers(self, smtp_server):
+        """Unreachable server: open after N failures, fail fast, half-open probe closes it"""
+        server, port = smtp_server
+        clock = FakeClock()
+        breaker = CircuitBreaker("smtp", failure_threshold=2, cooldown_seconds=30, clock=clock)
+        down = unused_port()
+
+        for _ in range(2):
+            with pytest.raises(Exception):
+                await send(down, breaker)
+        assert breaker.state == OPEN
+
+        # Fails fast without touching the (now healthy) server
+        with pytest.raises(CircuitOpen):
+            await send(port, breaker)
+        assert server.messages == 0
+
+        clock.now += 31
+        assert breaker.state == HALF_OPEN
+        await send(port, breaker)
+        assert server.messages == 1
+        assert breaker.state == CLOSED
+
+    @pytest.mark.asyncio
+    async def test_failed_probe_reopens(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker("smtp", failure_threshold=1, cooldown_seconds=30, clock=clock)
+        down = unused_port()
+        with pytest.raises(Exception):
+            await send(down, breaker)
+        clock.now += 31
+        with pytest.raises(Exception):
+            await send(down, breaker)
+        assert breaker.state == OPEN
+        assert breaker.times_opened == 2
@@ -0,0 +1,64 @@
+"""
+Tests for the SSE event broadcaster
+Run with: pytest test_events.py
+"""
+
+import pytest
+import events
+from events import Broadcaster, format_sse, stream
+
+class TestBroadcaster:
+
+    def test_publish_respects_filter(self):
+        """Each subscriber only receives events its filter accepts"""
+        broadcaster = Broadcaster(queue_size=10)
+        everything = broadcaster.subscribe()
+        only_a = broadcaster.subscribe(lambda event: event["user_id"] == "a")
+
+        broadcaster.publish({"type": events.USER_REGISTERED, "user_id": "a"})
+        broadcaster.publish({"type": events.USER_REGISTERED, "user_id": "b"})
+
+        assert everything.queue.qsize() == 2
+        assert only_a.queue.qsize() == 1
+
+    def test_slow_subscriber_is_dropped(self):
+        """A full queue disconnects the subscriber instead of growing"""
+        broadcaster = Broadcaster(queue_size=2)
+        slow = broadcaster.subscribe()
+        for i in range(3):
+            broadcaster.publish({"type": events.USER_REGISTERED, "user_id": str(i)})
+
+        assert slow.overflowed
+        assert slow not in broadcaster.subscribers
+        assert slow.queue.qsize() == 2
+
+    def test_subscribe_at_capacity_returns_none(self):
+        """New subscribers are refused once the worker limit is reached"""
+        broadcaster = Broadcaster(max_subscribers=1)
+        assert broadcaster.subscribe() is not None
+        assert broadcaster.subscribe() is None
+
+    def test_format_sse_uses_version_as_id(self):
+        frame = format_sse({"type": events.USER_APPROVED, "user_id": "a", "version": 7})
+        assert frame.startswith("event: user.approved\nid: 7\ndata: ")
+        assert frame.endswith("\n\n")
+
+    @pytest.mark.asyncio
+    async def test_stream_closes_after_final_event(self):
+        """The stream sends the initial state, heartbeats, and stops on close_after"""
+        subscription = events.broadcaster.subscribe()
+        frames = stream(
+            subscription,
+            initial=[{"type": "user.pending", "user_id": "a"}],
+            close_after=lambda event: event["type"] == events.USER_APPROVED,
+            heartbeat=0.01
+        )
+        assert (await frames.__anext__()).startswith("retry:")
+        assert "user.pending" in await frames.__anext__()
+        assert await frames.__anext__() == ": keep-alive\n\n"
+
+        events.broadcaster.publish({"type": events.USER_APPROVED, "user_id": "a", "version": 3})
+        assert "user.approved" in await frames.__anext__()
+        with pytest.raises(StopAsyncIteration):
+            await frames.__anext__()
+        assert subscription not in events.broadcaster.subscribers
@@ -0,0 +1,130 @@
+"""
+Tests for internal token introspection and forward auth
+Run with: pytest test_introspection.py
+"""
+
+import uuid
+from datetime import datetime, timedelta
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+import auth_routes
+from config import INTROSPECT_MAX_TOKENS
+from main import app
+from storage import set_storage
+from test_auth_middleware import CountingStorage, log_in
+
+INTERNAL_TOKEN = "internal-test-token"
+HEADERS = {"X-Internal-Token": INTERNAL_TOKEN}
+
+class IntrospectCountingStorage(CountingStorage):
+    def __init__(self):
+        super().__init__()
+        self.batches = 0
+
+    async def introspect_sessions(self, session_tokens, request=None):
+        self.batches += 1
+        return await super().introspect_sessions(session_tokens, request)
+
+@pytest_asyncio.fixture
+async def store(monkeypatch):
+    monkeypatch.setattr(auth_routes, "INTERNAL_API_TOKEN", INTERNAL_TOKEN)
+    store = IntrospectCountingStorage()
+    set_storage(store)
+    yield store
+    set_storage(None)
+
+@pytest_asyncio.fixture
+async def client():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        yield ac
+
+class TestIntrospection:
+
+    @pytest.mark.asyncio
+    async def test_batch_resolved_in_one_query(self, client, store):
+        admin_token = await log_in(store, role="admin")
+        user_token = await log_in(store)
+        expired_token = uuid.uuid4().hex
+        session = store.auth_sessions[user_token]
+        await store.replace_auth_session({
+            "id": str(uuid.uuid4()), "user_id": str(uuid.uuid4()), "session_token": expired_token,
+            "expires_at": datetime.utcnow() - timedelta(minutes=1)
+        })
+
+        response = await client.post("/auth/internal/introspect", headers=HEADERS, json={
+            "tokens": [admin_token, "unknown", user_token, expired_token, admin_token]
+        })
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert [result["active"] for result in results] == [True, False, True, False, True]
+        assert results[0]["role"] == "admin" and results[2]["role"] == "user"
+        assert results[2]["user_id"] == session["user_id"]
+        assert results[1] == {"active": False, "user_id": None, "role": None, "expires_at": None}
+        assert store.batches == 1 and store.lookups == 0
+
+        max_age = int(response.headers["cache-control"].split("max-age=")[1])
+        assert 0 < max_age <= auth_routes.INTROSPECT_MAX_AGE_SECONDS
+
+    @pytest.mark.asyncio
+    async def test_requires_internal_token(self, client, store):
+        response = await client.post("/auth/internal/introspect", json={"tokens": ["x"]})
+        assert response.status_code == 403
+        response = await client.post(
+            "/auth/internal/introspect", headers={"X-Internal-Token": "wrong"}, json={"tokens": ["x"]}
+        )
+        assert response.status_code == 403
+
+    @pytest.mark.asyncio
+    async def test_disabled_without_configured_token(self, client, store, monkeypatch):
+        monkeypatch.setattr(auth_routes, "INTERNAL_API_TOKEN", "")
+        response = await client.post("/auth/internal/introspect", headers={"X-Internal-Token": ""},
+                                     json={"tokens": ["x"]})
+        assert response.status_code == 403
+
+    @pytest.mark.asyncio
+    async def test_batch_size_limited(self, client, store):
+        tokens = ["x"] * (INTROSPECT_MAX_TOKENS + 1)
+        response = await client.post("/auth/internal/introspect", headers=HEADERS, json={"tokens": tokens})
+        assert response.status_code == 422
+
+class TestForwardAuth:
+
+    @pytest.mark.asyncio
+    async def test_valid_session_returns_headers_only(self, client, store):
+        token = await log_in(store, role="admin")
+        response = await client.get("/auth/internal/forward-auth", headers=HEADERS,
+                                    cookies={"auth_session_id": token})
+        assert response.status_code == 204
+        assert response.content == b""
+        assert response.headers["x-auth-role"] == "admin"
+        assert response.headers["x-auth-user-id"] == store.auth_sessions[token]["user_id"]
+
+    @pytest.mark.asyncio
+    async def test_missing_session_is_401_without_body(self, client, store):
+        response = await client.get("/auth/internal/forward-auth", headers=HEADERS,
+                                    cookies={"auth_session_id": "unknown"})
+        assert response.status_code == 401
+        assert response.content == b""
+
+    @pytest.mark.asyncio
+    async def test_max_age_capped_at_session_expiry(self, client, store):
+        token = await log_in(store)
+        store.auth_sessions[token]["expires_at"] = datetime.utcnow() + timedelta(seconds=10)
+        response = await client.get("/auth/internal/forward-auth", headers=HEADERS,
+                                    cookies={"auth_session_id": token})
+        assert response.status_code == 204
+        assert int(response.headers["cache-control"].split("max-age=")[1]) <= 10
+
+class TestInactiveUsers:
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("flag", ["is_active", "is_approved"])
+    async def test_both_paths_reject(self, client, store, flag):
+        token = await log_in(store)
+        store.users[store.auth_sessions[token]["user_id"]][flag] = False
+        response = await client.post("/auth/internal/introspect", headers=HEADERS, json={"tokens": [token]})
+        assert response.json()["results"][0]["active"] is False
+        response = await client.get("/auth/internal/forward-auth", headers=HEADERS,
+                                    cookies={"auth_session_id": token})
+        assert response.status_code == 401
@@ -0,0 +1,75 @@
+"""
+Tests for structured logging
+Run with: pytest test_logging_service.py
+"""
+
+import io
+import json
+import logging
+import queue
+import pytest
+import logging_service
+from logging_service import redact_text, redact_fields, request_id_var
+
+class TestRedaction:
+
+    def test_redact_text_masks_phone_and_otp(self):
+        """Phone numbers keep their last 3 digits, OTP codes are hidden"""
+        text = redact_text("SMS to 0987654321: Mã OTP của bạn là: 123456")
+        assert "0987654321" not in text
+        assert "*******321" in text
+        assert "123456" not in text
+
+    def test_redact_fields(self):
+        """Sensitive fields are replaced, phone and email fields are masked"""
+        fields = redact_fields({"otp": "123456", "phone": "0987654321", "to_email": "alice@b.co"})
+        assert fields == {"otp": "[REDACTED]", "phone": "*******321", "to_email": "a***@b.co"}
+
+    def test_redact_text_masks_email(self):
+        text = redact_text("550 mailbox unavailable: alice.nguyen@example.vn")
+        assert "alice" not in text and "a***@example.vn" in text
+
+class TestQueuedLogging:
+
+    @pytest.fixture
+    def output(self):
+        logging_service.shutdown_logging()
+        stream = io.StringIO()
+        logging_service.setup_logging(stream=stream)
+        yield stream
+        logging_service.shutdown_logging()
+
+    def test_records_are_json_with_request_id(self, output):
+        """Records are written by the listener as redacted JSON lines"""
+        token = request_id_var.set("req-1")
+        try:
+            logging_service.get_logger("test").info(
+                "SMS sent", extra={"fields": {"phone": "0987654321", "sms_text": "OTP 654321"}}
+            )
+        finally:
+            request_id_var.reset(token)
+        logging_service.shutdown_logging()
+
+        entry = json.loads(output.getvalue().splitlines()[-1])
+        assert entry["request_id"] == "req-1"
+        assert entry["logger"] == "auth.test"
+        assert entry["fields"] == {"phone": "*******321", "sms_text": "[REDACTED]"}
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        """A full queue never blocks the caller"""
+        logging_service.shutdown_logging()
+        handler = logging_service.NonBlockingQueueHandler(queue.Queue(maxsize=1))
+        record = logging.LogRecord("auth.test", logging.INFO, __file__, 1, "x", None, None)
+        handler.emit(record)
+        handler.emit(record)
+        assert handler.dropped == 1
+
+    def test_setup_after_shutdown_reattaches(self):
+        """A second app lifespan in the same process still writes its logs"""
+        logging_service.shutdown_logging()
+        stream = io.StringIO()
+        logging_service.setup_logging(stream=stream)
+        logging_service.get_logger("test").info("after restart")
+        logging_service.shutdown_logging()
+        assert json.loads(stream.getvalue().splitlines()[-1])["message"] == "after restart"
+        assert logging_service.setup_logging() in logging.getLogger("auth").handlers
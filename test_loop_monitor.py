@@ -0,0 +1,95 @@
+"""
+Tests for the event-loop stall detector
+Run with: pytest test_loop_monitor.py
+"""
+
+import asyncio
+import time
+import traceback
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+import loop_monitor as loop_monitor_module
+import metrics
+from loop_monitor import LoopMonitor, LAG_BUCKETS
+from main import app
+from storage import set_storage
+from test_auth_middleware import CountingStorage, log_in
+
+def block_the_loop(seconds: float):
+    time.sleep(seconds)
+
+@pytest_asyncio.fixture
+async def monitor():
+    monitor = LoopMonitor(interval_ms=10, threshold_ms=50, max_sites=2, enabled=True)
+    monitor.start()
+    await asyncio.sleep(0.05)
+    yield monitor
+    await monitor.stop()
+
+class TestLoopMonitor:
+
+    @pytest.mark.asyncio
+    async def test_stall_captures_blocking_site(self, monitor):
+        block_the_loop(0.3)
+        await asyncio.sleep(0.05)
+        assert monitor.stalls >= 1 and monitor.max_lag >= 0.2
+        assert monitor.captures == 1
+        site = monitor.top_sites()[0]
+        assert "in block_the_loop" in site["site"] and site["site"].startswith("test_loop_monitor.py:")
+        assert site["stack"][-1] == site["site"]
+
+    @pytest.mark.asyncio
+    async def test_short_pauses_not_captured(self, monitor):
+        for _ in range(3):
+            block_the_loop(0.01)
+            await asyncio.sleep(0.02)
+        assert monitor.captures == 0 and monitor.beats > 0
+
+    def test_histogram_is_cumulative(self):
+        monitor = LoopMonitor(enabled=False)
+        for lag in (0.0005, 0.003, 0.2, 30.0):
+            monitor.observe(lag)
+        buckets, total, count = monitor.lag_histogram()
+        assert [cumulative for _, cumulative in buckets][:3] == [1, 2, 2]
+        assert buckets[-1] == (LAG_BUCKETS[-1], 3) and count == 4
+        assert total == pytest.approx(30.2035)
+
+    def test_least_frequent_site_forgotten(self):
+        monitor = LoopMonitor(max_sites=2, enabled=False)
+        library = loop_monitor_module.LIBRARY_PATHS[0] + "/json/encoder.py"
+        def stack(name):
+            return traceback.StackSummary.from_list([
+                (loop_monitor_module.ROOT + "/auth_routes.py", 10, name, None), (library, 5, "encode", None)
+            ])
+        for name in ("a", "a", "b", "c"):
+            monitor.record_stall(stack(name))
+        # Library frames are skipped; "b" (seen once) made room for "c"
+        assert [site["site"] for site in monitor.top_sites()] == [
+            "auth_routes.py:10 in a", "auth_routes.py:10 in c"
+        ]
+        assert monitor.captures == 4
+
+    def test_metrics_rendered(self):
+        text = metrics.render()
+        assert "# TYPE event_loop_lag_seconds histogram" in text
+        assert 'event_loop_lag_seconds_bucket{le="+Inf"}' in text
+
+class TestDiagnosticsRoute:
+
+    @pytest.mark.asyncio
+    async def test_admin_only(self, monkeypatch):
+        store = CountingStorage()
+        set_storage(store)
+        monitor = LoopMonitor(enabled=False)
+        monitor.observe(0.2)
+        monkeypatch.setattr("diagnostics.loop_monitor", monitor)
+        try:
+            async with AsyncClient(app=app, base_url="http://test") as client:
+                assert (await client.get("/auth/admin/diagnostics/loop")).status_code == 403
+                client.cookies.set("auth_session_id", await log_in(store, role="admin"))
+                response = await client.get("/auth/admin/diagnostics/loop")
+            assert response.status_code == 200
+            assert response.json()["stalls"] == 1 and response.json()["max_lag_ms"] == 200
+        finally:
+            set_storage(None)
@@ -0,0 +1,93 @@
+"""
+Tests for the on-demand memory profiling endpoints
+Run with: pytest test_memory_diagnostics.py
+"""
+
+import asyncio
+import tracemalloc
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+import diagnostics
+from main import app
+from memory_diagnostics import MemoryDiagnostics, MemoryDiagnosticsBusy, rss_bytes
+from storage import set_storage
+from test_auth_middleware import CountingStorage, log_in
+
+BASE = "/auth/admin/diagnostics/memory"
+
+leaked = []
+
+def leak_strings():
+    leaked.extend("x" * 1000 + str(i) for i in range(2000))
+
+@pytest_asyncio.fixture
+async def admin(monkeypatch):
+    monkeypatch.setattr(diagnostics, "memory_diagnostics", MemoryDiagnostics(max_snapshots=2))
+    store = CountingStorage()
+    set_storage(store)
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        client.cookies.set("auth_session_id", await log_in(store, role="admin"))
+        yield client
+    set_storage(None)
+    tracemalloc.stop()
+    leaked.clear()
+
+class TestMemoryDiagnostics:
+
+    def test_off_by_default(self):
+        assert not tracemalloc.is_tracing()
+        assert MemoryDiagnostics().status()["tracing"] is False
+
+    @pytest.mark.asyncio
+    async def test_admin_only(self):
+        async with AsyncClient(app=app, base_url="http://test") as client:
+            assert (await client.get(BASE)).status_code == 403
+            assert (await client.post(f"{BASE}/tracemalloc/start")).status_code == 403
+        assert not tracemalloc.is_tracing()
+
+    @pytest.mark.asyncio
+    async def test_overview(self, admin):
+        body = (await admin.get(BASE)).json()
+        assert body["rss_bytes"] == pytest.approx(rss_bytes(), rel=0.5)
+        assert any(worker["pid"] == body["pid"] for worker in body["workers"])
+        assert len(body["gc"]["generations"]) == 3
+        assert body["tracemalloc"]["tracing"] is False
+
+    @pytest.mark.asyncio
+    async def test_snapshot_diff_finds_allocation_site(self, admin):
+        assert (await admin.post(f"{BASE}/snapshots")).status_code == 409
+        assert (await admin.post(f"{BASE}/tracemalloc/start")).json()["tracing"] is True
+
+        base = (await admin.post(f"{BASE}/snapshots")).json()["id"]
+        leak_strings()
+        target = (await admin.post(f"{BASE}/snapshots")).json()["id"]
+
+        stats = (await admin.get(f"{BASE}/diff", params={"base": base, "target": target})).json()["stats"]
+        top = stats[0]
+        assert "test_memory_diagnostics.py" in top["site"][0]
+        assert top["size_diff_bytes"] > 1_000_000 and top["count_diff"] >= 2000
+
+        top_sites = (await admin.get(f"{BASE}/snapshots/{target}", params={"group_by": "filename"})).json()
+        assert top_sites["stats"]
+
+        # Snapshots outlive tracing; only the newest two are kept
+        assert (await admin.post(f"{BASE}/tracemalloc/stop")).json()["tracing"] is False
+        assert (await admin.get(f"{BASE}/diff", params={"base": base, "target": target})).status_code == 200
+        diagnostics.memory_diagnostics.start()
+        await diagnostics.memory_diagnostics.take_snapshot()
+        assert (await admin.get(f"{BASE}/snapshots/{base}")).status_code == 404
+
+    @pytest.mark.asyncio
+    async def test_object_counts(self, admin):
+        objects = (await admin.get(f"{BASE}/objects", params={"top": 5})).json()["objects"]
+        assert len(objects) == 5 and objects[0]["count"] >= objects[-1]["count"]
+
+    @pytest.mark.asyncio
+    async def test_one_heavy_call_at_a_time(self):
+        profiler = MemoryDiagnostics()
+        first = asyncio.ensure_future(profiler.object_counts(5))
+        await asyncio.sleep(0)
+        with pytest.raises(MemoryDiagnosticsBusy):
+            await profiler.object_counts(5)
+        assert len(await first) == 5
@@ -0,0 +1,176 @@
+"""
+Tests for the online migration runner
+Run with: pytest test_migrations.py
+"""
+
+from contextlib import asynccontextmanager
+import asyncpg
+import pytest
+import migrations
+from migrations import SQL, Backfill, CreateIndexConcurrently, Migration, apply_migration, with_lock_retry
+
+def lock_timeout():
+    return asyncpg.exceptions.LockNotAvailableError("canceling statement due to lock timeout")
+
+class FakeConnection:
+    """Just enough of asyncpg.Connection for the runner: one table of integer
+    keys, the progress table, and a log of executed statements"""
+
+    def __init__(self, keys=(), index_valid=None, lock_failures=0, fail_update_at=None):
+        self.updated = {key: 0 for key in keys}
+        self.progress = {}
+        self.index_valid = index_valid
+        self.lock_failures = lock_failures
+        self.fail_update_at = fail_update_at
+        self.batches = 0
+        self.statements = []
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def execute(self, sql, *args):
+        sql = " ".join(sql.split())
+        self.statements.append(sql)
+        if sql.startswith("INSERT INTO schema_migration_progress"):
+            version, step, done, last_key, rows_delta = args
+            row = self.progress.setdefault((version, step), {"done": False, "last_key": None, "rows_done": 0})
+            row["done"] = row["done"] or done
+            row["last_key"] = last_key if last_key is not None else row["last_key"]
+            row["rows_done"] += rows_delta
+            return "INSERT 0 1"
+        if sql.startswith("UPDATE"):
+            return self._update(sql, args)
+        if self.lock_failures and sql.startswith(("CREATE", "ALTER")):
+            self.lock_failures -= 1
+            raise lock_timeout()
+        return "OK"
+
+    def _update(self, sql, args):
+        self.batches += 1
+        if self.batches == self.fail_update_at:
+            raise ConnectionError("connection lost")
+        lower = int(args[0]) if " > $1" in sql else None
+        upper = int(args[-1]) if " <= $" in sql else None
+        keys = [key for key in self.updated if (lower is None or key > lower) and (upper is None or key <= upper)]
+        for key in keys:
+            self.updated[key] += 1
+        return f"UPDATE {len(keys)}"
+
+    async def fetchval(self, sql, *args):
+        if "indisvalid" in sql:
+            return self.index_valid
+        if "format_type" in sql:
+            return "integer"
+        # Upper bound of the next backfill batch
+        last_key, offset = args
+        keys = sorted(key for key in self.updated if last_key is None or key > int(last_key))
+        return str(keys[offset]) if offset < len(keys) else None
+
+    async def fetchrow(self, sql, *args):
+        return self.progress.get(args)
+
+    async def fetch(self, sql, *args):
+        (version,) = args
+        return [{"step": step} for (v, step), row in self.progress.items() if v == version and row["done"]]
+
+    def ran(self, prefix):
+        return [sql for sql in self.statements if sql.startswith(prefix)]
+
+@pytest.fixture(autouse=True)
+def sleeps(monkeypatch):
+    """Record retry backoff instead of waiting"""
+    delays = []
+
+    async def sleep(seconds):
+        delays.append(seconds)
+
+    monkeypatch.setattr(migrations.asyncio, "sleep", sleep)
+    return delays
+
+class TestLockRetry:
+
+    @pytest.mark.asyncio
+    async def test_retries_with_backoff(self, sleeps):
+        conn = FakeConnection(lock_failures=2)
+        await SQL("ALTER TABLE users ADD COLUMN x INT").run(conn, 1, 0)
+        assert len(conn.ran("ALTER TABLE")) == 3
+        assert conn.ran("SET LOCAL lock_timeout") == [f"SET LOCAL lock_timeout = {migrations.MIGRATION_LOCK_TIMEOUT_MS}"] * 3
+        assert sleeps == [0.5, 1.0]
+
+    @pytest.mark.asyncio
+    async def test_gives_up_after_the_last_attempt(self, sleeps):
+        attempts = []
+
+        async def operation():
+            attempts.append(1)
+            raise lock_timeout()
+
+        with pytest.raises(asyncpg.exceptions.LockNotAvailableError):
+            await with_lock_retry(operation)
+        assert len(attempts) == migrations.MIGRATION_LOCK_RETRIES
+        assert len(sleeps) == migrations.MIGRATION_LOCK_RETRIES - 1
+
+class TestBackfill:
+
+    def step(self):
+        return Backfill("users", "version = 1", "TRUE", batch_size=3, pause_ms=0)
+
+    @pytest.mark.asyncio
+    async def test_batches_cover_every_row_once(self):
+        conn = FakeConnection(keys=range(1, 11))
+        await self.step().run(conn, 6, 3)
+        assert set(conn.updated.values()) == {1}
+        assert conn.batches == 4
+        assert conn.progress[(6, 3)] == {"done": False, "last_key": "9", "rows_done": 10}
+
+    @pytest.mark.asyncio
+    async def test_resumes_after_last_saved_batch(self):
+        conn = FakeConnection(keys=range(1, 11), fail_update_at=3)
+        with pytest.raises(ConnectionError):
+            await self.step().run(conn, 6, 3)
+        assert conn.progress[(6, 3)]["last_key"] == "6"
+
+        await self.step().run(conn, 6, 3)
+        assert set(conn.updated.values()) == {1}
+        assert conn.progress[(6, 3)]["rows_done"] == 10
+
+class TestCreateIndexConcurrently:
+
+    def step(self):
+        return CreateIndexConcurrently("idx_users_version", "users", "(version)")
+
+    @pytest.mark.asyncio
+    async def test_valid_index_left_alone(self):
+        conn = FakeConnection(index_valid=True)
+        await self.step().run(conn, 6, 4)
+        assert conn.statements == []
+
+    @pytest.mark.asyncio
+    async def test_invalid_leftover_dropped_then_rebuilt(self):
+        conn = FakeConnection(index_valid=False)
+        await self.step().run(conn, 6, 4)
+        assert conn.ran("DROP") == ["DROP INDEX CONCURRENTLY IF EXISTS idx_users_version"]
+        assert conn.ran("CREATE") == ["CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_version ON users (version)"]
+        assert conn.statements.index(conn.ran("DROP")[0]) < conn.statements.index(conn.ran("CREATE")[0])
+
+    @pytest.mark.asyncio
+    async def test_timed_out_build_cleaned_up_before_retry(self):
+        conn = FakeConnection(lock_failures=1)
+        await self.step().run(conn, 6, 4)
+        assert [sql.split()[0] for sql in conn.statements if sql.startswith(("CREATE", "DROP"))] == [
+            "CREATE", "DROP", "CREATE"
+        ]
+        assert conn.statements[-1] == "RESET lock_timeout"
+
+class TestApplyMigration:
+
+    @pytest.mark.asyncio
+    async def test_finished_steps_skipped_on_rerun(self):
+        conn = FakeConnection()
+        conn.progress[(42, 0)] = {"done": True, "last_key": None, "rows_done": 0}
+        migration = Migration(42, "test", [SQL("CREATE TABLE a (id INT)"), SQL("CREATE TABLE b (id INT)")])
+        await apply_migration(conn, migration)
+        assert conn.ran("CREATE") == ["CREATE TABLE b (id INT)"]
+        assert conn.ran("INSERT INTO schema_migrations ")
+        assert conn.ran("DELETE FROM schema_migration_progress")
@@ -0,0 +1,116 @@
+"""
+Query-plan regression suite for the hot statements of auth_routes.py
+Run with: AUTH_TEST_PLANS_DATABASE_URL=postgresql://... pytest test_query_plans.py
+
+Needs a database loaded by seed_dataset.py (same --seed, AUTH_TEST_PLANS_SEED,
+default "seed"). Each statement is built by storage_postgres exactly as the
+routes run it and captured with EXPLAIN (ANALYZE, BUFFERS). A test fails when
+the plan sequentially scans a table of SEQ_SCAN_MIN_ROWS rows or more, or
+when the median execution time exceeds its budget in query_plan_budgets.json.
+Set AUTH_TEST_PLANS_OUTPUT to a directory to keep the captured plans.
+"""
+
+import asyncio
+import json
+import os
+import statistics
+import asyncpg
+import pytest
+from sqlalchemy.dialects.postgresql.asyncpg import PGDialect_asyncpg
+import seed_dataset
+import storage_postgres
+
+DATABASE_URL = os.environ.get("AUTH_TEST_PLANS_DATABASE_URL")
+SEED = os.environ.get("AUTH_TEST_PLANS_SEED", "seed")
+OUTPUT_DIR = os.environ.get("AUTH_TEST_PLANS_OUTPUT")
+
+BUDGETS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "query_plan_budgets.json")
+
+# A sequential scan of a smaller table is the planner doing the right thing
+SEQ_SCAN_MIN_ROWS = 10_000
+RUNS = 5
+
+# Seeded user/session looked up by the point queries
+SAMPLE = 4242
+
+HOT_STATEMENTS = {
+    # POST /auth/login
+    "login_by_email": lambda: storage_postgres.user_by_email_query(seed_dataset.user_email(SAMPLE)),
+    "login_by_phone": lambda: storage_postgres.user_by_phone_query(seed_dataset.user_phone(SAMPLE)),
+    # Every authenticated request
+    "session_lookup": lambda: storage_postgres.auth_session_query(seed_dataset.session_token(SEED, SAMPLE)),
+    "current_user": lambda: storage_postgres.user_by_id_query(seed_dataset.user_id(SEED, SAMPLE)),
+    # POST /auth/verify-otp, /auth/verify-registration
+    "temp_session_lookup": lambda: storage_postgres.temp_session_query(seed_dataset.temp_session_id(SEED, 0)),
+    "temp_registration_lookup": lambda: storage_postgres.temp_registration_query(
+        seed_dataset.temp_registration_id(SEED, 0)
+    ),
+    # POST /auth/register (the usual case: neither identifier is taken)
+    "register_duplicate_check": lambda: storage_postgres.identifier_taken_query(
+        "not-registered@example.com", "0799999999"
+    ),
+    # GET /auth/admin/pending-users
+    "pending_users": lambda: storage_postgres.list_users_query(pending_only=True),
+    # ETag of the admin listings
+    "users_version": storage_postgres.users_version_query,
+}
+
+needs_database = pytest.mark.skipif(not DATABASE_URL, reason="AUTH_TEST_PLANS_DATABASE_URL not set")
+
+def load_budgets() -> dict:
+    with open(BUDGETS_FILE) as f:
+        return json.load(f)
+
+def to_sql(query):
+    """SQL text and positional parameters, as asyncpg receives them"""
+    compiled = query.compile(dialect=PGDialect_asyncpg())
+    return str(compiled), [compiled.params[name] for name in compiled.positiontup or ()]
+
+def plan_nodes(node: dict):
+    yield node
+    for child in node.get("Plans", ()):
+        yield from plan_nodes(child)
+
+async def explain(name: str):
+    """Return (plan, median execution ms, large table names)"""
+    sql, params = to_sql(HOT_STATEMENTS[name]())
+    conn = await asyncpg.connect(DATABASE_URL)
+    try:
+        if not await conn.fetchval("SELECT EXISTS (SELECT 1 FROM users WHERE email = $1)",
+                                   seed_dataset.user_email(SAMPLE)):
+            pytest.skip("database was not seeded by seed_dataset.py")
+        large_tables = {
+            row["relname"] for row in await conn.fetch(
+                "SELECT relname FROM pg_class WHERE relkind = 'r' AND reltuples >= $1", SEQ_SCAN_MIN_ROWS
+            )
+        }
+        await conn.fetch(sql, *params)  # warm the cache like a running server
+        plans = []
+        for _ in range(RUNS):
+            result = await conn.fetchval(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}", *params)
+            plans.append(json.loads(result)[0])
+    finally:
+        await conn.close()
+
+    if OUTPUT_DIR:
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        with open(os.path.join(OUTPUT_DIR, f"{name}.json"), "w") as f:
+            json.dump({"sql": sql, "plan": plans[-1]}, f, indent=2, default=str)
+    return plans[-1], statistics.median(plan["Execution Time"] for plan in plans), large_tables
+
+@needs_database
+@pytest.mark.parametrize("name", sorted(HOT_STATEMENTS))
+def test_hot_statement_plan(name):
+    budget_ms = load_budgets()[name]
+    plan, execution_ms, large_tables = asyncio.run(explain(name))
+    rendered = json.dumps(plan["Plan"], indent=2)
+
+    seq_scans = [
+        node["Relation Name"] for node in plan_nodes(plan["Plan"])
+        if node["Node Type"] == "Seq Scan" and node.get("Relation Name") in large_tables
+    ]
+    assert not seq_scans, f"{name} scans {seq_scans} sequentially:\n{rendered}"
+    assert execution_ms <= budget_ms, f"{name} took {execution_ms:.2f} ms (budget {budget_ms} ms):\n{rendered}"
+
+def test_every_hot_statement_has_a_budget():
+    assert set(load_budgets()) == set(HOT_STATEMENTS)
@@ -0,0 +1,76 @@
+"""
+Tests for read-replica routing
+Run with: pytest test_read_routing.py
+"""
+
+import pytest
+from database import ReadRouter, PRIMARY_PIN_COOKIE
+
+class FakeDatabase:
+    """Stand-in for databases.Database that records which pool served a read"""
+
+    def __init__(self, name, fail=False):
+        self.name = name
+        self.fail = fail
+        self.is_connected = True
+        self.calls = 0
+
+    async def fetch_one(self, query):
+        self.calls += 1
+        if self.fail:
+            raise ConnectionError(f"{self.name} is down")
+        return self.name
+
+    async def fetch_all(self, query):
+        return [await self.fetch_one(query)]
+
+class FakeRequest:
+    def __init__(self, cookies=None):
+        self.cookies = cookies or {}
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class TestReadRouter:
+
+    @pytest.mark.asyncio
+    async def test_reads_use_replica_by_default(self):
+        """Unpinned reads go to the replica"""
+        router = ReadRouter(FakeDatabase("primary"), FakeDatabase("replica"))
+        assert await router.fetch_one("q", FakeRequest()) == "replica"
+        assert await router.fetch_all("q") == ["replica"]
+
+    @pytest.mark.asyncio
+    async def test_without_replica_reads_use_primary(self):
+        """No replica configured means everything hits the primary"""
+        router = ReadRouter(FakeDatabase("primary"))
+        assert await router.fetch_one("q") == "primary"
+
+    @pytest.mark.asyncio
+    async def test_pinned_request_reads_primary(self):
+        """A recent-write pin cookie forces reads to the primary"""
+        router = ReadRouter(FakeDatabase("primary"), FakeDatabase("replica"))
+        request = FakeRequest({PRIMARY_PIN_COOKIE: "1"})
+        assert await router.fetch_one("q", request) == "primary"
+
+    @pytest.mark.asyncio
+    async def test_replica_failure_falls_back_and_recovers(self):
+        """A failing replica is skipped until the retry window passes"""
+        clock = FakeClock()
+        replica = FakeDatabase("replica", fail=True)
+        router = ReadRouter(FakeDatabase("primary"), replica, retry_seconds=30, clock=clock)
+
+        assert await router.fetch_one("q") == "primary"
+        assert not router.replica_healthy
+
+        # While unhealthy the replica is not even tried
+        assert await router.fetch_one("q") == "primary"
+        assert replica.calls == 1
+
+        replica.fail = False
+        clock.now += 31
+        assert await router.fetch_one("q") == "replica"
@@ -0,0 +1,237 @@
+"""
+Tests for the shared-memory session cache
+Run with: pytest test_session_cache.py
+"""
+
+import asyncio
+import multiprocessing
+import uuid
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from main import app
+import session_cache
+from session_cache import SharedSessionCache, RECORD_SIZE, HEADER_SIZE, SEQ
+from auth_middleware import auth_context
+from storage import set_storage
+import storage_postgres
+from test_auth_middleware import CountingStorage, log_in, make_request
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def principal(role="user", approved=True, active=True, user_id=None):
+    return SimpleNamespace(id=user_id or uuid.uuid4(), role=role, is_approved=approved, is_active=active)
+
+def expiry(hours=1):
+    return datetime.utcnow() + timedelta(hours=hours)
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = SharedSessionCache(str(tmp_path / "sessions"), slots=64, ttl_seconds=30)
+    yield cache
+    cache.close()
+
+def put_from_other_process(path: str, token: str, user_id: str):
+    cache = SharedSessionCache(path, slots=64)
+    cache.put(token, principal(role="admin", user_id=user_id), expiry())
+    cache.close()
+
+class TestSharedSessionCache:
+
+    def test_put_then_get(self, cache):
+        user = principal(role="admin", approved=False)
+        cache.put("token", user, expiry())
+        cached = cache.get("token")
+        assert (cached.id, cached.role, cached.is_approved, cached.is_active) == (user.id, "admin", False, True)
+        assert cache.get("other") is None
+
+    def test_entries_expire_with_ttl_and_session(self, tmp_path):
+        clock = Clock(datetime.utcnow().timestamp())
+        cache = SharedSessionCache(str(tmp_path / "sessions"), slots=64, ttl_seconds=30, clock=clock)
+        cache.put("short", principal(), datetime.utcnow() + timedelta(seconds=10))
+        cache.put("long", principal(), expiry())
+        clock.now += 15
+        assert cache.get("short") is None
+        assert cache.get("long") is not None
+        clock.now += 30
+        assert cache.get("long") is None
+        cache.close()
+
+    def test_invalidate_and_invalidate_user(self, cache):
+        user = principal()
+        cache.put("a", user, expiry())
+        cache.put("b", user, expiry())
+        cache.put("c", principal(), expiry())
+
+        cache.invalidate("a")
+        assert cache.get("a") is None and cache.get("b") is not None
+        cache.invalidate_user(user.id)
+        assert cache.get("b") is None
+        assert cache.get("c") is not None
+
+    def test_full_table_evicts_and_keeps_working(self, cache):
+        tokens = [f"token-{i}" for i in range(cache.slots * 2)]
+        for token in tokens:
+            cache.put(token, principal(), expiry())
+        assert cache.evictions > 0
+        assert cache.get(tokens[-1]) is not None
+
+    def test_probe_chain_survives_deletions(self, cache, monkeypatch):
+        # Same home slot for every token: force a chain
+        monkeypatch.setattr(session_cache, "token_digest", lambda token: bytes(8) + token.encode().ljust(8, b"-"))
+        for token in ("a", "b", "c"):
+            cache.put(token, principal(), expiry())
+        cache.invalidate("a")
+        assert cache.get("c") is not None
+        cache.put("d", principal(), expiry())  # reuses the tombstone
+        assert cache.get("c") is not None and cache.get("d") is not None
+
+    def test_record_being_written_reads_as_miss(self, cache):
+        cache.put("token", principal(), expiry())
+        offset = next(o for o in range(HEADER_SIZE, cache.size, RECORD_SIZE)
+                      if SEQ.unpack_from(cache.buffer, o)[0])
+        seq = SEQ.unpack_from(cache.buffer, offset)[0]
+        SEQ.pack_into(cache.buffer, offset, seq + 1)  # a writer is mid-update
+        assert cache.get("token") is None
+        SEQ.pack_into(cache.buffer, offset, seq + 2)
+        assert cache.get("token") is not None
+
+    def test_fill_dropped_after_concurrent_invalidation(self, cache):
+        user = principal()
+        since = cache.generations()
+        cache.invalidate("token")  # logout lands during the fill's lookup
+        cache.put("token", user, expiry(), since)
+        assert cache.get("token") is None and cache.stale_fills == 1
+
+        since = cache.generations()
+        cache.invalidate_user(user.id)  # login replaced the user's sessions
+        cache.put("other", user, expiry(), since)
+        assert cache.get("other") is None
+
+        # Unrelated invalidations don't block fills
+        since = cache.generations()
+        cache.invalidate("someone-else")
+        cache.put("token", user, expiry(), since)
+        assert cache.get("token") is not None
+
+    def test_visible_across_processes(self, cache):
+        user_id = str(uuid.uuid4())
+        process = multiprocessing.get_context("spawn").Process(
+            target=put_from_other_process, args=(cache.path, "shared", user_id)
+        )
+        process.start()
+        process.join(30)
+        assert process.exitcode == 0
+        cached = cache.get("shared")
+        assert str(cached.id) == user_id and cached.role == "admin"
+
+class PausingPrimary:
+    """Primary stand-in: a read sees the rows as they are when it starts; the
+    first session read then waits for `resume`"""
+
+    def __init__(self, sessions: dict, users: dict):
+        self.sessions = sessions
+        self.users = users
+        self.session_reads = 0
+        self.resume = asyncio.Event()
+
+    async def fetch_one(self, query):
+        (key,) = query.compile().params.values()
+        if query.get_final_froms()[0].name == "auth_sessions":
+            row = self.sessions.get(key)
+            self.session_reads += 1
+            if self.session_reads == 1:
+                await self.resume.wait()
+            return row
+        return self.users.get(key)
+
+class TestSessionCacheWithPostgres:
+
+    @pytest.mark.asyncio
+    async def test_fill_does_not_join_lookup_started_before_logout(self, cache, monkeypatch):
+        """A miss after a logout must not reuse a lookup begun before it (singleflight)"""
+        user = principal()
+        token = "token"
+        primary = PausingPrimary({token: SimpleNamespace(user_id=user.id, expires_at=expiry())}, {user.id: user})
+        monkeypatch.setattr(storage_postgres, "database", primary)
+        set_storage(storage_postgres.PostgresStorage())
+        session_cache.set_session_cache(cache)
+        try:
+            resolve = lambda: auth_context(make_request(f"auth_session_id={token}")).principal()
+            first = asyncio.create_task(resolve())
+            while not primary.session_reads:
+                await asyncio.sleep(0)
+            # Logged out (on another worker) while that lookup is in flight
+            del primary.sessions[token]
+            cache.invalidate(token)
+            second = asyncio.create_task(resolve())
+            for _ in range(5):
+                await asyncio.sleep(0)
+            primary.resume.set()
+            assert (await first).id == user.id
+            assert await second is None
+        finally:
+            session_cache.set_session_cache(None)
+            set_storage(None)
+        assert cache.get(token) is None and cache.stale_fills == 1
+
+class TestSessionCacheInRoutes:
+
+    @pytest_asyncio.fixture
+    async def store(self, cache):
+        store = CountingStorage()
+        set_storage(store)
+        session_cache.set_session_cache(cache)
+        yield store
+        session_cache.set_session_cache(None)
+        set_storage(None)
+
+    @pytest.mark.asyncio
+    async def test_admin_route_served_from_cache(self, store):
+        token = await log_in(store, role="admin")
+        async with AsyncClient(app=app, base_url="http://test", cookies={"auth_session_id": token}) as client:
+            assert (await client.get("/auth/admin/stats")).status_code == 200
+            assert store.lookups == 2
+            assert (await client.get("/auth/admin/stats")).status_code == 200
+            assert store.lookups == 2
+            # /me still needs the full row: one user lookup, no session lookup
+            assert (await client.get("/auth/me")).status_code == 200
+            assert store.lookups == 3
+
+    @pytest.mark.asyncio
+    async def test_logout_during_lookup_not_cached(self, store, cache, monkeypatch):
+        token = await log_in(store)
+        read = store.get_auth_session
+        requests = []
+
+        async def read_then_logged_out(session_token, request=None):
+            requests.append(request)
+            session = await read(session_token, request)
+            # Another worker logs the session out before this fill reaches the cache
+            await store.delete_auth_session(session_token)
+            session_cache.invalidate(session_token)
+            return session
+
+        monkeypatch.setattr(store, "get_auth_session", read_then_logged_out)
+        async with AsyncClient(app=app, base_url="http://test", cookies={"auth_session_id": token}) as client:
+            assert (await client.get("/auth/me")).status_code == 200
+            assert cache.get(token) is None
+            assert (await client.get("/auth/me")).status_code == 401
+        # Fills are read from the primary, never a replica
+        assert requests[0] is None
+
+    @pytest.mark.asyncio
+    async def test_logout_invalidates(self, store):
+        token = await log_in(store)
+        async with AsyncClient(app=app, base_url="http://test", cookies={"auth_session_id": token}) as client:
+            assert (await client.get("/auth/me")).status_code == 200
+            await client.post("/auth/logout")
+        async with AsyncClient(app=app, base_url="http://test", cookies={"auth_session_id": token}) as client:
+            assert (await client.get("/auth/me")).status_code == 401
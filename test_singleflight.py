@@ -0,0 +1,101 @@
+"""
+Tests for single-flight coalescing
+Run with: pytest test_singleflight.py
+"""
+
+import asyncio
+import pytest
+from singleflight import SingleFlight
+
+class Lookup:
+    """Slow lookup counting how often it really runs"""
+
+    def __init__(self, result="row", error=None):
+        self.result = result
+        self.error = error
+        self.runs = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.runs += 1
+        await self.release.wait()
+        if self.error:
+            raise self.error
+        return self.result
+
+class TestSingleFlight:
+
+    @pytest.mark.asyncio
+    async def test_concurrent_callers_share_one_call(self):
+        flight = SingleFlight("test_share")
+        lookup = Lookup()
+        callers = [asyncio.create_task(flight.do("token", lookup)) for _ in range(5)]
+        await asyncio.sleep(0)
+        lookup.release.set()
+
+        assert await asyncio.gather(*callers) == ["row"] * 5
+        assert lookup.runs == 1
+        assert flight.stats() == {"calls": 5, "coalesced": 4, "ratio": 0.8, "in_flight": 0}
+
+    @pytest.mark.asyncio
+    async def test_different_keys_are_not_coalesced(self):
+        flight = SingleFlight("test_keys")
+        lookup = Lookup()
+        lookup.release.set()
+        await asyncio.gather(flight.do("a", lookup), flight.do("b", lookup))
+        assert lookup.runs == 2
+
+    @pytest.mark.asyncio
+    async def test_nothing_is_cached_after_the_call(self):
+        flight = SingleFlight("test_fresh")
+        lookup = Lookup()
+        lookup.release.set()
+        await flight.do("token", lookup)
+        await flight.do("token", lookup)
+        assert lookup.runs == 2
+
+    @pytest.mark.asyncio
+    async def test_error_reaches_every_caller_and_is_not_kept(self):
+        flight = SingleFlight("test_error")
+        lookup = Lookup(error=ConnectionError("database unavailable"))
+        callers = [asyncio.create_task(flight.do("token", lookup)) for _ in range(3)]
+        await asyncio.sleep(0)
+        lookup.release.set()
+
+        results = await asyncio.gather(*callers, return_exceptions=True)
+        assert all(isinstance(result, ConnectionError) for result in results)
+        assert not flight.in_flight
+
+        lookup.error = None
+        assert await flight.do("token", lookup) == "row"
+
+    @pytest.mark.asyncio
+    async def test_cancelled_leader_does_not_cancel_followers(self):
+        flight = SingleFlight("test_cancel")
+        lookup = Lookup()
+        leader = asyncio.create_task(flight.do("token", lookup))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do("token", lookup))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        await asyncio.sleep(0)
+        lookup.release.set()
+
+        assert await follower == "row"
+        assert leader.cancelled()
+        assert lookup.runs == 1
+
+    @pytest.mark.asyncio
+    async def test_call_finishes_when_every_caller_is_cancelled(self):
+        flight = SingleFlight("test_abandoned")
+        lookup = Lookup(error=ConnectionError("database unavailable"))
+        caller = asyncio.create_task(flight.do("token", lookup))
+        await asyncio.sleep(0)
+        caller.cancel()
+        await asyncio.sleep(0)
+
+        task = flight.in_flight["token"]
+        lookup.release.set()
+        await asyncio.wait([task])
+        assert not flight.in_flight
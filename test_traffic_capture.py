@@ -0,0 +1,158 @@
+"""
+Tests for traffic capture and the replay harness
+Run with: pytest test_traffic_capture.py
+"""
+
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+import httpx
+import pytest
+from api_keys import generate_api_key, hash_api_key
+from main import app
+from replay_traffic import (
+    IdentityMap, Replayer, schedule, summarise, regressions, max_concurrency, compare
+)
+from seed_dataset import SEED_PASSWORD, session_token, session_is_live, otp, temp_session_id
+from storage import set_storage
+from test_auth_middleware import CountingStorage, log_in
+from traffic_capture import TrafficRecorder, TrafficCaptureMiddleware, anonymise, identities
+
+@pytest.fixture
+def recorder(tmp_path):
+    return TrafficRecorder(path=str(tmp_path / "traffic-{pid}.jsonl"), capacity=100, flush_ms=1000)
+
+def record(route, method="GET", status=200, identities=None, role=None, ts=0.0, duration_ms=1.0, **extra):
+    return {"ts": ts, "method": method, "route": route, "query": {}, "status": status,
+            "duration_ms": duration_ms, "stream": False, "identities": identities or {}, "role": role, **extra}
+
+class TestCapture:
+
+    @pytest.mark.asyncio
+    async def test_records_route_role_and_anonymised_identity(self, recorder):
+        store = CountingStorage()
+        set_storage(store)
+        try:
+            token = await log_in(store, role="admin")
+            transport = httpx.ASGITransport(app=TrafficCaptureMiddleware(app, recorder))
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                client.cookies.set("auth_session_id", token)
+                await client.get("/auth/admin/search-users", params={"q": "secret name", "field": "name", "page": 2})
+                await client.delete("/auth/admin/delete-user/00000000-0000-4000-8000-000000000000")
+                await client.get("/no-such-path")
+        finally:
+            set_storage(None)
+
+        search, delete, missing = recorder.buffer
+        assert search["route"] == "/auth/admin/search-users" and search["status"] == 200
+        assert search["query"] == {"q": "*", "field": "name", "page": "2"}
+        assert search["identities"] == {"session": anonymise(token)} and search["role"] == "admin"
+        assert delete["route"] == "/auth/admin/delete-user/{user_id}" and delete["method"] == "DELETE"
+        assert missing["route"] is None and missing["status"] == 404
+
+        await recorder.flush()
+        with open(recorder.path) as capture:
+            written = capture.read()
+        assert len(written.splitlines()) == 3 and not recorder.buffer
+        assert token not in written and "secret" not in written
+
+    @pytest.mark.asyncio
+    async def test_full_buffer_drops(self, recorder):
+        recorder.capacity = 1
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=TrafficCaptureMiddleware(app, recorder)),
+                                     base_url="http://test") as client:
+            await client.get("/health")
+            await client.get("/health")
+        assert recorder.captured == 1 and recorder.dropped == 1
+
+    def test_api_key_identity_does_not_match_stored_hash(self):
+        key, _ = generate_api_key()
+        for headers in ([(b"x-api-key", key.encode())], [(b"authorization", f"Bearer {key}".encode())]):
+            identity = identities(headers)["api_key"]
+            assert identity == anonymise(key) and not hash_api_key(key).startswith(identity)
+
+class TestIdentityMap:
+
+    def test_stable_and_skips_expired_and_admin_sessions(self):
+        identities = IdentityMap("seed", users=3, sessions=20, temp_sessions=10, temp_registrations=10)
+        first = identities.index("session", "a")
+        assert identities.index("session", "a") == first
+        assert len({identities.index("session", name) for name in "abcdefgh"}) == 8
+        for name in "abcdefgh":
+            j = identities.index("session", name)
+            assert session_is_live(j) and j % 3 != 0
+        assert identities.cookie("session", "a") == session_token("seed", first)
+
+    def test_temp_session_otp_matches_cookie(self):
+        replayer = Replayer(IdentityMap("seed", users=10, sessions=10, temp_sessions=5, temp_registrations=5))
+        ids = {"temp_session": "x"}
+        request = replayer.request(record("/auth/verify-otp", "POST", identities=ids))
+        j = replayer.identities.index("temp_session", "x")
+        assert request["headers"]["Cookie"] == f"temp_session_id={temp_session_id('seed', j)}"
+        assert request["json"] == {"otp": otp(j)}
+        assert replayer.request(record("/auth/verify-otp", "POST", 401, ids))["json"] == {"otp": "000000"}
+
+class TestReplayer:
+
+    def test_login_uses_active_approved_users(self):
+        replayer = Replayer(IdentityMap("seed", users=200, sessions=10, temp_sessions=5, temp_registrations=5))
+        emails = [replayer.request(record("/auth/login", "POST"))["json"]["identifier"] for _ in range(150)]
+        assert "user49@" not in " ".join(emails) and "user99@" not in " ".join(emails)
+        assert all(not email.startswith("user0@") for email in emails)
+        assert replayer.request(record("/auth/login", "POST"))["json"]["password"] == SEED_PASSWORD
+        assert replayer.request(record("/auth/login", "POST", 401))["json"]["password"] != SEED_PASSWORD
+
+    def test_admin_requests_use_api_key_and_fill_templates(self):
+        replayer = Replayer(IdentityMap("seed", users=10, sessions=10, temp_sessions=5, temp_registrations=5),
+                            admin_api_key="ak_admin")
+        captured = record("/auth/admin/delete-user/{user_id}", "DELETE", identities={"session": "s"}, role="admin",
+                          query={"q": "*", "page": "3"})
+        request = replayer.request(captured)
+        assert request["headers"] == {"X-API-Key": "ak_admin"}
+        assert "{" not in request["url"] and request["params"] == {"q": "Nguyen", "page": "3"}
+
+class TestScheduler:
+
+    @pytest.mark.asyncio
+    async def test_open_loop_keeps_offsets(self):
+        records = [record("/health", ts=offset) for offset in (100.0, 100.1, 100.2, 100.3)]
+        in_flight = {"now": 0, "peak": 0}
+
+        async def send(captured, due, sent):
+            in_flight["now"] += 1
+            in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+            # Slower than the arrival rate: requests must overlap, not queue
+            await asyncio.sleep(0.15)
+            in_flight["now"] -= 1
+            return due, sent
+
+        started = time.perf_counter()
+        results = await schedule(records, send, speed=2)
+        assert [due for due, _ in results] == pytest.approx([0, 0.05, 0.1, 0.15])
+        assert all(sent - due < 0.03 for due, sent in results)
+        assert in_flight["peak"] >= 3 and time.perf_counter() - started < 0.4
+
+    def test_max_concurrency(self):
+        assert max_concurrency([(0, 2), (1, 3), (2.5, 4), (5, 6)]) == 2
+
+class TestCompare:
+
+    def results(self, route, latencies):
+        return [record(route, latency_ms=latency) for latency in latencies]
+
+    def test_p99_regression_detected(self, tmp_path, capsys):
+        base = self.results("/auth/me", range(1, 101)) + self.results("/health", [1.0] * 5)
+        target = self.results("/auth/me", [value * 1.5 for value in range(1, 101)]) + self.results("/health", [9.0] * 5)
+        summary_a, summary_b = summarise(base), summarise(target)
+        assert summary_a[("GET", "/auth/me")] == (100, 50, 90, 99)
+        # /health has too few requests to judge
+        assert regressions(summary_a, summary_b, threshold=10, min_count=20) == [("GET", "/auth/me")]
+        assert regressions(summary_a, summary_b, threshold=60, min_count=20) == []
+
+        for name, results in (("a", base), ("b", target)):
+            (tmp_path / f"{name}.jsonl").write_text("".join(json.dumps(result) + "\n" for result in results))
+        args = SimpleNamespace(base=str(tmp_path / "a.jsonl"), target=str(tmp_path / "b.jsonl"),
+                               threshold=10, min_count=20)
+        assert compare(args) == 1
+        assert "⚠️" in capsys.readouterr().out
@@ -0,0 +1,39 @@
+"""
+Tests for startup warm-up and the readiness endpoint
+Run with: pytest test_warmup.py
+"""
+
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+import storage_postgres
+import warmup
+from main import app
+
+@pytest_asyncio.fixture
+async def client(monkeypatch):
+    monkeypatch.setattr(warmup, "STORAGE_BACKEND", "memory")
+    monkeypatch.setattr(warmup, "state", {"ready": False, "started_at": None, "finished_at": None, "steps": {}})
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        yield ac
+
+class TestReadiness:
+
+    @pytest.mark.asyncio
+    async def test_503_until_warm_up_completes(self, client):
+        response = await client.get("/ready")
+        assert response.status_code == 503 and response.json()["status"] == "warming_up"
+
+        await warmup.warm_up()
+        response = await client.get("/ready")
+        assert response.status_code == 200
+        steps = response.json()["steps"]
+        assert set(steps) == {"password_hashing", "models"}
+        assert all(step["ok"] for step in steps.values())
+
+class TestHotQueries:
+
+    def test_same_sql_as_storage(self):
+        sql = {str(query) for query in warmup.hot_queries()}
+        assert str(storage_postgres.identifier_taken_query("a", "b")) in sql
+        assert str(storage_postgres.auth_session_query("token")) in sql
@@ -0,0 +1,202 @@
+"""
+Traffic capture for realistic replay tests (see replay_traffic.py).
+
+With TRAFFIC_CAPTURE_ENABLED, TrafficCaptureMiddleware (outermost, pure
+ASGI) records one JSON line per request. Each line holds the start time, the
+method, the route template (e.g. /auth/admin/delete-user/{user_id}), the
+status, the duration and the response size. It also holds the principal's
+role when a handler resolved one.
+
+Nothing secret is kept:
+- Cookie values and API keys become anonymised identities: a keyed hash
+  (TRAFFIC_CAPTURE_KEY, over a "traffic-capture:" label plus the value, so
+  it never matches a digest the app stores, such as api_keys.key_hash). The
+  same session is the same identity across requests and workers, but the
+  token cannot be recovered.
+- Query values are kept only when they are numbers or one of a few
+  enumerations; anything else (e.g. search terms) becomes "*".
+- Bodies, path parameters and IPs are never read.
+
+Records are buffered in memory (TRAFFIC_CAPTURE_BUFFER_SIZE, newest dropped
+when full) and appended to TRAFFIC_CAPTURE_PATH by a background task every
+TRAFFIC_CAPTURE_FLUSH_MS, off the event loop.
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import random
+import time
+from collections import deque
+from typing import Optional
+from urllib.parse import parse_qsl
+from fastapi.concurrency import run_in_threadpool
+from starlette.requests import cookie_parser
+from auth_middleware import (
+    SCOPE_KEY, API_KEY_HEADER, AUTH_SESSION_COOKIE, TEMP_SESSION_COOKIE, TEMP_REGISTRATION_COOKIE
+)
+from config import (
+    TRAFFIC_CAPTURE_PATH, TRAFFIC_CAPTURE_SAMPLE_RATE, TRAFFIC_CAPTURE_BUFFER_SIZE, TRAFFIC_CAPTURE_FLUSH_MS,
+    TRAFFIC_CAPTURE_KEY
+)
+from logging_service import get_logger
+import metrics
+
+logger = get_logger(__name__)
+
+# Cookie -> identity kind in the captured record
+IDENTITY_COOKIES = {
+    AUTH_SESSION_COOKIE: "session",
+    TEMP_SESSION_COOKIE: "temp_session",
+    TEMP_REGISTRATION_COOKIE: "temp_registration",
+}
+# Query values safe to keep verbatim
+KEPT_QUERY_VALUES = {"all", "name", "email", "phone", "lineno", "filename", "traceback"}
+
+# Domain separation from every other HMAC in the app
+ANONYMISE_LABEL = b"traffic-capture:"
+
+def anonymise(value: str, key: str = TRAFFIC_CAPTURE_KEY) -> str:
+    return hmac.new(key.encode(), ANONYMISE_LABEL + value.encode(), hashlib.sha256).hexdigest()[:16]
+
+def sanitise_query(query_string: bytes) -> dict:
+    return {
+        name: value if value.isdigit() or value in KEPT_QUERY_VALUES else "*"
+        for name, value in parse_qsl(query_string.decode("latin-1"), keep_blank_values=True)
+    }
+
+def identities(headers: list) -> dict:
+    found = {}
+    for name, value in headers:
+        if name == b"cookie":
+            for cookie, kind in IDENTITY_COOKIES.items():
+                token = cookie_parser(value.decode("latin-1")).get(cookie)
+                if token:
+                    found[kind] = anonymise(token)
+        elif name == API_KEY_HEADER or (name == b"authorization" and value[:7].lower() == b"bearer "):
+            found["api_key"] = anonymise(value.decode("latin-1").split(" ")[-1])
+    return found
+
+_templates = {}
+
+def route_template(scope) -> Optional[str]:
+    """The matched route's path (the router leaves its endpoint in the scope)"""
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return None
+    if endpoint not in _templates:
+        _templates[endpoint] = next((
+            route.path for route in scope["app"].router.routes if getattr(route, "endpoint", None) is endpoint
+        ), None)
+    return _templates[endpoint]
+
+class TrafficRecorder:
+    """Bounded buffer of captured requests plus the task appending them to a file"""
+
+    def __init__(self, path: str = TRAFFIC_CAPTURE_PATH, capacity: int = TRAFFIC_CAPTURE_BUFFER_SIZE,
+                 flush_ms: int = TRAFFIC_CAPTURE_FLUSH_MS, sample_rate: float = TRAFFIC_CAPTURE_SAMPLE_RATE):
+        self.path = path.format(pid=os.getpid())
+        self.capacity = capacity
+        self.flush_seconds = flush_ms / 1000
+        self.sample_rate = sample_rate
+        self.buffer = deque()
+        self.flush_task: Optional[asyncio.Task] = None
+        self.captured = 0
+        self.dropped = 0
+
+    def sampled(self) -> bool:
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def record(self, entry: dict):
+        if len(self.buffer) >= self.capacity:
+            self.dropped += 1
+            return
+        self.buffer.append(entry)
+        self.captured += 1
+
+    def _write(self, lines: list):
+        with open(self.path, "a") as capture:
+            capture.write("".join(lines))
+
+    async def flush(self):
+        if not self.buffer:
+            return
+        lines = [json.dumps(self.buffer.popleft(), separators=(",", ":")) + "\n" for _ in range(len(self.buffer))]
+        try:
+            await run_in_threadpool(self._write, lines)
+        except OSError as e:
+            self.dropped += len(lines)
+            logger.error("Traffic capture write failed", extra={"fields": {"path": self.path, "error": str(e)}})
+
+    async def _flush_forever(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            await self.flush()
+
+    def start(self):
+        if self.flush_task is None:
+            self.flush_task = asyncio.create_task(self._flush_forever())
+            logger.info("Capturing traffic", extra={"fields": {"path": self.path, "sample_rate": self.sample_rate}})
+
+    async def stop(self):
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            try:
+                await self.flush_task
+            except asyncio.CancelledError:
+                pass
+            self.flush_task = None
+        await self.flush()
+
+class TrafficCaptureMiddleware:
+    """Pure ASGI middleware recording request metadata (add it outermost)"""
+
+    def __init__(self, app, recorder: "TrafficRecorder" = None):
+        self.app = app
+        self.recorder = recorder or traffic_recorder
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.recorder.sampled():
+            await self.app(scope, receive, send)
+            return
+
+        started_at = time.time()
+        started = time.perf_counter()
+        response = {"status": 500, "bytes": 0, "stream": False}
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                for name, value in message.get("headers", ()):
+                    if name == b"content-type" and value.startswith(b"text/event-stream"):
+                        response["stream"] = True
+            elif message["type"] == "http.response.body":
+                response["bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, capture_send)
+        finally:
+            context = scope.get(SCOPE_KEY)
+            principal = context.resolved_principal() if context is not None else None
+            headers = scope["headers"]
+            self.recorder.record({
+                "ts": round(started_at, 6),
+                "method": scope["method"],
+                "route": route_template(scope),
+                "query": sanitise_query(scope["query_string"]),
+                "status": response["status"],
+                "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+                "response_bytes": response["bytes"],
+                "stream": response["stream"],
+                "identities": identities(headers),
+                "role": getattr(principal, "role", None),
+                "worker": os.getpid(),
+            })
+
+traffic_recorder = TrafficRecorder()
+
+metrics.gauge("traffic_captured", "Requests captured for replay since start", lambda: traffic_recorder.captured)
+metrics.gauge("traffic_capture_dropped", "Captured requests lost to a full buffer or failed write",
+              lambda: traffic_recorder.dropped)
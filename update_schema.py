@@ -5,6 +5,10 @@ Script to update database schema to add approval columns
 import asyncio
 import asyncpg
 from config import DATABASE_URL
+from migrations import Backfill, migrate, run_backfill
+
+# Progress slot for the resumable "approve all existing users" backfill
+APPROVE_ALL_JOB_ID = 1
 
 async def update_database_schema():
     """Update database schema to add approval functionality"""
@@ -12,58 +16,22 @@ async def update_database_schema():
     print("🔄 Updating database schema...")
     
     try:
-        conn = await asyncpg.connect(DATABASE_URL)
-        
-        # Check if columns already exist
-        existing_columns = await conn.fetch("""
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name = 'users' 
-            AND column_name IN ('is_approved', 'approved_at', 'approved_by')
-        """)
-        
-        existing_column_names = [col['column_name'] for col in existing_columns]
-        
-        if 'is_approved' not in existing_column_names:
-            print("➕ Adding is_approved column...")
-            await conn.execute("""
-                ALTER TABLE users 
-                ADD COLUMN is_approved BOOLEAN DEFAULT FALSE
-            """)
-        else:
-            print("✅ is_approved column already exists")
-        
-        if 'approved_at' not in existing_column_names:
-            print("➕ Adding approved_at column...")
-            await conn.execute("""
-                ALTER TABLE users 
-                ADD COLUMN approved_at TIMESTAMP NULL
-            """)
-        else:
-            print("✅ approved_at column already exists")
-        
-        if 'approved_by' not in existing_column_names:
-            print("➕ Adding approved_by column...")
-            await conn.execute("""
-                ALTER TABLE users 
-                ADD COLUMN approved_by UUID NULL
-            """)
-        else:
-            print("✅ approved_by column already exists")
-        
-        print("✅ Database schema updated successfully!")
+        # Columns, defaults and indexes are versioned migrations now
+        await migrate()
         
         # Update existing users to be approved (for migration)
         update_choice = input("Bạn có muốn set tất cả user hiện tại thành 'approved'? (y/N): ")
         if update_choice.lower() == 'y':
-            result = await conn.execute("""
-                UPDATE users 
-                SET is_approved = TRUE, approved_at = CURRENT_TIMESTAMP 
-                WHERE is_approved IS FALSE OR is_approved IS NULL
-            """)
-            print(f"✅ Updated {result.split()[-1] if result else '0'} existing users to approved status")
-        
-        await conn.close()
+            # Chunked so a large users table is never locked in one long UPDATE
+            await run_backfill(
+                Backfill(
+                    "users",
+                    "is_approved = TRUE, approved_at = CURRENT_TIMESTAMP",
+                    "is_approved IS FALSE OR is_approved IS NULL",
+                ),
+                job_id=APPROVE_ALL_JOB_ID,
+            )
+            print("✅ Updated existing users to approved status")
         
     except Exception as e:
         print(f"❌ Error updating database schema: {e}")
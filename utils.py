@@ -4,10 +4,20 @@ import re
 from datetime import datetime, timedelta
 from passlib.context import CryptContext
 from jose import JWTError, jwt
-from config import SECRET_KEY, ALGORITHM, OTP_EXPIRE_MINUTES, SESSION_EXPIRE_MINUTES, AUTH_SESSION_EXPIRE_MINUTES
+from config import SECRET_KEY, ALGORITHM, OTP_EXPIRE_MINUTES, SESSION_EXPIRE_MINUTES, AUTH_SESSION_EXPIRE_MINUTES, BCRYPT_ROUNDS
 
 # Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+def build_pwd_context(rounds: int = BCRYPT_ROUNDS) -> CryptContext:
+    """Build the password context; hashes with any other cost are flagged for rehash"""
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=rounds,
+    )
+
+pwd_context = build_pwd_context()
 
 def hash_password(password: str) -> str:
     """Hash a password"""
@@ -17,6 +27,10 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
     return pwd_context.verify(plain_password, hashed_password)
 
+def password_needs_rehash(hashed_password: str) -> bool:
+    """Check if a stored hash uses outdated parameters"""
+    return pwd_context.needs_update(hashed_password)
+
 def generate_otp() -> str:
     """Generate a 6-digit OTP"""
     return ''.join(random.choices(string.digits, k=6))
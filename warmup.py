@@ -0,0 +1,134 @@
+"""
+Startup warm-up.
+
+Pays the one-time costs of the first requests after a deploy before the
+instance reports ready: pool connections, prepared statements for the hot
+queries, the bcrypt backend, pydantic serializers and (optionally) SMTP.
+"""
+import asyncio
+import time
+from datetime import datetime
+import aiosmtplib
+from fastapi.concurrency import run_in_threadpool
+from config import STORAGE_BACKEND, DB_POOL_MIN_SIZE, WARMUP_SMTP, SMTP_SERVER, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD
+from database import database, replica_database
+from models import (
+    UserResponse, RegisterSuccessResponse, RegisterResponse, LoginPendingResponse,
+    LoginSuccessResponse, SuccessResponse, UserListResponse, AdminResponse
+)
+from storage_postgres import (
+    auth_session_query, user_by_id_query, user_by_email_query, user_by_phone_query, identifier_taken_query,
+    temp_session_query, temp_registration_query, users_version_query
+)
+from utils import hash_password, verify_password
+
+PLACEHOLDER_ID = "00000000-0000-0000-0000-000000000000"
+
+# Warm-up progress, reported by /ready
+state = {
+    "ready": False,
+    "started_at": None,
+    "finished_at": None,
+    "steps": {},
+}
+
+def hot_queries():
+    """Statements on the request path, with placeholder values.
+
+    asyncpg caches prepared statements by SQL text, so running these once per
+    pooled connection prepares the exact statements the routes will use.
+    They come from storage_postgres's own query builders, so they cannot
+    drift from what the routes run.
+    """
+    return [
+        auth_session_query(""),
+        user_by_id_query(PLACEHOLDER_ID),
+        user_by_email_query(""),
+        user_by_phone_query(""),
+        identifier_taken_query("", ""),
+        temp_session_query(PLACEHOLDER_ID),
+        temp_registration_query(PLACEHOLDER_ID),
+        users_version_query(),
+    ]
+
+async def warm_pool(db):
+    """Open DB_POOL_MIN_SIZE connections and prepare the hot statements on each"""
+    queries = hot_queries()
+    # Hold every connection at once so each worker task gets its own
+    all_acquired = asyncio.Barrier(DB_POOL_MIN_SIZE)
+
+    async def warm_connection():
+        async with db.connection() as connection:
+            try:
+                for query in queries:
+                    await connection.fetch_one(query)
+            except Exception:
+                # Release the siblings waiting on the barrier
+                await all_acquired.abort()
+                raise
+            await all_acquired.wait()
+
+    await asyncio.gather(*(warm_connection() for _ in range(DB_POOL_MIN_SIZE)))
+
+async def warm_password_hashing():
+    """Load the bcrypt backend and run one verify"""
+    dummy_hash = await run_in_threadpool(hash_password, "warm-up")
+    await run_in_threadpool(verify_password, "warm-up", dummy_hash)
+
+async def warm_models():
+    """Build and serialize each response model once"""
+    user = UserResponse(id="warm-up", name="warm-up", email="warm@up.local", phone="0000000000", role="user")
+    samples = [
+        user,
+        RegisterSuccessResponse(status="success", message="", user=user),
+        RegisterResponse(status="Loading", message=""),
+        LoginPendingResponse(status="pending", message=""),
+        LoginSuccessResponse(status="success", message="", user=user),
+        SuccessResponse(status="success", message=""),
+        AdminResponse(status="success", message="", data={}),
+        UserListResponse(
+            id="warm-up", name="warm-up", email="warm@up.local", phone="0000000000",
+            role="user", is_approved=False, is_active=True, created_at=datetime.utcnow()
+        ),
+    ]
+    for sample in samples:
+        sample.model_dump_json()
+
+async def warm_smtp():
+    """Resolve, connect and authenticate against the SMTP server once"""
+    smtp = aiosmtplib.SMTP(hostname=SMTP_SERVER, port=SMTP_PORT, start_tls=True)
+    await smtp.connect()
+    try:
+        await smtp.login(SMTP_USERNAME, SMTP_PASSWORD)
+    finally:
+        await smtp.quit()
+
+async def run_step(name: str, step):
+    started = time.perf_counter()
+    try:
+        await step()
+        result = {"ok": True}
+    except Exception as e:
+        # A failed step slows the first requests down but must not keep the
+        # instance out of rotation forever
+        result = {"ok": False, "error": str(e)}
+    result["ms"] = round((time.perf_counter() - started) * 1000, 1)
+    state["steps"][name] = result
+
+async def warm_up():
+    """Run all warm-up steps, then mark the instance ready"""
+    state["started_at"] = datetime.utcnow().isoformat()
+    steps = [
+        ("password_hashing", warm_password_hashing),
+        ("models", warm_models),
+    ]
+    if STORAGE_BACKEND == "postgres":
+        steps.append(("database_pool", lambda: warm_pool(database)))
+    if STORAGE_BACKEND == "postgres" and replica_database is not None and replica_database.is_connected:
+        steps.append(("replica_pool", lambda: warm_pool(replica_database)))
+    if WARMUP_SMTP:
+        steps.append(("smtp", warm_smtp))
+
+    await asyncio.gather(*(run_step(name, step) for name, step in steps))
+    state["finished_at"] = datetime.utcnow().isoformat()
+    state["ready"] = True